@@ -0,0 +1,72 @@
+"""_summary_
+Benchmarks the event codecs of `shared.event_codec` in-process: the encoded size and the
+encode and decode throughput of every codec, with and without compression, on user
+update events shaped like the ones the user services publish: delta events carrying one
+changed field, full events, and full events of users with many email addresses. Every
+event is checked to decode back to itself before timing.
+
+Usage:
+    PYTHONPATH=src python experiments/benchmark_event_codec.py --events 20000 --repeat 5
+Author:
+    @TheBarzani
+"""
+
+import timeit
+import argparse
+import statistics
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+from shared.event_codec import _codecs, decode_event, encode_event
+from shared.user_events import build_user_update_event
+
+class Properties:
+    """
+    The AMQP properties of an encoded event, as a consumer receives them.
+    """
+
+    def __init__(self, content_type: str, content_encoding: str, headers: Dict[str, Any]):
+        self.content_type = content_type
+        self.content_encoding = content_encoding
+        self.headers = headers
+
+def make_event(i: int, kind: str) -> Dict[str, Any]:
+    """
+    Returns a user update event: 'delta' changes the address only, 'full' carries every
+    field, and 'many emails' carries every field of a user with 40 email addresses.
+    """
+    emails = [f'user{i}.{j}@example.com' for j in range(40 if kind == 'many emails' else 2)]
+    address = {'street': f'{i} Benchmark Street', 'city': 'Montreal', 'state': 'QC',
+               'postalCode': 'H3G 1M8', 'country': 'Canada'}
+    return build_user_update_event(f'user-{i}', emails, address, 1 + i % 50,
+                                   datetime(2024, 1, 1) + timedelta(minutes=i),
+                                   ['deliveryAddress'] if kind == 'delta' else None)
+
+def main() -> None:
+    """
+    Times every codec, uncompressed and compressed, on every kind of event.
+    """
+    parser = argparse.ArgumentParser(description='Benchmark the event codecs.')
+    parser.add_argument('--events', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    for kind in ('delta', 'full', 'many emails'):
+        events: List[Dict[str, Any]] = [make_event(i, kind) for i in range(args.events)]
+        for codec_name in _codecs:
+            for label, min_size in (('plain', 0), ('zlib', 1)):
+                encoded = [encode_event(event, codec_name, min_size) for event in events]
+                messages = [(body, Properties(**properties)) for body, properties in encoded]
+                assert [decode_event(*message) for message in messages] == events
+                encode_s = min(timeit.repeat(
+                    lambda: [encode_event(event, codec_name, min_size) for event in events],
+                    number=1, repeat=args.repeat))
+                decode_s = min(timeit.repeat(
+                    lambda: [decode_event(*message) for message in messages],
+                    number=1, repeat=args.repeat))
+                size = statistics.mean(len(body) for body, _ in messages)
+                print(f"{kind:>11} {codec_name:>8} {label:>5}: {size:7.1f} B/event | "
+                      f"encode {args.events / encode_s:9.0f} events/s | "
+                      f"decode {args.events / decode_s:9.0f} events/s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""_summary_
+Benchmarks full versus projected order reads: the BSON bytes MongoDB sends back, the
+JSON bytes returned to the client, and the latency of fetching and marshalling all the
+orders of a status.
+
+The orders are seeded into the `orders` collection of the configured database with a
+dedicated `userId`, and removed afterwards. With `--base-url`, the same reads are also
+timed through the HTTP API (`GET /orders/?status=...&fields=...`).
+
+Usage:
+    python experiments/benchmark_field_projection.py --orders 50000 --items 10 \
+        [--fields orderId,orderStatus] [--base-url http://localhost:8000]
+Environment Variables:
+    MONGO_URI: The URI of the MongoDB server.
+    DATABASE_NAME: The database holding the orders collection.
+Author:
+    @TheBarzani
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import statistics
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+from pymongo import MongoClient
+from pymongo.collection import Collection
+from dotenv import load_dotenv
+from flask_restx import marshal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+# pylint: disable=wrong-import-position
+from order_service.app.models import order_model
+from shared.projection import build_projection, parse_fields, trimmed_model
+
+load_dotenv()
+
+BENCHMARK_USER_ID = 'benchmark-field-projection'
+STATUS = 'delivered'
+
+def seed_orders(orders_collection: Collection, count: int, items: int) -> None:
+    """
+    Inserts `count` delivered orders with `items` items each.
+    """
+    batch: List[Dict[str, Any]] = []
+    for i in range(count):
+        batch.append({
+            'orderId': f'bench-{i}',
+            'userId': BENCHMARK_USER_ID,
+            'items': [{'itemId': f'item-{j}', 'quantity': random.randint(1, 5),
+                       'price': round(random.uniform(1, 500), 2)} for j in range(items)],
+            'userEmails': [f'bench{i}@example.com', f'bench{i}.alt@example.com'],
+            'deliveryAddress': {'street': f'{i} Benchmark Street', 'city': 'Montreal',
+                                'state': 'QC', 'postalCode': 'H3G 1M8',
+                                'country': 'Canada'},
+            'orderStatus': STATUS,
+            'createdAt': datetime.utcnow(),
+            'updatedAt': datetime.utcnow()
+        })
+        if len(batch) == 1000:
+            orders_collection.insert_many(batch)
+            batch = []
+    if batch:
+        orders_collection.insert_many(batch)
+
+def time_runs(run: Callable[[], int], repeat: int) -> Dict[str, float]:
+    """
+    Runs `run` `repeat` times and returns the median latency and the size it reported.
+    """
+    latencies: List[float] = []
+    size = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        size = run()
+        latencies.append((time.perf_counter() - started) * 1000)
+    return {'median_ms': statistics.median(latencies), 'bytes': size}
+
+def benchmark_database(orders_collection: Collection, field_names: Optional[List[str]],
+                       repeat: int) -> Dict[str, Dict[str, float]]:
+    """
+    Measures the BSON received from MongoDB, and the latency and JSON size of fetching
+    and marshalling every benchmark order.
+    """
+    query = {'userId': BENCHMARK_USER_ID, 'orderStatus': STATUS}
+    projection = build_projection(field_names)
+    model = trimmed_model(order_model, field_names)
+
+    def wire_bytes() -> int:
+        return sum(len(batch) for batch in
+                   orders_collection.find_raw_batches(query, projection))
+
+    def read_and_marshal() -> int:
+        orders = list(orders_collection.find(query, projection))
+        return len(json.dumps(marshal(orders, model)))
+
+    return {'bson': time_runs(wire_bytes, repeat),
+            'json': time_runs(read_and_marshal, repeat)}
+
+def benchmark_http(base_url: str, fields: Optional[str], repeat: int) -> Dict[str, float]:
+    """
+    Measures the latency and response size of listing orders through the API.
+    """
+    import requests  # pylint: disable=import-outside-toplevel
+    params = {'status': STATUS}
+    if fields:
+        params['fields'] = fields
+    return time_runs(lambda: len(requests.get(f'{base_url}/orders/', params=params,
+                                              timeout=300).content), repeat)
+
+def main() -> None:
+    """
+    Seeds the benchmark orders, compares full and projected reads and cleans up.
+    """
+    parser = argparse.ArgumentParser(description='Benchmark full vs projected order reads.')
+    parser.add_argument('--orders', type=int, default=50000)
+    parser.add_argument('--items', type=int, default=10)
+    parser.add_argument('--fields', default='orderId,orderStatus')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--base-url', help='Also benchmark the HTTP API at this URL')
+    args = parser.parse_args()
+
+    client = MongoClient(os.getenv('MONGO_URI'))
+    orders_collection = client[os.getenv('DATABASE_NAME')]['orders']
+    field_names = parse_fields(args.fields, order_model)
+
+    orders_collection.delete_many({'userId': BENCHMARK_USER_ID})
+    print(f"Seeding {args.orders} orders with {args.items} items each...")
+    seed_orders(orders_collection, args.orders, args.items)
+    try:
+        for label, names in (('full', None), (f'fields={args.fields}', field_names)):
+            results = benchmark_database(orders_collection, names, args.repeat)
+            print(f"{label:>32}: BSON {results['bson']['bytes'] / 1e6:8.2f} MB "
+                  f"in {results['bson']['median_ms']:8.1f} ms | JSON "
+                  f"{results['json']['bytes'] / 1e6:8.2f} MB, read + marshal "
+                  f"{results['json']['median_ms']:8.1f} ms")
+        if args.base_url:
+            # The API lists every order of the status, not only the benchmark ones
+            for label, fields in (('full', None), (f'fields={args.fields}', args.fields)):
+                result = benchmark_http(args.base_url, fields, args.repeat)
+                print(f"{'HTTP ' + label:>32}: {result['bytes'] / 1e6:8.2f} MB "
+                      f"in {result['median_ms']:8.1f} ms")
+    finally:
+        orders_collection.delete_many({'userId': BENCHMARK_USER_ID})
+        client.close()
+
+if __name__ == "__main__":
+    main()
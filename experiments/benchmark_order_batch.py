@@ -0,0 +1,116 @@
+"""_summary_
+Benchmarks order creation throughput through the API: `POST /orders/` one order per
+request (optionally from several concurrent clients) against `POST /orders/batch` with
+JSON arrays and with NDJSON streams.
+
+The created orders belong to a dedicated `userId`; pass `--cleanup` with `MONGO_URI`
+and `DATABASE_NAME` set to delete them afterwards.
+
+Usage:
+    python experiments/benchmark_order_batch.py --base-url http://localhost:8000 \
+        --orders 5000 --batch-size 500 --concurrency 8 [--cleanup]
+Author:
+    @TheBarzani
+"""
+
+import os
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+import requests
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BENCHMARK_USER_ID = 'benchmark-order-batch'
+
+def make_order(i: int) -> Dict[str, Any]:
+    """
+    Returns a valid order payload.
+    """
+    return {
+        'userId': BENCHMARK_USER_ID,
+        'items': [{'itemId': f'item-{j}', 'quantity': 1 + j, 'price': 9.99 * (j + 1)}
+                  for j in range(3)],
+        'userEmails': [f'bench{i}@example.com'],
+        'deliveryAddress': {'street': f'{i} Benchmark Street', 'city': 'Montreal',
+                            'state': 'QC', 'postalCode': 'H3G 1M8', 'country': 'Canada'},
+        'orderStatus': 'under process'
+    }
+
+def run_single(base_url: str, orders: List[Dict[str, Any]], concurrency: int) -> int:
+    """
+    Creates the orders one request at a time from `concurrency` clients.
+    """
+    def post(order: Dict[str, Any]) -> bool:
+        with requests.Session() as session:
+            return session.post(f'{base_url}/orders/', json=order,
+                                timeout=30).status_code == 201
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return sum(executor.map(post, orders))
+
+def run_batch(base_url: str, orders: List[Dict[str, Any]], batch_size: int,
+              ndjson: bool) -> int:
+    """
+    Creates the orders with `POST /orders/batch`, `batch_size` orders per request.
+    """
+    created = 0
+    with requests.Session() as session:
+        for start in range(0, len(orders), batch_size):
+            batch = orders[start:start + batch_size]
+            if ndjson:
+                response = session.post(f'{base_url}/orders/batch',
+                                        data='\n'.join(json.dumps(order) for order in batch),
+                                        headers={'Content-Type': 'application/x-ndjson'},
+                                        timeout=300)
+            else:
+                response = session.post(f'{base_url}/orders/batch', json=batch, timeout=300)
+            created += response.json()['created']
+    return created
+
+def measure(label: str, run: Callable[[], int], count: int) -> None:
+    """
+    Runs one scenario and prints its throughput.
+    """
+    started = time.perf_counter()
+    created = run()
+    elapsed = time.perf_counter() - started
+    print(f"{label:>28}: {created}/{count} created in {elapsed:7.2f} s "
+          f"({created / elapsed:8.1f} orders/s)")
+
+def main() -> None:
+    """
+    Runs every scenario with the same number of orders.
+    """
+    parser = argparse.ArgumentParser(description='Benchmark single vs batch order creation.')
+    parser.add_argument('--base-url', default='http://localhost:8000')
+    parser.add_argument('--orders', type=int, default=5000)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--cleanup', action='store_true',
+                        help='Delete the benchmark orders from MongoDB afterwards')
+    args = parser.parse_args()
+
+    orders = [make_order(i) for i in range(args.orders)]
+    measure('POST /orders/ (1 client)',
+            lambda: run_single(args.base_url, [dict(o) for o in orders], 1), args.orders)
+    measure(f'POST /orders/ ({args.concurrency} clients)',
+            lambda: run_single(args.base_url, [dict(o) for o in orders], args.concurrency),
+            args.orders)
+    measure(f'POST /orders/batch JSON x{args.batch_size}',
+            lambda: run_batch(args.base_url, orders, args.batch_size, False), args.orders)
+    measure(f'POST /orders/batch NDJSON x{args.batch_size}',
+            lambda: run_batch(args.base_url, orders, args.batch_size, True), args.orders)
+
+    if args.cleanup:
+        from pymongo import MongoClient  # pylint: disable=import-outside-toplevel
+        client = MongoClient(os.getenv('MONGO_URI'))
+        deleted = client[os.getenv('DATABASE_NAME')]['orders'].delete_many(
+            {'userId': BENCHMARK_USER_ID}).deleted_count
+        print(f"Deleted {deleted} benchmark orders")
+
+if __name__ == "__main__":
+    main()
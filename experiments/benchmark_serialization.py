@@ -0,0 +1,68 @@
+"""_summary_
+Benchmarks the serialization of `GET /orders/` in-process: `flask_restx.marshal`
+followed by `json.dumps`, as the endpoint does by default, against the compiled plans of
+`shared.serialization` (`ORDERS_FAST_SERIALIZATION=true`), on synthetic order documents
+shaped like the ones MongoDB returns (ObjectIds, datetimes). The outputs are checked to
+be identical before timing.
+
+Usage:
+    PYTHONPATH=src python experiments/benchmark_serialization.py --orders 5000 --repeat 5
+Author:
+    @TheBarzani
+"""
+
+import json
+import timeit
+import argparse
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+from bson import ObjectId
+from flask_restx import marshal
+from order_service.app.models import order_model
+from shared.projection import trimmed_model
+from shared.serialization import compile_plan, dumps
+
+def make_order(i: int) -> Dict[str, Any]:
+    """
+    Returns an order document as read from MongoDB.
+    """
+    created_at = datetime(2024, 1, 1) + timedelta(minutes=i)
+    return {
+        '_id': ObjectId(),
+        'orderId': f'order-{i}',
+        'userId': f'user-{i % 100}',
+        'items': [{'itemId': f'item-{j}', 'quantity': 1 + j, 'price': 9.99 * (j + 1)}
+                  for j in range(3)],
+        'userEmails': [f'user{i % 100}@example.com'],
+        'deliveryAddress': {'street': f'{i} Benchmark Street', 'city': 'Montreal',
+                            'state': 'QC', 'postalCode': 'H3G 1M8', 'country': 'Canada'},
+        'orderStatus': 'under process',
+        'createdAt': created_at,
+        'updatedAt': created_at
+    }
+
+def main() -> None:
+    """
+    Times both serializers on the full model and on a trimmed one.
+    """
+    parser = argparse.ArgumentParser(description='Benchmark marshal vs compiled plans.')
+    parser.add_argument('--orders', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    orders: List[Dict[str, Any]] = [make_order(i) for i in range(args.orders)]
+    for label, model in (('full model', order_model),
+                         ('fields=orderId,orderStatus',
+                          trimmed_model(order_model, ['orderId', 'orderStatus']))):
+        assert [compile_plan(model)(order) for order in orders] == marshal(orders, model)
+        timings = {
+            'marshal + json.dumps': lambda m=model: json.dumps(marshal(orders, m)),
+            'compiled plan': lambda m=model: dumps(orders, m)
+        }
+        for name, run in timings.items():
+            elapsed = min(timeit.repeat(run, number=1, repeat=args.repeat))
+            print(f"{label:>28} {name:>22}: {elapsed * 1000:8.1f} ms "
+                  f"({args.orders / elapsed:10.0f} orders/s)")
+
+if __name__ == "__main__":
+    main()
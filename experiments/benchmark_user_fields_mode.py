@@ -0,0 +1,146 @@
+"""_summary_
+Benchmarks the two ways orders can hold the user fields (`ORDERS_USER_FIELDS_MODE`):
+embedded, where a user update rewrites every order of the user, and reference, where it
+writes one user snapshot and reads resolve the fields from the snapshots with one `$in`
+query per page.
+
+Orders of `--users` users are seeded into two scratch collections of the configured
+database, one per mode, and dropped afterwards. The write cost is the latency of applying
+one user update; the read cost is the latency of fetching a page of orders, including
+the snapshot lookup in reference mode (with the in-memory snapshots disabled, so every
+page pays for it).
+
+Usage:
+    python experiments/benchmark_user_fields_mode.py --users 200 --orders-per-user 500 \
+        [--page-size 100] [--repeat 20]
+Environment Variables:
+    MONGO_URI: The URI of the MongoDB server.
+    DATABASE_NAME: The database the scratch collections are created in.
+Author:
+    @TheBarzani
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+from datetime import datetime
+from typing import Any, Callable, Dict, List
+from pymongo import MongoClient
+from pymongo.collection import Collection
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+# pylint: disable=wrong-import-position
+from order_service.app.user_snapshots import UserSnapshotStore, without_user_fields
+
+load_dotenv()
+
+EMBEDDED_COLLECTION = 'benchmark_orders_embedded'
+REFERENCE_COLLECTION = 'benchmark_orders_reference'
+SNAPSHOTS_COLLECTION = 'benchmark_user_snapshots'
+STATUS = 'under process'
+
+def user_snapshot(user_id: str, version: int) -> Dict[str, Any]:
+    """
+    Returns the user fields of a user, as carried by a user update event.
+    """
+    return {'userId': user_id, 'version': version,
+            'userEmails': [f'{user_id}.v{version}@example.com'],
+            'deliveryAddress': {'street': f'{version} Benchmark Street', 'city': 'Montreal',
+                                'state': 'QC', 'postalCode': 'H3G 1M8', 'country': 'Canada'}}
+
+def seed(embedded: Collection, reference: Collection, store: UserSnapshotStore,
+         users: int, orders_per_user: int) -> None:
+    """
+    Inserts the orders of every user in both collections, and the user snapshots.
+    """
+    store.record([user_snapshot(f'user-{u}', 1) for u in range(users)])
+    for u in range(users):
+        snapshot = user_snapshot(f'user-{u}', 1)
+        orders: List[Dict[str, Any]] = [{
+            'orderId': f'order-{u}-{i}',
+            'userId': snapshot['userId'],
+            'items': [{'itemId': 'item-1', 'quantity': 1, 'price': 9.99}],
+            'userEmails': snapshot['userEmails'],
+            'deliveryAddress': snapshot['deliveryAddress'],
+            'orderStatus': STATUS,
+            'userVersion': 1,
+            'createdAt': datetime.utcnow()
+        } for i in range(orders_per_user)]
+        embedded.insert_many([dict(order) for order in orders])
+        reference.insert_many([without_user_fields(order, snapshot) for order in orders])
+    for collection in (embedded, reference):
+        collection.create_index('userId')
+
+def median_ms(run: Callable[[int], None], repeat: int) -> float:
+    """
+    Runs `run` `repeat` times with the run number and returns the median latency.
+    """
+    latencies: List[float] = []
+    for i in range(repeat):
+        started = time.perf_counter()
+        run(i)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return statistics.median(latencies)
+
+def main() -> None:
+    """
+    Seeds both layouts, times user updates and page reads in each, and cleans up.
+    """
+    parser = argparse.ArgumentParser(description='Benchmark embedded vs reference user fields.')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--orders-per-user', type=int, default=500)
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    client = MongoClient(os.getenv('MONGO_URI'))
+    db = client[os.getenv('DATABASE_NAME')]
+    for name in (EMBEDDED_COLLECTION, REFERENCE_COLLECTION, SNAPSHOTS_COLLECTION):
+        db.drop_collection(name)
+    embedded, reference = db[EMBEDDED_COLLECTION], db[REFERENCE_COLLECTION]
+    # No memory tier: every read pays for the snapshot lookup
+    store = UserSnapshotStore(db[SNAPSHOTS_COLLECTION], max_entries=0, ttl=0)
+
+    print(f"Seeding {args.users} users with {args.orders_per_user} orders each...")
+    seed(embedded, reference, store, args.users, args.orders_per_user)
+    try:
+        def update_embedded(i: int) -> None:
+            snapshot = user_snapshot(f'user-{i % args.users}', 2 + i)
+            embedded.update_many(
+                {'userId': snapshot['userId'], 'userVersion': {'$not': {'$gte': 2 + i}}},
+                {'$set': {'userEmails': snapshot['userEmails'],
+                          'deliveryAddress': snapshot['deliveryAddress'],
+                          'userVersion': 2 + i}})
+
+        def update_reference(i: int) -> None:
+            store.record([user_snapshot(f'user-{i % args.users}', 2 + i)])
+
+        def read_page(collection: Collection, resolve: bool) -> Callable[[int], None]:
+            def run(i: int) -> None:
+                orders = list(collection.find({'orderStatus': STATUS}).sort('_id', 1)
+                              .skip((i * args.page_size) % (args.users * args.orders_per_user))
+                              .limit(args.page_size))
+                if resolve:
+                    store.resolve(orders)
+            return run
+
+        results = {
+            'user update, embedded': median_ms(update_embedded, args.repeat),
+            'user update, reference': median_ms(update_reference, args.repeat),
+            'page read, embedded': median_ms(read_page(embedded, False), args.repeat),
+            'page read, reference': median_ms(read_page(reference, True), args.repeat)
+        }
+        for label, elapsed in results.items():
+            print(f"{label:>24}: {elapsed:8.2f} ms")
+        print(f"{'orders per user update':>24}: {args.orders_per_user} embedded, "
+              f"0 reference (1 snapshot)")
+    finally:
+        for name in (EMBEDDED_COLLECTION, REFERENCE_COLLECTION, SNAPSHOTS_COLLECTION):
+            db.drop_collection(name)
+        client.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,51 @@
 """_summary_
 This module initializes and configures the Flask application for the order service.
 It sets up the Flask app, configures the API namespace, initializes the MongoDB 
-client, and starts a background thread to consume user update events.
+client, and starts a background thread to consume user update events unless the
+consumer runs as its own process (`python -m order_service.consumer`).
 
 Functions:
     start_event_consumer(app: Flask): Starts the event consumer within the Flask 
                                       app context.
+    init_mongo(app: Flask): Initializes the MongoDB client and collections of the app.
+    init_user_snapshots(app: Flask): Initializes the store of user snapshots fed by the
+                                     event consumer.
+    init_order_caches(app: Flask): Initializes the caches of order listings and of
+                                   single orders.
     create_app(): Creates and configures the Flask application, initializes 
                   MongoDB, and starts the event consumer thread.
+    create_consumer_app(): Creates a Flask application without API routes for the
+                           standalone event consumer.
 Athor:
     @TheBarzani
 """
 
 import threading
-from flask import Flask
+from typing import Any, Dict, List, Optional
+from flask import Flask, jsonify
 from pymongo import MongoClient
+from pymongo.errors import PyMongoError
 from flask_restx import Api
 from order_service.app.routes import api as order_api
-from order_service.app.events import consume_user_update_events
+from order_service.app.events import (QUEUE_NAME, add_events_listener,
+                                      add_orders_listener, consume_user_update_events,
+                                      consume_user_update_events_batched)
+from order_service.app.consumer_pool import run_consumer_pool
+from order_service.app.user_snapshots import (SETTINGS_COLLECTION, USER_SNAPSHOTS_COLLECTION,
+                                              UserSnapshotStore, ensure_user_fields_mode)
+from shared import metrics
+from shared.config.mongodb_indexes import ensure_indexes
+from shared.compression import init_compression
+from shared.change_markers import add_listener, bump_markers
+from shared.result_cache import ResultCache
+from shared.user_events import event_changes
 
 def start_event_consumer(app: Flask) -> None:
     """
     Starts the event consumer for the given Flask application.
     This function initializes the event consumer within the application context
-    and begins consuming user update events.
+    and begins consuming user update events, one by one, in micro-batches or with
+    a pool of workers depending on `EVENT_CONSUMER_MODE`.
     Args:
         app (Flask): The Flask application instance.
     Returns:
@@ -32,15 +54,131 @@ def start_event_consumer(app: Flask) -> None:
 
     # print("Starting event consumer...")
     with app.app_context():
-        consume_user_update_events()
+        if app.config['EVENT_CONSUMER_MODE'] == 'pool':
+            run_consumer_pool(app.orders_collection, QUEUE_NAME, app.config)
+        elif app.config['EVENT_CONSUMER_MODE'] == 'batch':
+            consume_user_update_events_batched()
+        else:
+            consume_user_update_events()
+
+def init_mongo(app: Flask) -> None:
+    """
+    Initializes the MongoDB client of the application, attaches the database and
+    the orders collection to it and creates the missing indexes of the orders collection.
+    Args:
+        app (Flask): The Flask application instance.
+    Returns:
+        None
+    """
+
+    # print ("Connecting to MongoDB... ", app.config['MONGO_URI'])
+    mongo_client = MongoClient(app.config['MONGO_URI'])
+    app.mongo_client = mongo_client
+    app.db = mongo_client[app.config['DATABASE_NAME']]
+    app.orders_collection = app.db['orders']
+
+    # Create the indexes missing from the spec; setup_mongodb.py creates them too,
+    # so a database that is not reachable yet does not prevent the service from starting
+    try:
+        ensure_indexes(app.db, ['orders'])
+    except PyMongoError as e:
+        print(f"Could not ensure the orders indexes: {e}", flush=True)
+
+def init_user_snapshots(app: Flask) -> None:
+    """
+    Initializes the store of user snapshots as `app.user_snapshots` and has it record
+    every user update event applied by the consumer of this process. Its statistics are
+    served under `user_snapshots` on `/metrics`. In reference mode, orders resolve their
+    user fields from the snapshots, so recording a snapshot also bumps the global change
+    marker of the orders and drops the cached orders of the user.
+    The API and the consumer must run in the same mode, so a process configured with
+    another mode than the one recorded in the database fails to start.
+    Args:
+        app (Flask): The Flask application instance.
+    Returns:
+        None
+    Raises:
+        RuntimeError: If `ORDERS_USER_FIELDS_MODE` differs from the deployment's mode.
+    """
+    # Like the indexes, the check is skipped if the database is not reachable yet
+    try:
+        ensure_user_fields_mode(app.db[SETTINGS_COLLECTION],
+                                app.config['ORDERS_USER_FIELDS_MODE'])
+    except PyMongoError as e:
+        print(f"Could not check the user fields mode: {e}", flush=True)
+
+    app.user_snapshots = UserSnapshotStore(app.db[USER_SNAPSHOTS_COLLECTION],
+                                           app.config['USER_SNAPSHOT_CACHE_SIZE'],
+                                           app.config['USER_SNAPSHOT_TTL'])
+    add_events_listener(app.user_snapshots.record)
+    metrics.register('user_snapshots', app.user_snapshots.stats)
+    if app.config['ORDERS_USER_FIELDS_MODE'] != 'reference':
+        return
+
+    def resolved_orders_changed(events: List[Dict[str, Any]]) -> None:
+        user_ids = {event['userId'] for event in events if event_changes(event)}
+        if not user_ids:
+            return
+        bump_markers(app.orders_collection)
+        order_cache = getattr(app, 'order_cache', None)
+        for user_id in user_ids if order_cache is not None else ():
+            order_cache.invalidate(user_id)
+
+    add_events_listener(resolved_orders_changed)
+
+def init_order_caches(app: Flask) -> None:
+    """
+    Initializes the cache of order listings as `app.orders_cache` and the cache of single
+    orders as `app.order_cache`, None when disabled. Cached pages of a status are dropped
+    whenever this process bumps the change marker of the status, and cached orders of a
+    user whenever the event consumer of this process writes the user's orders. Their
+    statistics are served under `orders_cache` and `order_cache` on `/metrics`.
+    Args:
+        app (Flask): The Flask application instance.
+    Returns:
+        None
+    """
+    app.order_cache = None
+    if app.config['ORDER_CACHE_MAX_BYTES'] > 0:
+        order_cache = ResultCache(app.config['ORDER_CACHE_MAX_ENTRIES'],
+                                  app.config['ORDER_CACHE_MAX_BYTES'],
+                                  app.config['ORDER_CACHE_TTL'])
+
+        def drop_orders_of_users(user_ids: List[str]) -> None:
+            for user_id in user_ids:
+                order_cache.invalidate(user_id)
+
+        add_orders_listener(drop_orders_of_users)
+        metrics.register('order_cache', order_cache.stats)
+        app.order_cache = order_cache
+
+    app.orders_cache = None
+    if app.config['ORDERS_CACHE_MAX_ENTRIES'] <= 0:
+        return
+    cache = ResultCache(app.config['ORDERS_CACHE_MAX_ENTRIES'],
+                        app.config['ORDERS_CACHE_MAX_BYTES'], app.config['ORDERS_CACHE_TTL'],
+                        app.config['ORDERS_CACHE_DIR'])
+
+    def invalidate(collection_name: str, statuses: Optional[List[str]]) -> None:
+        if collection_name != app.orders_collection.name:
+            return
+        if statuses is None:
+            cache.invalidate()
+        for status in statuses or []:
+            cache.invalidate(status)
+
+    add_listener(invalidate)
+    metrics.register('orders_cache', cache.stats)
+    app.orders_cache = cache
 
 def create_app() -> Flask:
     """
     Create and configure the Flask application.
     This function initializes the Flask application, configures it using the 
     settings from 'config.py', sets up the API namespace for order-related 
-    endpoints, and initializes the MongoDB client. It also starts the event 
-    consumer in a separate thread.
+    endpoints, initializes the MongoDB client and compresses large responses with
+    gzip or brotli. It also serves runtime statistics on `/metrics` and, if
+    `EMBEDDED_EVENT_CONSUMER` is set, starts the event consumer in a separate thread.
     Returns:
         Flask: The configured Flask application instance.
     """
@@ -50,14 +188,39 @@ def create_app() -> Flask:
     api = Api(app)
     api.add_namespace(order_api, path='/orders')
 
-    # Initialize MongoDB client
-    # print ("Connecting to MongoDB... ", app.config['MONGO_URI'])
-    mongo_client = MongoClient(app.config['MONGO_URI'])
-    app.mongo_client = mongo_client
-    app.db = mongo_client[app.config['DATABASE_NAME']]
-    app.orders_collection = app.db['orders']
+    # Initialize MongoDB client and the order caches
+    init_mongo(app)
+    init_user_snapshots(app)
+    init_order_caches(app)
+
+    # Compress large responses, e.g. order listings
+    if app.config['RESPONSE_COMPRESSION_MIN_SIZE'] > 0:
+        init_compression(app, app.config['RESPONSE_COMPRESSION_MIN_SIZE'],
+                         app.config['RESPONSE_COMPRESSION_LEVEL'])
+
+    @app.route('/metrics')
+    def get_metrics() -> Any:
+        return jsonify(metrics.snapshot())
 
-    # Start the event consumer in a separate thread
-    event_consumer_thread = threading.Thread(target=start_event_consumer, args=(app,), daemon=True)
-    event_consumer_thread.start()
+    # Start the event consumer in a separate thread, unless it runs as its own process
+    if app.config['EMBEDDED_EVENT_CONSUMER']:
+        event_consumer_thread = threading.Thread(target=start_event_consumer, args=(app,),
+                                                 daemon=True)
+        event_consumer_thread.start()
+    return app
+
+def create_consumer_app() -> Flask:
+    """
+    Create the Flask application used by the standalone event consumer.
+    The application is configured like the one from `create_app` and has the same
+    MongoDB client, but registers no API routes and starts no thread; it only
+    provides the application context the consumer runs in.
+    Returns:
+        Flask: The configured Flask application instance.
+    """
+
+    app = Flask(__name__)
+    app.config.from_object('order_service.app.config.Config')
+    init_mongo(app)
+    init_user_snapshots(app)
     return app
@@ -0,0 +1,153 @@
+"""_summary_
+This module creates orders in bulk for `POST /orders/batch`. Orders are validated one by
+one with the rules of `POST /orders/`: user fields an order lacks are filled in from the
+snapshot of its user, and the order records the snapshot's versions. In reference mode,
+user fields equal to the snapshot are not stored, like for `POST /orders/`. Payloads are handled
+in chunks of at most `ORDERS_BATCH_CHUNK_SIZE`: the snapshots of a chunk are read with a
+single lookup, and its valid orders are inserted with one unordered `insert_many`, so a
+burst of orders costs a few round trips per chunk instead of one per order, and an order
+rejected by the database does not prevent the rest of its chunk from being inserted.
+Payloads are consumed lazily, so an NDJSON upload is inserted while it is being read. The
+change markers of the statuses of the created orders are bumped once the batch is
+inserted.
+
+Functions:
+    iter_ndjson(lines: Iterable[bytes]) -> Iterator[Any]:
+        Decodes an NDJSON stream into order payloads.
+    create_orders(orders_collection: Collection, payloads: Iterable[Any], chunk_size: int,
+                  max_items: int, user_snapshots: Optional[UserSnapshotStore],
+                  reference: bool) -> Dict[str, Any]:
+        Validates and inserts a batch of orders and reports the outcome of every order.
+Author:
+    @TheBarzani
+"""
+
+import json
+import uuid
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError, PyMongoError
+from order_service.app.validation import validate_new_order
+from order_service.app.user_snapshots import (UserSnapshotStore, fill_user_fields,
+                                              order_versions, snapshot_user_id,
+                                              without_user_fields)
+from shared.change_markers import bump_markers
+
+def iter_ndjson(lines: Iterable[bytes]) -> Iterator[Any]:
+    """
+    Decodes an NDJSON stream, one order per line. Blank lines are skipped, and a line
+    that is not valid JSON yields the `ValueError` raised while decoding it, so that it
+    is reported as an invalid order instead of failing the whole batch.
+    Args:
+        lines (Iterable[bytes]): The lines of the request body.
+    Returns:
+        Iterator[Any]: The decoded payloads.
+    """
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield ValueError(f'Invalid JSON: {e}')
+
+def _insert_chunk(orders_collection: Collection,
+                  chunk: List[Tuple[Dict[str, Any], Dict[str, Any]]]) -> None:
+    """
+    Inserts a chunk of (result, order) pairs with one unordered `insert_many`, and marks
+    the results of the orders the database rejected as failed.
+    """
+    try:
+        orders_collection.insert_many([order for _, order in chunk], ordered=False)
+    except BulkWriteError as e:
+        for error in e.details['writeErrors']:
+            result = chunk[error['index']][0]
+            result.update({'status': 'failed', 'orderId': None, 'error': error['errmsg']})
+    except PyMongoError as e:
+        for result, _ in chunk:
+            result.update({'status': 'failed', 'orderId': None, 'error': str(e)})
+
+def _create_chunk(orders_collection: Collection, pending: List[Tuple[Dict[str, Any], Any]],
+                  user_snapshots: Optional[UserSnapshotStore], reference: bool) -> Set[str]:
+    """
+    Fills in, validates and inserts a chunk of (result, payload) pairs, reading the
+    snapshots of the users of the chunk with one `get_many`. Returns the statuses of the
+    orders inserted.
+    """
+    snapshots: Dict[str, Dict[str, Any]] = {}
+    user_ids = [snapshot_user_id(payload, reference) for _, payload in pending]
+    if user_snapshots is not None and any(user_ids):
+        snapshots = user_snapshots.get_many(user_id for user_id in user_ids if user_id)
+
+    chunk: List[Tuple[Dict[str, Any], Dict[str, Any]]] = []
+    statuses: Set[str] = set()
+    for (result, payload), user_id in zip(pending, user_ids):
+        snapshot = snapshots.get(user_id) if user_id else None
+        fill_user_fields(payload, snapshot)
+        try:
+            validate_new_order(payload)
+        except ValueError as e:
+            result['error'] = str(e)
+            continue
+        if snapshot:
+            # Later user update events then apply to the order like to any other
+            payload.update(order_versions(snapshot))
+
+        # Generate a unique orderId
+        payload['orderId'] = str(uuid.uuid1())
+        result.update({'status': 'created', 'orderId': payload['orderId']})
+        chunk.append((result, without_user_fields(payload, snapshot) if reference
+                       else payload))
+        statuses.add(payload['orderStatus'])
+    if chunk:
+        _insert_chunk(orders_collection, chunk)
+    return statuses
+
+def create_orders(orders_collection: Collection, payloads: Iterable[Any], chunk_size: int,
+                  max_items: int, user_snapshots: Optional[UserSnapshotStore] = None,
+                  reference: bool = False) -> Dict[str, Any]:
+    """
+    Validates and inserts a batch of orders.
+    Args:
+        orders_collection (Collection): The orders collection.
+        payloads (Iterable[Any]): The decoded orders, or the errors raised decoding them.
+        chunk_size (int): The maximum number of orders inserted per `insert_many`.
+        max_items (int): The maximum number of orders accepted in one batch. Orders past
+                         the limit are reported as invalid.
+        user_snapshots (Optional[UserSnapshotStore]): The store the user fields orders
+                                                      lack are filled in from, None to
+                                                      require them.
+        reference (bool): True in reference mode, where user fields equal to the
+                          snapshot are resolved at read time instead of stored.
+    Returns:
+        Dict[str, Any]: The number of orders created and rejected, and the result of every
+                        order in request order: its index, its status ('created', 'invalid'
+                        or 'failed'), its orderId if it was created and the error otherwise.
+    """
+    results: List[Dict[str, Any]] = []
+    pending: List[Tuple[Dict[str, Any], Any]] = []
+    statuses: Set[str] = set()
+    for index, payload in enumerate(payloads):
+        result: Dict[str, Any] = {'index': index, 'status': 'invalid', 'orderId': None,
+                                  'error': None}
+        results.append(result)
+        if index >= max_items:
+            result['error'] = f'A batch is limited to {max_items} orders'
+            continue
+        if isinstance(payload, ValueError):
+            result['error'] = str(payload)
+            continue
+        pending.append((result, payload))
+        if len(pending) >= chunk_size:
+            statuses |= _create_chunk(orders_collection, pending, user_snapshots,
+                                      reference)
+            pending = []
+    if pending:
+        statuses |= _create_chunk(orders_collection, pending, user_snapshots, reference)
+
+    created = sum(result['status'] == 'created' for result in results)
+    if created:
+        # Bumped after the chunks rather than with them in a transaction: a duplicate in a
+        # chunk would abort the transaction and take the valid orders of the chunk with it
+        bump_markers(orders_collection, statuses)
+    return {'created': created, 'rejected': len(results) - created, 'results': results}
@@ -22,7 +22,99 @@ class Config:
         MONGO_URI (str): The URI for connecting to the MongoDB database.
         DATABASE_NAME (str): The name of the MongoDB database to use.
         RABBITMQ_QUEUE_NAME (str): The name of the RabbitMQ queue to consume events from.
+        EMBEDDED_EVENT_CONSUMER (bool): Whether every web worker runs the event consumer in
+                                        a thread. Disable it when the consumer runs as its
+                                        own process (`python -m order_service.consumer`).
+        EVENT_CONSUMER_MODE (str): 'single' to apply events one by one, 'batch' to apply
+                                   them in micro-batches, or 'pool' to apply them with
+                                   a pool of partitioned workers.
+        RABBITMQ_PREFETCH_COUNT (int): Maximum number of unacknowledged messages delivered
+                                       to the consumer in batch mode.
+        EVENT_BATCH_SIZE (int): Maximum number of events applied per batch.
+        EVENT_BATCH_TIMEOUT_MS (int): Maximum time to wait for a batch to fill up.
+        EVENT_CONSUMER_WORKERS (int): Number of worker threads in pool mode.
+        EVENT_CONSUMER_PARTITIONS (int): Number of partitions userIds are hashed into.
+        EVENT_CONSUMER_QUEUE_DEPTH (int): Maximum number of events queued per worker.
+        CONSUMER_STATS_INTERVAL (int): Seconds between two statistics reports of the
+                                       standalone consumer, 0 to disable them.
+        ORDERS_PAGE_SIZE_MAX (int): Largest `limit` accepted when listing orders.
+        ORDERS_STREAM_BATCH_SIZE (int): Number of orders fetched per database round trip
+                                        when streaming orders.
+        ORDERS_BATCH_CHUNK_SIZE (int): Maximum number of orders inserted per `insert_many`
+                                       by `POST /orders/batch`.
+        ORDERS_BATCH_MAX_ITEMS (int): Maximum number of orders accepted in one batch, and
+                                      of order IDs accepted by `PUT /orders/status`.
+        ORDERS_ENFORCE_TRANSITIONS (bool): Whether `PUT /orders/status` only moves orders
+                                           along under process -> shipping -> delivered
+                                           when the request does not say.
+        ORDERS_FAST_SERIALIZATION (bool): Whether `GET /orders/` serializes orders with
+                                          the compiled plans of `shared.serialization`
+                                          instead of `marshal`.
+        RESPONSE_COMPRESSION_MIN_SIZE (int): Size in bytes from which responses are
+                                             compressed, 0 to disable compression.
+        RESPONSE_COMPRESSION_LEVEL (int): Compression level, 1 to 9 for gzip and up to
+                                          11 for brotli.
+        ORDERS_CACHE_MAX_ENTRIES (int): Maximum number of order listing pages cached in
+                                        memory, and in `ORDERS_CACHE_DIR`, 0 to disable
+                                        the cache.
+        ORDERS_CACHE_MAX_BYTES (int): Maximum total size of the cached pages, in memory
+                                      and in `ORDERS_CACHE_DIR`.
+        ORDERS_CACHE_TTL (float): Seconds after which a cached page expires.
+        ORDERS_CACHE_DIR (str): Directory where cached pages are shared by the workers of
+                                a host, e.g. under /dev/shm. Empty to keep them per worker.
+        ORDER_CACHE_MAX_BYTES (int): Maximum total size of the orders cached by
+                                     `GET /orders/<id>`, 0 to disable the cache.
+        ORDER_CACHE_MAX_ENTRIES (int): Maximum number of orders cached.
+        ORDER_CACHE_TTL (float): Seconds after which a cached order expires. Writes made
+                                 by other processes (workers, standalone consumer) are
+                                 seen at the latest after this delay.
+        USER_SNAPSHOT_CACHE_SIZE (int): Maximum number of user snapshots kept in memory
+                                        to fill in the user fields of new orders.
+        USER_SNAPSHOT_TTL (float): Seconds a user snapshot is served from memory to fill
+                                   in new orders before being read again from MongoDB.
+        ORDERS_USER_FIELDS_MODE (str): How orders hold the user fields: 'embedded' (each
+                                       order stores them and user updates rewrite every
+                                       order of the user) or 'reference' (orders of users
+                                       with a snapshot resolve them from the snapshot at
+                                       read time, until they are delivered). Rendered
+                                       orders read the snapshots from MongoDB, so user
+                                       updates consumed by another process are seen by
+                                       listings as soon as the consumer bumps the change
+                                       marker, and by GET /orders/<id> at the latest
+                                       after ORDER_CACHE_TTL. The order service and the
+                                       consumer must use the same mode: a process started
+                                       with another mode than the one recorded in the
+                                       `order_settings` collection fails.
     """
     MONGO_URI = os.getenv("MONGO_URI")
     DATABASE_NAME = os.getenv("DATABASE_NAME")
     RABBITMQ_QUEUE_NAME = os.getenv("RABBITMQ_QUEUE_NAME")
+    EMBEDDED_EVENT_CONSUMER = os.getenv("EMBEDDED_EVENT_CONSUMER", "true").lower() == "true"
+    EVENT_CONSUMER_MODE = os.getenv("EVENT_CONSUMER_MODE", "single")
+    RABBITMQ_PREFETCH_COUNT = int(os.getenv("RABBITMQ_PREFETCH_COUNT", "200"))
+    EVENT_BATCH_SIZE = int(os.getenv("EVENT_BATCH_SIZE", "100"))
+    EVENT_BATCH_TIMEOUT_MS = int(os.getenv("EVENT_BATCH_TIMEOUT_MS", "50"))
+    EVENT_CONSUMER_WORKERS = int(os.getenv("EVENT_CONSUMER_WORKERS", "4"))
+    EVENT_CONSUMER_PARTITIONS = int(os.getenv("EVENT_CONSUMER_PARTITIONS", "64"))
+    EVENT_CONSUMER_QUEUE_DEPTH = int(os.getenv("EVENT_CONSUMER_QUEUE_DEPTH", "100"))
+    CONSUMER_STATS_INTERVAL = int(os.getenv("CONSUMER_STATS_INTERVAL", "60"))
+    ORDERS_PAGE_SIZE_MAX = int(os.getenv("ORDERS_PAGE_SIZE_MAX", "1000"))
+    ORDERS_STREAM_BATCH_SIZE = int(os.getenv("ORDERS_STREAM_BATCH_SIZE", "500"))
+    ORDERS_BATCH_CHUNK_SIZE = int(os.getenv("ORDERS_BATCH_CHUNK_SIZE", "500"))
+    ORDERS_BATCH_MAX_ITEMS = int(os.getenv("ORDERS_BATCH_MAX_ITEMS", "10000"))
+    ORDERS_ENFORCE_TRANSITIONS = os.getenv("ORDERS_ENFORCE_TRANSITIONS",
+                                           "false").lower() == "true"
+    ORDERS_FAST_SERIALIZATION = os.getenv("ORDERS_FAST_SERIALIZATION",
+                                          "false").lower() == "true"
+    RESPONSE_COMPRESSION_MIN_SIZE = int(os.getenv("RESPONSE_COMPRESSION_MIN_SIZE", "1024"))
+    RESPONSE_COMPRESSION_LEVEL = int(os.getenv("RESPONSE_COMPRESSION_LEVEL", "6"))
+    ORDERS_CACHE_MAX_ENTRIES = int(os.getenv("ORDERS_CACHE_MAX_ENTRIES", "256"))
+    ORDERS_CACHE_MAX_BYTES = int(os.getenv("ORDERS_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    ORDERS_CACHE_TTL = float(os.getenv("ORDERS_CACHE_TTL", "30"))
+    ORDERS_CACHE_DIR = os.getenv("ORDERS_CACHE_DIR", "")
+    ORDER_CACHE_MAX_BYTES = int(os.getenv("ORDER_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+    ORDER_CACHE_MAX_ENTRIES = int(os.getenv("ORDER_CACHE_MAX_ENTRIES", "10000"))
+    ORDER_CACHE_TTL = float(os.getenv("ORDER_CACHE_TTL", "5"))
+    USER_SNAPSHOT_CACHE_SIZE = int(os.getenv("USER_SNAPSHOT_CACHE_SIZE", "10000"))
+    USER_SNAPSHOT_TTL = float(os.getenv("USER_SNAPSHOT_TTL", "30"))
+    ORDERS_USER_FIELDS_MODE = os.getenv("ORDERS_USER_FIELDS_MODE", "embedded")
@@ -0,0 +1,202 @@
+"""_summary_
+This module provides a pool of consumer workers for user update events, so that events
+of different users are applied in parallel while the events of any single user are still
+applied in the order they were published.
+
+A dispatcher reads messages from RabbitMQ on the connection's thread and routes each
+event to a partition derived from a stable hash of its `userId`. Partitions are assigned
+to workers round-robin, and each worker drains its own bounded queue in order, so two
+events of the same user always go through the same queue. Workers are threads: pymongo
+releases the GIL while waiting on the database, so the pool keeps several Mongo round
+trips in flight at once. Completed messages are handed back to the dispatcher, which is
+the only thread allowed to touch the pika channel, and acknowledged there. Events that
+fail are handed to `shared.config.rabbitmq_retry` by the dispatcher before being
+acknowledged, so a poison message is retried later instead of being redelivered at once,
+and are requeued instead if they cannot be republished.
+
+Classes:
+    ConsumerPool: Dispatches user update events to partitioned worker threads.
+Functions:
+    run_consumer_pool(orders_collection: Collection, queue_name: str, config: Dict[str, Any])
+        -> None:
+        Creates a consumer pool from the application configuration and runs it.
+Author:
+    @TheBarzani
+"""
+
+import queue
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Tuple
+from pymongo.collection import Collection
+from shared import metrics
+from shared.config.rabbitmq_retry import create_retry_channel, settle_failed
+from order_service.app.events import (apply_user_update_batch_isolated,
+                                      decode_user_update_event)
+
+# A unit of work: (delivery tag, decoded event)
+Delivery = Tuple[int, Dict[str, Any]]
+
+class ConsumerPool:
+    """
+    Consumes user update events with several worker threads.
+    Attributes:
+        orders_collection (Collection): The orders collection.
+        queue_name (str): The RabbitMQ queue to consume from.
+        workers (int): The number of worker threads.
+        partitions (int): The number of partitions `userId`s are hashed into.
+        queue_depth (int): The maximum number of events waiting in a worker's queue.
+        batch_size (int): The maximum number of queued events a worker applies at once.
+    """
+
+    def __init__(self, orders_collection: Collection, queue_name: str, workers: int,
+                 partitions: int, queue_depth: int, batch_size: int) -> None:
+        self.orders_collection = orders_collection
+        self.queue_name = queue_name
+        self.workers = workers
+        self.partitions = max(partitions, workers)
+        self.queue_depth = queue_depth
+        self.batch_size = batch_size
+        self._queues: List[queue.Queue] = [queue.Queue(maxsize=queue_depth)
+                                           for _ in range(workers)]
+        self._completed: queue.SimpleQueue = queue.SimpleQueue()
+        # Body and properties of every dispatched message, owned by the dispatcher thread
+        self._in_flight: Dict[int, Tuple[bytes, Any]] = {}
+        self._started = time.monotonic()
+        self._stats_lock = threading.Lock()
+        self._worker_stats: List[Dict[str, float]] = [
+            {'events': 0, 'batches': 0, 'failures': 0, 'busy_ms': 0.0}
+            for _ in range(workers)
+        ]
+
+    def partition_of(self, user_id: str) -> int:
+        """
+        Returns the partition of a user. crc32 is used instead of `hash` because string
+        hashes are randomized per process.
+        Args:
+            user_id (str): The ID of the user.
+        Returns:
+            int: The partition the user's events are routed to.
+        """
+        return zlib.crc32(user_id.encode('utf-8')) % self.partitions
+
+    def _work(self, index: int) -> None:
+        """
+        Worker loop: takes the next event, plus whatever else is already queued up to
+        `batch_size`, and applies them in order with one bulk write, falling back to one
+        write per event if the batch fails.
+        """
+        work_queue = self._queues[index]
+        while True:
+            deliveries: List[Delivery] = [work_queue.get()]
+            while len(deliveries) < self.batch_size:
+                try:
+                    deliveries.append(work_queue.get_nowait())
+                except queue.Empty:
+                    break
+            started = time.perf_counter()
+            errors = apply_user_update_batch_isolated(self.orders_collection,
+                                                      [event for _, event in deliveries])
+            busy_ms = (time.perf_counter() - started) * 1000
+            failures = sum(error is not None for error in errors)
+            with self._stats_lock:
+                stats = self._worker_stats[index]
+                stats['batches'] += 1
+                stats['busy_ms'] += busy_ms
+                stats['events'] += len(deliveries) - failures
+                stats['failures'] += failures
+            for (delivery_tag, _), error in zip(deliveries, errors):
+                self._completed.put((delivery_tag, error))
+
+    def _settle(self, channel: Any) -> None:
+        """
+        Acknowledges completed messages, after handing failed ones to the retry queues.
+        Runs on the dispatcher thread, which owns the channel.
+        """
+        while True:
+            try:
+                delivery_tag, error = self._completed.get_nowait()
+            except queue.Empty:
+                return
+            body, properties = self._in_flight.pop(delivery_tag)
+            if error is not None:
+                settle_failed(channel, self.queue_name, delivery_tag, body, properties, error)
+            else:
+                channel.basic_ack(delivery_tag=delivery_tag)
+
+    def _dispatch(self, channel: Any, connection: Any, delivery: Delivery) -> None:
+        """
+        Hands a delivery to the worker owning its partition. While that worker's queue is
+        full, the dispatcher keeps settling completions and servicing the connection so
+        that heartbeats are not missed.
+        """
+        worker = self.partition_of(delivery[1]['userId']) % self.workers
+        while True:
+            try:
+                self._queues[worker].put(delivery, timeout=0.05)
+                return
+            except queue.Full:
+                self._settle(channel)
+                connection.process_data_events(time_limit=0)
+
+    def run(self) -> None:
+        """
+        Starts the workers and dispatches messages to them until the connection closes.
+        The prefetch window covers every worker queue, so all workers can be kept busy.
+        """
+        for index in range(self.workers):
+            threading.Thread(target=self._work, args=(index,), daemon=True,
+                             name=f'order-consumer-{index}').start()
+
+        channel, connection = create_retry_channel(self.queue_name)
+        channel.basic_qos(prefetch_count=self.workers * self.queue_depth)
+        for method, properties, body in channel.consume(self.queue_name, auto_ack=False,
+                                                        inactivity_timeout=0.05):
+            if method is not None:
+                try:
+                    event = decode_user_update_event(body, properties)
+                except ValueError as e:
+                    settle_failed(channel, self.queue_name, method.delivery_tag, body,
+                                  properties, e, retryable=False)
+                else:
+                    self._in_flight[method.delivery_tag] = (body, properties)
+                    self._dispatch(channel, connection, (method.delivery_tag, event))
+            self._settle(channel)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns the statistics of every worker.
+        Returns:
+            Dict[str, Any]: Per worker, the events applied and failed, the number of batches,
+                            the current queue depth, the busy time and the throughput since
+                            the pool started.
+        """
+        uptime = time.monotonic() - self._started
+        with self._stats_lock:
+            workers = [dict(stats) for stats in self._worker_stats]
+        for index, stats in enumerate(workers):
+            stats['queue_depth'] = self._queues[index].qsize()
+            stats['events_per_second'] = stats['events'] / uptime if uptime else 0.0
+        return {'workers': workers, 'partitions': self.partitions,
+                'queue_capacity': self.queue_depth}
+
+def run_consumer_pool(orders_collection: Collection, queue_name: str,
+                      config: Dict[str, Any]) -> None:
+    """
+    Creates a consumer pool from the application configuration, registers its statistics
+    under `order_consumer_pool` and runs it.
+    Args:
+        orders_collection (Collection): The orders collection.
+        queue_name (str): The RabbitMQ queue to consume from.
+        config (Dict[str, Any]): The application configuration.
+    Returns:
+        None
+    """
+    pool = ConsumerPool(orders_collection, queue_name,
+                        workers=config['EVENT_CONSUMER_WORKERS'],
+                        partitions=config['EVENT_CONSUMER_PARTITIONS'],
+                        queue_depth=config['EVENT_CONSUMER_QUEUE_DEPTH'],
+                        batch_size=config['EVENT_BATCH_SIZE'])
+    metrics.register('order_consumer_pool', pool.stats)
+    pool.run()
@@ -1,20 +1,304 @@
 """_summary_
 Consumes user update events from a RabbitMQ queue and updates the corresponding 
-user orders in the database.
+user orders in the database. Each event is applied as a single server-side
+`update_many`, and the number of orders touched and the write latency are reported
+under `order_consumer` on `/metrics`.
+
+Events carry the user's `version`, and may be deltas carrying only the fields the update
+changed (`changedFields`). Orders remember the version each user field was last written
+from in `userFieldVersions` (and the newest one in `userVersion`), and an event only
+writes the fields it is newer for, so redelivered or out-of-order events are skipped by
+the database instead of rolling orders back to stale emails or addresses, and an older
+delta arriving late still applies the fields no newer event wrote. In reference mode
+(`ORDERS_USER_FIELDS_MODE=reference`), orders resolve the user fields from the user
+snapshots at read time, so only orders still embedding them are written. Writes that
+modify orders bump the global change marker of the orders collection, since the orders
+of a user may have any status, in the same transaction where the deployment supports
+them (`shared.change_markers.write_and_bump`), and are reported to the listeners registered with
+`add_orders_listener`, such as the cache of single orders, with the IDs of the users
+whose orders were written. Every applied event, whether it matched orders or not, is
+also passed to the listeners registered with `add_events_listener`, such as the store of
+user snapshots.
+
+In batch mode (`EVENT_CONSUMER_MODE=batch`), the consumer prefetches messages, gathers
+up to `EVENT_BATCH_SIZE` of them or waits at most `EVENT_BATCH_TIMEOUT_MS`, collapses the
+events of each user into one update, writes the whole batch with one `bulk_write` and
+acknowledges it with a single `basic_ack(multiple=True)`.
+
+Events that cannot be applied are moved off the queue instead of killing the consumer:
+undecodable messages are parked straight away, and failed writes are retried with
+exponential backoff through `shared.config.rabbitmq_retry` before being parked. If the
+broker refuses such a republish, the delivery is requeued rather than acknowledged.
 
 Author:
     @TheBarzani
 """
 
 import os
-import json
-from typing import Any, Dict, List, Optional
+import time
+import threading
+from typing import Any, Callable, Dict, List, Optional, Union
 from flask import current_app
+from pymongo import UpdateMany
+from pymongo.collection import Collection
 from dotenv import load_dotenv
-from shared.config.rabbitmq_config import create_channel
+from shared import metrics
+from shared.config.rabbitmq_retry import create_retry_channel, settle_failed
+from shared.change_markers import write_and_bump
+from shared.event_codec import decode_event
+from shared.user_events import (build_versioned_filter, build_versioned_merge,
+                                collapse_user_events, event_changes)
 
 load_dotenv()
 QUEUE_NAME = os.getenv('RABBITMQ_QUEUE_NAME')
+USER_FIELDS_MODE = os.getenv('ORDERS_USER_FIELDS_MODE', 'embedded')
+
+_stats: Dict[str, float] = {
+    'events': 0,
+    'orders_matched': 0,
+    'orders_modified': 0,
+    'write_ms_total': 0.0,
+    'write_ms_max': 0.0
+}
+_stats_lock = threading.Lock()
+_orders_listeners: List[Callable[[List[str]], None]] = []
+_events_listeners: List[Callable[[List[Dict[str, Any]]], None]] = []
+
+def add_orders_listener(listener: Callable[[List[str]], None]) -> None:
+    """
+    Registers a function called, after every write of user update events that modified
+    orders, with the IDs of the users whose orders were written.
+    Args:
+        listener (Callable[[List[str]], None]): The function.
+    Returns:
+        None
+    """
+    _orders_listeners.append(listener)
+
+def add_events_listener(listener: Callable[[List[Dict[str, Any]]], None]) -> None:
+    """
+    Registers a function called with every batch of events once they have been applied,
+    in delivery order. An exception raised by the function fails the events, which are
+    then retried.
+    Args:
+        listener (Callable[[List[Dict[str, Any]]], None]): The function.
+    Returns:
+        None
+    """
+    _events_listeners.append(listener)
+
+def _write_orders(orders_collection: Collection, write: Callable[[Any], Any],
+                  user_ids: List[str]) -> Any:
+    """
+    Runs a write of the orders of some users, bumping the global change marker of the
+    orders in the same transaction where possible, and notifies the listeners if orders
+    were modified.
+    """
+    result = write_and_bump(orders_collection, write,
+                            lambda result: None if result.modified_count else [])
+    if result.modified_count:
+        for listener in _orders_listeners:
+            listener(user_ids)
+    return result
+
+def consumer_stats() -> Dict[str, Any]:
+    """
+    Returns the statistics of the user update consumer.
+    Returns:
+        Dict[str, Any]: The number of events applied, the orders they matched and
+                        modified, and the total, maximum and average write latency.
+    """
+    with _stats_lock:
+        stats: Dict[str, Any] = dict(_stats)
+    stats['write_ms_avg'] = stats['write_ms_total'] / stats['events'] if stats['events'] else 0.0
+    return stats
+
+metrics.register('order_consumer', consumer_stats)
+
+def record_write(events: int, matched: int, modified: int, elapsed_ms: float) -> None:
+    """
+    Adds the outcome of a write to the consumer statistics.
+    Args:
+        events (int): The number of events applied by the write.
+        matched (int): The number of orders matched.
+        modified (int): The number of orders modified.
+        elapsed_ms (float): The duration of the write in milliseconds.
+    Returns:
+        None
+    """
+    with _stats_lock:
+        _stats['events'] += events
+        _stats['orders_matched'] += matched
+        _stats['orders_modified'] += modified
+        _stats['write_ms_total'] += elapsed_ms
+        _stats['write_ms_max'] = max(_stats['write_ms_max'], elapsed_ms)
+
+def build_order_update(event: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Builds the fields to set on a user's orders from a user update event: the fields
+    listed in its `changedFields`, or every non-empty field for full events.
+    Args:
+        event (Dict[str, Any]): The decoded user update event.
+    Returns:
+        Dict[str, Any]: The order fields to `$set`, empty if the event carries no change.
+    """
+    return event_changes(event)
+
+def build_order_filter(user_id: str, versions: Optional[Dict[str, int]]) -> Dict[str, Any]:
+    """
+    Builds the filter selecting the orders a user update event applies to. When the event
+    is versioned, orders that already hold that version or a newer one of every field the
+    event carries are excluded. Events without a version (from producers predating
+    versioning) apply unconditionally.
+    In reference mode, only orders still holding their user fields are selected, and
+    delivered orders keep the fields they were delivered with.
+    Args:
+        user_id (str): The ID of the user.
+        versions (Optional[Dict[str, int]]): The version of each field carried by the
+                                             event, None if it is not versioned.
+    Returns:
+        Dict[str, Any]: The filter for `update_many`.
+    """
+    order_filter: Dict[str, Any] = {'userId': user_id}
+    if versions:
+        order_filter.update(build_versioned_filter(versions, 'userVersion',
+                                                   'userFieldVersions'))
+    if USER_FIELDS_MODE == 'reference':
+        order_filter['userEmails'] = {'$exists': True}
+        order_filter['orderStatus'] = {'$ne': 'delivered'}
+    return order_filter
+
+def build_versioned_update(update_fields: Dict[str, Any], versions: Optional[Dict[str, int]]
+                           ) -> Union[Dict[str, Any], List[Dict[str, Any]]]:
+    """
+    Builds the update writing the given fields. Versioned fields are merged with a
+    pipeline that only writes the fields the order holds an older version of, and
+    records their versions.
+    Args:
+        update_fields (Dict[str, Any]): The order fields to set.
+        versions (Optional[Dict[str, int]]): The version of each field, None if the event
+                                             is not versioned.
+    Returns:
+        Union[Dict[str, Any], List[Dict[str, Any]]]: The update document or pipeline for
+                                                     `update_many`.
+    """
+    if versions is None:
+        return {'$set': update_fields}
+    return build_versioned_merge(update_fields, versions, 'userVersion', 'userFieldVersions')
+
+def apply_user_update_event(orders_collection: Collection,
+                            event: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Applies a user update event to all orders of the user with one `update_many`, so
+    the orders are neither loaded nor updated one round trip at a time. Only the fields
+    the event carries are written, and orders already holding the event's version or a
+    newer one of those fields are not matched.
+    Args:
+        orders_collection (Collection): The orders collection.
+        event (Dict[str, Any]): The decoded user update event.
+    Returns:
+        Dict[str, Any]: The number of orders matched and modified, and the write
+                        duration in milliseconds.
+    """
+    user_id: str = event['userId']
+    version: Optional[int] = event.get('version')
+    update_fields = build_order_update(event)
+    if not update_fields:
+        return {'matched': 0, 'modified': 0, 'elapsed_ms': 0.0}
+    versions = ({field: version for field in update_fields} if version is not None
+                else None)
+
+    started = time.perf_counter()
+    result = _write_orders(
+        orders_collection,
+        lambda session: orders_collection.update_many(
+            build_order_filter(user_id, versions),
+            build_versioned_update(update_fields, versions), session=session),
+        [user_id])
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    for listener in _events_listeners:
+        listener([event])
+    # Counted in the metrics rather than printed, to keep stdout off the hot path
+    record_write(1, result.matched_count, result.modified_count, elapsed_ms)
+    return {'matched': result.matched_count, 'modified': result.modified_count,
+            'elapsed_ms': elapsed_ms}
+
+def apply_user_update_batch(orders_collection: Collection,
+                            events: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Applies a batch of user update events with one unordered `bulk_write`. Events of the
+    same user are collapsed first with `collapse_user_events`, so the newest value of
+    every field wins and each user costs a single versioned `UpdateMany`.
+    Args:
+        orders_collection (Collection): The orders collection.
+        events (List[Dict[str, Any]]): The decoded events, in delivery order.
+    Returns:
+        Dict[str, Any]: The number of users written, the number of orders matched and
+                        modified, and the write duration in milliseconds.
+    """
+    collapsed = collapse_user_events(events)
+    operations = [UpdateMany(build_order_filter(user_id, versions),
+                             build_versioned_update(update_fields, versions))
+                  for user_id, (update_fields, versions) in collapsed.items()]
+    if not operations:
+        return {'users': 0, 'matched': 0, 'modified': 0, 'elapsed_ms': 0.0}
+
+    started = time.perf_counter()
+    result = _write_orders(
+        orders_collection,
+        lambda session: orders_collection.bulk_write(operations, ordered=False,
+                                                     session=session),
+        list(collapsed))
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    for listener in _events_listeners:
+        listener(events)
+    record_write(len(events), result.matched_count, result.modified_count, elapsed_ms)
+    return {'users': len(operations), 'matched': result.matched_count,
+            'modified': result.modified_count, 'elapsed_ms': elapsed_ms}
+
+def decode_user_update_event(body: bytes, properties: Any = None) -> Dict[str, Any]:
+    """
+    Decodes a user update event with the codec named by its properties.
+    Args:
+        body (bytes): The message body.
+        properties (Any): The AMQP properties of the message, None for a JSON body.
+    Returns:
+        Dict[str, Any]: The decoded event.
+    Raises:
+        ValueError: If the body cannot be decoded or is not an object whose `userId` is a
+                    non-empty string. Retrying such a message cannot succeed.
+    """
+    event = decode_event(body, properties)
+    user_id = event.get('userId')
+    if not isinstance(user_id, str) or not user_id:
+        raise ValueError(f'user update event with an invalid userId: {user_id!r}')
+    return event
+
+def apply_user_update_batch_isolated(orders_collection: Collection,
+                                     events: List[Dict[str, Any]]) -> List[Optional[Exception]]:
+    """
+    Applies a batch of events with `apply_user_update_batch`. If the batch write fails,
+    the events are applied one at a time, so that a single failing event does not fail
+    the others with it.
+    Args:
+        orders_collection (Collection): The orders collection.
+        events (List[Dict[str, Any]]): The decoded events, in delivery order.
+    Returns:
+        List[Optional[Exception]]: For every event, the error it failed with, or None.
+    """
+    try:
+        apply_user_update_batch(orders_collection, events)
+        return [None] * len(events)
+    except Exception:  # pylint: disable=broad-except
+        pass
+    errors: List[Optional[Exception]] = []
+    for event in events:
+        try:
+            apply_user_update_event(orders_collection, event)
+            errors.append(None)
+        except Exception as e:  # pylint: disable=broad-except
+            errors.append(e)
+    return errors
 
 def consume_user_update_events() -> None:
     """
@@ -29,41 +313,91 @@ def consume_user_update_events() -> None:
     3. Defines a callback function to handle incoming messages.
         - Parses the event data from the message body.
         - Extracts the user ID, emails, and delivery address from the event.
-        - Finds all orders associated with the user ID in the database.
-        - Updates the orders with the new emails and delivery address if provided.
+        - Updates all orders associated with the user ID with the new emails and
+          delivery address, if provided, in a single `update_many`.
+        - If decoding or the update fails, republishes the message to a retry queue,
+          or parks it once it has used up its attempts or cannot be decoded.
         - Acknowledges the message to remove it from the queue.
     4. Starts consuming messages from the queue using the defined callback function.
     Note:
         This function assumes that the application context is available and that 
         the `current_app` object provides access to the application configuration 
         and the orders collection in the database.
-    Raises:
-        Any exceptions raised during the processing of messages will be propagated.
     """
 
-    channel, connection = create_channel(QUEUE_NAME)
+    channel, connection = create_retry_channel(QUEUE_NAME)
 
     def callback(ch: Any, method: Any, properties: Any, body: bytes) -> None:
-        event = json.loads(body)
-
-        # Extract the data
-        user_id: str = event['userId']
-        emails: Optional[List[str]] = event.get('userEmails')
-        delivery_address: Optional[str] = event.get('deliveryAddress')
+        try:
+            event = decode_user_update_event(body, properties)
+        except ValueError as e:
+            settle_failed(ch, QUEUE_NAME, method.delivery_tag, body, properties, e,
+                          retryable=False)
+            return
+        try:
+            apply_user_update_event(current_app.orders_collection, event)
+        except Exception as e:  # pylint: disable=broad-except
+            settle_failed(ch, QUEUE_NAME, method.delivery_tag, body, properties, e)
+            return
+        ch.basic_ack(delivery_tag=method.delivery_tag)
 
-        orders_collection = current_app.orders_collection
-        old_orders: List[Dict[str, Any]] = list(orders_collection.find({'userId': user_id}))
+    channel.basic_consume(queue=QUEUE_NAME, on_message_callback=callback, auto_ack=False)
+    channel.start_consuming()
 
-        update_fields: Dict[str, Any] = {}
-        if emails:
-            update_fields['userEmails'] = emails
-        if delivery_address:
-            update_fields['deliveryAddress'] = delivery_address
+def consume_user_update_events_batched() -> None:
+    """
+    Consumes user update events in micro-batches. Up to `RABBITMQ_PREFETCH_COUNT`
+    unacknowledged messages are delivered ahead of time; the consumer gathers up to
+    `EVENT_BATCH_SIZE` of them, or whatever arrived within `EVENT_BATCH_TIMEOUT_MS` of the
+    first one, applies them with `apply_user_update_batch` and acknowledges the whole batch
+    at once with `multiple=True`. If the write fails, the events are retried one by one
+    and only those that still fail go to the retry queues, before the batch is acknowledged.
+    A failed event that cannot be republished is requeued and left out of the acknowledgement.
+    Note:
+        This function assumes that the application context is available, like
+        `consume_user_update_events`.
+    """
 
-        for order in old_orders:
-            orders_collection.update_one({'orderId': order["orderId"]}, {'$set': update_fields})
+    batch_size: int = current_app.config['EVENT_BATCH_SIZE']
+    batch_timeout: float = current_app.config['EVENT_BATCH_TIMEOUT_MS'] / 1000
+    # A prefetch window smaller than the batch would make every batch wait for the timeout
+    prefetch_count: int = max(current_app.config['RABBITMQ_PREFETCH_COUNT'], batch_size)
+    orders_collection = current_app.orders_collection
 
-        ch.basic_ack(delivery_tag=method.delivery_tag)
+    channel, connection = create_retry_channel(QUEUE_NAME)
+    channel.basic_qos(prefetch_count=prefetch_count)
 
-    channel.basic_consume(queue=QUEUE_NAME, on_message_callback=callback, auto_ack=False)
-    channel.start_consuming()
+    # Decoded events, with the delivery tag, body and properties needed to retry them
+    events: List[Dict[str, Any]] = []
+    messages: List[Any] = []
+    # Delivery tags of the batch still to be acknowledged
+    pending: List[int] = []
+    deadline: float = 0.0
+    for method, properties, body in channel.consume(QUEUE_NAME, auto_ack=False,
+                                                    inactivity_timeout=batch_timeout):
+        if method is not None:
+            if not pending:
+                deadline = time.monotonic() + batch_timeout
+            pending.append(method.delivery_tag)
+            try:
+                events.append(decode_user_update_event(body, properties))
+                messages.append((method.delivery_tag, body, properties))
+            except ValueError as e:
+                if settle_failed(channel, QUEUE_NAME, method.delivery_tag, body, properties,
+                                 e, retryable=False, ack=False) == 'requeued':
+                    pending.remove(method.delivery_tag)
+        if pending and (len(pending) >= batch_size or method is None
+                        or time.monotonic() >= deadline):
+            if events:
+                errors = apply_user_update_batch_isolated(orders_collection, events)
+                for (delivery_tag, failed_body, failed_properties), error in zip(messages,
+                                                                                 errors):
+                    if error is not None and settle_failed(
+                            channel, QUEUE_NAME, delivery_tag, failed_body,
+                            failed_properties, error, ack=False) == 'requeued':
+                        pending.remove(delivery_tag)
+            # Requeued deliveries are settled already, and acknowledging one of them again
+            # would close the channel
+            if pending:
+                channel.basic_ack(delivery_tag=pending[-1], multiple=True)
+            events, messages, pending = [], [], []
@@ -22,6 +22,25 @@ Models:
           'shipping', or 'delivered'.
         - createdAt (datetime): Timestamp of when the order was created.
         - updatedAt (datetime): Timestamp of when the order was last updated.
+    OrderBatchResult:
+        - index (int): The position of the order in the batch.
+        - status (str): 'created', 'invalid' or 'failed'.
+        - orderId (str): The unique identifier of the order, if it was created.
+        - error (str): Why the order was not created.
+    OrderStatusBulk:
+        - orderStatus (str): The status to move the orders to.
+        - orderIds (list[str]): The orders to update.
+        - filter (dict): Alternatively, the orderStatus and/or userId of the orders to update.
+        - enforceTransitions (bool): Only update orders allowed to move to the status.
+    OrderStatusBulkResult:
+        - orderStatus (str): The status the orders were moved to.
+        - requested (int): The number of order IDs given, if any.
+        - matched (int): The number of orders selected.
+        - modified (int): The number of orders whose status changed.
+    OrderBatch:
+        - created (int): The number of orders created.
+        - rejected (int): The number of orders that were not created.
+        - results (list[OrderBatchResult]): The result of every order, in request order.
 Author:
     @TheBarzani
 """
@@ -58,3 +77,36 @@ order_model = api.model('Order', {
     'createdAt': fields.DateTime(description='Timestamp of when the order was created.'),
     'updatedAt': fields.DateTime(description='Timestamp of when the order was last updated.')
 })
+
+order_batch_result_model = api.model('OrderBatchResult', {
+    'index': fields.Integer(description='The position of the order in the batch'),
+    'status': fields.String(description='The outcome for the order',
+                            enum=['created', 'invalid', 'failed']),
+    'orderId': fields.String(description='The unique identifier of the created order'),
+    'error': fields.String(description='Why the order was not created')
+})
+
+order_batch_model = api.model('OrderBatch', {
+    'created': fields.Integer(description='The number of orders created'),
+    'rejected': fields.Integer(description='The number of orders that were not created'),
+    'results': fields.List(fields.Nested(order_batch_result_model), description='The '+
+                           'result of every order, in request order')
+})
+
+order_status_bulk_model = api.model('OrderStatusBulk', {
+    'orderStatus': fields.String(required=True, description='The status to move the '+
+                                 'orders to', enum=['under process', 'shipping', 'delivered']),
+    'orderIds': fields.List(fields.String, description='The orders to update'),
+    'filter': fields.Raw(description='Alternatively, the orderStatus and/or userId of the '+
+                         'orders to update'),
+    'enforceTransitions': fields.Boolean(description='Only update orders allowed to move '+
+                                         'to the status (under process -> shipping -> '+
+                                         'delivered)')
+})
+
+order_status_bulk_result_model = api.model('OrderStatusBulkResult', {
+    'orderStatus': fields.String(description='The status the orders were moved to'),
+    'requested': fields.Integer(description='The number of order IDs given, if any'),
+    'matched': fields.Integer(description='The number of orders selected'),
+    'modified': fields.Integer(description='The number of orders whose status changed')
+})
@@ -0,0 +1,69 @@
+"""_summary_
+This module provides keyset pagination helpers for order listings. Pages are ordered by
+`_id` and a page starts right after the last `_id` of the previous page, so fetching any
+page costs an index range scan instead of skipping over all the previous pages.
+
+The cursor handed to clients is the URL-safe base64 encoding of the `_id` and must be
+treated as opaque.
+
+Functions:
+    encode_cursor(object_id: ObjectId) -> str:
+        Encodes the `_id` of the last order of a page into a cursor.
+    decode_cursor(cursor: str) -> ObjectId:
+        Decodes a cursor back into the `_id` the next page starts after.
+    parse_limit(value: Optional[str], maximum: int) -> Optional[int]:
+        Parses and validates the `limit` query parameter.
+Author:
+    @TheBarzani
+"""
+
+import base64
+import binascii
+from typing import Optional
+from bson.objectid import ObjectId
+
+def encode_cursor(object_id: ObjectId) -> str:
+    """
+    Encodes the `_id` of the last order of a page into an opaque cursor.
+    Args:
+        object_id (ObjectId): The `_id` of the last order returned.
+    Returns:
+        str: The cursor of the next page.
+    """
+    return base64.urlsafe_b64encode(object_id.binary).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: str) -> ObjectId:
+    """
+    Decodes a cursor into the `_id` the next page starts after.
+    Args:
+        cursor (str): The cursor returned with the previous page.
+    Returns:
+        ObjectId: The `_id` of the last order of the previous page.
+    Raises:
+        ValueError: If the cursor was not produced by `encode_cursor`.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+    except (binascii.Error, ValueError) as e:
+        raise ValueError('Invalid cursor') from e
+    if len(raw) != 12:
+        raise ValueError('Invalid cursor')
+    return ObjectId(raw)
+
+def parse_limit(value: Optional[str], maximum: int) -> Optional[int]:
+    """
+    Parses the `limit` query parameter.
+    Args:
+        value (Optional[str]): The raw parameter, None if it was not given.
+        maximum (int): The largest page size allowed.
+    Returns:
+        Optional[int]: The page size, None if no limit was requested.
+    Raises:
+        ValueError: If the limit is not an integer between 1 and `maximum`.
+    """
+    if value is None:
+        return None
+    limit = int(value)
+    if not 1 <= limit <= maximum:
+        raise ValueError(f'limit must be between 1 and {maximum}')
+    return limit
@@ -6,11 +6,20 @@ orders, with validation and error handling.
 Classes:
     OrderList(Resource): Handles the creation of new orders and retrieval of orders 
                          by status.
+    OrderBatch(Resource): Handles the creation of orders in bulk.
+    OrderStatusBulk(Resource): Handles the updating of the status of many orders at once.
+    Order(Resource): Handles the retrieval of a single order.
     OrderStatus(Resource): Handles the updating of order status.
     OrderDetails(Resource): Handles the updating of order emails or delivery address.
 Routes:
     /orders/ (POST): Creates a new order.
-    /orders/ (GET): Retrieves orders by status.
+    /orders/ (GET): Retrieves orders by status, a page at a time with `limit` and
+                    `after`, or streamed as NDJSON with `stream=true`. `fields` restricts
+                    the returned fields. Responses carry an ETag, and 304 is returned
+                    when the `If-None-Match` ETag is still current.
+    /orders/batch (POST): Creates orders in bulk from a JSON array or an NDJSON stream.
+    /orders/status (PUT): Updates the status of many orders with one `update_many`.
+    /orders/<string:id> (GET): Retrieves an order, with an ETag, from a read-through cache.
     /orders/<string:id>/status (PUT): Updates the status of an existing order.
     /orders/<string:id>/details (PUT): Updates the emails or delivery address of 
                                        an existing order.
@@ -20,14 +29,43 @@ Author:
 
 
 import uuid
-from flask import request, Flask, current_app
-from flask_restx import Resource, fields
-from bson.objectid import ObjectId
-from order_service.app.models import api, order_model, delivery_address_model
+import json
+import hashlib
+from typing import Any, Dict, Iterator, Optional
+from urllib.parse import urlencode
+from flask import request, Flask, Response, current_app, stream_with_context
+from flask_restx import Resource, fields, marshal
+from order_service.app.models import (api, order_model, delivery_address_model,
+                                      order_batch_model, order_status_bulk_model,
+                                      order_status_bulk_result_model)
+from order_service.app.validation import (ORDER_STATUSES, build_status_transition,
+                                          validate_new_order)
+from order_service.app.batch import create_orders, iter_ndjson
+from order_service.app.pagination import decode_cursor, encode_cursor, parse_limit
+from order_service.app.user_snapshots import (USER_FIELDS, fill_user_fields,
+                                              freeze_user_fields, order_versions,
+                                              snapshot_user_id, without_user_fields)
+from shared.repository import insert_document, update_document
+from shared.projection import build_projection, parse_fields, trimmed_model
+from shared.validation import RequestValidationError, validate
+from shared.serialization import compile_plan, dumps, json_response
+from shared.result_cache import ResultCache
+from shared.change_markers import read_marker, write_and_bump
+from shared.compression import (IDENTITY, etag_matches, pack_variants, select_variant,
+                                unpack_variants, variant_response)
 
 # The current_app variable is a proxy to the Flask application handling the request.
 current_app: Flask
 
+def is_reference_mode() -> bool:
+    """
+    Tells whether orders resolve their user fields from the user snapshots at read time
+    (`ORDERS_USER_FIELDS_MODE=reference`) instead of embedding them.
+    Returns:
+        bool: True in reference mode.
+    """
+    return current_app.config['ORDERS_USER_FIELDS_MODE'] == 'reference'
+
 @api.route('/')
 class OrderList(Resource):
     """_summary_
@@ -40,13 +78,18 @@ class OrderList(Resource):
         """
         Handles the HTTP POST request to create a new order.
         This method performs the following steps:
-        1. Parses the JSON data from the request.
+        1. Parses the JSON data from the request. If the order has a 'userId' but no
+           'userEmails' or 'deliveryAddress', they are filled in from the last snapshot
+           of the user received from the user services, and the order records the
+           snapshot's versions in 'userVersion' and 'userFieldVersions'. In reference
+           mode, user fields equal to the snapshot are not stored, but resolved from the
+           snapshot when read.
         2. Validates the presence and format of required fields.
         3. Ensures no additional fields are present in the request.
         4. Validates the structure of the 'items' and 'deliveryAddress' fields.
         5. Generates a unique orderId for the new order.
         6. Inserts the new order data into the database.
-        7. Retrieves and returns the newly created order.
+        7. Returns the newly created order, without reading it back.
         Returns:
             tuple: A tuple containing the newly created order data and the HTTP status 
                    code 201.
@@ -58,71 +101,322 @@ class OrderList(Resource):
 
         data: dict = request.json
 
-        # Ensure no other fields are present
-        allowed_fields: set = {'items', 'userEmails', 'deliveryAddress', 'orderStatus',
-                               'createdAt', 'updatedAt', 'userId'}
-        for field in data:
-            if field not in allowed_fields:
-                api.abort(400, f'Invalid field: {field}')
-
-        if 'items' not in data or not data['items']:
-            api.abort(400, 'items is a required field')
-        if 'userEmails' not in data or not data['userEmails']:
-            api.abort(400, 'userEmails is a required field')
-        if 'deliveryAddress' not in data:
-            api.abort(400, 'deliveryAddress is a required field')
-        if 'orderStatus' not in data:
-            api.abort(400, 'orderStatus is a required field')
-
-        # Validate items
-        for item in data['items']:
-            if not isinstance(item, dict):
-                api.abort(400, 'Each item must be an object')
-            required_fields: list = ['itemId', 'quantity', 'price']
-            for field in required_fields:
-                if field not in item or not isinstance(item[field], (str, int, float)):
-                    api.abort(400, f'Each item must contain a valid {field}')
-
-        # Validate deliveryAddress
-        delivery_address: dict = data['deliveryAddress']
-        required_fields: list = ['street', 'city', 'state', 'postalCode', 'country']
-        if not isinstance(delivery_address, dict):
-            api.abort(400, 'deliveryAddress must be an object')
-        for field in required_fields:
-            if field not in delivery_address or not isinstance(delivery_address[field], str):
-                api.abort(400, f'deliveryAddress must contain a valid {field}')
+        reference = is_reference_mode()
+        user_id = snapshot_user_id(data, reference)
+        snapshot: Optional[Dict[str, Any]] = (current_app.user_snapshots.get(user_id)
+                                              if user_id else None)
+        fill_user_fields(data, snapshot)
+
+        try:
+            validate_new_order(data)
+        except RequestValidationError as e:
+            api.abort(400, str(e), errors=e.errors)
 
         orders_collection = current_app.orders_collection
+        if snapshot:
+            # Later user update events then apply to the order like to any other
+            data.update(order_versions(snapshot))
 
         # Generate a unique orderId
         data['orderId'] = str(uuid.uuid1())
-        order_id: ObjectId = orders_collection.insert_one(data).inserted_id
-        order: dict = orders_collection.find_one({'_id': ObjectId(order_id)})
-        return order, 201
+        document = without_user_fields(data, snapshot) if reference else data
+        write_and_bump(orders_collection,
+                       lambda session: insert_document(orders_collection, document, session),
+                       lambda _: [data['orderStatus']])
+        return data, 201
 
     @api.param('status', 'The status of the orders to retrieve')
-    @api.marshal_with(order_model, as_list=True)
-    def get(self) -> list:
+    @api.param('limit', 'The maximum number of orders to return')
+    @api.param('after', 'The cursor returned in the X-Next-Cursor header of the previous page')
+    @api.param('stream', 'Set to true to stream the orders as NDJSON')
+    @api.param('fields', 'Comma-separated order fields to return, e.g. orderId,orderStatus')
+    @api.response(200, 'Success', [order_model])
+    @api.response(304, 'Not modified since the ETag given in If-None-Match')
+    def get(self) -> Any:
         """
         Handles the HTTP GET request to retrieve orders by status.
         This method performs the following steps:
-        1. Parses the 'status' parameter from the request.
-        2. Retrieves orders with the specified status from the database.
-        3. Returns the list of orders.
+        1. Parses the 'status', 'limit', 'after', 'stream' and 'fields' parameters from
+           the request.
+        2. Retrieves orders with the specified status from the database, in `_id` order,
+           starting after the cursor if one is given. Only the requested fields are
+           fetched and returned.
+        3. Answers 304 Not Modified, without reading any order, if the ETag given in
+           `If-None-Match` is still current. The ETag is derived from the change marker
+           of the status, which every write to orders of the status bumps.
+        4. Returns the orders as a JSON list, or streams them as NDJSON. With
+           `ORDERS_FAST_SERIALIZATION`, orders are serialized by the compiled plan of
+           their model instead of `marshal`, with the same output. Unless streamed,
+           the rendered page is cached by status, page and change marker, so repeated
+           requests cost one marker read until an order of the status is written.
+           In reference mode, the user fields are resolved from the user snapshots with
+           one MongoDB lookup per page, or per batch of streamed orders, so that a page
+           rendered under a change marker reflects every snapshot recorded before it.
+        When `limit` is given, one page is returned and, if more orders match, the cursor
+        of the next page is sent in the `X-Next-Cursor` header and in a `Link` header.
+        In streaming mode (`stream=true` or `Accept: application/x-ndjson`), orders are
+        written one per line straight from the database cursor, `ORDERS_STREAM_BATCH_SIZE`
+        at a time, so memory use does not grow with the number of matching orders.
         Returns:
-            list: A list of orders with the specified status.
+            Any: A list of orders with the specified status, or a streamed response.
         Raises:
             werkzeug.exceptions.HTTPException: If the 'status' parameter is missing 
-                                               or invalid.
+                                               or invalid, or if 'limit', 'after' or
+                                               'fields' is invalid.
         """
 
         status: str = request.args.get('status')
-        if not status or status not in ['under process', 'shipping', 'delivered']:
+        if not status or status not in ORDER_STATUSES:
             api.abort(400, 'Invalid or missing status parameter')
 
+        query: Dict[str, Any] = {'orderStatus': status}
+        try:
+            limit = parse_limit(request.args.get('limit'),
+                                current_app.config['ORDERS_PAGE_SIZE_MAX'])
+            if request.args.get('after'):
+                query['_id'] = {'$gt': decode_cursor(request.args['after'])}
+        except ValueError as e:
+            api.abort(400, f'Invalid pagination parameter: {e}')
+        try:
+            field_names = parse_fields(request.args.get('fields'), order_model)
+        except ValueError as e:
+            api.abort(400, str(e))
+        projection = build_projection(field_names)
+        if (projection and is_reference_mode() and 'userId' not in projection
+                and any(field in projection for field in USER_FIELDS)):
+            # User fields are resolved by userId; the trimmed model leaves it out again
+            projection['userId'] = 1
+        model = trimmed_model(order_model, field_names)
+        fast: bool = current_app.config['ORDERS_FAST_SERIALIZATION']
+
+        orders_collection = current_app.orders_collection
+        stream = (request.args.get('stream', '').lower() == 'true'
+                  or request.accept_mimetypes.best == 'application/x-ndjson')
+        # The marker is read before the orders, so the ETag is never newer than the body
+        etag = f"orders-{read_marker(orders_collection, status)}{'-ndjson' if stream else ''}"
+        cache_headers: Dict[str, str] = {'ETag': f'"{etag}"', 'Vary': 'Accept'}
+        matched_etag = etag_matches(etag)
+        if matched_etag:
+            return Response(status=304, headers={'ETag': f'"{matched_etag}"',
+                                                 'Vary': 'Accept, Accept-Encoding'})
+
+        if stream:
+            cursor = orders_collection.find(query, projection).sort('_id', 1).batch_size(
+                current_app.config['ORDERS_STREAM_BATCH_SIZE'])
+            if limit:
+                cursor = cursor.limit(limit)
+
+            serialize = compile_plan(model) if fast else lambda order: marshal(order, model)
+            batch_size: int = current_app.config['ORDERS_STREAM_BATCH_SIZE']
+            user_snapshots = current_app.user_snapshots if is_reference_mode() else None
+
+            def render(batch: list) -> Iterator[str]:
+                if user_snapshots is not None:
+                    user_snapshots.resolve(batch, field_names, fresh=True)
+                for order in batch:
+                    yield json.dumps(serialize(order)) + '\n'
+
+            def generate() -> Iterator[str]:
+                try:
+                    # Orders are rendered a cursor batch at a time, with one snapshot lookup
+                    batch: list = []
+                    for order in cursor:
+                        batch.append(order)
+                        if len(batch) == batch_size:
+                            yield from render(batch)
+                            batch = []
+                    yield from render(batch)
+                finally:
+                    cursor.close()
+
+            return Response(stream_with_context(generate()), headers=cache_headers,
+                            mimetype='application/x-ndjson')
+
+        # The marker is part of the key, so a cached page never outlives its orders
+        cache: Optional[ResultCache] = current_app.orders_cache
+        cache_key = f"{status}|{etag}|{limit}|{request.args.get('after', '')}|{field_names}"
+        if cache is not None:
+            cached = cache.get(cache_key)
+            if cached is not None:
+                cached_headers, variants = unpack_variants(cached)
+                encoding, added = select_variant(variants)
+                if added:
+                    cache.put(cache_key, pack_variants(cached_headers, variants), status)
+                return variant_response(variants, encoding, cached_headers,
+                                        'application/json')
+
+        headers: Dict[str, str] = dict(cache_headers)
+        if limit is None:
+            orders: list = list(orders_collection.find(query, projection).sort('_id', 1))
+        else:
+            # One extra order tells whether there is a next page
+            orders = list(orders_collection.find(query, projection).sort('_id', 1)
+                          .limit(limit + 1))
+            if len(orders) > limit:
+                orders = orders[:limit]
+                next_cursor = encode_cursor(orders[-1]['_id'])
+                next_params = {'status': status, 'limit': limit, 'after': next_cursor}
+                if field_names:
+                    next_params['fields'] = ','.join(field_names)
+                next_query = urlencode(next_params)
+                headers['X-Next-Cursor'] = next_cursor
+                headers['Link'] = f'<{request.path}?{next_query}>; rel="next"'
+        if is_reference_mode():
+            # Read from MongoDB: the page is valid for as long as the marker read above,
+            # which a consumer in another process bumps after recording the snapshots
+            current_app.user_snapshots.resolve(orders, field_names, fresh=True)
+
+        if cache is not None:
+            # The page is cached in the encoding sent too, so hits are not compressed again
+            body = (dumps(orders, model) if fast
+                    else json.dumps(marshal(orders, model))).encode()
+            variants = {IDENTITY: body + b'\n'}
+            encoding, _ = select_variant(variants)
+            cache.put(cache_key, pack_variants(headers, variants), status)
+            return variant_response(variants, encoding, headers, 'application/json')
+        if fast:
+            return json_response(orders, model, 200, headers)
+        return marshal(orders, model), 200, headers
+
+@api.route('/batch')
+class OrderBatch(Resource):
+    """_summary_
+    OrderBatch is a Flask-RESTful resource for creating orders in bulk.
+    """
+
+    @api.expect([order_model])
+    @api.marshal_with(order_batch_model, code=201)
+    @api.response(207, 'Some orders were not created', order_batch_model)
+    def post(self) -> tuple:
+        """
+        Handles the HTTP POST request to create orders in bulk.
+        The body is a JSON array of orders, or one order per line with the
+        `application/x-ndjson` content type, in which case orders are inserted while the
+        body is being read. Every order is validated with the rules of `POST /orders/`,
+        including the user fields filled in from the user snapshots, which are read with
+        one lookup per chunk, and the reference mode storage. The valid ones are inserted
+        with unordered `insert_many` calls of at most `ORDERS_BATCH_CHUNK_SIZE` orders.
+        Returns:
+            tuple: The per-order results, with the HTTP status code 201 if every order was
+                   created, or 207 otherwise.
+        Raises:
+            werkzeug.exceptions.HTTPException: If the body is neither a JSON array nor
+                                               an NDJSON stream.
+        """
+
+        if request.mimetype == 'application/x-ndjson':
+            payloads: Any = iter_ndjson(request.stream)
+        else:
+            payloads = request.get_json(silent=True)
+            if not isinstance(payloads, list):
+                api.abort(400, 'The body must be a JSON array of orders or an NDJSON stream')
+
+        batch: Dict[str, Any] = create_orders(current_app.orders_collection, payloads,
+                                              current_app.config['ORDERS_BATCH_CHUNK_SIZE'],
+                                              current_app.config['ORDERS_BATCH_MAX_ITEMS'],
+                                              current_app.user_snapshots,
+                                              is_reference_mode())
+        return batch, 201 if not batch['rejected'] else 207
+
+@api.route('/status')
+class OrderStatusBulk(Resource):
+    """_summary_
+    OrderStatusBulk is a Flask-RESTful resource for changing the status of many orders.
+    """
+
+    @api.expect(order_status_bulk_model)
+    @api.marshal_with(order_status_bulk_result_model)
+    def put(self) -> dict:
+        """
+        Moves the orders selected by 'orderIds' or 'filter' to 'orderStatus' with a single
+        server-side `update_many`. When transitions are enforced ('enforceTransitions', or
+        `ORDERS_ENFORCE_TRANSITIONS` by default), orders that may not move to the target
+        status are left untouched and are not counted as matched. In reference mode,
+        orders about to be delivered first embed the user fields they resolve to.
+        Returns:
+            dict: The target status, the number of order IDs given, and the number of
+                  orders matched and modified.
+        Raises:
+            HTTPException: If the JSON data is invalid, the status is not one of the
+                           order statuses, or the orders are not selected correctly.
+        """
+
+        data: Any = request.get_json(silent=True)
+        try:
+            query, status = build_status_transition(
+                data, current_app.config['ORDERS_BATCH_MAX_ITEMS'],
+                current_app.config['ORDERS_ENFORCE_TRANSITIONS'])
+        except ValueError as e:
+            api.abort(400, str(e))
+
         orders_collection = current_app.orders_collection
-        orders: list = list(orders_collection.find({'orderStatus': status}))
-        return orders
+        if status == 'delivered' and is_reference_mode():
+            freeze_user_fields(orders_collection, query, current_app.user_snapshots)
+        # The previous statuses of the orders are not known, so the global marker is bumped
+        result = write_and_bump(
+            orders_collection,
+            lambda session: orders_collection.update_many(
+                query, {'$set': {'orderStatus': status}}, session=session),
+            lambda result: None if result.modified_count else [])
+        if result.modified_count:
+            if current_app.order_cache is not None:
+                current_app.order_cache.invalidate()
+        return {'orderStatus': status, 'requested': len(data.get('orderIds', [])) or None,
+                'matched': result.matched_count, 'modified': result.modified_count}
+
+@api.route('/<string:id>')
+@api.response(404, 'Order not found')
+class Order(Resource):
+    """_summary_
+    Order is a Flask-RESTful resource for reading a single order.
+    """
+
+    @api.response(200, 'Success', order_model)
+    @api.response(304, 'Not modified since the ETag given in If-None-Match')
+    def get(self, id: str) -> Response:
+        """
+        Retrieves an order by its orderId through the unique `orderId` index. Orders are
+        served from a bounded read-through cache (`ORDER_CACHE_MAX_BYTES`) when enabled,
+        which the PUT handlers and the event consumer of this process keep current; writes
+        made by other processes are seen after at most `ORDER_CACHE_TTL` seconds. In
+        reference mode, the user fields are resolved from the snapshots in MongoDB rather
+        than in memory, so user updates are bound by the same delay.
+        The response carries a strong ETag derived from the rendered order, and 304 Not
+        Modified is returned when it matches the one given in `If-None-Match`.
+        Args:
+            id (str): The unique identifier of the order.
+        Returns:
+            Response: The order as JSON, or an empty 304 response.
+        Raises:
+            HTTPException: If the order with the given ID is not found.
+        """
+
+        cache: Optional[ResultCache] = current_app.order_cache
+        cached = cache.get(id) if cache is not None else None
+        if cached is not None:
+            meta, variants = unpack_variants(cached)
+        else:
+            order = current_app.orders_collection.find_one({'orderId': id})
+            if not order:
+                api.abort(404, "Order not found")
+            if is_reference_mode():
+                current_app.user_snapshots.resolve([order], fresh=True)
+            body = dumps(order, order_model)
+            # Tagged with the user, so the event consumer can drop the user's orders
+            meta = {'etag': f"order-{hashlib.sha1(body.encode()).hexdigest()[:20]}",
+                    'tag': order.get('userId') or ''}
+            variants = {IDENTITY: (body + '\n').encode()}
+
+        matched_etag = etag_matches(meta['etag'])
+        # The order is cached in every encoding sent so far, so hits are not compressed again
+        encoding, added = (IDENTITY, False) if matched_etag else select_variant(variants)
+        if cache is not None and (cached is None or added):
+            cache.put(id, pack_variants(meta, variants), meta['tag'])
+        if matched_etag:
+            return Response(status=304, headers={'ETag': f'"{matched_etag}"',
+                                                 'Vary': 'Accept-Encoding'})
+        return variant_response(variants, encoding, {'ETag': f'"{meta["etag"]}"'},
+                                'application/json')
 
 @api.route('/<string:id>/status')
 @api.response(404, 'Order not found')
@@ -135,9 +429,11 @@ class OrderStatus(Resource):
                                      enum=['under process', 'shipping', 'delivered'])
     }))
     @api.marshal_with(order_model)
-    def put(self) -> dict:
+    def put(self, id: str) -> dict:
         """
-        Update the status of an existing order based on the provided order ID.
+        Update the status of an existing order based on the provided order ID. The order
+        is read and updated atomically in a single round trip. In reference mode, an order
+        about to be delivered first embeds the user fields it resolves to.
         Args:
             id (str): The unique identifier of the order.
         Returns:
@@ -150,19 +446,27 @@ class OrderStatus(Resource):
 
         data: dict = request.json
 
-        if 'orderStatus' not in data or data['orderStatus'] not in ['under process',
-                                                                    'shipping', 'delivered']:
+        if 'orderStatus' not in data or data['orderStatus'] not in ORDER_STATUSES:
             api.abort(400, 'Invalid or missing orderStatus')
 
         orders_collection = current_app.orders_collection
-        old_order: dict = orders_collection.find_one({'orderId': id})
-        if not old_order:
+        if data['orderStatus'] == 'delivered' and is_reference_mode():
+            freeze_user_fields(orders_collection, {'orderId': id}, current_app.user_snapshots)
+        images = write_and_bump(
+            orders_collection,
+            lambda session: update_document(orders_collection, {'orderId': id},
+                                            {'$set': {'orderStatus': data['orderStatus']}},
+                                            session),
+            lambda images: ({images[0]['orderStatus'], images[1]['orderStatus']} if images
+                            else []))
+        if not images:
             api.abort(404, "Order not found")
+        if is_reference_mode():
+            current_app.user_snapshots.resolve(list(images))
 
-        orders_collection.update_one({'orderId': id}, {'$set': {'orderStatus':
-            data['orderStatus']}})
-        new_order: dict = orders_collection.find_one({'orderId': id})
-
+        old_order, new_order = images
+        if current_app.order_cache is not None:
+            current_app.order_cache.discard(id)
         return [old_order, new_order]
 
 @api.route('/<string:id>/details')
@@ -178,10 +482,10 @@ class OrderDetails(Resource):
                                          'The delivery address of the user')
     }))
     @api.marshal_with(order_model)
-    def put(self) -> dict:
+    def put(self, id: str) -> dict:
         """
         Update the emails or delivery address of an existing order based on the provided 
-        order ID.
+        order ID. The order is read and updated atomically in a single round trip.
         Args:
             id (str): The unique identifier of the order.
         Returns:
@@ -197,38 +501,23 @@ class OrderDetails(Resource):
 
         data: dict = request.json
 
-        # Ensure no other fields are present
-        allowed_fields: set = {'userEmails', 'deliveryAddress'}
-        for field in data:
-            if field not in allowed_fields:
-                api.abort(400, f'Invalid field: {field}')
-
-        if 'userEmails' not in data and 'deliveryAddress' not in data:
-            api.abort(400, 'Either userEmails or deliveryAddress is required')
-
-        # Validate userEmails
-        if 'userEmails' in data:
-            if not isinstance(data['userEmails'], list) or not all(isinstance(email, str)
-                                                                   and '@' in email for email
-                                                                   in data['userEmails']):
-                api.abort(400, 'userEmails must be an array of valid email addresses')
-
-        # Validate deliveryAddress
-        if 'deliveryAddress' in data:
-            delivery_address: dict = data['deliveryAddress']
-            required_fields: list = ['street', 'city', 'state', 'postalCode', 'country']
-            if not isinstance(delivery_address, dict):
-                api.abort(400, 'deliveryAddress must be an object')
-            for field in required_fields:
-                if field not in delivery_address or not isinstance(delivery_address[field], str):
-                    api.abort(400, f'deliveryAddress must contain a valid {field}')
+        try:
+            validate('order_details', data)
+        except RequestValidationError as e:
+            api.abort(400, str(e), errors=e.errors)
 
         orders_collection = current_app.orders_collection
-        old_order: dict = orders_collection.find_one({'orderId': id})
-        if not old_order:
+        images = write_and_bump(
+            orders_collection,
+            lambda session: update_document(orders_collection, {'orderId': id},
+                                            {'$set': data}, session),
+            lambda images: [images[1]['orderStatus']] if images else [])
+        if not images:
             api.abort(404, "Order not found")
+        if is_reference_mode():
+            current_app.user_snapshots.resolve(list(images))
 
-        orders_collection.update_one({'orderId': id}, {'$set': data})
-        new_order: dict = orders_collection.find_one({'orderId': id})
-
+        old_order, new_order = images
+        if current_app.order_cache is not None:
+            current_app.order_cache.discard(id)
         return [old_order, new_order]
@@ -0,0 +1,379 @@
+"""_summary_
+This module keeps the last known contact details of every user, fed by the user update
+events the order service consumes, so that `POST /orders/` can fill in the `userEmails`
+and `deliveryAddress` of an order from its `userId` instead of requiring clients to look
+the user up and send them.
+
+Snapshots (`userId` -> emails, delivery address, version) are stored in the
+`user_snapshots` collection, so they survive restarts, and the most recently used ones
+are kept in memory. Every field is guarded by the version it was written at, like the
+order updates of the consumer, so redelivered, out-of-order or delta events never roll
+a snapshot back. A snapshot may lack a field until an event carried it. The
+consumer of the process updates the memory tier as it goes; snapshots written by a
+consumer running in another process are picked up once the memory entry expires.
+
+In reference mode (`ORDERS_USER_FIELDS_MODE=reference`), orders of users with a snapshot
+are stored without their user fields, and `resolve` fills them in at read time from the
+snapshots, with at most one `$in` query per page of orders. Rendered orders are cached
+and validated by change marker, which a consumer in another process bumps after
+recording snapshots the memory tier of this process has not seen yet, so reads that
+render orders for a cache pass `fresh=True` to read the snapshots from MongoDB. A user
+update then costs one snapshot write instead of a write per order of the user. Orders are frozen before being
+delivered: the user fields they resolve to are embedded, so they keep them for good.
+
+Classes:
+    UserSnapshotStore: The store of user snapshots.
+Functions:
+    snapshot_user_id(order: Any, reference: bool) -> Optional[str]:
+        Returns the user whose snapshot a new order needs.
+    fill_user_fields(order: Any, snapshot: Optional[Dict[str, Any]]) -> None:
+        Fills in the user fields a new order lacks from the snapshot of its user.
+    without_user_fields(order: Dict[str, Any], snapshot: Optional[Dict[str, Any]])
+        -> Dict[str, Any]:
+        Returns an order as stored in reference mode.
+    order_versions(snapshot: Dict[str, Any]) -> Dict[str, Any]:
+        Returns the version fields of an order whose user fields are copied from a snapshot.
+    freeze_user_fields(orders_collection: Collection, query: Dict[str, Any],
+                       store: UserSnapshotStore) -> int:
+        Embeds the current user fields into the reference mode orders matching a query.
+    ensure_user_fields_mode(settings: Collection, mode: str) -> None:
+        Refuses to start a process whose user fields mode differs from the deployment's.
+Author:
+    @TheBarzani
+"""
+
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from pymongo import ReturnDocument, UpdateMany, UpdateOne
+from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from shared.user_events import build_versioned_merge, collapse_user_events
+
+USER_SNAPSHOTS_COLLECTION = 'user_snapshots'
+SETTINGS_COLLECTION = 'order_settings'
+USER_FIELDS_MODE_SETTING = 'ordersUserFieldsMode'
+DUPLICATE_KEY_ERROR = 11000
+# The order fields holding the contact details of the user
+USER_FIELDS: Tuple[str, ...] = ('userEmails', 'deliveryAddress')
+
+def snapshot_user_id(order: Any, reference: bool) -> Optional[str]:
+    """
+    Returns the user whose snapshot a new order needs: its user if the order lacks a user
+    field, or in reference mode, where the snapshot also decides which fields are stored.
+    Args:
+        order (Any): The order payload, not validated yet.
+        reference (bool): True in reference mode.
+    Returns:
+        Optional[str]: The ID of the user, None if no snapshot is needed.
+    """
+    if (isinstance(order, dict) and isinstance(order.get('userId'), str)
+            and (reference or any(field not in order for field in USER_FIELDS))):
+        return order['userId']
+    return None
+
+def fill_user_fields(order: Any, snapshot: Optional[Dict[str, Any]]) -> None:
+    """
+    Fills in the user fields a new order lacks from the snapshot of its user, in place.
+    Fields given by the client are kept.
+    Args:
+        order (Any): The order payload, not validated yet.
+        snapshot (Optional[Dict[str, Any]]): The snapshot of the order's user.
+    Returns:
+        None
+    """
+    for field in USER_FIELDS if snapshot and isinstance(order, dict) else ():
+        if field in snapshot:
+            order.setdefault(field, snapshot[field])
+
+def without_user_fields(order: Dict[str, Any],
+                        snapshot: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Returns an order as stored in reference mode: without its user fields, which are
+    resolved from the snapshot at read time, if they are those of the snapshot. Orders
+    whose user fields differ from the snapshot, or whose user has no snapshot, keep them.
+    Args:
+        order (Dict[str, Any]): The validated order, with its user fields.
+        snapshot (Optional[Dict[str, Any]]): The snapshot of the order's user.
+    Returns:
+        Dict[str, Any]: The order to store.
+    """
+    if not snapshot or any(order.get(field) != snapshot.get(field) for field in USER_FIELDS):
+        return order
+    return {key: value for key, value in order.items() if key not in USER_FIELDS}
+
+def order_versions(snapshot: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Returns the version fields of an order whose user fields are copied from a snapshot,
+    so that later user update events apply to it like to any other order of the user.
+    Args:
+        snapshot (Dict[str, Any]): The snapshot of the order's user.
+    Returns:
+        Dict[str, Any]: The `userVersion` and `userFieldVersions` of the order, empty if
+                        the snapshot is not versioned.
+    """
+    if snapshot.get('version') is None:
+        return {}
+    field_versions: Dict[str, Any] = snapshot.get('fieldVersions') or {}
+    return {'userVersion': snapshot['version'],
+            'userFieldVersions': {field: field_versions.get(field, snapshot['version'])
+                                  for field in USER_FIELDS}}
+
+class UserSnapshotStore:
+    """
+    The store of user snapshots: a bounded in-memory LRU in front of a MongoDB collection.
+    Attributes:
+        collection (Collection): The `user_snapshots` collection.
+        max_entries (int): The maximum number of snapshots kept in memory.
+        ttl (float): Seconds a snapshot is served from memory before being read again.
+    """
+
+    def __init__(self, collection: Collection, max_entries: int, ttl: float) -> None:
+        self.collection = collection
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # userId -> (expiry, snapshot), least recently used first
+        self._entries: 'OrderedDict[str, Tuple[float, Dict[str, Any]]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats: Dict[str, int] = {'hits': 0, 'reads': 0, 'misses': 0, 'recorded': 0}
+
+    def _remember(self, snapshot: Dict[str, Any]) -> None:
+        """
+        Keeps a snapshot in memory, unless a newer one is already there, and evicts the
+        least recently used snapshots past the bound. Must be called with the lock held.
+        """
+        current = self._entries.get(snapshot['userId'])
+        if (current is not None and snapshot.get('version') is not None
+                and (current[1].get('version') or 0) > snapshot['version']):
+            return
+        self._entries[snapshot['userId']] = (time.monotonic() + self.ttl, snapshot)
+        self._entries.move_to_end(snapshot['userId'])
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _merge(self, user_id: str, changes: Dict[str, Any],
+               versions: Optional[Dict[str, int]]) -> None:
+        """
+        Merges recorded changes into the snapshot kept in memory, like the database does.
+        Without one, the changes are only kept if they make a whole snapshot. Must be
+        called with the lock held.
+        """
+        entry = self._entries.get(user_id)
+        snapshot: Dict[str, Any] = (dict(entry[1], fieldVersions=dict(
+            entry[1].get('fieldVersions') or {})) if entry is not None
+                                    else {'userId': user_id, 'fieldVersions': {}})
+        for field in USER_FIELDS:
+            current = snapshot['fieldVersions'].get(field, snapshot.get('version') or 0)
+            if versions is not None:
+                # Pins every field, like `build_versioned_merge`
+                snapshot['fieldVersions'][field] = current
+            if field in changes and (versions is None or current < versions[field]):
+                snapshot[field] = changes[field]
+                if versions is not None:
+                    snapshot['fieldVersions'][field] = versions[field]
+        if versions:
+            snapshot['version'] = max([snapshot.get('version') or 0, *versions.values()])
+        if all(field in snapshot for field in USER_FIELDS):
+            self._entries.pop(user_id, None)
+            self._remember(snapshot)
+
+    def record(self, events: List[Dict[str, Any]]) -> None:
+        """
+        Records the user fields carried by user update events with one unordered
+        `bulk_write`. Events are collapsed per user first, and every field of a snapshot
+        is only replaced by a newer version of it, so delta events may arrive in any order.
+        Args:
+            events (List[Dict[str, Any]]): The decoded events, in delivery order.
+        Returns:
+            None
+        Raises:
+            PyMongoError: If the snapshots could not be written.
+        """
+        collapsed = collapse_user_events(events)
+        if not collapsed:
+            return
+
+        operations = []
+        for user_id, (changes, versions) in collapsed.items():
+            if versions is None:
+                update: Any = {'$set': {'userId': user_id, **changes}}
+            else:
+                update = build_versioned_merge(changes, versions, 'version', 'fieldVersions')
+                update[0]['$set']['userId'] = user_id
+            operations.append(UpdateOne({'_id': user_id}, update, upsert=True))
+        try:
+            self.collection.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            # Concurrent upserts of a new user: the losers apply to the inserted snapshot
+            errors = e.details['writeErrors']
+            if any(error['code'] != DUPLICATE_KEY_ERROR for error in errors):
+                raise
+            self.collection.bulk_write([operations[error['index']] for error in errors],
+                                       ordered=False)
+        with self._lock:
+            for user_id, (changes, versions) in collapsed.items():
+                self._merge(user_id, changes, versions)
+            self._stats['recorded'] += len(collapsed)
+
+    def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns the snapshot of a user.
+        Args:
+            user_id (str): The ID of the user.
+        Returns:
+            Optional[Dict[str, Any]]: The userId, userEmails, deliveryAddress, version and
+                                      field versions of the user, None if no event of
+                                      the user was seen.
+        """
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(user_id)
+                self._stats['hits'] += 1
+                return entry[1]
+        snapshot = self.collection.find_one({'_id': user_id}, {'_id': 0})
+        with self._lock:
+            if snapshot is None:
+                self._stats['misses'] += 1
+                return None
+            self._stats['reads'] += 1
+            self._remember(snapshot)
+        return snapshot
+
+    def get_many(self, user_ids: Iterable[str],
+                 fresh: bool = False) -> Dict[str, Dict[str, Any]]:
+        """
+        Returns the snapshots of several users, reading those not in memory with a single
+        `$in` query.
+        Args:
+            user_ids (Iterable[str]): The IDs of the users.
+            fresh (bool): True to read every snapshot from MongoDB, e.g. to render orders
+                          cached under a change marker bumped by another process. The
+                          snapshots read still refresh the memory tier.
+        Returns:
+            Dict[str, Dict[str, Any]]: The snapshots found, by userId.
+        """
+        snapshots: Dict[str, Dict[str, Any]] = {}
+        missing: List[str] = []
+        now = time.monotonic()
+        with self._lock:
+            for user_id in set(user_ids):
+                entry = self._entries.get(user_id)
+                if not fresh and entry is not None and entry[0] > now:
+                    self._entries.move_to_end(user_id)
+                    snapshots[user_id] = entry[1]
+                else:
+                    missing.append(user_id)
+            self._stats['hits'] += len(snapshots)
+        if not missing:
+            return snapshots
+        found = list(self.collection.find({'_id': {'$in': missing}}, {'_id': 0}))
+        with self._lock:
+            for snapshot in found:
+                self._remember(snapshot)
+                snapshots[snapshot['userId']] = snapshot
+            self._stats['reads'] += len(found)
+            self._stats['misses'] += len(missing) - len(found)
+        return snapshots
+
+    def resolve(self, orders: List[Dict[str, Any]],
+                field_names: Optional[Iterable[str]] = None, fresh: bool = False) -> None:
+        """
+        Fills in the user fields missing from orders stored in reference mode, in place.
+        Args:
+            orders (List[Dict[str, Any]]): The orders, e.g. one page of a listing.
+            field_names (Optional[Iterable[str]]): The order fields returned to the
+                                                   client, None for all of them. User
+                                                   fields not returned are not resolved.
+            fresh (bool): True to read the snapshots from MongoDB, see `get_many`.
+        Returns:
+            None
+        """
+        needed = [field for field in USER_FIELDS
+                  if field_names is None or field in field_names]
+        pending = [order for order in orders if order.get('userId')
+                   and any(field not in order for field in needed)]
+        if not pending:
+            return
+        snapshots = self.get_many((order['userId'] for order in pending), fresh)
+        for order in pending:
+            snapshot = snapshots.get(order['userId'])
+            for field in needed if snapshot else ():
+                if field in snapshot:
+                    order.setdefault(field, snapshot[field])
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns the store statistics.
+        Returns:
+            Dict[str, Any]: The lookups served from memory, read from MongoDB and not
+                            found, the snapshots recorded and the snapshots in memory.
+        """
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries))
+
+def freeze_user_fields(orders_collection: Collection, query: Dict[str, Any],
+                       store: UserSnapshotStore) -> int:
+    """
+    Embeds the current user fields into the orders stored in reference mode that match a
+    query, e.g. orders about to be delivered, so they keep the contact details they were
+    delivered with. Users are looked up with a single `$in` query, bypassing the memory
+    tier since the fields are kept for good, and each user's orders are written by one
+    pipeline update that only sets the fields they are missing.
+    Args:
+        orders_collection (Collection): The orders collection.
+        query (Dict[str, Any]): The filter of the orders to freeze.
+        store (UserSnapshotStore): The store of user snapshots.
+    Returns:
+        int: The number of orders written.
+    """
+    reference_query = {'$and': [query, {'userId': {'$type': 'string'}},
+                                {'$or': [{field: {'$exists': False}} for field in USER_FIELDS]}]}
+    user_ids = orders_collection.distinct('userId', reference_query)
+    if not user_ids:
+        return 0
+    snapshots = store.get_many(user_ids, fresh=True)
+    operations = []
+    for user_id, snapshot in snapshots.items():
+        # Fields the order already has, e.g. set by PUT /orders/<id>/details, are kept
+        frozen: Dict[str, Any] = {
+            field: {'$ifNull': [f'${field}', {'$literal': snapshot[field]}]}
+            for field in USER_FIELDS if field in snapshot}
+        if snapshot.get('version') is not None:
+            frozen['userVersion'] = {'$literal': snapshot['version']}
+        operations.append(UpdateMany({'$and': [reference_query, {'userId': user_id}]},
+                                     [{'$set': frozen}]))
+    if not operations:
+        return 0
+    return orders_collection.bulk_write(operations, ordered=False).modified_count
+
+def ensure_user_fields_mode(settings: Collection, mode: str) -> None:
+    """
+    Records the user fields mode of the deployment when the first process starts, and
+    refuses to start a process configured with another mode. The API and the consumer
+    must agree: orders stored without their user fields by one would be shown without
+    them by the other, and user updates would skip them.
+    To switch modes, stop every process, update the `ordersUserFieldsMode` document of
+    the `order_settings` collection, and restart them with the new mode. Leaving reference
+    mode also requires embedding the user fields of the orders stored without them.
+    Args:
+        settings (Collection): The `order_settings` collection.
+        mode (str): The `ORDERS_USER_FIELDS_MODE` of this process.
+    Returns:
+        None
+    Raises:
+        RuntimeError: If the deployment runs in another mode.
+    """
+    try:
+        setting = settings.find_one_and_update({'_id': USER_FIELDS_MODE_SETTING},
+                                               {'$setOnInsert': {'value': mode}},
+                                               upsert=True,
+                                               return_document=ReturnDocument.AFTER)
+    except DuplicateKeyError:
+        # Another process recorded its mode concurrently
+        setting = settings.find_one({'_id': USER_FIELDS_MODE_SETTING})
+    if setting['value'] != mode:
+        raise RuntimeError(f"ORDERS_USER_FIELDS_MODE is '{mode}' but the deployment runs in "
+                           f"'{setting['value']}' mode; give the order service and the "
+                           f"order consumer the same mode")
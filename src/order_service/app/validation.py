@@ -0,0 +1,102 @@
+"""_summary_
+This module validates new orders and order status changes. The rules are shared by the
+single order endpoints (`POST /orders/`, `PUT /orders/<id>/status`) and the bulk ones
+(`POST /orders/batch`, `PUT /orders/status`), so that a request is accepted or rejected
+the same way by both. New orders are checked by the shared schema validators of
+`shared.validation`.
+
+Functions:
+    validate_new_order(data: Any) -> None:
+        Validates the payload of a new order.
+    build_status_transition(data: Any, max_ids: int, enforce_transitions: bool)
+        -> Tuple[Dict[str, Any], str]:
+        Validates a bulk status change and builds the filter of the orders it applies to.
+Author:
+    @TheBarzani
+"""
+
+from typing import Any, Dict, List, Set, Tuple
+from shared.validation import validate
+
+ORDER_STATUSES: List[str] = ['under process', 'shipping', 'delivered']
+# The statuses an order may be in to be moved to a status: under process -> shipping ->
+# delivered. An order already in the target status matches too, so retries are no-ops.
+STATUS_PREDECESSORS: Dict[str, List[str]] = {
+    'under process': ['under process'],
+    'shipping': ['under process', 'shipping'],
+    'delivered': ['shipping', 'delivered']
+}
+# The fields a bulk status change may select orders by
+STATUS_FILTER_FIELDS: Set[str] = {'orderStatus', 'userId'}
+
+def validate_new_order(data: Any) -> None:
+    """
+    Validates the payload of a new order against the shared `order_create` schema: no
+    fields other than the allowed ones, the required fields present, and valid 'items',
+    'userEmails' and 'deliveryAddress'.
+    Args:
+        data (Any): The decoded JSON payload of the order.
+    Returns:
+        None
+    Raises:
+        RequestValidationError: If the order is invalid, with every error found.
+    """
+    validate('order_create', data)
+
+def build_status_transition(data: Any, max_ids: int,
+                            enforce_transitions: bool) -> Tuple[Dict[str, Any], str]:
+    """
+    Validates the payload of a bulk status change and builds the filter of the orders it
+    applies to.
+    The payload holds the target 'orderStatus' and selects orders either by 'orderIds',
+    a list of at most `max_ids` order IDs, or by 'filter', an object matching on
+    'orderStatus' and/or 'userId'. With 'enforceTransitions' (or `enforce_transitions` by
+    default), only orders whose current status may move to the target one are selected.
+    Args:
+        data (Any): The decoded JSON payload.
+        max_ids (int): The maximum number of order IDs accepted.
+        enforce_transitions (bool): Whether transitions are enforced when the payload
+                                    does not say.
+    Returns:
+        Tuple[Dict[str, Any], str]: The filter for `update_many` and the target status.
+    Raises:
+        ValueError: If the payload is invalid, with the message to return to the client.
+    """
+    if not isinstance(data, dict):
+        raise ValueError('The body must be an object')
+    for field in data:
+        if field not in {'orderStatus', 'orderIds', 'filter', 'enforceTransitions'}:
+            raise ValueError(f'Invalid field: {field}')
+    status: Any = data.get('orderStatus')
+    if status not in ORDER_STATUSES:
+        raise ValueError('Invalid or missing orderStatus')
+    if ('orderIds' in data) == ('filter' in data):
+        raise ValueError('Exactly one of orderIds or filter is required')
+
+    conditions: List[Dict[str, Any]] = []
+    if 'orderIds' in data:
+        order_ids: Any = data['orderIds']
+        if (not isinstance(order_ids, list) or not order_ids
+                or not all(isinstance(order_id, str) for order_id in order_ids)):
+            raise ValueError('orderIds must be a non-empty array of order IDs')
+        if len(order_ids) > max_ids:
+            raise ValueError(f'orderIds is limited to {max_ids} orders')
+        conditions.append({'orderId': {'$in': order_ids}})
+    else:
+        order_filter: Any = data['filter']
+        if not isinstance(order_filter, dict) or not order_filter:
+            raise ValueError('filter must be a non-empty object')
+        for field, value in order_filter.items():
+            if field not in STATUS_FILTER_FIELDS or not isinstance(value, str):
+                raise ValueError(f'Invalid filter field: {field}')
+        if 'orderStatus' in order_filter and order_filter['orderStatus'] not in ORDER_STATUSES:
+            raise ValueError('Invalid orderStatus in filter')
+        conditions.append(dict(order_filter))
+
+    enforce: Any = data.get('enforceTransitions', enforce_transitions)
+    if not isinstance(enforce, bool):
+        raise ValueError('enforceTransitions must be a boolean')
+    if enforce:
+        conditions.append({'orderStatus': {'$in': STATUS_PREDECESSORS[status]}})
+    query = conditions[0] if len(conditions) == 1 else {'$and': conditions}
+    return query, status
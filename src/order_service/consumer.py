@@ -0,0 +1,49 @@
+"""_summary_
+This module runs the order service event consumer as a standalone process, without the
+Flask routes. Running the consumer on its own lets HTTP workers and event workers be
+scaled independently: web workers started with `EMBEDDED_EVENT_CONSUMER=false` neither
+compete for the queue nor share their GIL with event processing, and only this process
+holds a MongoDB pool for consuming. The consumer mode (single, batch or pool) is
+configured exactly as for the embedded consumer.
+
+Since the process serves no `/metrics` endpoint, the consumer statistics are printed
+every `CONSUMER_STATS_INTERVAL` seconds instead.
+
+Usage:
+    python -m order_service.consumer
+Author:
+    @TheBarzani
+"""
+
+import json
+import threading
+import time
+from order_service.app import create_consumer_app, start_event_consumer
+from shared import metrics
+
+def report_stats(interval: int) -> None:
+    """
+    Prints the statistics of every registered component at a fixed interval.
+    Args:
+        interval (int): Seconds between two reports.
+    Returns:
+        None
+    """
+    while True:
+        time.sleep(interval)
+        print(f"Consumer stats: {json.dumps(metrics.snapshot())}", flush=True)
+
+def main() -> None:
+    """
+    Creates the consumer application and runs the event consumer in the main thread.
+    """
+    app = create_consumer_app()
+    if app.config['CONSUMER_STATS_INTERVAL'] > 0:
+        threading.Thread(target=report_stats, args=(app.config['CONSUMER_STATS_INTERVAL'],),
+                         daemon=True).start()
+    print(f"Starting order event consumer in {app.config['EVENT_CONSUMER_MODE']} mode...",
+          flush=True)
+    start_event_consumer(app)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""_summary_
+This module keeps change markers: counters bumped after every write to a collection, so
+that readers can tell whether what they served before is still current by reading one
+small document instead of the data itself. They back the ETags of the order listings.
+
+The markers of a collection are one document of the `change_markers` collection, keyed
+by the collection name, holding a counter per key (e.g. per order status) and a global
+counter `*` for writes that may touch any key:
+
+    {'_id': 'orders', 'versions': {'*': 3, 'shipping': 12, 'delivered': 7}}
+
+Writers bump the markers after their write has been applied, never before, so a reader
+that sees a marker always reads data at least as new as it. `write_and_bump` runs the
+write and the bump in one transaction where the deployment supports them (replica sets
+and sharded clusters), so a process dying in between cannot leave a write behind an
+unchanged marker, and thus behind ETags and cached pages that stay valid forever. On a
+standalone server it bumps right after the write. Listeners registered in the process,
+such as caches, are told about every bump made by the process, once it is committed.
+
+Functions:
+    bump_markers(collection: Collection, keys: Optional[Iterable[str]],
+                 session: Optional[ClientSession]) -> None:
+        Bumps the markers of the given keys, or the global marker.
+    supports_transactions(collection: Collection) -> bool:
+        Tells whether writes to a collection can run in a transaction.
+    write_and_bump(collection: Collection, write: Callable[[Optional[ClientSession]], T],
+                   keys_of: Callable[[T], Optional[Iterable[str]]]) -> T:
+        Runs a write and bumps the markers it changed, in one transaction where possible.
+    read_marker(collection: Collection, key: str) -> str:
+        Returns the marker of a key.
+    add_listener(listener: Callable[[str, Optional[List[str]]], None]) -> None:
+        Registers a function called after every bump made by the process.
+Author:
+    @TheBarzani
+"""
+
+from typing import Callable, Iterable, List, Optional, Tuple, TypeVar
+from pymongo.client_session import ClientSession
+from pymongo.collection import Collection
+from pymongo.topology_description import TopologyDescription
+
+CHANGE_MARKERS_COLLECTION = 'change_markers'
+GLOBAL_KEY = '*'
+# Topologies whose servers support multi-document transactions
+TRANSACTIONAL_TOPOLOGIES = ('ReplicaSetWithPrimary', 'Sharded', 'LoadBalanced')
+
+T = TypeVar('T')
+
+_listeners: List[Callable[[str, Optional[List[str]]], None]] = []
+
+def add_listener(listener: Callable[[str, Optional[List[str]]], None]) -> None:
+    """
+    Registers a function called after every bump made by the process, with the name of
+    the collection and the keys bumped, None for the global marker.
+    Args:
+        listener (Callable[[str, Optional[List[str]]], None]): The function.
+    Returns:
+        None
+    """
+    _listeners.append(listener)
+
+def _increment(collection: Collection, bumped: Optional[List[str]],
+               session: Optional[ClientSession] = None) -> bool:
+    """
+    Increments the markers of the given keys, or the global marker, with a single upsert.
+    Returns False if there was nothing to bump.
+    """
+    increments = {f'versions.{key}': 1 for key in (bumped if bumped is not None
+                                                   else [GLOBAL_KEY])}
+    if not increments:
+        return False
+    collection.database[CHANGE_MARKERS_COLLECTION].update_one(
+        {'_id': collection.name}, {'$inc': increments}, upsert=True, session=session)
+    return True
+
+def _notify(collection: Collection, bumped: Optional[List[str]]) -> None:
+    """
+    Tells the listeners about a bump.
+    """
+    for listener in _listeners:
+        listener(collection.name, bumped)
+
+def bump_markers(collection: Collection, keys: Optional[Iterable[str]] = None,
+                 session: Optional[ClientSession] = None) -> None:
+    """
+    Bumps the markers of a collection with a single upsert.
+    Args:
+        collection (Collection): The collection that was written to.
+        keys (Optional[Iterable[str]]): The keys whose data changed, None if the write
+                                        may have changed any key.
+        session (Optional[ClientSession]): The session of the transaction the bump is part
+                                           of. The listeners are still told right away.
+    Returns:
+        None
+    """
+    bumped = list(keys) if keys is not None else None
+    if _increment(collection, bumped, session):
+        _notify(collection, bumped)
+
+def supports_transactions(collection: Collection) -> bool:
+    """
+    Tells whether writes to a collection can run in a transaction, i.e. whether its client
+    is connected to a replica set, a sharded cluster or a load balancer. Until the client
+    has discovered the deployment, writes are made without one.
+    Args:
+        collection (Collection): The collection.
+    Returns:
+        bool: True if transactions are supported.
+    """
+    description = getattr(collection.database.client, 'topology_description', None)
+    return (isinstance(description, TopologyDescription)
+            and description.topology_type_name in TRANSACTIONAL_TOPOLOGIES)
+
+def write_and_bump(collection: Collection, write: Callable[[Optional[ClientSession]], T],
+                   keys_of: Callable[[T], Optional[Iterable[str]]]) -> T:
+    """
+    Runs a write and bumps the markers it changed. Where transactions are supported, both
+    run in one transaction, which `with_transaction` retries on transient errors, so
+    `write` may be called more than once and must only write through the session it is
+    given. Elsewhere, `write` is called with None and the markers are bumped after it.
+    The listeners are told once the bump is committed.
+    Args:
+        collection (Collection): The collection written to.
+        write (Callable[[Optional[ClientSession]], T]): The write, given the session to
+                                                         write with, if any.
+        keys_of (Callable[[T], Optional[Iterable[str]]]): Returns the keys the write
+                                                          changed from its result: None
+                                                          for the global marker, an empty
+                                                          list to bump nothing.
+    Returns:
+        T: The result of the write.
+    """
+    if not supports_transactions(collection):
+        result = write(None)
+        bump_markers(collection, keys_of(result))
+        return result
+
+    def transaction(session: ClientSession) -> Tuple[T, Optional[List[str]], bool]:
+        result = write(session)
+        keys = keys_of(result)
+        bumped = list(keys) if keys is not None else None
+        return result, bumped, _increment(collection, bumped, session)
+
+    with collection.database.client.start_session() as session:
+        result, bumped, incremented = session.with_transaction(transaction)
+    if incremented:
+        _notify(collection, bumped)
+    return result
+
+def read_marker(collection: Collection, key: str) -> str:
+    """
+    Returns the marker of a key, which changes whenever data of the key may have changed.
+    Args:
+        collection (Collection): The collection.
+        key (str): The key, e.g. an order status.
+    Returns:
+        str: The marker, as '<global counter>.<key counter>'.
+    """
+    markers = collection.database[CHANGE_MARKERS_COLLECTION].find_one(
+        {'_id': collection.name}, {f'versions.{GLOBAL_KEY}': 1, f'versions.{key}': 1})
+    versions = (markers or {}).get('versions', {})
+    return f"{versions.get(GLOBAL_KEY, 0)}.{versions.get(key, 0)}"
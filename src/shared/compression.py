@@ -0,0 +1,262 @@
+"""_summary_
+This module compresses the responses of a Flask application and helps endpoints answer
+conditional requests.
+
+Responses of at least `min_size` bytes with a JSON or text body are compressed with the
+best encoding the client accepts in `Accept-Encoding`: brotli if the `brotli` package is
+installed, else gzip. Streamed responses are sent as they are. When a compressed response
+carries an ETag, the encoding is appended to it (`"<tag>-gzip"`), so the ETag stays strong,
+i.e. it identifies the exact bytes sent, and `etag_matches` strips it again when a client
+revalidates.
+
+Endpoints that cache rendered bodies keep the compressed bytes too, so that cached GETs
+are not compressed again on every request: `pack_variants` stores the body in every
+encoding produced so far in one cache entry, `select_variant` picks the one the request
+accepts (compressing the body once if that encoding is missing) and `variant_response`
+sends it as is.
+
+The number of responses, the bytes before and after compression, the bytes sent, the
+CPU time spent compressing and the responses served from cached variants are reported
+under `compression` on `/metrics`.
+
+Functions:
+    init_compression(app: Flask, min_size: int, level: int) -> None:
+        Compresses the responses of an application.
+    etag_matches(tag: str) -> Optional[str]:
+        Returns the ETag of the request's `If-None-Match` matching a tag, if any.
+    pack_variants(meta: Dict[str, Any], variants: Dict[str, bytes]) -> bytes:
+        Packs the encodings of a body and its metadata into one cache entry.
+    unpack_variants(entry: bytes) -> Tuple[Dict[str, Any], Dict[str, bytes]]:
+        Unpacks a cache entry written by `pack_variants`.
+    select_variant(variants: Dict[str, bytes]) -> Tuple[str, bool]:
+        Picks the encoding of a body to send for the current request.
+    variant_response(variants: Dict[str, bytes], encoding: str, headers: Dict[str, str],
+                     mimetype: str) -> Response:
+        Builds the response sending one encoding of a body.
+    compression_stats() -> Dict[str, Any]:
+        Returns the compression statistics.
+Author:
+    @TheBarzani
+"""
+
+import gzip
+import json
+import time
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+from flask import Flask, Response, current_app, request
+from shared import metrics
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Encodings in order of preference
+ENCODINGS: List[str] = (['br'] if brotli else []) + ['gzip']
+IDENTITY = 'identity'
+
+_stats: Dict[str, Any] = {
+    'responses': 0,
+    'compressed': {encoding: 0 for encoding in ENCODINGS},
+    'not_modified': 0,
+    'bytes_uncompressed': 0,
+    'bytes_compressed': 0,
+    'bytes_sent': 0,
+    'compress_cpu_ms': 0.0,
+    'cached_variants_served': 0
+}
+_stats_lock = threading.Lock()
+
+def compression_stats() -> Dict[str, Any]:
+    """
+    Returns the compression statistics, including the ratio of compressed to uncompressed
+    bytes.
+    Returns:
+        Dict[str, Any]: The statistics.
+    """
+    with _stats_lock:
+        stats = dict(_stats, compressed=dict(_stats['compressed']))
+    stats['ratio'] = (stats['bytes_compressed'] / stats['bytes_uncompressed']
+                      if stats['bytes_uncompressed'] else None)
+    return stats
+
+def _compress(body: bytes, encoding: str, level: int) -> bytes:
+    """
+    Compresses a body with the given encoding.
+    """
+    if encoding == 'br':
+        return brotli.compress(body, quality=min(level, 11))
+    return gzip.compress(body, compresslevel=min(level, 9))
+
+def _compress_counted(body: bytes, encoding: str, level: int) -> bytes:
+    """
+    Compresses a body with the given encoding and records it in the statistics.
+    """
+    started = time.thread_time()
+    compressed = _compress(body, encoding, level)
+    cpu_ms = (time.thread_time() - started) * 1000
+    with _stats_lock:
+        _stats['compressed'][encoding] += 1
+        _stats['bytes_uncompressed'] += len(body)
+        _stats['bytes_compressed'] += len(compressed)
+        _stats['compress_cpu_ms'] += cpu_ms
+    return compressed
+
+def _mark_encoded(response: Response, encoding: str) -> None:
+    """
+    Sets the headers of a response whose body is compressed with the given encoding.
+    """
+    response.headers['Content-Encoding'] = encoding
+    tag, weak = response.get_etag()
+    if tag:
+        response.set_etag(f'{tag}-{encoding}', weak)
+
+def _is_compressible(response: Response) -> bool:
+    """
+    Tells whether a response is worth compressing, whatever its size.
+    """
+    return (response.status_code == 200 and not response.is_streamed
+            and not response.direct_passthrough
+            and 'Content-Encoding' not in response.headers
+            and (response.mimetype.startswith('text/') or response.mimetype.endswith('json')))
+
+def init_compression(app: Flask, min_size: int, level: int) -> None:
+    """
+    Compresses the responses of an application and registers the compression statistics.
+    Args:
+        app (Flask): The application.
+        min_size (int): The size in bytes from which responses are compressed.
+        level (int): The compression level, 1 to 9 for gzip and up to 11 for brotli.
+    Returns:
+        None
+    """
+
+    @app.after_request
+    def compress_response(response: Response) -> Response:
+        if response.status_code == 304:
+            with _stats_lock:
+                _stats['responses'] += 1
+                _stats['not_modified'] += 1
+            return response
+        if not _is_compressible(response):
+            with _stats_lock:
+                _stats['responses'] += 1
+                if not response.is_streamed:
+                    _stats['bytes_sent'] += response.content_length or 0
+            return response
+
+        response.vary.add('Accept-Encoding')
+        body = response.get_data()
+        encoding = request.accept_encodings.best_match(ENCODINGS)
+        if encoding is None or len(body) < min_size:
+            with _stats_lock:
+                _stats['responses'] += 1
+                _stats['bytes_sent'] += len(body)
+            return response
+
+        compressed = _compress_counted(body, encoding, level)
+        response.set_data(compressed)
+        _mark_encoded(response, encoding)
+        with _stats_lock:
+            _stats['responses'] += 1
+            _stats['bytes_sent'] += len(compressed)
+        return response
+
+    app.extensions['compression'] = {'min_size': min_size, 'level': level}
+    metrics.register('compression', compression_stats)
+
+def etag_matches(tag: str) -> Optional[str]:
+    """
+    Returns the ETag of the request's `If-None-Match` header that matches a tag, if any.
+    ETags of compressed variants match the tag they were derived from, and weak ETags
+    match too, as `If-None-Match` uses the weak comparison.
+    Args:
+        tag (str): The unquoted ETag of the current representation, before compression.
+    Returns:
+        Optional[str]: The matching ETag, as sent by the client and unquoted, or None.
+    """
+    for candidate in request.if_none_match.as_set(include_weak=True):
+        base = candidate
+        for encoding in ENCODINGS:
+            if base.endswith(f'-{encoding}'):
+                base = base[:-len(encoding) - 1]
+                break
+        if base == tag:
+            return candidate
+    return None
+
+def pack_variants(meta: Dict[str, Any], variants: Dict[str, bytes]) -> bytes:
+    """
+    Packs the encodings of a body and its metadata into one cache entry: a JSON line with
+    the metadata and the size of every variant, followed by the variants.
+    Args:
+        meta (Dict[str, Any]): What the endpoint needs besides the body, e.g. its headers.
+        variants (Dict[str, bytes]): The body by encoding, `IDENTITY` for the uncompressed
+                                     body.
+    Returns:
+        bytes: The cache entry.
+    """
+    sizes = [[encoding, len(body)] for encoding, body in variants.items()]
+    return (json.dumps({'meta': meta, 'sizes': sizes}).encode() + b'\n'
+            + b''.join(variants.values()))
+
+def unpack_variants(entry: bytes) -> Tuple[Dict[str, Any], Dict[str, bytes]]:
+    """
+    Unpacks a cache entry written by `pack_variants`.
+    Args:
+        entry (bytes): The cache entry.
+    Returns:
+        Tuple[Dict[str, Any], Dict[str, bytes]]: The metadata and the body by encoding.
+    """
+    header, _, data = entry.partition(b'\n')
+    packed = json.loads(header)
+    variants: Dict[str, bytes] = {}
+    offset = 0
+    for encoding, size in packed['sizes']:
+        variants[encoding] = data[offset:offset + size]
+        offset += size
+    return packed['meta'], variants
+
+def select_variant(variants: Dict[str, bytes]) -> Tuple[str, bool]:
+    """
+    Picks the encoding of a body to send for the current request, the way the responses
+    of the application are compressed. If the body is not cached in that encoding yet, it
+    is compressed from the `IDENTITY` variant and added to `variants`, which the caller
+    should then store again.
+    Args:
+        variants (Dict[str, bytes]): The body by encoding, with at least `IDENTITY`.
+    Returns:
+        Tuple[str, bool]: The encoding, and whether it was added to `variants`.
+    """
+    settings: Optional[Dict[str, int]] = current_app.extensions.get('compression')
+    body = variants[IDENTITY]
+    encoding = request.accept_encodings.best_match(ENCODINGS)
+    if settings is None or encoding is None or len(body) < settings['min_size']:
+        return IDENTITY, False
+    if encoding in variants:
+        return encoding, False
+    variants[encoding] = _compress_counted(body, encoding, settings['level'])
+    return encoding, True
+
+def variant_response(variants: Dict[str, bytes], encoding: str, headers: Dict[str, str],
+                     mimetype: str) -> Response:
+    """
+    Builds the response sending one encoding of a body, which the application does not
+    compress again.
+    Args:
+        variants (Dict[str, bytes]): The body by encoding.
+        encoding (str): The encoding to send, as returned by `select_variant`.
+        headers (Dict[str, str]): The headers of the response, with the ETag of the
+                                  uncompressed body if any.
+        mimetype (str): The mimetype of the body.
+    Returns:
+        Response: The response.
+    """
+    response = Response(variants[encoding], headers=headers, mimetype=mimetype)
+    response.vary.add('Accept-Encoding')
+    if encoding != IDENTITY:
+        _mark_encoded(response, encoding)
+        with _stats_lock:
+            _stats['cached_variants_served'] += 1
+    return response
@@ -1,11 +1,13 @@
 """_summary_
 This script sets up MongoDB collections for a microservices architecture.
-It initializes the 'users' and 'orders' collections with appropriate schema validation.
+It initializes the 'users' and 'orders' collections with schema validation generated
+from the shared JSON Schemas in `shared/schemas`, and creates their indexes from the spec
+in `shared.config.mongodb_indexes`.
 
 Functions:
     setup_users_collection(): Initializes the 'users' collection with schema validation.
     setup_orders_collection(): Initializes the 'orders' collection with schema validation.
-    main(): Main function to set up the MongoDB collections.
+    main(): Main function to set up the MongoDB collections and their indexes.
 
 Author:
     @TheBarzani
@@ -14,6 +16,8 @@ Author:
 import os
 from pymongo import MongoClient
 from dotenv import load_dotenv
+from shared.config.mongodb_indexes import ensure_indexes
+from shared.schemas import load_schema, to_mongo_schema
 
 # Load environment variables from .env
 load_dotenv()
@@ -34,51 +38,25 @@ def setup_users_collection() -> None:
     """
     Sets up the 'users' collection in the MongoDB database with a JSON schema validator.
 
-    The schema enforces the following structure:
-    - userId: string (required)
-    - firstName: string (optional)
-    - lastName: string (optional)
-    - emails: array of strings (required, each string must match the email pattern)
-    - deliveryAddress: object (required) with the following properties:
-        - street: string (required)
-        - city: string (required)
-        - state: string (required)
-        - postalCode: string (required)
-        - country: string (required)
-    - phoneNumber: string (optional, must match the pattern for phone numbers with 10 to 15 digits)
-    - createdAt: date (optional)
-    - updatedAt: date (optional)
+    The validator is generated from `shared/schemas/user_schema.json`, the schema the
+    user services validate requests against, so both always enforce the same structure:
+    userId, emails and deliveryAddress are required, emails must be an array of email
+    addresses, deliveryAddress must hold street, city, state, postalCode and
+    country, and phoneNumber must have 10 to 15 digits. Fields that only exist in the
+    database are added to it:
+    - version: int (optional, 1 for users created by V2, incremented by every update)
+    - outboxEventId: objectId (optional, marks a user update event not yet relayed)
+
+    The user services additionally reject requests with an empty emails array, which
+    the validator does not.
 
     If the collection already exists or creation fails, an exception is caught and an 
     error message is printed.
     """
-    user_schema: dict = {
-        "bsonType": "object",
-        "required": ["userId", "emails", "deliveryAddress"],
-        "properties": {
-            "userId": {"bsonType": "string"},
-            "firstName": {"bsonType": "string"},
-            "lastName": {"bsonType": "string"},
-            "emails": {
-                "bsonType": "array",
-                "items": {"bsonType": "string", "pattern": "^.+@.+$"}
-            },
-            "deliveryAddress": {
-                "bsonType": "object",
-                "required": ["street", "city", "state", "postalCode", "country"],
-                "properties": {
-                    "street": {"bsonType": "string"},
-                    "city": {"bsonType": "string"},
-                    "state": {"bsonType": "string"},
-                    "postalCode": {"bsonType": "string"},
-                    "country": {"bsonType": "string"}
-                }
-            },
-            "phoneNumber": {"bsonType": "string", "pattern": "^[0-9]{10,15}$"},
-            "createdAt": {"bsonType": "date"},
-            "updatedAt": {"bsonType": "date"}
-        }
-    }
+    user_schema: dict = to_mongo_schema(load_schema('user'), {
+        "version": {"bsonType": "int", "minimum": 1},
+        "outboxEventId": {"bsonType": "objectId"}
+    })
 
     db.create_collection("users", validator={"$jsonSchema": user_schema}, validationLevel="strict")
 
@@ -88,76 +66,38 @@ def setup_orders_collection() -> None:
     """
     Sets up the 'orders' collection in MongoDB with a JSON schema validator.
 
-    The schema for the 'orders' collection includes the following fields:
-    - orderId (string): Unique identifier for the order.
-    - items (array of objects): List of items in the order, each containing:
-        - itemId (string): Unique identifier for the item.
-        - name (string): Name of the item.
-        - quantity (int): Quantity of the item, must be at least 1.
-        - price (double): Price of the item, must be at least 0.
-    - userEmails (array of strings): List of user email addresses, each must match 
-                                     the email pattern.
-    - deliveryAddress (object): Delivery address containing:
-        - street (string): Street address.
-        - city (string): City name.
-        - state (string): State name.
-        - postalCode (string): Postal code.
-        - country (string): Country name.
-    - orderStatus (string): Status of the order, must be one of ["under process", 
-                            "shipping", "delivered"].
-    - createdAt (date): Date when the order was created.
-    - updatedAt (date): Date when the order was last updated.
+    The validator is generated from `shared/schemas/order_schema.json`, the schema the
+    order service validates requests against: orderId, items and orderStatus are
+    required, items must be an array of items with an itemId, an int quantity of at
+    least 1 and a non-negative price, and orderStatus must be one of ["under process",
+    "shipping", "delivered"]. Fields that only exist in the database are added to it:
+    - userVersion (int): Version of the user the contact details were last copied from.
+    - userFieldVersions (object): Version of the user each contact detail was last
+      copied from, 0 for a contact detail no versioned event has written.
+    userEmails and deliveryAddress, required by the order service on creation, are not
+    required in the database: orders stored in reference mode (`ORDERS_USER_FIELDS_MODE`)
+    resolve them from the user snapshots. The order service additionally rejects requests
+    with empty items or userEmails arrays, which the validator does not.
 
     If the collection already exists or creation fails, an exception is caught and 
     an error message is printed.
     """
 
-    order_schema: dict = {
-        "bsonType": "object",
-        "required": ["orderId", "items", "userEmails", "deliveryAddress", "orderStatus"],
-        "properties": {
-            "orderId": {"bsonType": "string"},
-            "userId": {"bsonType": "string"},
-            "items": {
-                "bsonType": "array",
-                "items": {
-                    "bsonType": "object",
-                    "required": ["itemId", "quantity", "price"],
-                    "properties": {
-                        "itemId": {"bsonType": "string"},
-                        "quantity": {"bsonType": "int", "minimum": 1},
-                        "price": {"bsonType": "double", "minimum": 0}
-                    }
-                }
-            },
-            "userEmails": {
-                "bsonType": "array",
-                "items": {"bsonType": "string", "pattern": "^.+@.+$"}
-            },
-            "deliveryAddress": {
-                "bsonType": "object",
-                "required": ["street", "city", "state", "postalCode", "country"],
-                "properties": {
-                    "street": {"bsonType": "string"},
-                    "city": {"bsonType": "string"},
-                    "state": {"bsonType": "string"},
-                    "postalCode": {"bsonType": "string"},
-                    "country": {"bsonType": "string"}
-                }
-            },
-            "orderStatus": {"bsonType": "string", "enum": ["under process", "shipping",
-                                                           "delivered"]},
-            "createdAt": {"bsonType": "date"},
-            "updatedAt": {"bsonType": "date"}
-        }
-    }
+    order_schema: dict = to_mongo_schema(load_schema('order'), {
+        "userVersion": {"bsonType": "int", "minimum": 1},
+        "userFieldVersions": {"bsonType": "object",
+                              "additionalProperties": {"bsonType": "int", "minimum": 0}}
+    })
+    order_schema['required'] = [field for field in order_schema['required']
+                                if field not in ('userEmails', 'deliveryAddress')]
 
     db.create_collection("orders", validator={"$jsonSchema": order_schema}, validationLevel=
                          "strict")
 
 def main() -> None:
     """
-    Main function to set up the MongoDB collections for users and orders.
+    Main function to set up the MongoDB collections for users and orders, and their
+    indexes.
     """
     print("Setting up MongoDB...")
     # Drop existing collections if they exist
@@ -165,6 +105,7 @@ def main() -> None:
     db.orders.drop()
     setup_users_collection()
     setup_orders_collection()
+    ensure_indexes(db)
     print("MongoDB setup complete.")
 
 if __name__ == "__main__":
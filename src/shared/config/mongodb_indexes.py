@@ -0,0 +1,128 @@
+"""_summary_
+This module declares the secondary indexes of the `users` and `orders` collections and
+applies them idempotently. It is used by `setup_mongodb.py` when the database is set up
+and by every service at startup, so a database created before an index was added to the
+spec gets it on the next deployment.
+
+Indexes keep MongoDB's default names (e.g. `orderId_1`), so creating an index that
+already exists with the same options is a no-op.
+
+Functions:
+    ensure_indexes(db: Database, collections: Optional[Iterable[str]]) -> Dict[str, List[str]]:
+        Creates the indexes of the spec that are missing.
+    check_indexes(db: Database) -> Dict[str, Dict[str, List[str]]]:
+        Reports missing, unexpected and unused indexes using `$indexStats`.
+Usage:
+    python -m shared.config.mongodb_indexes          # apply the spec
+    python -m shared.config.mongodb_indexes --check  # report, exit 1 if indexes are missing
+Author:
+    @TheBarzani
+"""
+
+import os
+import sys
+import argparse
+from typing import Dict, Iterable, List, Optional
+from pymongo import ASCENDING, IndexModel, MongoClient
+from pymongo.database import Database
+from pymongo.errors import OperationFailure
+from dotenv import load_dotenv
+
+load_dotenv()
+
+INDEX_SPEC: Dict[str, List[IndexModel]] = {
+    'users': [
+        # User lookups and updates by ID
+        IndexModel([('userId', ASCENDING)], unique=True),
+        # Multikey: no email address may belong to two users
+        IndexModel([('emails', ASCENDING)], unique=True),
+        # Users with a pending outbox event (shared.outbox.OUTBOX_FIELD)
+        IndexModel([('outboxEventId', ASCENDING)], sparse=True)
+    ],
+    'orders': [
+        # Order lookups and updates by ID
+        IndexModel([('orderId', ASCENDING)], unique=True),
+        # Orders of a user, for user update events
+        IndexModel([('userId', ASCENDING)]),
+        # Orders by status, newest or oldest first
+        IndexModel([('orderStatus', ASCENDING), ('createdAt', ASCENDING)]),
+        # Orders by status, in the keyset pagination order of GET /orders
+        IndexModel([('orderStatus', ASCENDING), ('_id', ASCENDING)])
+    ]
+}
+
+def ensure_indexes(db: Database,
+                   collections: Optional[Iterable[str]] = None) -> Dict[str, List[str]]:
+    """
+    Creates the indexes of the spec. Each index is created on its own, so an index
+    that cannot be built (e.g. a unique index over duplicated values) is reported without
+    preventing the others from being created.
+    Args:
+        db (Database): The database holding the collections.
+        collections (Optional[Iterable[str]]): The collections to index, all by default.
+    Returns:
+        Dict[str, List[str]]: Per collection, the names of the indexes of the spec that
+                              are now in place.
+    """
+    applied: Dict[str, List[str]] = {}
+    for collection_name in collections or INDEX_SPEC:
+        applied[collection_name] = []
+        for index in INDEX_SPEC[collection_name]:
+            try:
+                applied[collection_name] += db[collection_name].create_indexes([index])
+            except OperationFailure as e:
+                print(f"Could not create index {index.document['name']} on "
+                      f"{collection_name}: {e}", flush=True)
+    return applied
+
+def check_indexes(db: Database) -> Dict[str, Dict[str, List[str]]]:
+    """
+    Compares the indexes of every collection in the spec with the spec. Usage counters
+    from `$indexStats` are reset when the server restarts, so unused indexes are only
+    meaningful after the server has served representative traffic.
+    Args:
+        db (Database): The database holding the collections.
+    Returns:
+        Dict[str, Dict[str, List[str]]]: Per collection, the `missing` indexes of the
+                                         spec, the `unexpected` indexes not in the spec
+                                         and the `unused` indexes never accessed.
+    """
+    report: Dict[str, Dict[str, List[str]]] = {}
+    for collection_name, indexes in INDEX_SPEC.items():
+        expected = [index.document['name'] for index in indexes]
+        stats = {stat['name']: stat['accesses']['ops']
+                 for stat in db[collection_name].aggregate([{'$indexStats': {}}])}
+        report[collection_name] = {
+            'missing': [name for name in expected if name not in stats],
+            'unexpected': [name for name in stats if name not in expected and name != '_id_'],
+            'unused': [name for name, ops in stats.items() if ops == 0 and name != '_id_']
+        }
+    return report
+
+def main() -> None:
+    """
+    Applies the index spec, or reports on it with `--check`.
+    """
+    parser = argparse.ArgumentParser(description='Apply or check the MongoDB index spec.')
+    parser.add_argument('--check', action='store_true',
+                        help='Report missing, unexpected and unused indexes instead')
+    args = parser.parse_args()
+
+    client = MongoClient(os.getenv('MONGO_URI'))
+    db = client[os.getenv('DATABASE_NAME')]
+    if not args.check:
+        for collection_name, names in ensure_indexes(db).items():
+            print(f"{collection_name}: {', '.join(names)}")
+        return
+
+    report = check_indexes(db)
+    for collection_name, findings in report.items():
+        for finding, names in findings.items():
+            if names:
+                print(f"{collection_name}: {finding} {', '.join(names)}")
+    if any(findings['missing'] for findings in report.values()):
+        sys.exit(1)
+    print("All indexes of the spec are in place.")
+
+if __name__ == "__main__":
+    main()
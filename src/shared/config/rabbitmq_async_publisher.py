@@ -0,0 +1,462 @@
+"""_summary_
+This module provides an asynchronous RabbitMQ publisher that takes event publishing off
+the HTTP request path. Messages are appended to a bounded in-process buffer and a
+background sender thread drains the buffer in batches over its own connection. Every
+batch is published in one AMQP transaction: the messages are sent back to back and a
+single `tx_commit` round trip waits for the broker to accept all of them, so a message
+only leaves the buffer once the broker has accepted it, at the cost of one round trip
+per batch rather than per message. (The blocking pika adapter waits for every publisher
+confirm in turn, which would cost a round trip per message.)
+
+When the buffer is full, the configured overflow policy applies:
+    block: the caller waits for free space, up to `RABBITMQ_PUBLISH_BLOCK_TIMEOUT` seconds,
+           after which the message is spilled as in 'spill' mode rather than failing a
+           request whose write has already been committed.
+    drop_oldest: the oldest buffered message is discarded to make room.
+    spill: the message is appended to a file in `RABBITMQ_PUBLISH_SPILL_DIR` and replayed
+           by the sender once the buffer has drained.
+
+Every process spills to its own file, named after its pid, so gunicorn workers never
+append to or drain each other's files. Files left behind by processes that have exited
+are picked up by whichever live worker claims them first, with an atomic rename. Spill
+files are read line by line: a line that cannot be decoded, e.g. one cut short by a
+crash, is moved to a `.corrupt` file next to them instead of losing the rest of the file.
+
+Classes:
+    AsyncRabbitMQPublisher: Buffers messages and publishes them from a background thread.
+Functions:
+    get_async_publisher(queue_name: str) -> AsyncRabbitMQPublisher:
+        Returns the asynchronous publisher for the given queue, creating it on first use.
+Environment Variables:
+    RABBITMQ_PUBLISH_BUFFER_SIZE: Maximum number of buffered messages (default: 10000).
+    RABBITMQ_PUBLISH_BATCH_SIZE: Maximum number of messages sent per batch (default: 100).
+    RABBITMQ_PUBLISH_OVERFLOW: One of 'block', 'drop_oldest' or 'spill' (default: 'block').
+    RABBITMQ_PUBLISH_BLOCK_TIMEOUT: Seconds to wait for space in 'block' mode (default: 5).
+    RABBITMQ_PUBLISH_SPILL_DIR: Directory for spilled messages (default: /tmp).
+Author:
+    @TheBarzani
+"""
+
+import atexit
+import json
+import base64
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple, Union
+import pika
+from pika.exceptions import AMQPChannelError, AMQPConnectionError
+from dotenv import load_dotenv
+from shared import metrics
+from shared.config.rabbitmq_config import EXCHANGE_NAME, get_connection
+from shared.config.rabbitmq_topology import declare_user_events_topology
+
+load_dotenv()
+
+PUBLISH_BUFFER_SIZE = int(os.getenv('RABBITMQ_PUBLISH_BUFFER_SIZE', '10000'))
+PUBLISH_BATCH_SIZE = int(os.getenv('RABBITMQ_PUBLISH_BATCH_SIZE', '100'))
+PUBLISH_OVERFLOW = os.getenv('RABBITMQ_PUBLISH_OVERFLOW', 'block')
+PUBLISH_BLOCK_TIMEOUT = float(os.getenv('RABBITMQ_PUBLISH_BLOCK_TIMEOUT', '5'))
+PUBLISH_SPILL_DIR = os.getenv('RABBITMQ_PUBLISH_SPILL_DIR', '/tmp')
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ('block', 'drop_oldest', 'spill')
+RECONNECT_DELAY = 1.0
+# Seconds between two scans of the spill directory for files of exited processes
+ORPHAN_SCAN_INTERVAL = 30.0
+
+# A buffered message: (exchange, routing key, body, properties other than the delivery mode)
+Message = Tuple[str, str, bytes, Dict[str, Any]]
+
+class AsyncRabbitMQPublisher:
+    """
+    Buffers messages in memory and publishes them from a background thread in
+    transactional batches. `publish` only appends to the buffer, so it returns without
+    touching the network unless the buffer is full and the overflow policy is 'block'.
+    Attributes:
+        queue_name (str): The queue bound to the exchange, also used as the routing key.
+        max_size (int): Maximum number of buffered messages.
+        batch_size (int): Maximum number of messages taken from the buffer per batch.
+        overflow (str): The overflow policy, one of `OVERFLOW_POLICIES`.
+        block_timeout (float): Seconds `publish` waits for space in 'block' mode.
+        spill_dir (str): The directory spilled messages are written to.
+    """
+
+    def __init__(self, queue_name: str, max_size: int = PUBLISH_BUFFER_SIZE,
+                 batch_size: int = PUBLISH_BATCH_SIZE, overflow: str = PUBLISH_OVERFLOW,
+                 block_timeout: float = PUBLISH_BLOCK_TIMEOUT,
+                 spill_dir: str = PUBLISH_SPILL_DIR) -> None:
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f'Invalid overflow policy: {overflow}')
+        self.queue_name = queue_name
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.spill_dir = spill_dir
+        self._next_orphan_scan = 0.0
+        self._buffer: Deque[Message] = deque()
+        self._condition = threading.Condition()
+        self._spill_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._pid = os.getpid()
+        self._stopping = False
+        self._connection: Optional[pika.BlockingConnection] = None
+        self._channel: Optional[pika.channel.Channel] = None
+        self._stats: Dict[str, float] = {
+            'enqueued': 0,
+            'published': 0,
+            'dropped': 0,
+            'spilled': 0,
+            'block_timeouts': 0,
+            'spill_corrupt': 0,
+            'publish_failures': 0,
+            'sender_errors': 0,
+            'batches': 0,
+            'confirm_latency_ms_total': 0.0,
+            'confirm_latency_ms_max': 0.0
+        }
+
+    def _ensure_started(self) -> None:
+        """
+        Starts the sender thread on first use, and again in a freshly forked worker, which
+        inherits the buffer object but not the thread.
+        """
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._condition:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._buffer.clear()
+                self._connection = None
+                self._channel = None
+                self._thread = None
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True,
+                                                name=f'async-publisher-{self.queue_name}')
+                self._thread.start()
+
+    def publish(self, body: Union[str, bytes], routing_key: Optional[str] = None,
+                properties: Optional[Dict[str, Any]] = None,
+                exchange: Optional[str] = None) -> None:
+        """
+        Appends a message to the buffer. The message is published by the sender thread.
+        Args:
+            body (Union[str, bytes]): The message body.
+            routing_key (Optional[str]): The routing key, defaults to the queue name.
+            properties (Optional[Dict[str, Any]]): The AMQP properties of the message
+                                                   (e.g. `content_type`, `headers`), as
+                                                   keyword arguments of
+                                                   `pika.BasicProperties`. Messages are
+                                                   always persistent.
+            exchange (Optional[str]): The exchange, defaults to the `user_order` exchange.
+        Returns:
+            None
+        """
+        self._ensure_started()
+        message: Message = (exchange or EXCHANGE_NAME, routing_key or self.queue_name,
+                            body.encode() if isinstance(body, str) else body,
+                            properties or {})
+        with self._condition:
+            if len(self._buffer) >= self.max_size:
+                if self.overflow == 'drop_oldest':
+                    self._buffer.popleft()
+                    self._stats['dropped'] += 1
+                elif self.overflow == 'spill':
+                    self._spill([message])
+                    return
+                elif not self._condition.wait_for(lambda: len(self._buffer) < self.max_size,
+                                                  timeout=self.block_timeout):
+                    self._stats['block_timeouts'] += 1
+                    self._spill([message])
+                    return
+            self._buffer.append(message)
+            self._stats['enqueued'] += 1
+            self._condition.notify_all()
+
+    @property
+    def spill_path(self) -> str:
+        """
+        The file this process appends spilled messages to.
+        """
+        return os.path.join(self.spill_dir, f'{self.queue_name}.spill.{os.getpid()}.ndjson')
+
+    @property
+    def corrupt_path(self) -> str:
+        """
+        The file this process moves spilled lines that cannot be decoded to.
+        """
+        return os.path.join(self.spill_dir, f'{self.queue_name}.spill.{os.getpid()}.corrupt')
+
+    def _spill(self, messages: List[Message]) -> None:
+        """
+        Appends messages to the spill file of the process, one JSON document per line, with
+        the body in base64 since it may be binary.
+        """
+        with self._spill_lock:
+            with open(self.spill_path, 'a', encoding='utf-8') as spill_file:
+                for exchange, routing_key, body, properties in messages:
+                    spill_file.write(json.dumps({
+                        'exchange': exchange,
+                        'routingKey': routing_key,
+                        'body64': base64.b64encode(body).decode(),
+                        'properties': properties}) + '\n')
+        with self._condition:
+            self._stats['spilled'] += len(messages)
+
+    def _spill_files(self) -> List[str]:
+        """
+        Returns the spill files waiting to be drained by this process: its own, and, at
+        most every `ORPHAN_SCAN_INTERVAL` seconds, those of processes that have exited,
+        including files they were draining and files named before spill files had a pid.
+        """
+        paths = [self.spill_path] if os.path.exists(self.spill_path) else []
+        if time.monotonic() < self._next_orphan_scan:
+            return paths
+        self._next_orphan_scan = time.monotonic() + ORPHAN_SCAN_INTERVAL
+        prefix = f'{self.queue_name}.spill.'
+        try:
+            names = os.listdir(self.spill_dir)
+        except OSError:
+            return paths
+        for name in names:
+            pid = name[len(prefix):].split('.', 1)[0]
+            if (name.startswith(prefix) and name.endswith(('.ndjson', '.draining'))
+                    and not (pid.isdigit() and _process_alive(int(pid)))):
+                paths.append(os.path.join(self.spill_dir, name))
+        return paths
+
+    def _take_spilled(self, paths: List[str]) -> List[Message]:
+        """
+        Moves spill files aside and returns their messages so they can be published. Each
+        file is renamed to a draining name unique to this drain first, so a file claimed
+        by another process in the meantime is skipped. Lines that cannot be decoded are
+        appended to `corrupt_path` and counted under `spill_corrupt`.
+        """
+        messages: List[Message] = []
+        for path in paths:
+            draining_path = f'{self.spill_path}.{uuid.uuid4().hex}.draining'
+            with self._spill_lock:
+                try:
+                    os.replace(path, draining_path)
+                except FileNotFoundError:
+                    continue
+            corrupt: List[bytes] = []
+            # Read as bytes so that a line with invalid UTF-8 is only one corrupt line
+            with open(draining_path, 'rb') as spill_file:
+                for line in spill_file:
+                    if not line.strip():
+                        continue
+                    try:
+                        messages.append(_decode_spilled(line))
+                    except ValueError:
+                        corrupt.append(line if line.endswith(b'\n') else line + b'\n')
+            if corrupt:
+                with self._spill_lock:
+                    with open(self.corrupt_path, 'ab') as corrupt_file:
+                        corrupt_file.writelines(corrupt)
+                with self._condition:
+                    self._stats['spill_corrupt'] += len(corrupt)
+                logger.error('Moved %d undecodable spilled messages of %s to %s',
+                             len(corrupt), path, self.corrupt_path)
+            os.remove(draining_path)
+        return messages
+
+    def _next_batch(self) -> List[Message]:
+        """
+        Waits for buffered messages and takes up to `batch_size` of them from the buffer.
+        Spilled messages are only picked up once the in-memory buffer is empty.
+        """
+        spill_files = self._spill_files()
+        with self._condition:
+            self._condition.wait_for(lambda: self._buffer or self._stopping,
+                                     timeout=0 if spill_files else 1.0)
+            batch = [self._buffer.popleft()
+                     for _ in range(min(self.batch_size, len(self._buffer)))]
+            self._condition.notify_all()
+        if not batch and spill_files:
+            spilled = self._take_spilled(spill_files)
+            if spilled:
+                with self._condition:
+                    # Whatever does not fit goes back to disk on the next overflow
+                    room = max(self.max_size - len(self._buffer), 0)
+                    self._buffer.extend(spilled[:room])
+                if spilled[room:]:
+                    self._spill(spilled[room:])
+        return batch
+
+    def _get_channel(self) -> pika.channel.Channel:
+        """
+        Returns the sender thread's channel, connecting and selecting transactions as
+        needed.
+        """
+        if self._connection is None or not self._connection.is_open:
+            self._connection = get_connection()
+            self._channel = None
+        if self._channel is None or not self._channel.is_open:
+            self._channel = self._connection.channel()
+            declare_user_events_topology(self._channel, self.queue_name)
+            self._channel.tx_select()
+        return self._channel
+
+    def _send(self, batch: List[Message]) -> None:
+        """
+        Publishes a batch in one transaction: every message is sent without waiting, and
+        the batch is removed from `batch` once the commit confirms the broker accepted all
+        of it. On failure, nothing of the batch was committed and `batch` is left whole;
+        a commit lost after the broker applied it republishes the batch, which consumers
+        discard as stale by version.
+        """
+        channel = self._get_channel()
+        started = time.perf_counter()
+        sent = 0
+        try:
+            for exchange, routing_key, body, properties in batch:
+                channel.basic_publish(exchange=exchange, routing_key=routing_key,
+                                      body=body, properties=pika.BasicProperties(
+                                          delivery_mode=pika.DeliveryMode.Persistent,
+                                          **properties))
+            channel.tx_commit()
+            sent = len(batch)
+        finally:
+            del batch[:sent]
+            latency_ms = (time.perf_counter() - started) * 1000
+            with self._condition:
+                self._stats['published'] += sent
+                self._stats['batches'] += 1
+                self._stats['confirm_latency_ms_total'] += latency_ms
+                self._stats['confirm_latency_ms_max'] = max(
+                    self._stats['confirm_latency_ms_max'], latency_ms)
+
+    def _run(self) -> None:
+        """
+        Sender loop: drains the buffer batch by batch. On a broker failure, the
+        uncommitted batch is kept and retried first once the sender has reconnected, so
+        messages are published in the order they were buffered. Any other error is logged
+        and handled the same way, so the sender thread never dies with messages buffered.
+        """
+        batch: List[Message] = []
+        while batch or self._buffer or not self._stopping:
+            try:
+                if not batch:
+                    batch = self._next_batch()
+                    if not batch:
+                        continue
+                self._send(batch)
+            except (AMQPConnectionError, AMQPChannelError):
+                with self._condition:
+                    self._stats['publish_failures'] += 1
+            except Exception:  # pylint: disable=broad-except
+                logger.exception('Async publisher for %s failed, retrying in %.1fs',
+                                 self.queue_name, RECONNECT_DELAY)
+                with self._condition:
+                    self._stats['sender_errors'] += 1
+            else:
+                continue
+            self._connection = None
+            self._channel = None
+            if self._stopping:
+                break
+            time.sleep(RECONNECT_DELAY)
+        if batch and self.overflow == 'spill':
+            self._spill(batch)
+
+    def close(self, timeout: float = 5.0) -> None:
+        """
+        Stops the sender thread after it has drained the buffer, waiting at most
+        `timeout` seconds. In 'spill' mode, messages still buffered afterwards are
+        written to the spill file so the next process can publish them.
+        Args:
+            timeout (float): Maximum number of seconds to wait for the buffer to drain.
+        Returns:
+            None
+        """
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout)
+        if self.overflow == 'spill':
+            with self._condition:
+                leftover = list(self._buffer)
+                self._buffer.clear()
+            if leftover:
+                self._spill(leftover)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns the buffer and confirm statistics of the publisher.
+        Returns:
+            Dict[str, Any]: The queue depth, counters for enqueued, published, dropped,
+                            spilled and corrupt spilled messages, block timeouts and
+                            failures, plus confirm latencies: the time from the first
+                            publish of a batch to its commit.
+        """
+        with self._condition:
+            stats: Dict[str, Any] = dict(self._stats)
+            stats['depth'] = len(self._buffer)
+        stats['max_size'] = self.max_size
+        stats['overflow'] = self.overflow
+        stats['confirm_latency_ms_avg'] = (stats['confirm_latency_ms_total'] / stats['batches']
+                                           if stats['batches'] else 0.0)
+        stats['queue'] = self.queue_name
+        return stats
+
+def _decode_spilled(line: bytes) -> Message:
+    """
+    Decodes a line of a spill file. Files spilled before bodies were binary hold them as
+    text, and older files hold no exchange.
+    Raises:
+        ValueError: If the line is not a spilled message.
+    """
+    try:
+        entry = json.loads(line)
+        body = (base64.b64decode(entry['body64'], validate=True) if 'body64' in entry
+                else entry['body'].encode())
+        message: Message = (entry.get('exchange', EXCHANGE_NAME), entry['routingKey'], body,
+                            entry.get('properties') or {})
+        # Properties pika does not accept would fail every batch the message is sent in
+        pika.BasicProperties(**message[3])
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        raise ValueError(f'Undecodable spilled message: {e!r}') from e
+    if not (isinstance(message[0], str) and isinstance(message[1], str)):
+        raise ValueError('Undecodable spilled message: the exchange or routing key is not text')
+    return message
+
+def _process_alive(pid: int) -> bool:
+    """
+    Returns whether a process with the given pid is running.
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+_publishers: Dict[str, AsyncRabbitMQPublisher] = {}
+_publishers_lock = threading.Lock()
+
+def get_async_publisher(queue_name: str) -> AsyncRabbitMQPublisher:
+    """
+    Returns the asynchronous publisher for the given queue, creating it and registering
+    its statistics under `rabbitmq_async_publisher` on first use. The publisher is
+    drained when the process exits.
+    Args:
+        queue_name (str): The queue bound to the exchange, also used as the routing key.
+    Returns:
+        AsyncRabbitMQPublisher: The publisher for the queue.
+    """
+    with _publishers_lock:
+        publisher = _publishers.get(queue_name)
+        if publisher is None:
+            publisher = AsyncRabbitMQPublisher(queue_name)
+            _publishers[queue_name] = publisher
+            metrics.register(f'rabbitmq_async_publisher.{queue_name}', publisher.stats)
+            atexit.register(publisher.close)
+        return publisher
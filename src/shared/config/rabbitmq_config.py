@@ -5,6 +5,8 @@ and creating channels with specified queues and exchanges.
 Functions:
     get_connection() -> pika.BlockingConnection:
         Establishes and returns a connection to the RabbitMQ server using the provided credentials.
+    declare_topology(channel: pika.channel.Channel, queue_name: str) -> None:
+        Declares the exchange and the queue on the given channel and binds them together.
     create_channel(queue_name: str) -> Tuple[pika.channel.Channel, pika.BlockingConnection]:
         Creates a channel, declares an exchange and a queue, binds them together, and returns 
         the channel and connection.
@@ -27,6 +29,7 @@ RABBITMQ_HOST = os.getenv('RABBITMQ_HOST')
 RABBITMQ_PORT = int(os.getenv('RABBITMQ_PORT'))
 RABBITMQ_USER = os.getenv('RABBITMQ_USER', 'admin')
 RABBITMQ_PASSWORD = os.getenv('RABBITMQ_PASSWORD', 'admin')
+EXCHANGE_NAME = "user_order"
 
 def get_connection() -> pika.BlockingConnection:
     """
@@ -39,6 +42,25 @@ def get_connection() -> pika.BlockingConnection:
                                                              port=RABBITMQ_PORT,
                                                              credentials=credentials))
 
+def declare_topology(channel: pika.channel.Channel, queue_name: str) -> None:
+    """
+    Declares the exchange and the queue on the given channel and binds them together.
+    Declarations are idempotent, so calling this on an existing topology is harmless.
+    Args:
+        channel (pika.channel.Channel): An open channel to declare the topology on.
+        queue_name (str): The name of the queue and routing key for the exchange.
+    Returns:
+        None
+    """
+    # Declare an exchange
+    channel.exchange_declare(exchange=EXCHANGE_NAME, exchange_type='direct', durable=True)
+
+    # Declare a queue
+    channel.queue_declare(queue=queue_name, durable=True)
+
+    # Bind the queue to the exchange with a routing key
+    channel.queue_bind(exchange=EXCHANGE_NAME, queue=queue_name, routing_key=queue_name)
+
 def create_channel(queue_name: str) -> Tuple[pika.channel.Channel, pika.BlockingConnection]:
     """
     Creates a channel, declares an exchange and a queue, binds them together, and returns
@@ -51,13 +73,6 @@ def create_channel(queue_name: str) -> Tuple[pika.channel.Channel, pika.Blocking
     """
     connection = get_connection()
     channel = connection.channel()
-    # Declare an exchange
-    channel.exchange_declare(exchange="user_order", exchange_type='direct', durable=True)
-
-    # Declare a queue
-    channel.queue_declare(queue=queue_name, durable=True)
-
-    # Bind the queue to the exchange with a routing key
-    channel.queue_bind(exchange="user_order", queue=queue_name, routing_key=queue_name)
+    declare_topology(channel, queue_name)
 
     return channel, connection
@@ -0,0 +1,203 @@
+"""_summary_
+This module provides a long-lived RabbitMQ publisher shared by the user services.
+Instead of opening a connection, declaring the exchange and queue, publishing and closing
+again for every message, each worker thread keeps its own connection and channel open and
+reuses them. The topology is declared once per process, and a connection that was dropped
+by the broker is re-established transparently on the next publish.
+
+Classes:
+    RabbitMQPublisher: Keeps per-thread connections and channels alive and publishes
+                       messages on them.
+Functions:
+    get_publisher(queue_name: str) -> RabbitMQPublisher:
+        Returns the publisher for the given queue, creating it on first use.
+Author:
+    @TheBarzani
+"""
+
+import os
+import threading
+from typing import Any, Dict, Optional, Union
+import pika
+from pika.exceptions import AMQPChannelError, AMQPConnectionError
+from shared import metrics
+from shared.config.rabbitmq_config import EXCHANGE_NAME, get_connection
+from shared.config.rabbitmq_topology import declare_user_events_topology
+
+class RabbitMQPublisher:
+    """
+    Publishes messages to the user event exchanges over connections that outlive a single
+    request. pika connections are not thread-safe, so every thread gets its own connection
+    and channel; the publisher keeps track of them to report pool statistics.
+    Attributes:
+        queue_name (str): The queue bound to the exchange, also used as the routing key.
+        max_retries (int): How many times a publish is retried on a fresh connection
+                           after the current one turned out to be broken.
+    """
+
+    def __init__(self, queue_name: str, max_retries: int = 1) -> None:
+        self.queue_name = queue_name
+        self.max_retries = max_retries
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._topology_declared = False
+        self._connections: Dict[int, pika.BlockingConnection] = {}
+        self._stats: Dict[str, int] = {
+            'connections_opened': 0,
+            'reconnects': 0,
+            'published': 0,
+            'publish_failures': 0
+        }
+
+    def _reset_after_fork(self) -> None:
+        """
+        Drops the connections inherited from a parent process. A forked gunicorn worker
+        must never share a socket with its parent, so it starts with an empty pool.
+        """
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._local = threading.local()
+            self._connections = {}
+            self._topology_declared = False
+
+    def _open(self) -> pika.channel.Channel:
+        """
+        Opens a new connection and channel for the calling thread, declaring the topology
+        if this process has not done so yet.
+        """
+        connection = get_connection()
+        channel = connection.channel()
+        with self._lock:
+            if not self._topology_declared:
+                declare_user_events_topology(channel, self.queue_name)
+                self._topology_declared = True
+            stale = self._connections.get(threading.get_ident())
+            self._connections[threading.get_ident()] = connection
+            self._stats['connections_opened'] += 1
+        if stale is not None and stale is not connection and stale.is_open:
+            # Thread identifiers are reused, so this belongs to a thread that has exited.
+            stale.close()
+        self._local.connection = connection
+        self._local.channel = channel
+        return channel
+
+    def _discard(self) -> None:
+        """
+        Forgets the calling thread's connection so the next publish opens a new one.
+        """
+        connection = getattr(self._local, 'connection', None)
+        self._local.connection = None
+        self._local.channel = None
+        with self._lock:
+            if (connection is not None
+                    and self._connections.get(threading.get_ident()) is connection):
+                del self._connections[threading.get_ident()]
+        if connection is not None and connection.is_open:
+            try:
+                connection.close()
+            except (AMQPConnectionError, AMQPChannelError):
+                pass
+
+    def _get_channel(self) -> pika.channel.Channel:
+        """
+        Returns the calling thread's channel, opening a connection or a channel as needed.
+        """
+        if self._pid != os.getpid():
+            self._reset_after_fork()
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or not connection.is_open:
+            return self._open()
+        if self._local.channel is None or not self._local.channel.is_open:
+            self._local.channel = connection.channel()
+        # Service the heartbeats that arrived while the connection sat idle between requests.
+        connection.process_data_events(time_limit=0)
+        return self._local.channel
+
+    def publish(self, body: Union[str, bytes], routing_key: Optional[str] = None,
+                properties: Optional[pika.BasicProperties] = None,
+                exchange: Optional[str] = None) -> None:
+        """
+        Publishes a message on the calling thread's long-lived channel. If the connection
+        turns out to be broken, it is replaced and the publish is retried.
+        Args:
+            body (Union[str, bytes]): The message body.
+            routing_key (Optional[str]): The routing key, defaults to the queue name.
+            properties (Optional[pika.BasicProperties]): Optional AMQP message properties.
+            exchange (Optional[str]): The exchange, defaults to the `user_order` exchange.
+        Returns:
+            None
+        Raises:
+            pika.exceptions.AMQPError: If the message could not be published after
+                                       `max_retries` reconnections.
+        """
+        attempts = 0
+        while True:
+            try:
+                channel = self._get_channel()
+                channel.basic_publish(exchange=exchange or EXCHANGE_NAME,
+                                      routing_key=routing_key or self.queue_name,
+                                      body=body,
+                                      properties=properties)
+                with self._lock:
+                    self._stats['published'] += 1
+                return
+            except (AMQPConnectionError, AMQPChannelError):
+                self._discard()
+                with self._lock:
+                    if attempts >= self.max_retries:
+                        self._stats['publish_failures'] += 1
+                        raise
+                    self._stats['reconnects'] += 1
+                attempts += 1
+
+    def close(self) -> None:
+        """
+        Closes every connection held by the publisher. Intended for shutdown only.
+        """
+        with self._lock:
+            connections = list(self._connections.values())
+            self._connections = {}
+            self._local = threading.local()
+        for connection in connections:
+            if connection.is_open:
+                try:
+                    connection.close()
+                except (AMQPConnectionError, AMQPChannelError):
+                    pass
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns the pool statistics of the publisher.
+        Returns:
+            Dict[str, Any]: Counters for opened connections, reconnects, published messages
+                            and failed publishes, plus the number of open connections.
+        """
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._stats)
+            stats['open_connections'] = sum(1 for connection in self._connections.values()
+                                            if connection.is_open)
+        stats['queue'] = self.queue_name
+        return stats
+
+_publishers: Dict[str, RabbitMQPublisher] = {}
+_publishers_lock = threading.Lock()
+
+def get_publisher(queue_name: str) -> RabbitMQPublisher:
+    """
+    Returns the publisher for the given queue, creating it and registering its statistics
+    under `rabbitmq_publisher` on first use.
+    Args:
+        queue_name (str): The queue bound to the exchange, also used as the routing key.
+    Returns:
+        RabbitMQPublisher: The publisher for the queue.
+    """
+    with _publishers_lock:
+        publisher = _publishers.get(queue_name)
+        if publisher is None:
+            publisher = RabbitMQPublisher(queue_name)
+            _publishers[queue_name] = publisher
+            metrics.register(f'rabbitmq_publisher.{queue_name}', publisher.stats)
+        return publisher
@@ -0,0 +1,302 @@
+"""_summary_
+This module adds delayed retries and a parking queue on top of the topology declared by
+`shared.config.rabbitmq_topology.declare_user_events_topology`, so that a message whose
+processing fails neither kills the consumer nor gets redelivered in a tight loop.
+
+A failed message is acknowledged on the main queue and republished to a retry queue.
+Each retry queue holds messages for a fixed time (`x-message-ttl`) and then dead-letters
+them back to the `user_order` exchange with the main queue as routing key, whichever
+exchange the message was first published to. There is one retry queue per attempt, with
+exponentially growing delays, so every queue expires its messages in FIFO order and a
+message waiting for a long retry never holds back one waiting for a short retry. Since
+failed messages leave the main queue immediately, healthy traffic keeps flowing behind
+them. After `RABBITMQ_RETRY_MAX_ATTEMPTS` attempts, or straight away for messages that
+can never succeed (e.g. undecodable bodies), the message goes to the parking queue,
+where it stays until it is inspected and replayed. If the republish itself fails, the
+original delivery is requeued on the main queue rather than acknowledged.
+
+Topology for a queue named `q`:
+    q.retry.<n>.<delay_ms>: Retry queue for attempt n, with a delay of
+                            `RABBITMQ_RETRY_BASE_DELAY_MS * 2**(n-1)` milliseconds.
+    q.parking: Parking queue for poison messages.
+
+The delay is part of the retry queue name because the broker refuses to redeclare a
+queue with another `x-message-ttl`: changing `RABBITMQ_RETRY_BASE_DELAY_MS` declares new
+retry queues instead of failing the consumer at startup. Messages still waiting in the
+retry queues of the previous delays dead-letter back to the main queue as usual; those
+queues can be deleted once they are empty.
+
+Functions:
+    retry_delays(max_attempts: int, base_delay_ms: int) -> List[int]:
+        Returns the delay of every retry.
+    declare_retry_topology(channel: pika.channel.Channel, queue_name: str) -> None:
+        Declares the retry and parking queues of a queue.
+    create_retry_channel(queue_name: str) -> Tuple[pika.channel.Channel, pika.BlockingConnection]:
+        Creates a channel with the user events and retry topologies declared.
+    retry_or_park(channel: pika.channel.Channel, queue_name: str, body: bytes,
+                  properties: Optional[pika.BasicProperties], error: Exception,
+                  retryable: bool) -> str:
+        Republishes a failed message to its next retry queue, or parks it.
+    settle_failed(channel: pika.channel.Channel, queue_name: str, delivery_tag: int,
+                  body: bytes, properties: Optional[pika.BasicProperties],
+                  error: Exception, retryable: bool, ack: bool) -> str:
+        Retries or parks a failed delivery, requeueing it if the republish fails.
+Environment Variables:
+    RABBITMQ_RETRY_MAX_ATTEMPTS: Attempts before a message is parked (default: 5).
+    RABBITMQ_RETRY_BASE_DELAY_MS: Delay before the first retry (default: 1000).
+Usage:
+    python -m shared.config.rabbitmq_retry inspect [--queue QUEUE] [--limit N]
+    python -m shared.config.rabbitmq_retry replay [--queue QUEUE] [--limit N]
+    python -m shared.config.rabbitmq_retry purge [--queue QUEUE]
+Author:
+    @TheBarzani
+"""
+
+import os
+import logging
+import argparse
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+import pika
+from pika.exceptions import AMQPError
+from dotenv import load_dotenv
+from shared import metrics
+from shared.config.rabbitmq_config import EXCHANGE_NAME, get_connection
+from shared.config.rabbitmq_topology import declare_user_events_topology
+
+load_dotenv()
+
+RETRY_MAX_ATTEMPTS = int(os.getenv('RABBITMQ_RETRY_MAX_ATTEMPTS', '5'))
+RETRY_BASE_DELAY_MS = int(os.getenv('RABBITMQ_RETRY_BASE_DELAY_MS', '1000'))
+
+logger = logging.getLogger(__name__)
+
+ATTEMPT_HEADER = 'x-retry-attempt'
+ERROR_HEADER = 'x-last-error'
+
+_stats: Dict[str, int] = {'retried': 0, 'parked': 0, 'requeued': 0}
+_stats_lock = threading.Lock()
+metrics.register('rabbitmq_retry', lambda: dict(_stats))
+
+def retry_delays(max_attempts: int = RETRY_MAX_ATTEMPTS,
+                 base_delay_ms: int = RETRY_BASE_DELAY_MS) -> List[int]:
+    """
+    Returns the delay of every retry. The first attempt is the original delivery, so
+    there are `max_attempts - 1` retries, each waiting twice as long as the previous one.
+    Args:
+        max_attempts (int): The total number of attempts, including the first delivery.
+        base_delay_ms (int): The delay before the first retry, in milliseconds.
+    Returns:
+        List[int]: The delay before each retry, in milliseconds.
+    """
+    return [base_delay_ms * 2 ** retry for retry in range(max(max_attempts - 1, 0))]
+
+def retry_queue_name(queue_name: str, retry: int, delay_ms: int) -> str:
+    """
+    Returns the name of the retry queue used for the given retry (starting at 1) when it
+    is delayed by `delay_ms` milliseconds.
+    """
+    return f'{queue_name}.retry.{retry}.{delay_ms}'
+
+def parking_queue_name(queue_name: str) -> str:
+    """
+    Returns the name of the parking queue of the given queue.
+    """
+    return f'{queue_name}.parking'
+
+def declare_retry_topology(channel: pika.channel.Channel, queue_name: str) -> None:
+    """
+    Declares the retry queues and the parking queue of a queue. Retry queues are fed
+    through the default exchange and dead-letter expired messages back to the main queue.
+    Args:
+        channel (pika.channel.Channel): An open channel to declare the topology on.
+        queue_name (str): The name of the main queue.
+    Returns:
+        None
+    """
+    for retry, delay_ms in enumerate(retry_delays(), start=1):
+        channel.queue_declare(queue=retry_queue_name(queue_name, retry, delay_ms),
+                              durable=True,
+                              arguments={'x-message-ttl': delay_ms,
+                                         'x-dead-letter-exchange': EXCHANGE_NAME,
+                                         'x-dead-letter-routing-key': queue_name})
+    channel.queue_declare(queue=parking_queue_name(queue_name), durable=True)
+
+def create_retry_channel(queue_name: str) -> Tuple[pika.channel.Channel,
+                                                   pika.BlockingConnection]:
+    """
+    Creates a channel and declares the user events topology of the queue, including the
+    topic exchange bindings in topic mode, and its retry topology on it. Publisher
+    confirms are enabled, so a message republished by `retry_or_park` on the channel has
+    been accepted by the broker before the original delivery is acknowledged.
+    Args:
+        queue_name (str): The name of the queue and routing key for the exchange.
+    Returns:
+        Tuple[pika.channel.Channel, pika.BlockingConnection]: A tuple containing the channel
+        and connection objects.
+    """
+    connection = get_connection()
+    channel = connection.channel()
+    declare_user_events_topology(channel, queue_name)
+    declare_retry_topology(channel, queue_name)
+    channel.confirm_delivery()
+    return channel, connection
+
+def attempt_of(properties: Optional[pika.BasicProperties]) -> int:
+    """
+    Returns how many times a message has been attempted so far, counting the delivery
+    it came with.
+    """
+    headers: Dict[str, Any] = (properties.headers if properties and properties.headers
+                               else {})
+    return int(headers.get(ATTEMPT_HEADER, 0)) + 1
+
+def retry_or_park(channel: pika.channel.Channel, queue_name: str, body: bytes,
+                  properties: Optional[pika.BasicProperties], error: Exception,
+                  retryable: bool = True) -> str:
+    """
+    Republishes a failed message to its next retry queue, or to the parking queue if it
+    has used up its attempts or is not retryable. On a channel created by
+    `create_retry_channel`, this returns once the broker has confirmed the republished
+    message. The caller must still acknowledge the original delivery, and must do so only
+    after this function returns.
+    Args:
+        channel (pika.channel.Channel): The channel the message was consumed on.
+        queue_name (str): The name of the main queue.
+        body (bytes): The message body.
+        properties (Optional[pika.BasicProperties]): The message properties.
+        error (Exception): The error raised while processing the message.
+        retryable (bool): False if retrying cannot help, e.g. for an undecodable body.
+    Returns:
+        str: 'retried' or 'parked'.
+    Raises:
+        pika.exceptions.NackError: If the broker refused the republished message. The
+                                   original delivery must then be left unacknowledged.
+    """
+    attempt = attempt_of(properties)
+    delays = retry_delays()
+    headers: Dict[str, Any] = dict(properties.headers or {}) if properties else {}
+    headers[ATTEMPT_HEADER] = attempt
+    headers[ERROR_HEADER] = f'{type(error).__name__}: {error}'[:500]
+    retry_properties = pika.BasicProperties(
+        content_type=properties.content_type if properties else None,
+        content_encoding=properties.content_encoding if properties else None,
+        delivery_mode=pika.DeliveryMode.Persistent,
+        headers=headers)
+
+    if retryable and attempt <= len(delays):
+        target, outcome = retry_queue_name(queue_name, attempt, delays[attempt - 1]), 'retried'
+    else:
+        target, outcome = parking_queue_name(queue_name), 'parked'
+    channel.basic_publish(exchange='', routing_key=target, body=body,
+                          properties=retry_properties)
+    with _stats_lock:
+        _stats[outcome] += 1
+    # Parked messages need someone to look at them; retries are expected to recover
+    logger.log(logging.WARNING if outcome == 'parked' else logging.INFO,
+               'Message %s after attempt %d (%s)', outcome, attempt, headers[ERROR_HEADER])
+    return outcome
+
+def settle_failed(channel: pika.channel.Channel, queue_name: str, delivery_tag: int,
+                  body: bytes, properties: Optional[pika.BasicProperties],
+                  error: Exception, retryable: bool = True, ack: bool = True) -> str:
+    """
+    Hands a failed delivery to `retry_or_park` and settles it. If the broker refuses the
+    republished message or the publish fails, the original delivery is rejected with
+    `requeue=True` instead of being acknowledged, so the message is never lost and the
+    consumer keeps running.
+    Args:
+        channel (pika.channel.Channel): The channel the message was consumed on.
+        queue_name (str): The name of the main queue.
+        delivery_tag (int): The delivery tag of the failed message.
+        body (bytes): The message body.
+        properties (Optional[pika.BasicProperties]): The message properties.
+        error (Exception): The error raised while processing the message.
+        retryable (bool): False if retrying cannot help, e.g. for an undecodable body.
+        ack (bool): False if the caller acknowledges the delivery itself, e.g. with the
+                    rest of its batch through `multiple=True`.
+    Returns:
+        str: 'retried', 'parked' or 'requeued'.
+    """
+    try:
+        outcome = retry_or_park(channel, queue_name, body, properties, error, retryable)
+    except AMQPError as e:
+        with _stats_lock:
+            _stats['requeued'] += 1
+        logger.warning('Could not republish a failed message, requeueing it (%r)', e)
+        # A closed channel returns its unacknowledged deliveries to the queue by itself
+        if channel.is_open:
+            channel.basic_nack(delivery_tag=delivery_tag, requeue=True)
+        return 'requeued'
+    if ack:
+        channel.basic_ack(delivery_tag=delivery_tag)
+    return outcome
+
+def inspect_parked(queue_name: str, limit: int) -> None:
+    """
+    Prints up to `limit` parked messages without removing them from the parking queue.
+    """
+    channel, connection = create_retry_channel(queue_name)
+    for _ in range(limit):
+        method, properties, body = channel.basic_get(parking_queue_name(queue_name),
+                                                     auto_ack=False)
+        if method is None:
+            break
+        headers = properties.headers or {}
+        print(f"[attempts={headers.get(ATTEMPT_HEADER)}] {headers.get(ERROR_HEADER)}\n"
+              f"    {body[:500]!r}")
+    # Closing the connection returns every unacknowledged message to the parking queue
+    connection.close()
+
+def replay_parked(queue_name: str, limit: int) -> int:
+    """
+    Moves up to `limit` parked messages back to the main queue with a fresh attempt
+    count. Each message is removed from the parking queue only once the broker has
+    confirmed its republication.
+    Returns:
+        int: The number of replayed messages.
+    """
+    channel, connection = create_retry_channel(queue_name)
+    replayed = 0
+    while replayed < limit:
+        method, properties, body = channel.basic_get(parking_queue_name(queue_name),
+                                                     auto_ack=False)
+        if method is None:
+            break
+        headers = {key: value for key, value in (properties.headers or {}).items()
+                   if key not in (ATTEMPT_HEADER, ERROR_HEADER)}
+        channel.basic_publish(exchange=EXCHANGE_NAME, routing_key=queue_name, body=body,
+                              properties=pika.BasicProperties(
+                                  content_type=properties.content_type,
+                                  content_encoding=properties.content_encoding,
+                                  delivery_mode=pika.DeliveryMode.Persistent,
+                                  headers=headers))
+        channel.basic_ack(delivery_tag=method.delivery_tag)
+        replayed += 1
+    connection.close()
+    return replayed
+
+def main() -> None:
+    """
+    Command line interface to inspect, replay or purge parked messages.
+    """
+    parser = argparse.ArgumentParser(description='Inspect and replay parked messages.')
+    parser.add_argument('command', choices=['inspect', 'replay', 'purge'])
+    parser.add_argument('--queue', default=os.getenv('RABBITMQ_QUEUE_NAME'),
+                        help='The main queue (default: $RABBITMQ_QUEUE_NAME)')
+    parser.add_argument('--limit', type=int, default=100,
+                        help='Maximum number of messages to inspect or replay')
+    args = parser.parse_args()
+
+    if args.command == 'inspect':
+        inspect_parked(args.queue, args.limit)
+    elif args.command == 'replay':
+        print(f"Replayed {replay_parked(args.queue, args.limit)} messages")
+    else:
+        channel, connection = create_retry_channel(args.queue)
+        purged = channel.queue_purge(parking_queue_name(args.queue)).method.message_count
+        connection.close()
+        print(f"Purged {purged} messages")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""_summary_
+This module declares the RabbitMQ topology the user events travel through, from a spec,
+and tells publishers where each event goes.
+
+With `RABBITMQ_TOPOLOGY=direct` (the default), every event is published to the `direct`
+`user_order` exchange with the queue name as routing key, so every consumer of the queue
+gets every event. With `RABBITMQ_TOPOLOGY=topic`, events are published to the `topic`
+`user_events` exchange with a routing key naming what happened:
+
+    user.created            A user was created.
+    user.email.updated      Only the emails of a user changed.
+    user.address.updated    Only the delivery address of a user changed.
+    user.profile.updated    Several fields changed, or the changed fields are unknown.
+
+and queues only receive the events matching their bindings, so a new downstream service
+subscribes by binding its own queue without adding load to the order queue. The spec
+lists the exchanges and the queues with their bindings; `DEFAULT_TOPOLOGY` binds the
+order queue to every user event, and `RABBITMQ_TOPOLOGY_FILE` may point to a JSON file
+with another spec. The `user_order` exchange and its queue binding are declared in both
+modes, since retried messages are dead-lettered through them, and producers that are
+not upgraded yet keep being delivered.
+
+Functions:
+    load_topology(path: Optional[str]) -> Dict[str, Any]:
+        Returns the topology spec of the file, or the default one.
+    declare_spec(channel: pika.channel.Channel, spec: Dict[str, Any]) -> None:
+        Declares the exchanges, queues and bindings of a spec.
+    declare_user_events_topology(channel: pika.channel.Channel, queue_name: str) -> None:
+        Declares everything the user events of a queue travel through.
+    user_event_routing_key(changed_fields: Optional[List[str]]) -> str:
+        Returns the routing key of a user update event.
+    publish_target(routing_key: str, queue_name: str) -> Tuple[str, str]:
+        Returns the exchange and routing key an event is published with.
+Environment Variables:
+    RABBITMQ_TOPOLOGY: 'direct' or 'topic' (default: 'direct').
+    RABBITMQ_TOPOLOGY_FILE: A JSON file holding the topology spec (default: none).
+Author:
+    @TheBarzani
+"""
+
+import os
+import json
+from typing import Any, Dict, List, Optional, Tuple
+import pika
+from dotenv import load_dotenv
+from shared.config.rabbitmq_config import EXCHANGE_NAME, declare_topology
+
+load_dotenv()
+
+TOPOLOGY_MODE = os.getenv('RABBITMQ_TOPOLOGY', 'direct')
+TOPOLOGY_FILE = os.getenv('RABBITMQ_TOPOLOGY_FILE')
+USER_EVENTS_EXCHANGE = 'user_events'
+
+USER_CREATED = 'user.created'
+USER_EMAIL_UPDATED = 'user.email.updated'
+USER_ADDRESS_UPDATED = 'user.address.updated'
+USER_PROFILE_UPDATED = 'user.profile.updated'
+# The routing key of an update event changing a single field, by event field
+FIELD_ROUTING_KEYS: Dict[str, str] = {'userEmails': USER_EMAIL_UPDATED,
+                                      'deliveryAddress': USER_ADDRESS_UPDATED}
+
+DEFAULT_TOPOLOGY: Dict[str, Any] = {
+    'exchanges': [{'name': USER_EVENTS_EXCHANGE, 'type': 'topic'}],
+    'queues': [{
+        'name': os.getenv('RABBITMQ_QUEUE_NAME'),
+        # The order service copies the emails and address, and records new users' ones
+        'bindings': [{'exchange': USER_EVENTS_EXCHANGE,
+                      'routing_keys': [USER_CREATED, USER_EMAIL_UPDATED,
+                                       USER_ADDRESS_UPDATED, USER_PROFILE_UPDATED]}]
+    }]
+}
+
+def load_topology(path: Optional[str] = TOPOLOGY_FILE) -> Dict[str, Any]:
+    """
+    Returns the topology spec held by a JSON file, or `DEFAULT_TOPOLOGY`.
+    Args:
+        path (Optional[str]): The path of the file, None for the default spec.
+    Returns:
+        Dict[str, Any]: The spec: 'exchanges', a list of {'name', 'type'}, and 'queues', a
+                        list of {'name', 'bindings'}, bindings being lists of
+                        {'exchange', 'routing_keys'}.
+    Raises:
+        OSError: If the file cannot be read.
+        ValueError: If the file is not valid JSON.
+    """
+    if not path:
+        return DEFAULT_TOPOLOGY
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+def declare_spec(channel: pika.channel.Channel, spec: Dict[str, Any]) -> None:
+    """
+    Declares the exchanges, queues and bindings of a topology spec. Declarations are
+    idempotent, so calling this on an existing topology is harmless.
+    Args:
+        channel (pika.channel.Channel): An open channel to declare the topology on.
+        spec (Dict[str, Any]): The topology spec, as returned by `load_topology`.
+    Returns:
+        None
+    """
+    for exchange in spec.get('exchanges', []):
+        channel.exchange_declare(exchange=exchange['name'], exchange_type=exchange['type'],
+                                 durable=True)
+    for queue in spec.get('queues', []):
+        channel.queue_declare(queue=queue['name'], durable=True)
+        for binding in queue.get('bindings', []):
+            for routing_key in binding['routing_keys']:
+                channel.queue_bind(exchange=binding['exchange'], queue=queue['name'],
+                                   routing_key=routing_key)
+
+_topology: Optional[Dict[str, Any]] = None
+
+def declare_user_events_topology(channel: pika.channel.Channel, queue_name: str) -> None:
+    """
+    Declares the `user_order` exchange and the queue bound to it and, in topic mode, the
+    topology spec. The spec is read once per process.
+    Args:
+        channel (pika.channel.Channel): An open channel to declare the topology on.
+        queue_name (str): The name of the queue and routing key for the `user_order`
+                          exchange.
+    Returns:
+        None
+    """
+    global _topology  # pylint: disable=global-statement
+    declare_topology(channel, queue_name)
+    if TOPOLOGY_MODE == 'topic':
+        if _topology is None:
+            _topology = load_topology()
+        declare_spec(channel, _topology)
+
+def user_event_routing_key(changed_fields: Optional[List[str]]) -> str:
+    """
+    Returns the routing key of a user update event.
+    Args:
+        changed_fields (Optional[List[str]]): The event fields the update changed, None if
+                                              unknown.
+    Returns:
+        str: `user.email.updated` or `user.address.updated` if only that field changed,
+             `user.profile.updated` otherwise.
+    """
+    if changed_fields is not None and len(changed_fields) == 1:
+        return FIELD_ROUTING_KEYS.get(changed_fields[0], USER_PROFILE_UPDATED)
+    return USER_PROFILE_UPDATED
+
+def publish_target(routing_key: str, queue_name: str) -> Tuple[str, str]:
+    """
+    Returns the exchange and routing key a user event is published with.
+    Args:
+        routing_key (str): The routing key of the event, e.g. `user.created`.
+        queue_name (str): The queue of the publisher, the routing key in direct mode.
+    Returns:
+        Tuple[str, str]: The exchange and the routing key.
+    """
+    if TOPOLOGY_MODE == 'topic':
+        return USER_EVENTS_EXCHANGE, routing_key
+    return EXCHANGE_NAME, queue_name
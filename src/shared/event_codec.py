@@ -0,0 +1,202 @@
+"""_summary_
+This module encodes the events exchanged between the services into message bodies and
+decodes them back, describing every body with its AMQP properties so that producers and
+consumers can change encoding independently.
+
+A body is produced by a codec, named by the `content_type` property: JSON (the default,
+and the only encoding of producers predating this module), BSON, which pymongo provides,
+and MessagePack if the `msgpack` package is installed. Further codecs can be added with
+`register_codec`. Bodies of at least `EVENT_COMPRESSION_MIN_SIZE` bytes are compressed
+with zlib, stated by `content_encoding: deflate`. The `x-schema-version` header carries
+the version of the event payload; consumers refuse events of a schema version newer
+than `SCHEMA_VERSION`, which are then parked until the consumer is upgraded. Messages
+without properties are decoded as JSON of the first schema version.
+
+The number of events encoded and decoded per codec, the bytes before and after
+compression and the CPU time spent are reported under `event_codec` on `/metrics`.
+
+Classes:
+    Codec: A named encoding of events into bytes.
+Functions:
+    register_codec(codec: Codec) -> None:
+        Makes a codec available for encoding and decoding.
+    encode_event(event: Dict[str, Any], codec_name: str, compress_min_size: int)
+        -> Tuple[bytes, Dict[str, Any]]:
+        Encodes an event and returns its body and AMQP properties.
+    decode_event(body: bytes, properties: Any) -> Dict[str, Any]:
+        Decodes an event from its body and AMQP properties.
+    codec_stats() -> Dict[str, Any]:
+        Returns the codec statistics.
+Environment Variables:
+    EVENT_CODEC: The codec events are published with (default: 'json').
+    EVENT_COMPRESSION_MIN_SIZE: The body size from which events are compressed, 0 to
+                                never compress (default: 1024).
+Author:
+    @TheBarzani
+"""
+
+import os
+import json
+import time
+import zlib
+import threading
+from typing import Any, Callable, Dict, Tuple
+import bson
+from dotenv import load_dotenv
+from shared import metrics
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+load_dotenv()
+
+EVENT_CODEC = os.getenv('EVENT_CODEC', 'json')
+EVENT_COMPRESSION_MIN_SIZE = int(os.getenv('EVENT_COMPRESSION_MIN_SIZE', '1024'))
+# The version of the event payloads published by this code
+SCHEMA_VERSION = 1
+SCHEMA_VERSION_HEADER = 'x-schema-version'
+COMPRESSED_ENCODING = 'deflate'
+
+class Codec:
+    """
+    A named encoding of events into bytes.
+    Attributes:
+        name (str): The name the codec is selected by, e.g. in `EVENT_CODEC`.
+        content_type (str): The `content_type` property of the bodies it produces.
+        encode (Callable[[Dict[str, Any]], bytes]): Encodes an event.
+        decode (Callable[[bytes], Dict[str, Any]]): Decodes an event.
+    """
+
+    def __init__(self, name: str, content_type: str,
+                 encode: Callable[[Dict[str, Any]], bytes],
+                 decode: Callable[[bytes], Dict[str, Any]]) -> None:
+        self.name = name
+        self.content_type = content_type
+        self.encode = encode
+        self.decode = decode
+
+_codecs: Dict[str, Codec] = {}
+_codecs_by_content_type: Dict[str, Codec] = {}
+_stats: Dict[str, Any] = {
+    'encoded': {},
+    'decoded': {},
+    'compressed': 0,
+    'bytes_uncompressed': 0,
+    'bytes_encoded': 0,
+    'encode_cpu_ms': 0.0,
+    'decode_cpu_ms': 0.0
+}
+_stats_lock = threading.Lock()
+
+def register_codec(codec: Codec) -> None:
+    """
+    Makes a codec available for encoding, by name, and for decoding, by content type.
+    Registering a codec under an existing name replaces it.
+    Args:
+        codec (Codec): The codec.
+    Returns:
+        None
+    """
+    _codecs[codec.name] = codec
+    _codecs_by_content_type[codec.content_type] = codec
+
+register_codec(Codec('json', 'application/json',
+                     lambda event: json.dumps(event, separators=(',', ':')).encode(),
+                     json.loads))
+register_codec(Codec('bson', 'application/bson', bson.encode, bson.decode))
+if msgpack is not None:
+    register_codec(Codec('msgpack', 'application/msgpack', msgpack.packb, msgpack.unpackb))
+
+def codec_stats() -> Dict[str, Any]:
+    """
+    Returns the codec statistics, including the ratio of sent to uncompressed bytes.
+    Returns:
+        Dict[str, Any]: The statistics.
+    """
+    with _stats_lock:
+        stats = dict(_stats, encoded=dict(_stats['encoded']), decoded=dict(_stats['decoded']))
+    stats['ratio'] = (stats['bytes_encoded'] / stats['bytes_uncompressed']
+                      if stats['bytes_uncompressed'] else None)
+    return stats
+
+metrics.register('event_codec', codec_stats)
+
+def encode_event(event: Dict[str, Any], codec_name: str = EVENT_CODEC,
+                 compress_min_size: int = EVENT_COMPRESSION_MIN_SIZE
+                 ) -> Tuple[bytes, Dict[str, Any]]:
+    """
+    Encodes an event with a codec, and compresses it if it is large enough.
+    Args:
+        event (Dict[str, Any]): The event payload.
+        codec_name (str): The name of the codec.
+        compress_min_size (int): The body size from which the body is compressed, 0 to
+                                 never compress.
+    Returns:
+        Tuple[bytes, Dict[str, Any]]: The body, and the `content_type`,
+                                      `content_encoding` and `headers` properties
+                                      describing it, as keyword arguments of
+                                      `pika.BasicProperties`.
+    Raises:
+        ValueError: If no codec has the given name.
+    """
+    codec = _codecs.get(codec_name)
+    if codec is None:
+        raise ValueError(f"Unknown event codec '{codec_name}'")
+    started = time.thread_time()
+    body = codec.encode(event)
+    size = len(body)
+    encoding = None
+    if 0 < compress_min_size <= size:
+        body, encoding = zlib.compress(body), COMPRESSED_ENCODING
+    cpu_ms = (time.thread_time() - started) * 1000
+    with _stats_lock:
+        _stats['encoded'][codec.name] = _stats['encoded'].get(codec.name, 0) + 1
+        _stats['compressed'] += int(encoding is not None)
+        _stats['bytes_uncompressed'] += size
+        _stats['bytes_encoded'] += len(body)
+        _stats['encode_cpu_ms'] += cpu_ms
+    return body, {'content_type': codec.content_type, 'content_encoding': encoding,
+                  'headers': {SCHEMA_VERSION_HEADER: SCHEMA_VERSION}}
+
+def decode_event(body: bytes, properties: Any = None) -> Dict[str, Any]:
+    """
+    Decodes an event from its body and AMQP properties.
+    Args:
+        body (bytes): The message body.
+        properties (Any): The `pika.BasicProperties` of the message, None for a JSON body.
+    Returns:
+        Dict[str, Any]: The event payload.
+    Raises:
+        ValueError: If the body cannot be decoded: unknown content type or encoding, newer
+                    schema version, corrupt body, or a payload that is not an object.
+                    Retrying such a message cannot succeed.
+    """
+    content_type = getattr(properties, 'content_type', None) or 'application/json'
+    encoding = getattr(properties, 'content_encoding', None)
+    headers: Dict[str, Any] = getattr(properties, 'headers', None) or {}
+    codec = _codecs_by_content_type.get(content_type)
+    if codec is None:
+        raise ValueError(f"Unsupported event content type '{content_type}'")
+    if encoding not in (None, COMPRESSED_ENCODING):
+        raise ValueError(f"Unsupported event content encoding '{encoding}'")
+    schema_version = headers.get(SCHEMA_VERSION_HEADER, 1)
+    if not isinstance(schema_version, int) or schema_version > SCHEMA_VERSION:
+        raise ValueError(f"Unsupported event schema version {schema_version!r}")
+
+    started = time.thread_time()
+    try:
+        event = codec.decode(zlib.decompress(body) if encoding else body)
+    except ValueError:
+        raise
+    except Exception as e:  # pylint: disable=broad-except
+        # Codecs raise their own errors on corrupt bodies, e.g. bson.errors.InvalidBSON
+        raise ValueError(f'Corrupt {codec.name} event: {e}') from e
+    cpu_ms = (time.thread_time() - started) * 1000
+    if not isinstance(event, dict):
+        raise ValueError('The event is not an object')
+    with _stats_lock:
+        _stats['decoded'][codec.name] = _stats['decoded'].get(codec.name, 0) + 1
+        _stats['decode_cpu_ms'] += cpu_ms
+    return event
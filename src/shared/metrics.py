@@ -0,0 +1,55 @@
+"""_summary_
+This module provides a minimal in-process registry for runtime statistics.
+Components such as the RabbitMQ publisher register a provider function under a name,
+and the services expose a snapshot of every registered provider on `GET /metrics`.
+
+Functions:
+    register(name: str, provider: Callable[[], Dict[str, Any]]) -> None:
+        Registers (or replaces) a statistics provider under the given name.
+    unregister(name: str) -> None:
+        Removes the provider registered under the given name, if any.
+    snapshot() -> Dict[str, Dict[str, Any]]:
+        Collects the current statistics from every registered provider.
+Author:
+    @TheBarzani
+"""
+
+import threading
+from typing import Any, Callable, Dict
+
+_providers: Dict[str, Callable[[], Dict[str, Any]]] = {}
+_lock = threading.Lock()
+
+def register(name: str, provider: Callable[[], Dict[str, Any]]) -> None:
+    """
+    Registers a statistics provider. Registering a second provider under the same name
+    replaces the first one.
+    Args:
+        name (str): The name the statistics are reported under.
+        provider (Callable[[], Dict[str, Any]]): A function returning the current statistics.
+    Returns:
+        None
+    """
+    with _lock:
+        _providers[name] = provider
+
+def unregister(name: str) -> None:
+    """
+    Removes the provider registered under the given name, if any.
+    Args:
+        name (str): The name the provider was registered under.
+    Returns:
+        None
+    """
+    with _lock:
+        _providers.pop(name, None)
+
+def snapshot() -> Dict[str, Dict[str, Any]]:
+    """
+    Collects the current statistics from every registered provider.
+    Returns:
+        Dict[str, Dict[str, Any]]: The statistics of each provider, keyed by name.
+    """
+    with _lock:
+        providers = dict(_providers)
+    return {name: provider() for name, provider in providers.items()}
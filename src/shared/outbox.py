@@ -0,0 +1,222 @@
+"""_summary_
+This module implements a transactional outbox for user update events, together with the
+relay worker that delivers them to RabbitMQ.
+
+The deployed MongoDB is a standalone server, which does not support multi-document
+transactions, so the outbox entry lives on the user document itself: the same
+`update_one` that changes a user also sets `outboxEventId` to a fresh ObjectId. The write
+and the pending event therefore succeed or fail together. The relay tails users with a
+pending event in batches (through a sparse index, oldest first), publishes the user's
+current emails and delivery address, and then clears the marker only if it still holds
+the token that was published. Every batch is published in one AMQP transaction, so one
+`tx_commit` round trip confirms the whole batch, and its markers are cleared by a single
+`bulk_write`. A user updated again in the
+meantime keeps its marker and is published once more in the next batch, and several
+updates of the same user between two batches collapse into one event. Since the relay
+does not know which updates a collapsed event covers, it publishes every field, with
+the `user.profile.updated` routing key when events go through the topic exchange.
+
+Functions:
+    mark_user_event_pending(update: Dict[str, Any]) -> Dict[str, Any]:
+        Adds a pending outbox event to the `$set` fields of a user update.
+    discard_user_event(users_collection: Collection, user_id: str,
+                       update: Dict[str, Any]) -> None:
+        Withdraws the pending outbox event added to a user update.
+    ensure_outbox_index(users_collection: Collection) -> None:
+        Creates the sparse index the relay tails.
+Classes:
+    OutboxRelay: Publishes pending user update events in batches and clears them.
+Environment Variables:
+    OUTBOX_BATCH_SIZE: Maximum number of events relayed per batch (default: 500).
+    OUTBOX_POLL_INTERVAL: Seconds to wait when the outbox is drained (default: 0.5).
+Usage:
+    python -m shared.outbox
+Author:
+    @TheBarzani
+"""
+
+import os
+import time
+from typing import Any, Dict, List, Optional
+import pika
+from bson.objectid import ObjectId
+from pika.exceptions import AMQPChannelError, AMQPConnectionError
+from pymongo import MongoClient, UpdateOne
+from pymongo.collection import Collection
+from pymongo.errors import PyMongoError
+from dotenv import load_dotenv
+from shared.config.rabbitmq_config import get_connection
+from shared.config.rabbitmq_topology import (USER_PROFILE_UPDATED, declare_user_events_topology,
+                                             publish_target)
+from shared.user_events import user_update_event_from_user
+from shared.event_codec import encode_event
+
+load_dotenv()
+
+OUTBOX_FIELD = 'outboxEventId'
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', '500'))
+OUTBOX_POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', '0.5'))
+RECONNECT_DELAY = 1.0
+
+def mark_user_event_pending(update: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Adds a pending outbox event to the `$set` fields of a user update, so that the update
+    and its event are persisted by the same single-document write.
+    Args:
+        update (Dict[str, Any]): The fields about to be `$set` on the user document.
+    Returns:
+        Dict[str, Any]: The same dictionary, with the outbox marker added.
+    """
+    update[OUTBOX_FIELD] = ObjectId()
+    return update
+
+def discard_user_event(users_collection: Collection, user_id: str,
+                       update: Dict[str, Any]) -> None:
+    """
+    Withdraws the pending outbox event added to a user update by `mark_user_event_pending`,
+    e.g. because the update changed nothing consumers care about. The marker is only
+    cleared if it was not replaced by a newer update in the meantime. Callers must not
+    withdraw the event if the user already had one pending before the update.
+    Args:
+        users_collection (Collection): The users collection.
+        user_id (str): The ID of the user.
+        update (Dict[str, Any]): The `$set` fields of the update, with the outbox marker.
+    Returns:
+        None
+    """
+    users_collection.update_one({'userId': user_id, OUTBOX_FIELD: update[OUTBOX_FIELD]},
+                                {'$unset': {OUTBOX_FIELD: ''}})
+
+def ensure_outbox_index(users_collection: Collection) -> None:
+    """
+    Creates the sparse index on the outbox marker. Only users with a pending event are
+    indexed, so tailing the outbox never scans the users collection.
+    Args:
+        users_collection (Collection): The users collection.
+    Returns:
+        None
+    """
+    users_collection.create_index(OUTBOX_FIELD, sparse=True)
+
+class OutboxRelay:
+    """
+    Relays pending user update events from the users collection to RabbitMQ.
+    Attributes:
+        users_collection (Collection): The users collection holding the outbox markers.
+        queue_name (str): The queue bound to the exchange, also used as the routing key.
+        batch_size (int): Maximum number of events relayed per batch.
+        poll_interval (float): Seconds to wait when the outbox is drained.
+    """
+
+    def __init__(self, users_collection: Collection, queue_name: str,
+                 batch_size: int = OUTBOX_BATCH_SIZE,
+                 poll_interval: float = OUTBOX_POLL_INTERVAL) -> None:
+        self.users_collection = users_collection
+        self.queue_name = queue_name
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._connection: Optional[pika.BlockingConnection] = None
+        self._channel: Optional[pika.channel.Channel] = None
+        self._stats: Dict[str, int] = {'batches': 0, 'published': 0, 'superseded': 0}
+
+    def _get_channel(self) -> pika.channel.Channel:
+        """
+        Returns the relay's channel, connecting and selecting transactions as needed.
+        """
+        if self._connection is None or not self._connection.is_open:
+            self._connection = get_connection()
+            self._channel = None
+        if self._channel is None or not self._channel.is_open:
+            self._channel = self._connection.channel()
+            declare_user_events_topology(self._channel, self.queue_name)
+            self._channel.tx_select()
+        return self._channel
+
+    def relay_batch(self) -> int:
+        """
+        Publishes one batch of pending events and clears the markers of the published
+        users. A marker is cleared only if it was not replaced by a newer update while the
+        batch was in flight.
+        Returns:
+            int: The number of events published.
+        Raises:
+            pika.exceptions.AMQPError: If the broker connection fails. The batch was not
+                                       committed and its markers are left in place.
+            pymongo.errors.PyMongoError: If the outbox cannot be read or cleared. Markers
+                                         left in place are published again.
+        """
+        users: List[Dict[str, Any]] = list(
+            self.users_collection.find({OUTBOX_FIELD: {'$exists': True}},
+                                       {'_id': 0, 'userId': 1, 'emails': 1,
+                                        'deliveryAddress': 1, 'version': 1, 'updatedAt': 1,
+                                        OUTBOX_FIELD: 1})
+            .sort(OUTBOX_FIELD, 1)
+            .limit(self.batch_size))
+        if not users:
+            return 0
+
+        channel = self._get_channel()
+        exchange, routing_key = publish_target(USER_PROFILE_UPDATED, self.queue_name)
+        for user in users:
+            body, properties = encode_event(user_update_event_from_user(user))
+            channel.basic_publish(exchange=exchange, routing_key=routing_key,
+                                  body=body, properties=pika.BasicProperties(
+                                      delivery_mode=pika.DeliveryMode.Persistent,
+                                      **properties))
+        channel.tx_commit()
+
+        result = self.users_collection.bulk_write(
+            [UpdateOne({'userId': user['userId'], OUTBOX_FIELD: user[OUTBOX_FIELD]},
+                       {'$unset': {OUTBOX_FIELD: ''}}) for user in users], ordered=False)
+        self._stats['batches'] += 1
+        self._stats['published'] += len(users)
+        self._stats['superseded'] += len(users) - result.modified_count
+        return len(users)
+
+    def run(self) -> None:
+        """
+        Relays events until the process is stopped, reconnecting to the broker after
+        failures, backing off the same way while MongoDB is unavailable (e.g. during a
+        failover), and sleeping for `poll_interval` whenever the outbox is drained.
+        """
+        index_ensured = False
+        while True:
+            try:
+                if not index_ensured:
+                    ensure_outbox_index(self.users_collection)
+                    index_ensured = True
+                published = self.relay_batch()
+            except (AMQPConnectionError, AMQPChannelError) as e:
+                print(f"Outbox relay lost the broker connection: {e}", flush=True)
+                self._connection = None
+                self._channel = None
+                time.sleep(RECONNECT_DELAY)
+                continue
+            except PyMongoError as e:
+                print(f"Outbox relay cannot reach MongoDB: {e}", flush=True)
+                time.sleep(RECONNECT_DELAY)
+                continue
+            if published < self.batch_size:
+                time.sleep(self.poll_interval)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns the relay statistics.
+        Returns:
+            Dict[str, int]: The number of batches and published events, and how many
+                            published events were superseded by a newer update in flight.
+        """
+        return dict(self._stats)
+
+def main() -> None:
+    """
+    Runs the outbox relay against the database and queue configured in the environment.
+    """
+    client = MongoClient(os.getenv('MONGO_URI'))
+    users_collection = client[os.getenv('DATABASE_NAME')]['users']
+    relay = OutboxRelay(users_collection, os.getenv('RABBITMQ_QUEUE_NAME'))
+    print("Starting outbox relay...", flush=True)
+    relay.run()
+
+if __name__ == "__main__":
+    main()
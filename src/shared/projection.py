@@ -0,0 +1,72 @@
+"""_summary_
+This module turns the `fields=` query parameter of read endpoints into a MongoDB
+projection and a matching trimmed marshalling model, so that a caller asking for a few
+fields gets only those fields from the database and in the response.
+
+Fields are top-level names of the endpoint's Flask-RESTx model, separated by commas,
+e.g. `fields=orderId,orderStatus`. Trimmed models are cached per model and field set.
+
+Functions:
+    parse_fields(value: Optional[str], model: Model) -> Optional[List[str]]:
+        Parses and validates the `fields` query parameter against a model.
+    build_projection(field_names: Optional[List[str]]) -> Optional[Dict[str, int]]:
+        Builds the MongoDB projection selecting the given fields.
+    trimmed_model(model: Model, field_names: Optional[List[str]]) -> Mapping[str, Any]:
+        Returns the model restricted to the given fields.
+Author:
+    @TheBarzani
+"""
+
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+from flask_restx import Model
+
+_trimmed_models: Dict[Tuple[str, Tuple[str, ...]], Dict[str, Any]] = {}
+
+def parse_fields(value: Optional[str], model: Model) -> Optional[List[str]]:
+    """
+    Parses the `fields` query parameter.
+    Args:
+        value (Optional[str]): The raw parameter, None if it was not given.
+        model (Model): The model of the endpoint's response.
+    Returns:
+        Optional[List[str]]: The requested fields in model order, None for all fields.
+    Raises:
+        ValueError: If a requested field is not part of the model.
+    """
+    if not value:
+        return None
+    requested = {name.strip() for name in value.split(',') if name.strip()}
+    unknown = requested - set(model)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return [name for name in model if name in requested]
+
+def build_projection(field_names: Optional[List[str]]) -> Optional[Dict[str, int]]:
+    """
+    Builds the MongoDB projection selecting the given fields. `_id` stays included,
+    since pagination cursors are built from it.
+    Args:
+        field_names (Optional[List[str]]): The fields returned by `parse_fields`.
+    Returns:
+        Optional[Dict[str, int]]: The projection, None to fetch whole documents.
+    """
+    if field_names is None:
+        return None
+    return {name: 1 for name in field_names}
+
+def trimmed_model(model: Model, field_names: Optional[List[str]]) -> Mapping[str, Any]:
+    """
+    Returns the model restricted to the given fields, for use with `marshal`.
+    Args:
+        model (Model): The full model.
+        field_names (Optional[List[str]]): The fields returned by `parse_fields`.
+    Returns:
+        Mapping[str, Any]: The full model if no fields were requested, else a mapping
+                           of the requested field names to their field definitions.
+    """
+    if field_names is None:
+        return model
+    key = (model.name, tuple(field_names))
+    if key not in _trimmed_models:
+        _trimmed_models[key] = {name: model[name] for name in field_names}
+    return _trimmed_models[key]
@@ -0,0 +1,109 @@
+"""_summary_
+This module provides the write operations shared by the order and user services, each
+done in a single MongoDB round trip.
+
+Updates use `find_one_and_update`, which atomically matches, updates and returns the
+document as it was before the update. The document after the update is derived from
+that before image by applying the update locally, so no other write can slip in between
+reading and updating a document, and the after image is exactly the result of this
+update even if another write follows immediately. Inserts return the inserted document,
+which pymongo completes with its generated `_id`, instead of reading it back.
+
+Functions:
+    insert_document(collection: Collection, document: Dict[str, Any],
+                    session: Optional[ClientSession]) -> Dict[str, Any]:
+        Inserts a document and returns it.
+    update_document(collection: Collection, query: Dict[str, Any], update: Dict[str, Any],
+                    session: Optional[ClientSession])
+        -> Optional[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        Atomically updates one document and returns its before and after images.
+    apply_update(document: Dict[str, Any], update: Dict[str, Any]) -> Dict[str, Any]:
+        Applies an update document to a copy of a document.
+Author:
+    @TheBarzani
+"""
+
+import copy
+from typing import Any, Dict, List, Optional, Tuple
+from pymongo import ReturnDocument
+from pymongo.client_session import ClientSession
+from pymongo.collection import Collection
+
+SUPPORTED_OPERATORS = ('$set', '$unset', '$inc')
+
+def insert_document(collection: Collection, document: Dict[str, Any],
+                    session: Optional[ClientSession] = None) -> Dict[str, Any]:
+    """
+    Inserts a document and returns it without reading it back.
+    Args:
+        collection (Collection): The collection to insert into.
+        document (Dict[str, Any]): The document to insert. Its `_id` is set by the insert.
+        session (Optional[ClientSession]): The session of the transaction to insert in.
+    Returns:
+        Dict[str, Any]: The inserted document, including its `_id`.
+    Raises:
+        pymongo.errors.DuplicateKeyError: If the document violates a unique index.
+    """
+    collection.insert_one(document, session=session)
+    return document
+
+def update_document(collection: Collection, query: Dict[str, Any], update: Dict[str, Any],
+                    session: Optional[ClientSession] = None
+                    ) -> Optional[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """
+    Atomically updates the first document matching the query.
+    Args:
+        collection (Collection): The collection holding the document.
+        query (Dict[str, Any]): The filter selecting the document.
+        update (Dict[str, Any]): The update, using only operators supported by
+                                 `apply_update`.
+        session (Optional[ClientSession]): The session of the transaction to update in.
+    Returns:
+        Optional[Tuple[Dict[str, Any], Dict[str, Any]]]: The document before and after the
+                                                         update, None if no document
+                                                         matched.
+    Raises:
+        ValueError: If the update uses an unsupported operator. Nothing is written then.
+    """
+    unsupported = [operator for operator in update if operator not in SUPPORTED_OPERATORS]
+    if unsupported:
+        raise ValueError(f"Unsupported update operators: {', '.join(unsupported)}")
+    before: Optional[Dict[str, Any]] = collection.find_one_and_update(
+        query, update, return_document=ReturnDocument.BEFORE, session=session)
+    if before is None:
+        return None
+    return before, apply_update(before, update)
+
+def _parent_of(document: Dict[str, Any], path: str) -> Tuple[Dict[str, Any], str]:
+    """
+    Returns the embedded document holding the last field of a dotted path, creating
+    missing embedded documents like MongoDB does, and the name of that field.
+    """
+    keys: List[str] = path.split('.')
+    for key in keys[:-1]:
+        document = document.setdefault(key, {})
+    return document, keys[-1]
+
+def apply_update(document: Dict[str, Any], update: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Applies an update document to a copy of a document, as MongoDB would. Only the
+    `SUPPORTED_OPERATORS` (`$set`, `$unset` and `$inc`) are applied, on top-level fields
+    and dotted paths of embedded documents, which covers every update issued by the
+    services.
+    Args:
+        document (Dict[str, Any]): The document before the update. It is not modified.
+        update (Dict[str, Any]): The update document.
+    Returns:
+        Dict[str, Any]: The document after the update.
+    """
+    result: Dict[str, Any] = copy.deepcopy(document)
+    for operator, fields in update.items():
+        for path, value in fields.items():
+            parent, key = _parent_of(result, path)
+            if operator == '$set':
+                parent[key] = copy.deepcopy(value)
+            elif operator == '$unset':
+                parent.pop(key, None)
+            elif operator == '$inc':
+                parent[key] = parent.get(key, 0) + value
+    return result
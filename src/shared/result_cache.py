@@ -0,0 +1,292 @@
+"""_summary_
+This module implements a bounded in-process cache for rendered query results, with an
+optional file-backed tier shared by the workers of a host.
+
+Entries are bytes (e.g. a rendered JSON body) stored under a key, and may carry a tag
+(e.g. an order status) so that everything derived from the same data can be dropped at
+once. The in-process tier is an LRU bounded both by number of entries and by total size;
+entries also expire after a TTL. When a directory is given, entries are also written
+there, one file per entry, so that a worker can reuse a result another worker rendered.
+The file tier is bounded by the same number of entries and total size: a background
+thread of every process periodically deletes expired files, and then the least recently
+used ones past the bounds, using the modification time that reads refresh. Requests
+never list the directory.
+
+Where writes can happen in other processes, callers include a change marker
+(`shared.change_markers`) in their keys, so that an entry can never outlive the data it
+was rendered from; `invalidate` then only frees memory eagerly, and files of stale keys
+are left to the sweeper.
+
+Classes:
+    ResultCache: An LRU cache of bytes with a TTL, a size bound and an optional
+                 file-backed tier.
+Author:
+    @TheBarzani
+"""
+
+import os
+import time
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+# Seconds between two sweeps of the file-backed tier
+SWEEP_INTERVAL = 10.0
+
+class ResultCache:
+    """
+    A thread-safe LRU cache of bytes with a TTL, a size bound and an optional file-backed
+    tier.
+    Attributes:
+        max_entries (int): The maximum number of entries kept in memory.
+        max_bytes (int): The maximum total size of the entries kept in memory.
+        ttl (float): Seconds after which an entry expires.
+        directory (Optional[str]): The directory of the file-backed tier, None for none.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float,
+                 directory: Optional[str] = None) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.directory = directory or None
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+        # key -> (expiry, tag, value), least recently used first
+        self._entries: 'OrderedDict[str, Tuple[float, str, bytes]]' = OrderedDict()
+        # tag -> keys of the entries in memory carrying it
+        self._tags: Dict[str, Set[str]] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._sweeper_pid: Optional[int] = None
+        self._stats: Dict[str, int] = {'hits': 0, 'file_hits': 0, 'misses': 0,
+                                       'evictions': 0, 'file_evictions': 0,
+                                       'invalidations': 0}
+
+    def _path(self, key: str) -> str:
+        """
+        Returns the file of an entry.
+        """
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest())
+
+    def _remove(self, key: str) -> None:
+        """
+        Removes an entry from memory. Must be called with the lock held.
+        """
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._forget(key, entry)
+
+    def _forget(self, key: str, entry: Tuple[float, str, bytes]) -> None:
+        """
+        Updates the size and the tag index after an entry left memory. Must be called
+        with the lock held.
+        """
+        self._bytes -= len(entry[2])
+        keys = self._tags.get(entry[1])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._tags[entry[1]]
+
+    def _store(self, key: str, expiry: float, tag: str, value: bytes) -> None:
+        """
+        Stores an entry in memory and evicts the least recently used entries past the
+        bounds. Must be called with the lock held.
+        """
+        self._remove(key)
+        self._entries[key] = (expiry, tag, value)
+        self._tags.setdefault(tag, set()).add(key)
+        self._bytes += len(value)
+        while self._entries and (len(self._entries) > self.max_entries
+                                 or self._bytes > self.max_bytes):
+            self._forget(*self._entries.popitem(last=False))
+            self._stats['evictions'] += 1
+
+    def _read_file(self, key: str) -> Optional[Tuple[float, str, bytes]]:
+        """
+        Reads an entry from the file-backed tier, if it is there and has not expired, and
+        marks the file as recently used. Files start with a header line holding the
+        expiry and the tag of the entry.
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as file:
+                header, value = file.read().split(b'\n', 1)
+            expiry, tag = header.decode().split(' ', 1)
+            if float(expiry) <= time.time():
+                return None
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return float(expiry), tag, value
+
+    def _write_file(self, key: str, expiry: float, tag: str, value: bytes) -> None:
+        """
+        Writes an entry to the file-backed tier atomically, starting the sweeper of the
+        process on first use.
+        """
+        if self._sweeper_pid != os.getpid():
+            self._start_sweeper()
+        try:
+            descriptor, temp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+            with os.fdopen(descriptor, 'wb') as file:
+                file.write(f'{expiry} {tag}\n'.encode() + value)
+            os.replace(temp_path, self._path(key))
+        except OSError:
+            return
+
+    def _start_sweeper(self) -> None:
+        """
+        Starts the thread sweeping the file-backed tier, once per process: a forked
+        worker inherits the cache but not the thread.
+        """
+        with self._lock:
+            if self._sweeper_pid == os.getpid():
+                return
+            self._sweeper_pid = os.getpid()
+        threading.Thread(target=self._sweep_forever, daemon=True,
+                         name='result-cache-sweeper').start()
+
+    def _sweep_forever(self) -> None:
+        """
+        Sweeps the file-backed tier every `SWEEP_INTERVAL` seconds.
+        """
+        while True:
+            time.sleep(SWEEP_INTERVAL)
+            self.sweep()
+
+    def sweep(self) -> None:
+        """
+        Deletes the files of the file-backed tier that were not used for `ttl` seconds,
+        which have all expired, and then the least recently used files until the tier
+        fits in `max_entries` and `max_bytes`. Files deleted concurrently by the sweeper
+        of another worker are skipped.
+        Returns:
+            None
+        """
+        unused_since = time.time() - self.ttl
+        files: List[Tuple[float, int, str]] = []
+        try:
+            entries = list(os.scandir(self.directory))
+        except OSError:
+            return
+        for entry in entries:
+            try:
+                stat = entry.stat()
+                if stat.st_mtime <= unused_since:
+                    # Expired entries, and temporary files of interrupted writes
+                    os.remove(entry.path)
+                elif not entry.name.startswith('.tmp-'):
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+            except OSError:
+                continue
+        files.sort()
+        total_bytes = sum(size for _, size, _ in files)
+        evicted = 0
+        for _, size, path in files:
+            if len(files) - evicted <= self.max_entries and total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            evicted += 1
+            total_bytes -= size
+        if evicted:
+            with self._lock:
+                self._stats['file_evictions'] += evicted
+
+    def get(self, key: str) -> Optional[bytes]:
+        """
+        Returns a cached value.
+        Args:
+            key (str): The key of the entry.
+        Returns:
+            Optional[bytes]: The value, None if it is not cached or has expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.time():
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return entry[2]
+                self._remove(key)
+        entry = self._read_file(key) if self.directory else None
+        with self._lock:
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            self._stats['file_hits'] += 1
+            self._store(key, *entry)
+        return entry[2]
+
+    def put(self, key: str, value: bytes, tag: str = '') -> None:
+        """
+        Caches a value. Values larger than the whole cache are not cached.
+        Args:
+            key (str): The key of the entry.
+            value (bytes): The value.
+            tag (str): The tag of the entry, used to drop it with `invalidate`. It must
+                       not contain line breaks.
+        Returns:
+            None
+        """
+        if len(value) > self.max_bytes:
+            return
+        expiry = time.time() + self.ttl
+        with self._lock:
+            self._store(key, expiry, tag, value)
+        if self.directory:
+            self._write_file(key, expiry, tag, value)
+
+    def discard(self, key: str) -> None:
+        """
+        Drops an entry, if it is cached.
+        Args:
+            key (str): The key of the entry.
+        Returns:
+            None
+        """
+        with self._lock:
+            self._remove(key)
+            self._stats['invalidations'] += 1
+        if self.directory:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def invalidate(self, tag: Optional[str] = None) -> None:
+        """
+        Drops the entries of a tag, or every entry, from memory. Files are left to the
+        sweeper: callers sharing the file-backed tier across processes key their entries
+        by change marker, so the files of the dropped entries are never read again.
+        Args:
+            tag (Optional[str]): The tag, None for every entry.
+        Returns:
+            None
+        """
+        with self._lock:
+            for key in list(self._entries if tag is None else self._tags.get(tag, ())):
+                self._remove(key)
+            self._stats['invalidations'] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns the cache statistics.
+        Returns:
+            Dict[str, Any]: The hits (from memory and from files), misses, hit ratio,
+                            evictions (from memory and from files), invalidations, and
+                            the number and total size of the entries in memory.
+        """
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._stats, entries=len(self._entries),
+                                         bytes=self._bytes)
+        lookups = stats['hits'] + stats['file_hits'] + stats['misses']
+        stats['hit_ratio'] = ((stats['hits'] + stats['file_hits']) / lookups
+                              if lookups else None)
+        return stats
@@ -0,0 +1,88 @@
+"""_summary_
+This package holds the JSON Schemas of the documents exchanged by the services
+(`user_schema.json`, `order_schema.json`). They are the single source of the validation
+rules: `shared.validation` derives the request validators from them, and
+`setup_mongodb.py` derives the MongoDB `$jsonSchema` validators from them.
+
+Functions:
+    load_schema(name: str) -> Dict[str, Any]:
+        Loads a document schema.
+    to_mongo_schema(schema: Dict[str, Any], extra_properties: Optional[Dict[str, Any]])
+        -> Dict[str, Any]:
+        Converts a document schema into a MongoDB `$jsonSchema` validator.
+Author:
+    @TheBarzani
+"""
+
+import os
+import json
+import copy
+from typing import Any, Dict, Optional
+
+SCHEMA_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# JSON Schema types and the BSON types MongoDB stores them as
+BSON_TYPES: Dict[str, str] = {
+    'string': 'string',
+    'integer': 'int',
+    'number': 'number',
+    'boolean': 'bool',
+    'object': 'object',
+    'array': 'array'
+}
+# What `format: email` is enforced as in MongoDB, which does not support formats
+EMAIL_PATTERN = '^.+@.+$'
+# Keywords that only document the schema
+ANNOTATIONS = {'$schema', 'title', 'description', 'format'}
+
+def load_schema(name: str) -> Dict[str, Any]:
+    """
+    Loads a document schema.
+    Args:
+        name (str): The name of the schema, e.g. 'user' for `user_schema.json`.
+    Returns:
+        Dict[str, Any]: The JSON Schema.
+    """
+    with open(os.path.join(SCHEMA_DIR, f'{name}_schema.json'), encoding='utf-8') as file:
+        return json.load(file)
+
+def _convert(node: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Converts one schema node and its children to `$jsonSchema`.
+    """
+    converted: Dict[str, Any] = {}
+    for keyword, value in node.items():
+        if keyword in ANNOTATIONS:
+            continue
+        if keyword == 'type':
+            converted['bsonType'] = BSON_TYPES[value]
+        elif keyword == 'properties':
+            converted['properties'] = {name: _convert(child) for name, child in value.items()}
+        elif keyword == 'items':
+            converted['items'] = _convert(value)
+        else:
+            converted[keyword] = copy.deepcopy(value)
+    # Timestamps travel as strings in JSON but are stored as dates
+    if node.get('format') == 'date-time':
+        converted['bsonType'] = 'date'
+    elif node.get('format') == 'email':
+        converted['pattern'] = EMAIL_PATTERN
+    return converted
+
+def to_mongo_schema(schema: Dict[str, Any],
+                    extra_properties: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Converts a document schema into a MongoDB `$jsonSchema` validator: types become BSON
+    types, `date-time` strings become dates, `email` formats become patterns and
+    annotations are dropped.
+    Args:
+        schema (Dict[str, Any]): The document schema.
+        extra_properties (Optional[Dict[str, Any]]): `$jsonSchema` definitions of fields
+                                                     that only exist in the database,
+                                                     such as versions and outbox markers.
+    Returns:
+        Dict[str, Any]: The `$jsonSchema` validator.
+    """
+    mongo_schema = _convert(schema)
+    mongo_schema['properties'].update(extra_properties or {})
+    return mongo_schema
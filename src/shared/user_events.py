@@ -0,0 +1,193 @@
+"""_summary_
+This module defines the payload of the user update events exchanged between the user
+services and the order service, so that every producer (the user services and the
+outbox relay) publishes exactly the same shape.
+
+Every user update increments the user's `version`, and the event carries that version
+so consumers can discard redelivered or out-of-order events instead of rolling data back.
+
+Events may be deltas: `changedFields` then lists the user fields the update changed, and
+only those are carried. Since a delta says nothing about the other fields, consumers keep
+a version per field (`build_versioned_merge`), so that an older delta arriving late still
+applies the fields no newer event has written. Events without `changedFields` carry every
+field.
+
+Functions:
+    build_user_update_event(user_id: str, emails: List[str], address: Dict[str, Any],
+                            version: Optional[int], updated_at: Optional[datetime])
+        -> Dict[str, Any]:
+        Builds the event published when a user's emails or delivery address change.
+    user_update_event_from_user(user: Dict[str, Any]) -> Dict[str, Any]:
+        Builds the same event from a user document.
+    changed_event_fields(old_user: Dict[str, Any], new_user: Dict[str, Any]) -> List[str]:
+        Returns the event fields whose value differs between two images of a user.
+    event_changes(event: Dict[str, Any]) -> Dict[str, Any]:
+        Returns the user fields carried by an event.
+    collapse_user_events(events: List[Dict[str, Any]])
+        -> Dict[str, Tuple[Dict[str, Any], Optional[Dict[str, int]]]]:
+        Merges the changes of several events per user.
+    build_versioned_filter(versions: Dict[str, int], version_field: str,
+                           field_versions_field: str) -> Dict[str, Any]:
+        Builds the filter of the documents some versioned fields are newer for.
+    build_versioned_merge(changes: Dict[str, Any], versions: Dict[str, int],
+                          version_field: str, field_versions_field: str)
+        -> List[Dict[str, Any]]:
+        Builds the pipeline update merging versioned fields into a document.
+Author:
+    @TheBarzani
+"""
+
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+# The update that bumps a user's version, to be merged into every user update
+VERSION_INCREMENT: Dict[str, Dict[str, int]] = {'$inc': {'version': 1}}
+# The user fields carried by the events, and the user document fields they come from
+EVENT_FIELDS: Dict[str, str] = {'userEmails': 'emails', 'deliveryAddress': 'deliveryAddress'}
+
+def build_user_update_event(user_id: str, emails: List[str], address: Dict[str, Any],
+                            version: Optional[int] = None,
+                            updated_at: Optional[datetime] = None,
+                            changed_fields: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Builds the event published when a user's emails or delivery address change.
+    Args:
+        user_id (str): The ID of the user.
+        emails (List[str]): The email addresses of the user.
+        address (Dict[str, Any]): The delivery address of the user.
+        version (Optional[int]): The version of the user after the update.
+        updated_at (Optional[datetime]): When the user was updated.
+        changed_fields (Optional[List[str]]): The event fields the update changed, None
+                                              to publish every field. Only the changed
+                                              fields are carried then.
+    Returns:
+        Dict[str, Any]: The event payload.
+    """
+    event: Dict[str, Any] = {'userId': user_id}
+    for field, value in (('userEmails', emails), ('deliveryAddress', address)):
+        if changed_fields is None or field in changed_fields:
+            event[field] = value
+    if changed_fields is not None:
+        event['changedFields'] = list(changed_fields)
+    if version is not None:
+        event['version'] = version
+    if updated_at is not None:
+        event['updatedAt'] = updated_at.isoformat()
+    return event
+
+def user_update_event_from_user(user: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Builds the user update event from a user document.
+    Args:
+        user (Dict[str, Any]): The user document, as stored in the users collection.
+    Returns:
+        Dict[str, Any]: The event payload.
+    """
+    return build_user_update_event(user['userId'], user['emails'], user['deliveryAddress'],
+                                   user.get('version'), user.get('updatedAt'))
+
+def changed_event_fields(old_user: Dict[str, Any], new_user: Dict[str, Any]) -> List[str]:
+    """
+    Returns the event fields whose value differs between two images of a user.
+    Args:
+        old_user (Dict[str, Any]): The user document before the update.
+        new_user (Dict[str, Any]): The user document after the update.
+    Returns:
+        List[str]: The changed event fields, empty if no consumer has anything to apply.
+    """
+    return [field for field, user_field in EVENT_FIELDS.items()
+            if old_user.get(user_field) != new_user.get(user_field)]
+
+def event_changes(event: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Returns the user fields carried by an event: those listed in its `changedFields`, or
+    every non-empty one for events without it.
+    Args:
+        event (Dict[str, Any]): The decoded user update event.
+    Returns:
+        Dict[str, Any]: The values of the fields, by event field.
+    """
+    changed: Optional[List[str]] = event.get('changedFields')
+    return {field: event[field] for field in EVENT_FIELDS
+            if event.get(field) and (changed is None or field in changed)}
+
+def collapse_user_events(events: List[Dict[str, Any]]
+                         ) -> Dict[str, Tuple[Dict[str, Any], Optional[Dict[str, int]]]]:
+    """
+    Merges the changes of several events per user, in delivery order. For every field,
+    the value of the newest version wins, and events not newer than one already merged
+    for the field are skipped; events without a version (from producers predating
+    versioning) always win.
+    Args:
+        events (List[Dict[str, Any]]): The decoded events, in delivery order.
+    Returns:
+        Dict[str, Tuple[Dict[str, Any], Optional[Dict[str, int]]]]: For every user with
+            changes, the values of the fields and the version of each field, None if a
+            field was changed by an event without a version.
+    """
+    collapsed: Dict[str, Tuple[Dict[str, Any], Dict[str, int]]] = {}
+    for event in events:
+        changes = event_changes(event)
+        if not changes:
+            continue
+        version: Optional[int] = event.get('version')
+        user_changes, versions = collapsed.setdefault(event['userId'], ({}, {}))
+        for field, value in changes.items():
+            if version is None:
+                user_changes[field] = value
+                versions.pop(field, None)
+            elif field not in versions or version > versions[field]:
+                user_changes[field] = value
+                versions[field] = version
+    return {user_id: (changes, versions if len(versions) == len(changes) else None)
+            for user_id, (changes, versions) in collapsed.items()}
+
+def build_versioned_filter(versions: Dict[str, int], version_field: str,
+                           field_versions_field: str) -> Dict[str, Any]:
+    """
+    Builds the filter of the documents at least one versioned field is newer for. A field
+    version missing from a document is taken to be its overall version, as written by
+    consumers predating field versions.
+    Args:
+        versions (Dict[str, int]): The version of each field, by event field.
+        version_field (str): The document field holding the overall version.
+        field_versions_field (str): The document field holding the version of each field.
+    Returns:
+        Dict[str, Any]: The filter.
+    """
+    return {'$or': [condition for field, version in versions.items() for condition in (
+        {f'{field_versions_field}.{field}': {'$lt': version}},
+        {f'{field_versions_field}.{field}': {'$exists': False},
+         version_field: {'$not': {'$gte': version}}})]}
+
+def build_versioned_merge(changes: Dict[str, Any], versions: Dict[str, int],
+                          version_field: str,
+                          field_versions_field: str) -> List[Dict[str, Any]]:
+    """
+    Builds the pipeline update merging versioned fields into a document: each field is
+    only written if it is newer than the version of the field in the document, so deltas
+    can be applied in any order. The version of every field is recorded, 0 for a field no
+    versioned event has written, and the overall version becomes the newest one seen.
+    Args:
+        changes (Dict[str, Any]): The values of the fields, by event field.
+        versions (Dict[str, int]): The version of each field, by event field.
+        version_field (str): The document field holding the overall version.
+        field_versions_field (str): The document field holding the version of each field.
+    Returns:
+        List[Dict[str, Any]]: The pipeline, for `update_one` or `update_many`.
+    """
+    merged: Dict[str, Any] = {}
+    for field in EVENT_FIELDS:
+        # A document written before any versioned event holds neither version: its fields
+        # are at version 0, so the recorded field versions are always ints
+        current = {'$ifNull': [f'${field_versions_field}.{field}',
+                               {'$ifNull': [f'${version_field}', 0]}]}
+        if field not in changes:
+            # Pins the field to the version it was written at before the overall one moves
+            merged[f'{field_versions_field}.{field}'] = current
+            continue
+        newer = {'$lt': [current, versions[field]]}
+        merged[field] = {'$cond': [newer, {'$literal': changes[field]}, f'${field}']}
+        merged[f'{field_versions_field}.{field}'] = {'$cond': [newer, versions[field], current]}
+    merged[version_field] = {'$max': [f'${version_field}', *versions.values()]}
+    return [{'$set': merged}]
@@ -0,0 +1,134 @@
+"""_summary_
+This module validates request payloads against validators derived from the document
+schemas in `shared.schemas`, the same schemas the MongoDB validators are generated from.
+
+Every request validator is built once, at import time: its schema is derived from the
+document schema (restricted to the fields the request may carry, with the arrays a
+request may not leave empty, such as items and emails, marked as such), checked, and
+bound to
+a `jsonschema` validator class together with a format checker, so validating a request
+is a single pass over the payload that collects every error instead of stopping at the
+first one.
+
+Request schemas:
+    order_create: A new order (`POST /orders/`, `POST /orders/batch`).
+    order_details: An order emails or delivery address update.
+    user_create: A new user.
+    user_update: A user emails or delivery address update.
+Classes:
+    RequestValidationError(ValueError): Raised with every error found in a payload.
+Functions:
+    validation_errors(name: str, data: Any) -> List[str]:
+        Returns every error of a payload.
+    validate(name: str, data: Any) -> None:
+        Validates a payload, raising `RequestValidationError` if it is invalid.
+Author:
+    @TheBarzani
+"""
+
+from typing import Any, Dict, List, Sequence
+from jsonschema import FormatChecker
+from jsonschema.protocols import Validator
+from jsonschema.validators import validator_for
+from shared.schemas import load_schema
+
+# Only the formats the services rely on; `email` requires an '@'
+FORMAT_CHECKER = FormatChecker(['email'])
+
+class RequestValidationError(ValueError):
+    """
+    Raised when a payload is invalid.
+    Attributes:
+        errors (List[str]): Every error found, as '<field path>: <message>'.
+    """
+
+    def __init__(self, errors: List[str]) -> None:
+        super().__init__('; '.join(errors))
+        self.errors = errors
+
+def request_schema(document: Dict[str, Any], fields: List[str], required: List[str],
+                   min_properties: int = 0,
+                   non_empty: Sequence[str] = ()) -> Dict[str, Any]:
+    """
+    Derives the schema of a request payload from a document schema.
+    Args:
+        document (Dict[str, Any]): The document schema.
+        fields (List[str]): The document fields the payload may carry; any other field
+                            is rejected.
+        required (List[str]): The fields the payload must carry.
+        min_properties (int): The minimum number of fields the payload must carry.
+        non_empty (Sequence[str]): The array fields that must hold at least one item when
+                                   present. This only applies to requests: the document
+                                   schema, and the MongoDB validator derived from it, are
+                                   left as they are.
+    Returns:
+        Dict[str, Any]: The request schema.
+    """
+    properties: Dict[str, Any] = {field: document['properties'][field] for field in fields}
+    for field in non_empty:
+        properties[field] = dict(properties[field], minItems=1)
+    return {
+        '$schema': document['$schema'],
+        'type': 'object',
+        'properties': properties,
+        'required': required,
+        'minProperties': min_properties,
+        'additionalProperties': False
+    }
+
+def _compile(schema: Dict[str, Any]) -> Validator:
+    """
+    Checks a schema and binds it to the validator class of its draft.
+    """
+    validator_class = validator_for(schema)
+    validator_class.check_schema(schema)
+    return validator_class(schema, format_checker=FORMAT_CHECKER)
+
+_ORDER = load_schema('order')
+_USER = load_schema('user')
+
+VALIDATORS: Dict[str, Validator] = {
+    'order_create': _compile(request_schema(
+        _ORDER, ['userId', 'items', 'userEmails', 'deliveryAddress', 'orderStatus',
+                 'createdAt', 'updatedAt'],
+        ['items', 'userEmails', 'deliveryAddress', 'orderStatus'],
+        non_empty=['items', 'userEmails'])),
+    'order_details': _compile(request_schema(
+        _ORDER, ['userEmails', 'deliveryAddress'], [], min_properties=1,
+        non_empty=['userEmails'])),
+    'user_create': _compile(request_schema(
+        _USER, ['firstName', 'lastName', 'emails', 'deliveryAddress', 'phoneNumber',
+                'createdAt', 'updatedAt'],
+        ['emails', 'deliveryAddress'], non_empty=['emails'])),
+    'user_update': _compile(request_schema(
+        _USER, ['emails', 'deliveryAddress'], [], min_properties=1, non_empty=['emails']))
+}
+
+def validation_errors(name: str, data: Any) -> List[str]:
+    """
+    Returns every error of a payload, ordered by field.
+    Args:
+        name (str): The request schema, e.g. 'order_create'.
+        data (Any): The decoded JSON payload.
+    Returns:
+        List[str]: The errors, as '<field path>: <message>', empty if the payload is valid.
+    """
+    errors = sorted(VALIDATORS[name].iter_errors(data),
+                    key=lambda error: [str(part) for part in error.absolute_path])
+    return [f"{'.'.join(str(part) for part in error.absolute_path) or 'body'}: "
+            f"{error.message}" for error in errors]
+
+def validate(name: str, data: Any) -> None:
+    """
+    Validates a payload.
+    Args:
+        name (str): The request schema, e.g. 'order_create'.
+        data (Any): The decoded JSON payload.
+    Returns:
+        None
+    Raises:
+        RequestValidationError: If the payload is invalid, with all of its errors.
+    """
+    errors = validation_errors(name, data)
+    if errors:
+        raise RequestValidationError(errors)
@@ -1,7 +1,10 @@
-from flask import Flask
+from flask import Flask, jsonify
 from flask_restx import Api
 from user_service_v1.app.routes import api as user_api
 from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+from shared import metrics
+from shared.config.mongodb_indexes import ensure_indexes
 
 def create_app():
     app = Flask(__name__)
@@ -14,5 +17,13 @@ def create_app():
     app.mongo_client = mongo_client
     app.db = mongo_client[app.config['DATABASE_NAME']]
     app.users_collection = app.db['users']
+    try:
+        ensure_indexes(app.db, ['users'])
+    except PyMongoError as e:
+        print(f"Could not ensure the users indexes: {e}", flush=True)
+
+    @app.route('/metrics')
+    def get_metrics():
+        return jsonify(metrics.snapshot())
     
     return app
\ No newline at end of file
@@ -1,26 +1,23 @@
-import json
 import pika
-from shared.config.rabbitmq_config import create_channel
+from shared.config.rabbitmq_publisher import get_publisher
+from shared.config.rabbitmq_topology import publish_target, user_event_routing_key
+from shared.user_events import build_user_update_event
+from shared.event_codec import encode_event
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 QUEUE_NAME = os.getenv('RABBITMQ_QUEUE_NAME')
+DELTA_EVENTS = os.getenv('USER_EVENTS_DELTA', 'true').lower() == 'true'
 
-def publish_user_update_event(user_id, email, address):
-    channel, connection = create_channel(QUEUE_NAME)
-    event = {
-        'userId': user_id,
-        'userEmails': email,
-        'deliveryAddress': address
-    }
-    channel.basic_publish(
-        exchange="user_order",
-        routing_key=QUEUE_NAME,
-        body=json.dumps(event)
-        # properties=pika.BasicProperties(
-        #     delivery_mode=2,  # Make the message persistent
-        # )
-    )
+def publish_user_update_event(user_id, email, address, version=None, changed_fields=None):
+    # Delta events only carry the fields the update changed
+    event = build_user_update_event(user_id, email, address, version,
+                                    changed_fields=changed_fields if DELTA_EVENTS else None)
+    # Reuses the worker's long-lived connection instead of connecting per event
+    body, properties = encode_event(event)
+    # Routed by what changed on the topic exchange, by queue name on the legacy one
+    exchange, routing_key = publish_target(user_event_routing_key(changed_fields), QUEUE_NAME)
+    get_publisher(QUEUE_NAME).publish(body, routing_key, pika.BasicProperties(**properties),
+                                      exchange)
     print(f" V1 Published event: {event}", flush=True)
-    connection.close()
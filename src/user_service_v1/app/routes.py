@@ -3,21 +3,27 @@ This module defines the routes for user-related operations in a Flask applicatio
 It includes endpoints for creating and updating user information, with validation and error handling.
 Classes:
     UserList(Resource): Handles the creation of new users.
-    User(Resource): Handles the updating of existing users.
+    User(Resource): Handles the retrieval and updating of existing users.
 Routes:
     /users/ (POST): Creates a new user.
+    /users/<string:id> (GET): Retrieves a user, optionally restricted to some fields.
     /users/<string:id> (PUT): Updates an existing user.
 Functions:
     UserList.post(): Creates a new user with the provided data.
+    User.get(id: str): Retrieves a user.
     User.put(id: str): Updates an existing user with the provided data.
 """
 
 from flask import request, Flask, current_app
-from flask_restx import Namespace, Resource, fields
-from bson.objectid import ObjectId
+from flask_restx import Namespace, Resource, fields, marshal
+from pymongo.errors import DuplicateKeyError
 import uuid
 from user_service_v1.app.models import api, user_model, delivery_address_model
 from user_service_v1.app.events import publish_user_update_event
+from shared.user_events import VERSION_INCREMENT, changed_event_fields
+from shared.projection import build_projection, parse_fields, trimmed_model
+from shared.repository import insert_document, update_document
+from shared.validation import RequestValidationError, validate
 
 # The current_app variable is a proxy to the Flask application handling the request.
 current_app : Flask
@@ -37,7 +43,7 @@ class UserList(Resource):
         5. Checks if any of the provided email addresses already exist in the database.
         6. Generates a unique userId for the new user.
         7. Inserts the new user data into the database.
-        8. Retrieves and returns the newly created user.
+        8. Returns the newly created user, without reading it back.
         Returns:
             tuple: A tuple containing the newly created user data and the HTTP status code 201.
         Raises:
@@ -50,27 +56,11 @@ class UserList(Resource):
         except Exception as e:
             api.abort(400, f'Invalid JSON data: {str(e)}')
         
-        # Ensure no other fields are present
-        allowed_fields = {'emails', 'deliveryAddress', 'firstName', 'lastName', 'phoneNumber', 'createdAt', 'updatedAt'}
-        for field in data:
-            if field not in allowed_fields:
-                api.abort(400, f'Invalid field: {field}')
-        
-        if 'emails' not in data or not data['emails']:
-            api.abort(400, 'emails is a required field')
-        if 'deliveryAddress' not in data:
-            api.abort(400, 'deliveryAddress is a required field')
-        
-                # Validate deliveryAddress
-        if 'deliveryAddress' in data:
-            delivery_address = data['deliveryAddress']
-            required_fields = ['street', 'city', 'state', 'postalCode', 'country']
-            if not isinstance(delivery_address, dict):
-                api.abort(400, 'deliveryAddress must be an object')
-            for field in required_fields:
-                if field not in delivery_address or not isinstance(delivery_address[field], str):
-                    api.abort(400, f'deliveryAddress must contain a valid {field}')
-                    
+        try:
+            validate('user_create', data)
+        except RequestValidationError as e:
+            api.abort(400, str(e), errors=e.errors)
+
         users_collection = current_app.users_collection
         # Check if any of the emails already exist in the database
         existing_user = users_collection.find_one({'emails': {'$in': data['emails']}})
@@ -79,19 +69,49 @@ class UserList(Resource):
             
         # Generate a unique userId
         data['userId'] = str(uuid.uuid4())
-        user_id: ObjectId = users_collection.insert_one(data).inserted_id
-        user: dict = users_collection.find_one({'_id': ObjectId(user_id)})
+        try:
+            user: dict = insert_document(users_collection, data)
+        except DuplicateKeyError:
+            api.abort(400, 'One or more email addresses are already in use')
         return user, 201
     
     
 @api.route('/<string:id>')
 @api.response(404, 'User not found')
 class User(Resource):
+    @api.param('fields', 'Comma-separated user fields to return, e.g. userId,emails')
+    @api.response(200, 'Success', user_model)
+    def get(self, id: str) -> dict:
+        """
+        Retrieve a user by ID, optionally restricted to the fields listed in the 'fields'
+        query parameter. Only the requested fields are fetched from the database.
+        Args:
+            id (str): The unique identifier of the user.
+        Returns:
+            dict: The user data.
+        Raises:
+            HTTPException: If 'fields' contains a field that is not part of the user model.
+            HTTPException: If the user with the given ID is not found.
+        """
+
+        try:
+            field_names = parse_fields(request.args.get('fields'), user_model)
+        except ValueError as e:
+            api.abort(400, str(e))
+
+        user: dict = current_app.users_collection.find_one({'userId': id},
+                                                           build_projection(field_names))
+        if not user:
+            api.abort(404, "User not found")
+        return marshal(user, trimmed_model(user_model, field_names))
+
     @api.expect(user_model)
     @api.marshal_with(user_model)
     def put(self, id: str) -> dict:
         """
-        Update user information based on the provided user ID.
+        Update user information based on the provided user ID. An update event carrying
+        the changed fields is published, unless the emails and delivery address are
+        unchanged.
         Args:
             id (str): The unique identifier of the user.
         Returns:
@@ -110,41 +130,27 @@ class User(Resource):
         except Exception as e:
             api.abort(400, f'Invalid JSON data: {str(e)}')
         
-        # Ensure no other fields are present
-        allowed_fields = {'emails', 'deliveryAddress'}
-        for field in data:
-            if field not in allowed_fields:
-                api.abort(400, f'Invalid field: {field}')
-                
-        if 'emails' not in data and 'deliveryAddress' not in data:
-            api.abort(400, 'Either emails or deliveryAddress is required')
-        
-        # Validate emails
-        if 'emails' in data:
-            if not isinstance(data['emails'], list) or not all(isinstance(email, str) and '@' in email for email in data['emails']):
-                api.abort(400, 'emails must be an array of valid email addresses')
+        try:
+            validate('user_update', data)
+        except RequestValidationError as e:
+            api.abort(400, str(e), errors=e.errors)
 
-        # Validate deliveryAddress
-        if 'deliveryAddress' in data:
-            delivery_address = data['deliveryAddress']
-            required_fields = ['street', 'city', 'state', 'postalCode', 'country']
-            if not isinstance(delivery_address, dict):
-                api.abort(400, 'deliveryAddress must be an object')
-            for field in required_fields:
-                if field not in delivery_address or not isinstance(delivery_address[field], str):
-                    api.abort(400, f'deliveryAddress must contain a valid {field}')
-        
         users_collection = current_app.users_collection
-        old_user = users_collection.find_one({'userId': id})
-        if not old_user:
+        try:
+            images = update_document(users_collection, {'userId': id},
+                                     {'$set': data, **VERSION_INCREMENT})
+        except DuplicateKeyError:
+            api.abort(400, 'One or more email addresses are already in use')
+        if not images:
             api.abort(404, "User not found")
-
-        users_collection.update_one({'userId': id}, {'$set': data})
-        new_user: dict = users_collection.find_one({'userId': id})
+        old_user, new_user = images
         
         emails = new_user["emails"]
         deliveryAddress = new_user["deliveryAddress"]
 
-        # Publish the update event
-        publish_user_update_event(id, emails, deliveryAddress)
+        # Publish the update event, unless nothing consumers care about changed
+        changed_fields = changed_event_fields(old_user, new_user)
+        if changed_fields:
+            publish_user_update_event(id, emails, deliveryAddress, new_user['version'],
+                                      changed_fields)
         return [old_user, new_user]
@@ -1,14 +1,17 @@
 """_summary_
 This module initializes the Flask application and sets up the necessary configurations,
-including the Flask-RESTx API and MongoDB client.
+including the Flask-RESTx API, the MongoDB client and the `/metrics` endpoint.
 
 Author:
     @TheBarzani
 """
 from typing import Any
-from flask import Flask
+from flask import Flask, jsonify
 from flask_restx import Api
 from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+from shared import metrics
+from shared.config.mongodb_indexes import ensure_indexes
 from user_service_v2.app.routes import api as user_api
 
 def create_app() -> Flask:
@@ -16,7 +19,9 @@ def create_app() -> Flask:
     Create and configure the Flask application.
     This function initializes the Flask application, configures it using the 
     settings from 'user_service_v2.app.config.Config', sets up the API namespace 
-    for user-related endpoints, and initializes the MongoDB client.
+    for user-related endpoints, and initializes the MongoDB client and the indexes of
+    the users collection, including the outbox index. Runtime statistics
+    of the shared components (e.g. the RabbitMQ publisher) are served on `/metrics`.
     Returns:
         Flask: The configured Flask application instance.
     """
@@ -32,4 +37,15 @@ def create_app() -> Flask:
     app.db = mongo_client[app.config['DATABASE_NAME']]
     app.users_collection = app.db['users']
 
+    # Create the indexes missing from the spec; setup_mongodb.py creates them too,
+    # so a database that is not reachable yet does not prevent the service from starting
+    try:
+        ensure_indexes(app.db, ['users'])
+    except PyMongoError as e:
+        print(f"Could not ensure the users indexes: {e}", flush=True)
+
+    @app.route('/metrics')
+    def get_metrics() -> Any:
+        return jsonify(metrics.snapshot())
+
     return app
@@ -21,7 +21,10 @@ class Config:
         MONGO_URI (str): The URI for connecting to the MongoDB database.
         DATABASE_NAME (str): The name of the MongoDB database to use.
         RABBITMQ_QUEUE_NAME (str): The name of the RabbitMQ queue to consume events from.
+        USER_EVENTS_OUTBOX (bool): Whether user update events go through the outbox and its
+                                   relay instead of being published from the request.
     """
     MONGO_URI = os.getenv("MONGO_URI")
     DATABASE_NAME = os.getenv("DATABASE_NAME")
     RABBITMQ_QUEUE_NAME = os.getenv('RABBITMQ_QUEUE_NAME')
+    USER_EVENTS_OUTBOX = os.getenv('USER_EVENTS_OUTBOX', 'false').lower() == 'true'
@@ -1,43 +1,90 @@
 """__summary__
 This module handles the publishing of user update events to a RabbitMQ queue.
+Events are published through the shared long-lived publisher, so a user update costs
+a single `basic_publish` on an already open channel. With `RABBITMQ_PUBLISH_MODE=async`,
+events are handed to a bounded background buffer instead, so the HTTP response does not
+wait for the broker at all.
+
+With `USER_EVENTS_DELTA` (the default), events only carry the fields the update changed,
+listed in `changedFields`. Events are encoded by `shared.event_codec`, with the codec
+selected by `EVENT_CODEC`. With `RABBITMQ_TOPOLOGY=topic`, events are routed by what
+changed (`user.email.updated`, `user.address.updated` or `user.profile.updated`), and
+new users are announced with a `user.created` event carrying every field.
 
 Author:
     @TheBarzani
 """
 
 import os
-import json
-from flask import current_app
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import pika
 from dotenv import load_dotenv
-from shared.config.rabbitmq_config import create_channel
+from shared.config.rabbitmq_publisher import get_publisher
+from shared.config.rabbitmq_async_publisher import get_async_publisher
+from shared.config.rabbitmq_topology import (TOPOLOGY_MODE, USER_CREATED, publish_target,
+                                             user_event_routing_key)
+from shared.user_events import build_user_update_event, user_update_event_from_user
+from shared.event_codec import encode_event
 
 load_dotenv()
 QUEUE_NAME = os.getenv('RABBITMQ_QUEUE_NAME')
+PUBLISH_MODE = os.getenv('RABBITMQ_PUBLISH_MODE', 'sync')
+DELTA_EVENTS = os.getenv('USER_EVENTS_DELTA', 'true').lower() == 'true'
 
-def publish_user_update_event(user_id: int, email: str, address: str) -> None:
+def publish_user_update_event(user_id: int, email: str, address: str,
+                              version: Optional[int] = None,
+                              updated_at: Optional[datetime] = None,
+                              changed_fields: Optional[List[str]] = None) -> None:
     """
     Publishes an event to notify about a user update.
     Args:
         user_id (int): The ID of the user.
         email (str): The email address of the user.
         address (str): The delivery address of the user.
+        version (Optional[int]): The version of the user after the update.
+        updated_at (Optional[datetime]): When the user was updated.
+        changed_fields (Optional[List[str]]): The event fields the update changed, None
+                                              if unknown. Only those are published with
+                                              `USER_EVENTS_DELTA`.
     Returns:
         None  
     """
 
-    channel, connection = create_channel(QUEUE_NAME)
-    event = {
-        'userId': user_id,
-        'userEmails': email,
-        'deliveryAddress': address
-    }
-    channel.basic_publish(
-        exchange="user_order",
-        routing_key=QUEUE_NAME,
-        body=json.dumps(event)
-        # properties=pika.BasicProperties(
-        #     delivery_mode=2,  # Make the message persistent
-        # )
-    )
+    event = build_user_update_event(user_id, email, address, version, updated_at,
+                                    changed_fields if DELTA_EVENTS else None)
+    publish_event(event, user_event_routing_key(changed_fields))
+    print(f"V2 Published event: {event}", flush=True)
+
+def publish_user_created_event(user: Dict[str, Any]) -> None:
+    """
+    Publishes an event to announce a new user, with every field, when events go through
+    the topic exchange. Consumers of the legacy exchange only receive updates.
+    Args:
+        user (Dict[str, Any]): The inserted user document.
+    Returns:
+        None
+    """
+    if TOPOLOGY_MODE != 'topic':
+        return
+    event = user_update_event_from_user(user)
+    publish_event(event, USER_CREATED)
     print(f"V2 Published event: {event}", flush=True)
-    connection.close()
+
+def publish_event(event: Dict[str, Any], routing_key: str) -> None:
+    """
+    Encodes and publishes a user event with the publisher selected by
+    `RABBITMQ_PUBLISH_MODE`.
+    Args:
+        event (Dict[str, Any]): The event payload.
+        routing_key (str): The routing key of the event on the topic exchange.
+    Returns:
+        None
+    """
+    body, properties = encode_event(event)
+    exchange, routing_key = publish_target(routing_key, QUEUE_NAME)
+    if PUBLISH_MODE == 'async':
+        get_async_publisher(QUEUE_NAME).publish(body, routing_key, properties, exchange)
+    else:
+        get_publisher(QUEUE_NAME).publish(body, routing_key,
+                                          pika.BasicProperties(**properties), exchange)
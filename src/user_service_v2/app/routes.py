@@ -5,12 +5,14 @@ error handling.
 
 Classes:
     UserList(Resource): Handles the creation of new users.
-    User(Resource): Handles the updating of existing users.
+    User(Resource): Handles the retrieval and updating of existing users.
 Routes:
     /users/ (POST): Creates a new user.
+    /users/<string:id> (GET): Retrieves a user, optionally restricted to some fields.
     /users/<string:id> (PUT): Updates an existing user.
 Functions:
     UserList.post(): Creates a new user with the provided data.
+    User.get(id: str): Retrieves a user.
     User.put(id: str): Updates an existing user with the provided data.
 Note:
     This is V2 of the microservice that automatically sets the dates.
@@ -20,11 +22,16 @@ Author:
 
 import uuid
 from datetime import datetime
-from bson.objectid import ObjectId
+from pymongo.errors import DuplicateKeyError
 from flask import request, Flask, current_app
-from flask_restx import Resource
+from flask_restx import Resource, marshal
 from user_service_v2.app.models import api, user_model
-from user_service_v2.app.events import publish_user_update_event
+from user_service_v2.app.events import publish_user_created_event, publish_user_update_event
+from shared.outbox import discard_user_event, mark_user_event_pending, OUTBOX_FIELD
+from shared.user_events import VERSION_INCREMENT, changed_event_fields
+from shared.projection import build_projection, parse_fields, trimmed_model
+from shared.repository import insert_document, update_document
+from shared.validation import RequestValidationError, validate
 
 # The current_app variable is a proxy to the Flask application handling the request.
 current_app : Flask
@@ -47,7 +54,8 @@ class UserList(Resource):
         5. Checks if any of the provided email addresses already exist in the database.
         6. Generates a unique userId for the new user.
         7. Inserts the new user data into the database.
-        8. Retrieves and returns the newly created user.
+        8. Announces the new user with a `user.created` event in topic mode.
+        9. Returns the newly created user, without reading it back.
         Returns:
             tuple: A tuple containing the newly created user data and the HTTP status code 201.
         Raises:
@@ -58,27 +66,10 @@ class UserList(Resource):
 
         data: dict = request.json
 
-        # Ensure no other fields are present
-        allowed_fields: set = {'emails', 'deliveryAddress', 'firstName', 'lastName', 'phoneNumber',
-                               'createdAt', 'updatedAt'}
-        for field in data:
-            if field not in allowed_fields:
-                api.abort(400, f'Invalid field: {field}')
-
-        if 'emails' not in data or not data['emails']:
-            api.abort(400, 'emails is a required field')
-        if 'deliveryAddress' not in data:
-            api.abort(400, 'deliveryAddress is a required field')
-
-        # Validate deliveryAddress
-        if 'deliveryAddress' in data:
-            delivery_address: dict = data['deliveryAddress']
-            required_fields: list = ['street', 'city', 'state', 'postalCode', 'country']
-            if not isinstance(delivery_address, dict):
-                api.abort(400, 'deliveryAddress must be an object')
-            for field in required_fields:
-                if field not in delivery_address or not isinstance(delivery_address[field], str):
-                    api.abort(400, f'deliveryAddress must contain a valid {field}')
+        try:
+            validate('user_create', data)
+        except RequestValidationError as e:
+            api.abort(400, str(e), errors=e.errors)
 
         users_collection = current_app.users_collection
         # Check if any of the emails already exist in the database
@@ -93,22 +84,56 @@ class UserList(Resource):
         current_time: datetime = datetime.utcnow()
         data['createdAt'] = current_time
         data['updatedAt'] = current_time
+        # New users start at version 1, so their creation event orders before any update
+        data['version'] = 1
 
-        user_id: ObjectId = users_collection.insert_one(data).inserted_id
-        user: dict = users_collection.find_one({'_id': ObjectId(user_id)})
+        # The unique emails index catches a concurrent request taking the same email
+        try:
+            user: dict = insert_document(users_collection, data)
+        except DuplicateKeyError:
+            api.abort(400, 'One or more email addresses are already in use')
+        publish_user_created_event(user)
         return user, 201
 
 @api.route('/<string:id>')
 @api.response(404, 'User not found')
 class User(Resource):
     """_summary_
-    Resource class to handle the updating of existing users.
+    Resource class to handle the retrieval and updating of existing users.
     """
+    @api.param('fields', 'Comma-separated user fields to return, e.g. userId,emails')
+    @api.response(200, 'Success', user_model)
+    def get(self, id: str) -> dict:
+        """
+        Retrieve a user by ID, optionally restricted to the fields listed in the 'fields'
+        query parameter. Only the requested fields are fetched from the database.
+        Args:
+            id (str): The unique identifier of the user.
+        Returns:
+            dict: The user data.
+        Raises:
+            HTTPException: If 'fields' contains a field that is not part of the user model.
+            HTTPException: If the user with the given ID is not found.
+        """
+
+        try:
+            field_names = parse_fields(request.args.get('fields'), user_model)
+        except ValueError as e:
+            api.abort(400, str(e))
+
+        user: dict = current_app.users_collection.find_one({'userId': id},
+                                                           build_projection(field_names))
+        if not user:
+            api.abort(404, "User not found")
+        return marshal(user, trimmed_model(user_model, field_names))
+
     @api.expect(user_model)
     @api.marshal_with(user_model)
-    def put(self) -> list:
+    def put(self, id: str) -> list:
         """
-        Update user information based on the provided user ID.
+        Update user information based on the provided user ID. The user is read and
+        updated atomically in a single round trip. An update event carrying the changed
+        fields is published, unless the emails and delivery address are unchanged.
         Args:
             id (str): The unique identifier of the user.
         Returns:
@@ -119,52 +144,48 @@ class User(Resource):
             HTTPException: If neither 'emails' nor 'deliveryAddress' is provided.
             HTTPException: If 'emails' is not a list of valid email addresses.
             HTTPException: If 'deliveryAddress' is not a valid object with required fields.
+            HTTPException: If one of the emails is already used by another user.
             HTTPException: If the user with the given ID is not found.
         """
 
         data: dict = request.json
 
-        # Ensure no other fields are present
-        allowed_fields = {'emails', 'deliveryAddress'}
-        for field in data:
-            if field not in allowed_fields:
-                api.abort(400, f'Invalid field: {field}')
-
-        if 'emails' not in data and 'deliveryAddress' not in data:
-            api.abort(400, 'Either emails or deliveryAddress is required')
-
-        # Validate emails
-        if 'emails' in data:
-            if not isinstance(data['emails'], list) or not all(isinstance(email, str)
-                                                               and '@' in email for email
-                                                               in data['emails']):
-                api.abort(400, 'emails must be an array of valid email addresses')
-
-        # Validate deliveryAddress
-        if 'deliveryAddress' in data:
-            delivery_address = data['deliveryAddress']
-            required_fields = ['street', 'city', 'state', 'postalCode', 'country']
-            if not isinstance(delivery_address, dict):
-                api.abort(400, 'deliveryAddress must be an object')
-            for field in required_fields:
-                if field not in delivery_address or not isinstance(delivery_address[field], str):
-                    api.abort(400, f'deliveryAddress must contain a valid {field}')
+        try:
+            validate('user_update', data)
+        except RequestValidationError as e:
+            api.abort(400, str(e), errors=e.errors)
 
         users_collection = current_app.users_collection
-        old_user: dict = users_collection.find_one({'userId': id})
-        if not old_user:
-            api.abort(404, "User not found")
 
         # update date automatically
         current_time = datetime.utcnow()
         data['updatedAt'] = current_time
 
-        users_collection.update_one({'userId': id}, {'$set': data})
-        new_user: dict = users_collection.find_one({'userId': id})
+        # With the outbox enabled, the event is persisted by the same write and
+        # published by the outbox relay instead of from the request
+        use_outbox: bool = current_app.config['USER_EVENTS_OUTBOX']
+        if use_outbox:
+            mark_user_event_pending(data)
+
+        # Every update bumps the user's version, which the event carries for ordering
+        try:
+            images = update_document(users_collection, {'userId': id},
+                                     {'$set': data, **VERSION_INCREMENT})
+        except DuplicateKeyError:
+            api.abort(400, 'One or more email addresses are already in use')
+        if not images:
+            api.abort(404, "User not found")
+        old_user, new_user = images
 
         emails: list = new_user["emails"]
         delivery_address: dict = new_user["deliveryAddress"]
 
-        # Publish the update event
-        publish_user_update_event(id, emails, delivery_address)
+        # Publish the update event, unless nothing consumers care about changed
+        changed_fields = changed_event_fields(old_user, new_user)
+        if use_outbox:
+            if not changed_fields and OUTBOX_FIELD not in old_user:
+                discard_user_event(users_collection, id, data)
+        elif changed_fields:
+            publish_user_update_event(id, emails, delivery_address, new_user['version'],
+                                      new_user['updatedAt'], changed_fields)
         return [old_user, new_user]
@@ -0,0 +1,13 @@
+import os
+import sys
+
+# The services import their modules from src, as in their Docker images
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                'src'))
+
+# Settings read at import time by the modules under test; unit tests never connect
+os.environ.setdefault("RABBITMQ_HOST", "localhost")
+os.environ.setdefault("RABBITMQ_PORT", "5672")
+os.environ.setdefault("RABBITMQ_QUEUE_NAME", "user_order_queue")
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017/?serverSelectionTimeoutMS=200")
+os.environ.setdefault("DATABASE_NAME", "unit_tests")
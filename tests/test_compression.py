@@ -0,0 +1,247 @@
+import gzip
+from unittest import mock
+
+import mongomock
+import pytest
+
+import order_service.app as order_app
+import shared.compression as compression
+from order_service.app.config import Config
+from shared import change_markers
+from shared.change_markers import CHANGE_MARKERS_COLLECTION, bump_markers, read_marker
+
+ADDRESS = {"street": "1 Main", "city": "Montreal", "state": "QC", "postalCode": "H1H1H1",
+           "country": "CA"}
+
+# Test: Change Markers
+
+
+@pytest.fixture
+def orders():
+    return mongomock.MongoClient().db.orders
+
+
+def test_markers_start_at_zero(orders):
+    assert read_marker(orders, "shipping") == "0.0"
+
+
+def test_bumping_a_key_changes_only_its_marker(orders):
+    bump_markers(orders, ["shipping"])
+    bump_markers(orders, ["shipping", "delivered"])
+    assert read_marker(orders, "shipping") == "0.2"
+    assert read_marker(orders, "delivered") == "0.1"
+    assert read_marker(orders, "under process") == "0.0"
+    assert orders.database[CHANGE_MARKERS_COLLECTION].count_documents({}) == 1
+
+
+def test_bumping_the_global_marker_changes_every_key(orders):
+    bump_markers(orders, ["shipping"])
+    bump_markers(orders)
+    assert read_marker(orders, "shipping") == "1.1"
+    assert read_marker(orders, "delivered") == "1.0"
+
+
+def test_bumping_no_key_does_not_write(orders):
+    bump_markers(orders, [])
+    assert orders.database[CHANGE_MARKERS_COLLECTION].count_documents({}) == 0
+
+
+def test_write_and_bump_bumps_after_a_standalone_write(orders):
+    notified = []
+    change_markers.add_listener(lambda name, keys: notified.append((name, keys)))
+    try:
+        result = change_markers.write_and_bump(
+            orders, lambda session: orders.insert_one({"orderStatus": "shipping"},
+                                                      session=session),
+            lambda _: ["shipping"])
+    finally:
+        change_markers._listeners.pop()
+    assert result.inserted_id is not None
+    assert read_marker(orders, "shipping") == "0.1"
+    assert notified == [("orders", ["shipping"])]
+
+
+def test_write_and_bump_shares_the_transaction_of_the_write():
+    notified = []
+    written_with = []
+    session = mock.MagicMock()
+
+    def with_transaction(callback):
+        result = callback(session)
+        assert notified == []
+        return result
+
+    session.with_transaction.side_effect = with_transaction
+    collection = mock.MagicMock()
+    collection.name = "orders"
+    collection.database.client.start_session.return_value.__enter__.return_value = session
+    markers = collection.database.__getitem__.return_value
+
+    change_markers.add_listener(lambda name, keys: notified.append((name, keys)))
+    try:
+        with mock.patch.object(change_markers, "supports_transactions", return_value=True):
+            result = change_markers.write_and_bump(
+                collection, lambda session_: written_with.append(session_) or "written",
+                lambda _: ["shipping"])
+    finally:
+        change_markers._listeners.pop()
+    assert result == "written"
+    assert written_with == [session]
+    markers.update_one.assert_called_once_with(
+        {"_id": "orders"}, {"$inc": {"versions.shipping": 1}}, upsert=True, session=session)
+    assert notified == [("orders", ["shipping"])]
+
+
+def test_standalone_clients_do_not_support_transactions(orders):
+    assert not change_markers.supports_transactions(orders)
+
+# Test: Conditional Requests
+
+
+@pytest.fixture
+def app(monkeypatch):
+    monkeypatch.setattr(Config, "EMBEDDED_EVENT_CONSUMER", False)
+    monkeypatch.setattr(order_app, "MongoClient", lambda uri: mongomock.MongoClient())
+    app = order_app.create_app()
+    app.orders_collection.insert_many([
+        {"orderId": f"o{i}", "userId": "u1", "orderStatus": "shipping",
+         "items": [{"itemId": f"item-{i}", "quantity": 1, "price": 9.99}],
+         "userEmails": ["a@x.com"], "deliveryAddress": ADDRESS}
+        for i in range(30)])
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def test_current_etag_is_answered_with_not_modified(client):
+    first = client.get("/orders/?status=shipping")
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+    second = client.get("/orders/?status=shipping", headers={"If-None-Match": etag})
+    assert second.status_code == 304
+    assert second.get_data() == b""
+    assert second.headers["ETag"] == etag
+
+
+def test_etag_changes_after_a_write_to_orders_of_the_status(client):
+    etag = client.get("/orders/?status=shipping").headers["ETag"]
+    other = client.get("/orders/?status=delivered").headers["ETag"]
+    assert client.put("/orders/o1/status", json={"orderStatus": "delivered"}).status_code \
+        == 200
+    response = client.get("/orders/?status=shipping", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert client.get("/orders/?status=delivered",
+                      headers={"If-None-Match": other}).status_code == 200
+
+
+def test_etag_does_not_change_after_a_write_to_another_status(client):
+    etag = client.get("/orders/?status=shipping").headers["ETag"]
+    client.post("/orders/", json={"items": [{"itemId": "i1", "quantity": 1, "price": 1}],
+                                  "userEmails": ["a@x.com"], "deliveryAddress": ADDRESS,
+                                  "orderStatus": "under process"})
+    assert client.get("/orders/?status=shipping",
+                      headers={"If-None-Match": etag}).status_code == 304
+
+
+def test_cached_single_order_is_answered_with_not_modified(client):
+    etag = client.get("/orders/o1").headers["ETag"]
+    response = client.get("/orders/o1", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+
+
+def test_marker_bump_drops_the_cached_page(app, client):
+    before = client.get("/orders/?status=shipping").get_json()
+    app.orders_collection.update_one({"orderId": "o1"}, {"$set": {"orderStatus": "delivered"}})
+    assert client.get("/orders/?status=shipping").get_json() == before
+    bump_markers(app.orders_collection, ["shipping"])
+    after = client.get("/orders/?status=shipping").get_json()
+    assert len(after) == len(before) - 1
+    assert "o1" not in {order["orderId"] for order in after}
+
+
+def test_ndjson_and_json_listings_have_different_etags(client):
+    json_etag = client.get("/orders/?status=shipping").headers["ETag"]
+    ndjson = client.get("/orders/?status=shipping&stream=true",
+                        headers={"If-None-Match": json_etag})
+    assert ndjson.status_code == 200
+    assert ndjson.headers["ETag"] != json_etag
+
+# Test: Content Negotiation
+
+
+def test_large_responses_are_gzipped_when_accepted(client):
+    plain = client.get("/orders/?status=shipping")
+    compressed = client.get("/orders/?status=shipping",
+                            headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in plain.headers
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(compressed.get_data()) == plain.get_data()
+    assert "Accept-Encoding" in compressed.headers["Vary"]
+    assert compressed.headers["ETag"] == plain.headers["ETag"][:-1] + '-gzip"'
+
+
+def test_compressed_etag_revalidates(client):
+    etag = client.get("/orders/?status=shipping",
+                      headers={"Accept-Encoding": "gzip"}).headers["ETag"]
+    assert client.get("/orders/?status=shipping", headers={
+        "Accept-Encoding": "gzip", "If-None-Match": etag}).status_code == 304
+
+
+def test_unknown_encodings_and_small_responses_are_not_compressed(client):
+    assert "Content-Encoding" not in client.get(
+        "/orders/?status=shipping", headers={"Accept-Encoding": "compress"}).headers
+    assert "Content-Encoding" not in client.get(
+        "/orders/?status=shipping&limit=1", headers={"Accept-Encoding": "gzip"}).headers
+
+
+def test_cached_pages_are_not_compressed_again(client):
+    with mock.patch.object(compression, "_compress", wraps=compression._compress) as compress:
+        first = client.get("/orders/?status=shipping", headers={"Accept-Encoding": "gzip"})
+        second = client.get("/orders/?status=shipping", headers={"Accept-Encoding": "gzip"})
+    assert compress.call_count == 1
+    assert second.headers["Content-Encoding"] == "gzip"
+    assert second.get_data() == first.get_data()
+    assert second.headers["ETag"] == first.headers["ETag"]
+
+
+def test_plain_and_gzip_clients_share_the_cached_page(client):
+    plain = client.get("/orders/?status=shipping")
+    with mock.patch.object(compression, "_compress", wraps=compression._compress) as compress:
+        for _ in range(2):
+            compressed = client.get("/orders/?status=shipping",
+                                    headers={"Accept-Encoding": "gzip"})
+        again = client.get("/orders/?status=shipping")
+    assert compress.call_count == 1
+    assert gzip.decompress(compressed.get_data()) == plain.get_data()
+    assert "Content-Encoding" not in again.headers
+    assert again.get_data() == plain.get_data()
+
+
+def test_cached_single_orders_are_not_compressed_again(app, client):
+    app.orders_collection.update_one({"orderId": "o1"}, {"$set": {"items": [
+        {"itemId": f"item-{i}", "quantity": 1, "price": 9.99} for i in range(40)]}})
+    plain = client.get("/orders/o1")
+    with mock.patch.object(compression, "_compress", wraps=compression._compress) as compress:
+        for _ in range(2):
+            compressed = client.get("/orders/o1", headers={"Accept-Encoding": "gzip"})
+    assert compress.call_count == 1
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in compressed.headers["Vary"]
+    assert compressed.headers["ETag"] == plain.headers["ETag"][:-1] + '-gzip"'
+    assert gzip.decompress(compressed.get_data()) == plain.get_data()
+    assert client.get("/orders/o1", headers={
+        "Accept-Encoding": "gzip", "If-None-Match": compressed.headers["ETag"]}).status_code \
+        == 304
+
+
+def test_variants_round_trip_through_a_cache_entry():
+    variants = {compression.IDENTITY: b"{}\n", "gzip": gzip.compress(b"{}\n")}
+    meta, unpacked = compression.unpack_variants(
+        compression.pack_variants({"etag": "x"}, variants))
+    assert meta == {"etag": "x"}
+    assert unpacked == variants
@@ -0,0 +1,110 @@
+from unittest import mock
+
+import pytest
+from pika.exceptions import NackError
+
+from order_service.app import consumer_pool
+from order_service.app.consumer_pool import ConsumerPool
+from order_service.app.events import decode_user_update_event
+
+
+def make_pool(workers=4, partitions=64):
+    return ConsumerPool(orders_collection=None, queue_name="user_order_queue",
+                        workers=workers, partitions=partitions, queue_depth=10,
+                        batch_size=10)
+
+# Test: Partition Stability
+
+
+def test_partition_of_is_stable_across_pools():
+    user_ids = [f"user-{i}" for i in range(200)]
+    first, second = make_pool(), make_pool()
+    assert [first.partition_of(u) for u in user_ids] == \
+        [second.partition_of(u) for u in user_ids]
+
+
+def test_partition_of_uses_crc32():
+    # crc32("abc") is fixed, unlike hash(), which is randomized per process
+    assert make_pool(partitions=1 << 32).partition_of("abc") == 0x352441C2
+    assert make_pool(partitions=64).partition_of("abc") == 0x352441C2 % 64
+
+
+def test_partition_of_stays_in_range_and_spreads_users():
+    pool = make_pool(workers=4, partitions=16)
+    partitions = {pool.partition_of(f"user-{i}") for i in range(1000)}
+    assert partitions <= set(range(16))
+    assert len(partitions) == 16
+
+
+def test_partitions_are_at_least_the_number_of_workers():
+    assert make_pool(workers=8, partitions=2).partitions == 8
+
+# Test: Decoding Events
+
+
+def test_decoded_event_keeps_its_fields():
+    assert decode_user_update_event(b'{"userId": "u1", "userEmails": []}') == \
+        {"userId": "u1", "userEmails": []}
+
+
+@pytest.mark.parametrize("body", [b'{"userEmails": []}', b'{"userId": null}',
+                                  b'{"userId": ""}', b'{"userId": 42}',
+                                  b'{"userId": ["u1"]}', b'{"userId": {"$ne": null}}'])
+def test_event_without_a_valid_user_id_is_rejected(body):
+    with pytest.raises(ValueError):
+        decode_user_update_event(body)
+
+
+def test_event_without_a_valid_user_id_is_parked_before_dispatch(monkeypatch):
+    pool = make_pool()
+    channel = mock.Mock()
+    channel.consume.return_value = iter([(mock.Mock(delivery_tag=1), None,
+                                          b'{"userId": 42}')])
+    monkeypatch.setattr(consumer_pool, "create_retry_channel",
+                        lambda queue: (channel, mock.Mock()))
+    monkeypatch.setattr(consumer_pool.threading, "Thread", mock.Mock())
+    pool.run()
+    assert channel.basic_publish.call_args.kwargs["routing_key"] == "user_order_queue.parking"
+    channel.basic_ack.assert_called_once_with(delivery_tag=1)
+    assert sum(q.qsize() for q in pool._queues) == 0
+
+# Test: Dispatching and Settling
+
+
+def test_events_of_a_user_go_to_the_same_worker_in_order():
+    pool = make_pool(workers=4)
+    for tag in range(1, 4):
+        pool._dispatch(mock.Mock(), mock.Mock(), (tag, {"userId": "u1"}))
+    worker = pool.partition_of("u1") % pool.workers
+    assert [pool._queues[worker].get_nowait()[0] for _ in range(3)] == [1, 2, 3]
+    assert sum(q.qsize() for q in pool._queues) == 0
+
+
+def complete(pool, error):
+    pool._in_flight = {1: (b"first", None), 2: (b"second", None)}
+    pool._completed.put((1, None))
+    pool._completed.put((2, error))
+
+
+def test_settle_acks_completed_deliveries_after_retrying_failed_ones():
+    pool = make_pool()
+    complete(pool, RuntimeError("write failed"))
+    channel = mock.Mock()
+    pool._settle(channel)
+    assert channel.basic_publish.call_args.kwargs["routing_key"].startswith(
+        "user_order_queue.retry.1.")
+    assert channel.basic_publish.call_args.kwargs["body"] == b"second"
+    assert channel.basic_ack.call_args_list == [mock.call(delivery_tag=1),
+                                                mock.call(delivery_tag=2)]
+    assert pool._in_flight == {}
+
+
+def test_settle_requeues_failed_deliveries_the_broker_refused_to_retry():
+    pool = make_pool()
+    complete(pool, RuntimeError("write failed"))
+    channel = mock.Mock()
+    channel.basic_publish.side_effect = NackError([])
+    pool._settle(channel)
+    channel.basic_ack.assert_called_once_with(delivery_tag=1)
+    channel.basic_nack.assert_called_once_with(delivery_tag=2, requeue=True)
+    assert pool._in_flight == {}
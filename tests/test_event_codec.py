@@ -0,0 +1,87 @@
+import json
+
+import pika
+import pytest
+
+from shared.event_codec import (COMPRESSED_ENCODING, SCHEMA_VERSION, SCHEMA_VERSION_HEADER,
+                                decode_event, encode_event)
+
+EVENT = {"userId": "u1", "userEmails": ["a@x.com"],
+         "deliveryAddress": {"street": "1 Test Street", "city": "Montreal"},
+         "changedFields": ["userEmails", "deliveryAddress"], "version": 3}
+
+
+def round_trip(event, codec, compress_min_size=0):
+    body, properties = encode_event(event, codec, compress_min_size)
+    return body, properties, decode_event(body, pika.BasicProperties(**properties))
+
+
+@pytest.fixture(params=["json", "bson", "msgpack"])
+def codec(request):
+    if request.param == "msgpack":
+        pytest.importorskip("msgpack")
+    return request.param
+
+# Test: Round Trips
+
+
+def test_round_trip(codec):
+    _, properties, decoded = round_trip(EVENT, codec)
+    assert decoded == EVENT
+    assert properties["content_encoding"] is None
+    assert properties["headers"] == {SCHEMA_VERSION_HEADER: SCHEMA_VERSION}
+
+
+def test_round_trip_with_deflate(codec):
+    event = dict(EVENT, userEmails=[f"user{i}@example.com" for i in range(100)])
+    body, properties, decoded = round_trip(event, codec, compress_min_size=64)
+    assert decoded == event
+    assert properties["content_encoding"] == COMPRESSED_ENCODING
+    uncompressed, _ = encode_event(event, codec, 0)
+    assert len(body) < len(uncompressed)
+
+
+def test_small_events_are_not_compressed(codec):
+    _, properties, _ = round_trip(EVENT, codec, compress_min_size=1 << 20)
+    assert properties["content_encoding"] is None
+
+
+def test_content_types():
+    assert encode_event(EVENT, "json", 0)[1]["content_type"] == "application/json"
+    assert encode_event(EVENT, "bson", 0)[1]["content_type"] == "application/bson"
+
+
+def test_unknown_codec_is_rejected():
+    with pytest.raises(ValueError, match="Unknown event codec"):
+        encode_event(EVENT, "xml", 0)
+
+# Test: Decoding Messages of Other Producers
+
+
+def test_message_without_properties_is_json():
+    assert decode_event(json.dumps(EVENT).encode()) == EVENT
+    assert decode_event(json.dumps(EVENT).encode(), pika.BasicProperties()) == EVENT
+
+
+@pytest.mark.parametrize("properties, error", [
+    (pika.BasicProperties(content_type="application/xml"), "Unsupported event content type"),
+    (pika.BasicProperties(content_encoding="gzip"), "Unsupported event content encoding"),
+    (pika.BasicProperties(headers={SCHEMA_VERSION_HEADER: SCHEMA_VERSION + 1}),
+     "Unsupported event schema version"),
+    (pika.BasicProperties(headers={SCHEMA_VERSION_HEADER: "1"}),
+     "Unsupported event schema version"),
+])
+def test_undecodable_properties_are_rejected(properties, error):
+    with pytest.raises(ValueError, match=error):
+        decode_event(json.dumps(EVENT).encode(), properties)
+
+
+@pytest.mark.parametrize("body, properties", [
+    (b"{not json", None),
+    (b"[1, 2]", None),
+    (b"\x00\x01", pika.BasicProperties(content_type="application/bson")),
+    (b"not deflated", pika.BasicProperties(content_encoding=COMPRESSED_ENCODING)),
+])
+def test_corrupt_bodies_are_rejected(body, properties):
+    with pytest.raises(ValueError):
+        decode_event(body, properties)
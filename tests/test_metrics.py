@@ -0,0 +1,22 @@
+from shared import metrics
+
+# Test: Statistics Registry
+
+
+def test_snapshot_collects_every_provider():
+    metrics.register("test_a", lambda: {"count": 1})
+    metrics.register("test_b", lambda: {"count": 2})
+    snapshot = metrics.snapshot()
+    assert snapshot["test_a"] == {"count": 1}
+    assert snapshot["test_b"] == {"count": 2}
+    metrics.unregister("test_a")
+    metrics.unregister("test_b")
+    assert "test_a" not in metrics.snapshot()
+
+
+def test_register_replaces_a_provider():
+    metrics.register("test_c", lambda: {"count": 1})
+    metrics.register("test_c", lambda: {"count": 2})
+    assert metrics.snapshot()["test_c"] == {"count": 2}
+    metrics.unregister("test_c")
+    metrics.unregister("test_c")
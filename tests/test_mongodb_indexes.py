@@ -0,0 +1,69 @@
+from unittest import mock
+
+import mongomock
+import pytest
+from pymongo.errors import OperationFailure
+
+from shared.config.mongodb_indexes import INDEX_SPEC, check_indexes, ensure_indexes
+
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient().db
+
+
+def spec_names(collection_name):
+    return [index.document["name"] for index in INDEX_SPEC[collection_name]]
+
+# Test: Applying the Spec
+
+
+def test_ensure_indexes_creates_every_index_of_the_spec(db):
+    applied = ensure_indexes(db)
+    assert applied == {name: spec_names(name) for name in INDEX_SPEC}
+    assert set(spec_names("orders")) <= set(db.orders.index_information())
+    assert db.users.index_information()["emails_1"]["unique"]
+
+
+def test_ensure_indexes_is_idempotent_and_limited_to_the_given_collections(db):
+    ensure_indexes(db, ["orders"])
+    assert ensure_indexes(db, ["orders"]) == {"orders": spec_names("orders")}
+    assert "users" not in db.list_collection_names()
+
+
+def test_index_that_cannot_be_built_does_not_prevent_the_others():
+    def create_indexes(indexes):
+        name = indexes[0].document["name"]
+        if name == "emails_1":
+            raise OperationFailure("E11000 duplicate key error")
+        return [name]
+
+    users = mock.Mock(create_indexes=mock.Mock(side_effect=create_indexes))
+    assert ensure_indexes({"users": users}, ["users"]) == \
+        {"users": ["userId_1", "outboxEventId_1"]}
+    assert users.create_indexes.call_count == 3
+
+
+# Test: Checking the Spec
+
+
+def index_stats(usage):
+    return [{"name": name, "accesses": {"ops": ops}} for name, ops in usage.items()]
+
+
+def test_check_indexes_reports_missing_unexpected_and_unused_indexes():
+    stats = {
+        "users": {"_id_": 0, "userId_1": 12, "emails_1": 0, "outboxEventId_1": 3},
+        "orders": {"_id_": 5, "orderId_1": 7, "userId_1": 2,
+                   "orderStatus_1_createdAt_1": 1, "orderStatus_1__id_1": 4,
+                   "legacy_1": 0},
+    }
+    del stats["users"]["outboxEventId_1"]
+    db = {name: mock.Mock(aggregate=mock.Mock(return_value=index_stats(usage)))
+          for name, usage in stats.items()}
+    report = check_indexes(db)
+    assert report["users"] == {"missing": ["outboxEventId_1"], "unexpected": [],
+                               "unused": ["emails_1"]}
+    assert report["orders"] == {"missing": [], "unexpected": ["legacy_1"],
+                                "unused": ["legacy_1"]}
+    db["orders"].aggregate.assert_called_once_with([{"$indexStats": {}}])
@@ -0,0 +1,126 @@
+import json
+from unittest import mock
+
+import mongomock
+import pytest
+from pymongo.errors import BulkWriteError, ServerSelectionTimeoutError
+
+import order_service.app as order_app
+from order_service.app.batch import create_orders, iter_ndjson
+from order_service.app.config import Config
+
+ADDRESS = {"street": "1 Main", "city": "Montreal", "state": "QC", "postalCode": "H1H1H1",
+           "country": "CA"}
+
+
+def new_order(item_id="i1"):
+    return {"items": [{"itemId": item_id, "quantity": 1, "price": 9.99}],
+            "userEmails": ["a@x.com"], "deliveryAddress": dict(ADDRESS),
+            "orderStatus": "under process"}
+
+
+@pytest.fixture
+def orders():
+    return mongomock.MongoClient().db.orders
+
+
+def spy_on(orders):
+    # Change markers are written through the collection's database
+    spy = mock.Mock(wraps=orders, database=orders.database)
+    spy.name = orders.name
+    return spy
+
+
+def statuses(batch):
+    return [result["status"] for result in batch["results"]]
+
+# Test: NDJSON Decoding
+
+
+def test_iter_ndjson_skips_blank_lines_and_reports_invalid_ones():
+    payloads = list(iter_ndjson([b'{"a": 1}\n', b"\n", b"{oops\n", b'{"b": 2}']))
+    assert payloads[0] == {"a": 1} and payloads[2] == {"b": 2}
+    assert isinstance(payloads[1], ValueError)
+    assert str(payloads[1]).startswith("Invalid JSON")
+
+# Test: Creating Orders
+
+
+def test_valid_orders_are_inserted_in_chunks(orders):
+    spy = spy_on(orders)
+    batch = create_orders(spy, [new_order(str(i)) for i in range(5)], chunk_size=2,
+                          max_items=10)
+    assert (batch["created"], batch["rejected"]) == (5, 0)
+    assert [len(call.args[0]) for call in spy.insert_many.call_args_list] == [2, 2, 1]
+    assert all(call.kwargs == {"ordered": False} for call in spy.insert_many.call_args_list)
+    assert orders.count_documents({}) == 5
+    assert {result["orderId"] for result in batch["results"]} == \
+        {order["orderId"] for order in orders.find()}
+
+
+def test_invalid_orders_are_reported_without_failing_the_batch(orders):
+    invalid = new_order()
+    del invalid["orderStatus"]
+    batch = create_orders(orders, [new_order(), invalid, "not an order", new_order()],
+                          chunk_size=10, max_items=10)
+    assert statuses(batch) == ["created", "invalid", "invalid", "created"]
+    assert batch["results"][1]["error"] == "body: 'orderStatus' is a required property"
+    assert batch["results"][1]["orderId"] is None
+    assert orders.count_documents({}) == 2
+
+
+def test_orders_past_the_limit_are_rejected(orders):
+    batch = create_orders(orders, [new_order() for _ in range(3)], chunk_size=10,
+                          max_items=2)
+    assert statuses(batch) == ["created", "created", "invalid"]
+    assert batch["results"][2]["error"] == "A batch is limited to 2 orders"
+
+
+def test_orders_rejected_by_the_database_are_failed_individually():
+    collection = mock.MagicMock()
+    collection.insert_many.side_effect = BulkWriteError({"writeErrors": [
+        {"index": 1, "code": 121, "errmsg": "Document failed validation"}]})
+    batch = create_orders(collection, [new_order() for _ in range(3)], chunk_size=10,
+                          max_items=10)
+    assert statuses(batch) == ["created", "failed", "created"]
+    assert batch["results"][1] == {"index": 1, "status": "failed", "orderId": None,
+                                   "error": "Document failed validation"}
+
+
+def test_chunk_that_cannot_be_written_fails_only_its_own_orders():
+    collection = mock.MagicMock()
+    collection.insert_many.side_effect = [None, ServerSelectionTimeoutError("down")]
+    batch = create_orders(collection, [new_order() for _ in range(3)], chunk_size=2,
+                          max_items=10)
+    assert statuses(batch) == ["created", "created", "failed"]
+    assert (batch["created"], batch["rejected"]) == (2, 1)
+
+# Test: Batch Endpoint
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(Config, "EMBEDDED_EVENT_CONSUMER", False)
+    monkeypatch.setattr(order_app, "MongoClient", lambda uri: mongomock.MongoClient())
+    return order_app.create_app().test_client()
+
+
+def test_batch_of_valid_orders_is_created(client):
+    response = client.post("/orders/batch", json=[new_order(), new_order()])
+    assert response.status_code == 201
+    assert response.json["created"] == 2
+
+
+def test_ndjson_batch_with_bad_lines_is_partially_created(client):
+    body = "\n".join([json.dumps(new_order()), "{not json", json.dumps({"items": []}),
+                      json.dumps(new_order())])
+    response = client.post("/orders/batch", data=body,
+                           content_type="application/x-ndjson")
+    assert response.status_code == 207
+    assert (response.json["created"], response.json["rejected"]) == (2, 2)
+    assert statuses(response.json) == ["created", "invalid", "invalid", "created"]
+    assert response.json["results"][1]["error"].startswith("Invalid JSON")
+
+
+def test_batch_body_must_be_a_list(client):
+    assert client.post("/orders/batch", json=new_order()).status_code == 400
@@ -0,0 +1,75 @@
+import threading
+from unittest import mock
+
+import mongomock
+import pytest
+
+import order_service.app as order_app
+from order_service import consumer
+from order_service.app import create_app, create_consumer_app, start_event_consumer
+from order_service.app.config import Config
+
+
+@pytest.fixture(autouse=True)
+def mongo(monkeypatch):
+    monkeypatch.setattr(order_app, "MongoClient", lambda uri: mongomock.MongoClient())
+
+
+@pytest.fixture
+def consumers(monkeypatch):
+    consumers = mock.Mock()
+    monkeypatch.setattr(order_app, "consume_user_update_events", consumers.single)
+    monkeypatch.setattr(order_app, "consume_user_update_events_batched", consumers.batch)
+    monkeypatch.setattr(order_app, "run_consumer_pool", consumers.pool)
+    return consumers
+
+# Test: Consumer Modes
+
+
+@pytest.mark.parametrize("mode", ["single", "batch", "pool"])
+def test_start_event_consumer_runs_the_configured_mode(consumers, mode):
+    app = create_consumer_app()
+    app.config["EVENT_CONSUMER_MODE"] = mode
+    start_event_consumer(app)
+    for name in ("single", "batch", "pool"):
+        assert getattr(consumers, name).called == (name == mode)
+
+# Test: Standalone Consumer
+
+
+def test_consumer_app_has_mongo_but_no_routes():
+    app = create_consumer_app()
+    assert app.orders_collection.name == "orders"
+    assert [rule.rule for rule in app.url_map.iter_rules()] == ["/static/<path:filename>"]
+
+
+def test_main_runs_the_consumer_in_the_calling_thread(consumers, monkeypatch):
+    app = create_consumer_app()
+    app.config.update(EVENT_CONSUMER_MODE="batch", CONSUMER_STATS_INTERVAL=0)
+    monkeypatch.setattr(consumer, "create_consumer_app", lambda: app)
+    with mock.patch.object(consumer.threading, "Thread") as thread:
+        consumer.main()
+    consumers.batch.assert_called_once_with()
+    thread.assert_not_called()
+
+
+def test_main_reports_stats_when_an_interval_is_set(consumers, monkeypatch):
+    app = create_consumer_app()
+    app.config["CONSUMER_STATS_INTERVAL"] = 30
+    monkeypatch.setattr(consumer, "create_consumer_app", lambda: app)
+    with mock.patch.object(consumer.threading, "Thread") as thread:
+        consumer.main()
+    thread.assert_called_once_with(target=consumer.report_stats, args=(30,), daemon=True)
+    thread.return_value.start.assert_called_once_with()
+
+# Test: Embedded Consumer
+
+
+@pytest.mark.parametrize("embedded", [True, False])
+def test_web_app_starts_the_consumer_only_when_embedded(monkeypatch, embedded):
+    started = threading.Event()
+    monkeypatch.setattr(Config, "EMBEDDED_EVENT_CONSUMER", embedded)
+    monkeypatch.setattr(order_app, "start_event_consumer", lambda app: started.set())
+    app = create_app()
+    assert started.wait(1 if embedded else 0.1) == embedded
+    assert "/metrics" in [rule.rule for rule in app.url_map.iter_rules()]
@@ -0,0 +1,313 @@
+import json
+from unittest import mock
+
+import mongomock
+import pytest
+from flask import Flask
+from pika.exceptions import NackError
+
+from order_service.app import events
+from order_service.app.events import (apply_user_update_batch, apply_user_update_event,
+                                      build_order_update, consume_user_update_events,
+                                      consume_user_update_events_batched)
+
+
+@pytest.fixture
+def orders():
+    orders = mongomock.MongoClient().db.orders
+    orders.insert_many([
+        {"orderId": "o1", "userId": "u1", "userEmails": ["old@x.com"],
+         "deliveryAddress": {"city": "Old"}},
+        {"orderId": "o2", "userId": "u1", "userEmails": ["old@x.com"],
+         "deliveryAddress": {"city": "Old"}},
+        {"orderId": "o3", "userId": "u2", "userEmails": ["other@x.com"],
+         "deliveryAddress": {"city": "Other"}},
+    ])
+    return orders
+
+
+def spy_on(orders):
+    # Change markers are written through the collection's database
+    spy = mock.Mock(wraps=orders, database=orders.database)
+    spy.name = orders.name
+    return spy
+
+
+def order(orders, order_id):
+    return orders.find_one({"orderId": order_id}, {"_id": 0})
+
+# Test: Building the Update
+
+
+def test_build_order_update_sets_only_the_fields_the_event_carries():
+    assert build_order_update({"userId": "u1", "userEmails": ["a@x.com"]}) == \
+        {"userEmails": ["a@x.com"]}
+    assert build_order_update({"userId": "u1", "deliveryAddress": {"city": "A"}}) == \
+        {"deliveryAddress": {"city": "A"}}
+    assert build_order_update({"userId": "u1", "userEmails": [], "deliveryAddress": None}) == {}
+
+# Test: Applying an Event
+
+
+def test_apply_user_update_event_updates_every_order_of_the_user(orders):
+    result = apply_user_update_event(orders, {"userId": "u1", "userEmails": ["new@x.com"],
+                                              "deliveryAddress": {"city": "New"}})
+    assert (result["matched"], result["modified"]) == (2, 2)
+    for order_id in ("o1", "o2"):
+        assert order(orders, order_id)["userEmails"] == ["new@x.com"]
+        assert order(orders, order_id)["deliveryAddress"] == {"city": "New"}
+    assert order(orders, "o3")["userEmails"] == ["other@x.com"]
+
+
+def test_apply_user_update_event_keeps_fields_the_event_does_not_carry(orders):
+    apply_user_update_event(orders, {"userId": "u1", "userEmails": ["new@x.com"]})
+    assert order(orders, "o1")["deliveryAddress"] == {"city": "Old"}
+
+
+def test_apply_user_update_event_without_changes_does_not_write():
+    orders = mock.Mock()
+    result = apply_user_update_event(orders, {"userId": "u1"})
+    assert result == {"matched": 0, "modified": 0, "elapsed_ms": 0.0}
+    orders.update_many.assert_not_called()
+
+
+def test_apply_user_update_event_is_one_update_many(orders):
+    spy = spy_on(orders)
+    apply_user_update_event(spy, {"userId": "u1", "userEmails": ["new@x.com"]})
+    spy.update_many.assert_called_once_with({"userId": "u1"},
+                                            {"$set": {"userEmails": ["new@x.com"]}},
+                                            session=None)
+
+
+def test_apply_user_update_event_is_recorded_in_the_consumer_stats(orders):
+    before = events.consumer_stats()
+    apply_user_update_event(orders, {"userId": "u1", "userEmails": ["new@x.com"]})
+    after = events.consumer_stats()
+    assert after["events"] == before["events"] + 1
+    assert after["orders_matched"] == before["orders_matched"] + 2
+    assert after["orders_modified"] == before["orders_modified"] + 2
+
+# Test: Applying a Batch
+
+
+def test_apply_user_update_batch_collapses_the_events_of_each_user(orders):
+    spy = spy_on(orders)
+    result = apply_user_update_batch(spy, [
+        {"userId": "u1", "userEmails": ["first@x.com"], "deliveryAddress": {"city": "A"}},
+        {"userId": "u2", "deliveryAddress": {"city": "B"}},
+        {"userId": "u1", "userEmails": ["second@x.com"]},
+    ])
+    assert result["users"] == 2
+    assert (result["matched"], result["modified"]) == (3, 3)
+    spy.bulk_write.assert_called_once()
+    assert len(spy.bulk_write.call_args.args[0]) == 2
+    assert spy.bulk_write.call_args.kwargs == {"ordered": False, "session": None}
+    assert order(orders, "o1")["userEmails"] == ["second@x.com"]
+    assert order(orders, "o2")["deliveryAddress"] == {"city": "A"}
+    assert order(orders, "o3")["deliveryAddress"] == {"city": "B"}
+
+
+def test_apply_user_update_batch_without_changes_does_not_write():
+    orders = mock.Mock()
+    result = apply_user_update_batch(orders, [{"userId": "u1"}, {"userId": "u2"}])
+    assert result == {"users": 0, "matched": 0, "modified": 0, "elapsed_ms": 0.0}
+    orders.bulk_write.assert_not_called()
+
+# Test: Batched Consumer
+
+
+def delivery(tag, event):
+    return mock.Mock(delivery_tag=tag), None, json.dumps(event).encode()
+
+
+def republished(channel):
+    return [(call.kwargs["routing_key"], call.kwargs["body"])
+            for call in channel.basic_publish.call_args_list]
+
+
+@pytest.fixture
+def consumer_app(orders, monkeypatch):
+    app = Flask(__name__)
+    app.config.update(EVENT_BATCH_SIZE=2, EVENT_BATCH_TIMEOUT_MS=50,
+                      RABBITMQ_PREFETCH_COUNT=1)
+    app.orders_collection = orders
+    channel = mock.Mock()
+    monkeypatch.setattr(events, "create_retry_channel",
+                        lambda queue: (channel, mock.Mock()))
+    with app.app_context():
+        yield channel
+
+
+def test_batched_consumer_acknowledges_each_full_batch_at_once(consumer_app, orders):
+    consumer_app.consume.return_value = iter([
+        delivery(1, {"userId": "u1", "userEmails": ["a@x.com"]}),
+        delivery(2, {"userId": "u2", "userEmails": ["b@x.com"]}),
+        delivery(3, {"userId": "u1", "userEmails": ["c@x.com"]}),
+        (None, None, None),
+    ])
+    consume_user_update_events_batched()
+    # The prefetch window is raised to the batch size
+    consumer_app.basic_qos.assert_called_once_with(prefetch_count=2)
+    assert consumer_app.basic_ack.call_args_list == [
+        mock.call(delivery_tag=2, multiple=True), mock.call(delivery_tag=3, multiple=True)]
+    assert order(orders, "o1")["userEmails"] == ["c@x.com"]
+    assert order(orders, "o3")["userEmails"] == ["b@x.com"]
+
+
+def test_batched_consumer_retries_only_the_events_that_still_fail(consumer_app, orders,
+                                                                   monkeypatch):
+    consumer_app.consume.return_value = iter([
+        delivery(1, {"userId": "u1", "userEmails": ["a@x.com"]}),
+        delivery(2, {"userId": "u2", "userEmails": ["b@x.com"]}),
+    ])
+    apply_event = events.apply_user_update_event
+
+    def apply_or_fail(collection, event):
+        if event["userId"] == "u2":
+            raise RuntimeError("write failed")
+        return apply_event(collection, event)
+
+    monkeypatch.setattr(events, "apply_user_update_batch",
+                        mock.Mock(side_effect=RuntimeError("write failed")))
+    monkeypatch.setattr(events, "apply_user_update_event", apply_or_fail)
+    consume_user_update_events_batched()
+    assert order(orders, "o1")["userEmails"] == ["a@x.com"]
+    [(target, body)] = republished(consumer_app)
+    assert target.startswith(f"{events.QUEUE_NAME}.retry.1.")
+    assert json.loads(body)["userId"] == "u2"
+    consumer_app.basic_ack.assert_called_once_with(delivery_tag=2, multiple=True)
+
+
+def test_batched_consumer_parks_undecodable_messages(consumer_app):
+    consumer_app.consume.return_value = iter([
+        (mock.Mock(delivery_tag=1), None, b"[]"), (None, None, None)])
+    consume_user_update_events_batched()
+    assert republished(consumer_app) == [(f"{events.QUEUE_NAME}.parking", b"[]")]
+    consumer_app.basic_ack.assert_called_once_with(delivery_tag=1, multiple=True)
+
+
+def test_batched_consumer_requeues_events_the_broker_refused_to_retry(consumer_app, orders,
+                                                                       monkeypatch):
+    consumer_app.consume.return_value = iter([
+        delivery(1, {"userId": "u1", "userEmails": ["a@x.com"]}),
+        delivery(2, {"userId": "u2", "userEmails": ["b@x.com"]}),
+        delivery(3, {"userId": "u1", "userEmails": ["c@x.com"]}),
+        delivery(4, {"userId": "u2", "userEmails": ["d@x.com"]}),
+    ])
+    apply_event = events.apply_user_update_event
+
+    def apply_or_fail(collection, event):
+        if event["userId"] == "u2":
+            raise RuntimeError("write failed")
+        return apply_event(collection, event)
+
+    monkeypatch.setattr(events, "apply_user_update_batch",
+                        mock.Mock(side_effect=RuntimeError("write failed")))
+    monkeypatch.setattr(events, "apply_user_update_event", apply_or_fail)
+    consumer_app.basic_publish.side_effect = NackError([])
+    consume_user_update_events_batched()
+    assert consumer_app.basic_nack.call_args_list == [
+        mock.call(delivery_tag=2, requeue=True), mock.call(delivery_tag=4, requeue=True)]
+    # The last delivery of the second batch was requeued, so only the third is acked
+    assert consumer_app.basic_ack.call_args_list == [
+        mock.call(delivery_tag=1, multiple=True), mock.call(delivery_tag=3, multiple=True)]
+    assert order(orders, "o1")["userEmails"] == ["c@x.com"]
+
+
+def test_batched_consumer_requeues_undecodable_messages_it_cannot_park(consumer_app):
+    consumer_app.consume.return_value = iter([
+        (mock.Mock(delivery_tag=1), None, b"[]"), (None, None, None)])
+    consumer_app.basic_publish.side_effect = NackError([])
+    consume_user_update_events_batched()
+    consumer_app.basic_nack.assert_called_once_with(delivery_tag=1, requeue=True)
+    consumer_app.basic_ack.assert_not_called()
+
+# Test: Versioned Events
+
+
+def test_versioned_event_records_the_user_version(orders):
+    apply_user_update_event(orders, {"userId": "u1", "userEmails": ["v1@x.com"], "version": 1})
+    assert order(orders, "o1")["userVersion"] == 1
+
+
+def test_stale_or_redelivered_events_are_skipped(orders):
+    apply_user_update_event(orders, {"userId": "u1", "userEmails": ["v2@x.com"], "version": 2})
+    for version in (1, 2):
+        result = apply_user_update_event(orders, {"userId": "u1", "version": version,
+                                                  "userEmails": [f"stale{version}@x.com"]})
+        assert result["matched"] == 0
+    assert order(orders, "o1")["userEmails"] == ["v2@x.com"]
+    assert order(orders, "o1")["userVersion"] == 2
+
+
+def test_unversioned_events_apply_unconditionally(orders):
+    apply_user_update_event(orders, {"userId": "u1", "userEmails": ["v2@x.com"], "version": 2})
+    apply_user_update_event(orders, {"userId": "u1", "userEmails": ["legacy@x.com"]})
+    assert order(orders, "o1")["userEmails"] == ["legacy@x.com"]
+    assert order(orders, "o1")["userVersion"] == 2
+
+
+def test_batch_keeps_the_newest_version_of_every_field(orders):
+    apply_user_update_batch(orders, [
+        {"userId": "u1", "userEmails": ["v3@x.com"], "version": 3},
+        {"userId": "u1", "userEmails": ["v2@x.com"], "deliveryAddress": {"city": "v2"},
+         "version": 2},
+    ])
+    # No newer event wrote the address, so the late version 2 of it still applies
+    assert order(orders, "o1")["userEmails"] == ["v3@x.com"]
+    assert order(orders, "o1")["deliveryAddress"] == {"city": "v2"}
+    assert order(orders, "o1")["userVersion"] == 3
+    assert order(orders, "o1")["userFieldVersions"] == {"userEmails": 3, "deliveryAddress": 2}
+
+
+def test_batch_skips_orders_already_holding_a_newer_version(orders):
+    apply_user_update_event(orders, {"userId": "u1", "userEmails": ["v5@x.com"], "version": 5})
+    result = apply_user_update_batch(orders, [
+        {"userId": "u1", "userEmails": ["v4@x.com"], "version": 4},
+        {"userId": "u2", "userEmails": ["u2v1@x.com"], "version": 1},
+    ])
+    assert result["matched"] == 1
+    assert order(orders, "o1")["userEmails"] == ["v5@x.com"]
+    assert order(orders, "o3")["userEmails"] == ["u2v1@x.com"]
+
+# Test: Single Consumer
+
+
+def single_callback(consumer_app):
+    consume_user_update_events()
+    return consumer_app.basic_consume.call_args.kwargs["on_message_callback"]
+
+
+def test_single_consumer_applies_and_acknowledges_each_event(consumer_app, orders):
+    callback = single_callback(consumer_app)
+    method, _, body = delivery(7, {"userId": "u1", "userEmails": ["a@x.com"]})
+    callback(consumer_app, method, None, body)
+    assert order(orders, "o1")["userEmails"] == ["a@x.com"]
+    consumer_app.basic_ack.assert_called_once_with(delivery_tag=7)
+
+
+def test_single_consumer_retries_failed_events(consumer_app, monkeypatch):
+    monkeypatch.setattr(events, "apply_user_update_event",
+                        mock.Mock(side_effect=RuntimeError("write failed")))
+    callback = single_callback(consumer_app)
+    method, _, body = delivery(7, {"userId": "u1", "userEmails": ["a@x.com"]})
+    callback(consumer_app, method, None, body)
+    [(target, republished_body)] = republished(consumer_app)
+    assert target.startswith(f"{events.QUEUE_NAME}.retry.1.")
+    assert republished_body == body
+    consumer_app.basic_ack.assert_called_once_with(delivery_tag=7)
+
+
+def test_single_consumer_requeues_events_the_broker_refused_to_retry(consumer_app,
+                                                                      monkeypatch):
+    monkeypatch.setattr(events, "apply_user_update_event",
+                        mock.Mock(side_effect=RuntimeError("write failed")))
+    consumer_app.basic_publish.side_effect = NackError([])
+    callback = single_callback(consumer_app)
+    for tag in (7, 8):
+        method, _, body = delivery(tag, {"userId": "u1", "userEmails": ["a@x.com"]})
+        callback(consumer_app, method, None, body)
+    # The consumer keeps going, and neither delivery is acknowledged
+    assert consumer_app.basic_nack.call_args_list == [
+        mock.call(delivery_tag=7, requeue=True), mock.call(delivery_tag=8, requeue=True)]
+    consumer_app.basic_ack.assert_not_called()
@@ -0,0 +1,167 @@
+import json
+from unittest import mock
+
+import mongomock
+import pytest
+
+import order_service.app as order_app
+from order_service.app import create_app
+from order_service.app.config import Config
+from order_service.app.events import apply_user_update_event
+
+
+@pytest.fixture
+def app(monkeypatch):
+    monkeypatch.setattr(Config, "EMBEDDED_EVENT_CONSUMER", False)
+    monkeypatch.setattr(order_app, "MongoClient", lambda uri: mongomock.MongoClient())
+    return create_app()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def add_orders(app, count, status="under process", first=0):
+    app.orders_collection.insert_many([
+        {"orderId": f"o{i}", "userId": "u1", "items": [{"itemId": "i1", "quantity": 1,
+                                                        "price": 9.99}],
+         "userEmails": ["a@x.com"], "deliveryAddress": {"city": "Montreal"},
+         "orderStatus": status}
+        for i in range(first, first + count)])
+
+# Test: Pagination
+
+
+def test_orders_without_limit_are_returned_in_full(app, client):
+    add_orders(app, 3)
+    add_orders(app, 2, status="shipping", first=3)
+    response = client.get("/orders/?status=under process")
+    assert response.status_code == 200
+    assert [order["orderId"] for order in response.json] == ["o0", "o1", "o2"]
+    assert "X-Next-Cursor" not in response.headers
+
+
+def test_pages_follow_the_next_cursor(app, client):
+    add_orders(app, 5)
+    seen, url = [], "/orders/?status=under process&limit=2"
+    while True:
+        response = client.get(url)
+        assert response.status_code == 200
+        seen += [order["orderId"] for order in response.json]
+        if "X-Next-Cursor" not in response.headers:
+            break
+        assert response.headers["Link"].endswith('rel="next"')
+        url = ("/orders/?status=under process&limit=2&after="
+               + response.headers["X-Next-Cursor"])
+    assert seen == ["o0", "o1", "o2", "o3", "o4"]
+
+
+@pytest.mark.parametrize("query", ["limit=0", "limit=abc", "after=not-a-cursor"])
+def test_invalid_pagination_parameters_are_rejected(client, query):
+    assert client.get(f"/orders/?status=shipping&{query}").status_code == 400
+
+# Test: Streaming
+
+
+@pytest.mark.parametrize("request_args", [
+    {"query_string": {"status": "shipping", "stream": "true"}},
+    {"query_string": {"status": "shipping"}, "headers": {"Accept": "application/x-ndjson"}},
+])
+def test_orders_are_streamed_as_ndjson(app, client, request_args):
+    add_orders(app, 3, status="shipping")
+    response = client.get("/orders/", **request_args)
+    assert response.mimetype == "application/x-ndjson"
+    lines = response.get_data(as_text=True).splitlines()
+    assert [json.loads(line)["orderId"] for line in lines] == ["o0", "o1", "o2"]
+
+# Test: Field Projection
+
+
+def test_fields_restrict_the_returned_orders(app, client):
+    add_orders(app, 3)
+    response = client.get("/orders/?status=under process&limit=2&fields=orderStatus,orderId")
+    assert response.json == [{"orderId": "o0", "orderStatus": "under process"},
+                             {"orderId": "o1", "orderStatus": "under process"}]
+    assert "fields=orderId%2CorderStatus" in response.headers["Link"]
+
+
+def test_unknown_fields_are_rejected(client):
+    response = client.get("/orders/?status=shipping&fields=orderId,secret")
+    assert response.status_code == 400
+
+# Test: Bulk Status Transitions
+
+
+def test_bulk_status_transition_updates_the_selected_orders(app, client):
+    add_orders(app, 3)
+    response = client.put("/orders/status", json={"orderStatus": "shipping",
+                                                  "orderIds": ["o0", "o2", "missing"]})
+    assert response.status_code == 200
+    assert response.json == {"orderStatus": "shipping", "requested": 3, "matched": 2,
+                             "modified": 2}
+    shipping = app.orders_collection.find({"orderStatus": "shipping"})
+    assert sorted(order["orderId"] for order in shipping) == ["o0", "o2"]
+
+
+def test_enforced_bulk_status_transition_skips_orders_that_may_not_move(app, client):
+    add_orders(app, 1)
+    add_orders(app, 1, status="shipping", first=1)
+    response = client.put("/orders/status", json={"orderStatus": "delivered",
+                                                  "filter": {"userId": "u1"},
+                                                  "enforceTransitions": True})
+    assert response.json["matched"] == 1
+    assert app.orders_collection.find_one({"orderId": "o0"})["orderStatus"] == \
+        "under process"
+
+
+def test_invalid_bulk_status_transition_is_rejected(client):
+    response = client.put("/orders/status", json={"orderStatus": "lost", "orderIds": ["o1"]})
+    assert response.status_code == 400
+
+# Test: Single Orders
+
+
+def test_get_order_returns_the_order_with_an_etag(app, client):
+    add_orders(app, 2)
+    response = client.get("/orders/o1")
+    assert response.status_code == 200
+    assert response.json["orderId"] == "o1"
+    assert response.headers["ETag"].startswith('"order-')
+    assert client.get("/orders/o1", headers={
+        "If-None-Match": response.headers["ETag"]}).status_code == 304
+
+
+def test_get_unknown_order_is_not_found(client):
+    assert client.get("/orders/missing").status_code == 404
+
+
+def test_get_order_is_read_through_the_cache(app, client):
+    add_orders(app, 1)
+    first = client.get("/orders/o0")
+    with mock.patch.object(app.orders_collection, "find_one") as find_one:
+        second = client.get("/orders/o0")
+    find_one.assert_not_called()
+    assert second.get_data() == first.get_data()
+    assert second.headers["ETag"] == first.headers["ETag"]
+
+
+@pytest.mark.parametrize("url, payload", [
+    ("/orders/o0/status", {"orderStatus": "shipping"}),
+    ("/orders/status", {"orderStatus": "shipping", "orderIds": ["o0"]}),
+])
+def test_order_writes_drop_the_cached_order(app, client, url, payload):
+    add_orders(app, 1)
+    etag = client.get("/orders/o0").headers["ETag"]
+    assert client.put(url, json=payload).status_code == 200
+    response = client.get("/orders/o0", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json["orderStatus"] == "shipping"
+
+
+def test_user_update_events_drop_the_cached_orders_of_the_user(app, client):
+    add_orders(app, 1)
+    client.get("/orders/o0")
+    apply_user_update_event(app.orders_collection, {"userId": "u1",
+                                                    "userEmails": ["new@x.com"]})
+    assert client.get("/orders/o0").json["userEmails"] == ["new@x.com"]
@@ -0,0 +1,93 @@
+import pytest
+
+from order_service.app.validation import build_status_transition, validate_new_order
+from shared.validation import RequestValidationError
+
+# Test: Bulk Status Transitions
+
+
+def test_transition_by_order_ids():
+    query, status = build_status_transition(
+        {"orderStatus": "shipping", "orderIds": ["o1", "o2"]}, 10, False)
+    assert status == "shipping"
+    assert query == {"orderId": {"$in": ["o1", "o2"]}}
+
+
+def test_transition_by_filter():
+    query, status = build_status_transition(
+        {"orderStatus": "delivered", "filter": {"userId": "u1", "orderStatus": "shipping"}},
+        10, False)
+    assert status == "delivered"
+    assert query == {"userId": "u1", "orderStatus": "shipping"}
+
+
+def test_enforced_transition_selects_the_predecessors_only():
+    query, _ = build_status_transition(
+        {"orderStatus": "delivered", "orderIds": ["o1"]}, 10, True)
+    assert query == {"$and": [{"orderId": {"$in": ["o1"]}},
+                              {"orderStatus": {"$in": ["shipping", "delivered"]}}]}
+
+
+def test_payload_overrides_the_default_enforcement():
+    payload = {"orderStatus": "shipping", "orderIds": ["o1"]}
+    query, _ = build_status_transition(dict(payload, enforceTransitions=False), 10, True)
+    assert query == {"orderId": {"$in": ["o1"]}}
+    query, _ = build_status_transition(dict(payload, enforceTransitions=True), 10, False)
+    assert query["$and"][1] == {"orderStatus": {"$in": ["under process", "shipping"]}}
+
+
+@pytest.mark.parametrize("payload, error", [
+    ([], "The body must be an object"),
+    ({"orderStatus": "shipping", "orderIds": ["o1"], "extra": 1}, "Invalid field: extra"),
+    ({"orderIds": ["o1"]}, "Invalid or missing orderStatus"),
+    ({"orderStatus": "lost", "orderIds": ["o1"]}, "Invalid or missing orderStatus"),
+    ({"orderStatus": "shipping"}, "Exactly one of orderIds or filter is required"),
+    ({"orderStatus": "shipping", "orderIds": ["o1"], "filter": {"userId": "u1"}},
+     "Exactly one of orderIds or filter is required"),
+    ({"orderStatus": "shipping", "orderIds": []}, "orderIds must be a non-empty array"),
+    ({"orderStatus": "shipping", "orderIds": [1]}, "orderIds must be a non-empty array"),
+    ({"orderStatus": "shipping", "orderIds": ["o1", "o2", "o3"]},
+     "orderIds is limited to 2 orders"),
+    ({"orderStatus": "shipping", "filter": {}}, "filter must be a non-empty object"),
+    ({"orderStatus": "shipping", "filter": {"items": "x"}}, "Invalid filter field: items"),
+    ({"orderStatus": "shipping", "filter": {"userId": {"$ne": "u1"}}},
+     "Invalid filter field: userId"),
+    ({"orderStatus": "shipping", "filter": {"orderStatus": "lost"}},
+     "Invalid orderStatus in filter"),
+    ({"orderStatus": "shipping", "orderIds": ["o1"], "enforceTransitions": "yes"},
+     "enforceTransitions must be a boolean"),
+])
+def test_invalid_transition_is_rejected(payload, error):
+    with pytest.raises(ValueError, match=error):
+        build_status_transition(payload, 2, False)
+
+# Test: New Orders
+
+
+def new_order(**fields):
+    order = {"userId": "u1", "items": [{"itemId": "i1", "quantity": 2, "price": 9.99}],
+             "userEmails": ["a@x.com"], "orderStatus": "under process",
+             "deliveryAddress": {"street": "1 Test Street", "city": "Montreal",
+                                 "state": "QC", "postalCode": "H3G 1M8",
+                                 "country": "Canada"}}
+    order.update(fields)
+    return order
+
+
+def test_valid_new_order():
+    validate_new_order(new_order())
+
+
+@pytest.mark.parametrize("order, field", [
+    (new_order(items=[]), "items"),
+    (new_order(items=[{"itemId": "i1", "quantity": 0, "price": 1}]), "items.0.quantity"),
+    (new_order(items=[{"itemId": "i1", "quantity": 1, "price": -1}]), "items.0.price"),
+    (new_order(userEmails=["nobody"]), "userEmails.0"),
+    (new_order(orderStatus="lost"), "orderStatus"),
+    (new_order(orderId="o1"), "body"),
+    (new_order(deliveryAddress={"city": "Montreal"}), "deliveryAddress"),
+])
+def test_invalid_new_order_is_rejected(order, field):
+    with pytest.raises(RequestValidationError) as info:
+        validate_new_order(order)
+    assert {error.split(":")[0] for error in info.value.errors} == {field}
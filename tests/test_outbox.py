@@ -0,0 +1,125 @@
+import json
+from unittest import mock
+
+import mongomock
+import pytest
+from bson.objectid import ObjectId
+from pika.exceptions import AMQPChannelError
+
+from shared import outbox
+from shared.outbox import OUTBOX_FIELD, OutboxRelay, mark_user_event_pending
+
+QUEUE = "user_order_queue"
+
+
+@pytest.fixture
+def users():
+    return mongomock.MongoClient().db.users
+
+
+@pytest.fixture
+def channel(monkeypatch):
+    channel = mock.Mock(is_open=True)
+    connection = mock.Mock(is_open=True)
+    connection.channel.return_value = channel
+    monkeypatch.setattr(outbox, "get_connection", lambda: connection)
+    return channel
+
+
+def add_user(users, user_id, pending=True):
+    user = {"userId": user_id, "emails": [f"{user_id}@x.com"],
+            "deliveryAddress": {"city": user_id}}
+    if pending:
+        mark_user_event_pending(user)
+    users.insert_one(user)
+
+
+def published(channel):
+    return [json.loads(call.kwargs["body"])["userId"]
+            for call in channel.basic_publish.call_args_list]
+
+# Test: Pending Events
+
+
+def test_mark_user_event_pending_adds_a_fresh_marker():
+    first = mark_user_event_pending({"emails": []})
+    second = mark_user_event_pending({"emails": []})
+    assert isinstance(first[OUTBOX_FIELD], ObjectId)
+    assert first[OUTBOX_FIELD] != second[OUTBOX_FIELD]
+
+# Test: Relaying Batches
+
+
+def test_relay_publishes_pending_events_oldest_first_and_clears_them(users, channel):
+    add_user(users, "u1")
+    add_user(users, "u2", pending=False)
+    add_user(users, "u3")
+    relay = OutboxRelay(users, QUEUE, batch_size=10)
+    assert relay.relay_batch() == 2
+    assert published(channel) == ["u1", "u3"]
+    assert users.count_documents({OUTBOX_FIELD: {"$exists": True}}) == 0
+    event = json.loads(channel.basic_publish.call_args.kwargs["body"])
+    assert event["userEmails"] == ["u3@x.com"]
+    assert relay.relay_batch() == 0
+
+
+
+def test_relay_publishes_the_stored_version(users, channel):
+    add_user(users, "u1")
+    users.update_one({"userId": "u1"}, {"$set": {"version": 3}})
+    OutboxRelay(users, QUEUE).relay_batch()
+    assert json.loads(channel.basic_publish.call_args.kwargs["body"])["version"] == 3
+
+def test_relay_takes_at_most_one_batch(users, channel):
+    for user_id in ("u1", "u2", "u3"):
+        add_user(users, user_id)
+    relay = OutboxRelay(users, QUEUE, batch_size=2)
+    assert relay.relay_batch() == 2
+    assert published(channel) == ["u1", "u2"]
+    assert [user["userId"] for user in users.find({OUTBOX_FIELD: {"$exists": True}})] == \
+        ["u3"]
+
+
+def test_markers_are_cleared_after_publishing(users, channel):
+    add_user(users, "u1")
+    pending_at_publish = []
+    channel.basic_publish.side_effect = lambda **kwargs: pending_at_publish.append(
+        users.count_documents({OUTBOX_FIELD: {"$exists": True}}))
+    OutboxRelay(users, QUEUE).relay_batch()
+    assert pending_at_publish == [1]
+    assert users.count_documents({OUTBOX_FIELD: {"$exists": True}}) == 0
+
+
+def test_marker_replaced_during_the_batch_is_kept(users, channel):
+    add_user(users, "u1")
+
+    def update_again(**kwargs):
+        users.update_one({"userId": "u1"}, {"$set": mark_user_event_pending({})})
+
+    channel.basic_publish.side_effect = update_again
+    relay = OutboxRelay(users, QUEUE)
+    relay.relay_batch()
+    assert users.count_documents({OUTBOX_FIELD: {"$exists": True}}) == 1
+    assert relay.stats()["superseded"] == 1
+    # The newer update is published with the next batch
+    channel.basic_publish.side_effect = None
+    assert relay.relay_batch() == 1
+
+
+def test_batch_is_committed_once(users, channel):
+    for user_id in ("u1", "u2"):
+        add_user(users, user_id)
+    assert OutboxRelay(users, QUEUE).relay_batch() == 2
+    channel.tx_select.assert_called_once()
+    channel.tx_commit.assert_called_once()
+
+
+def test_events_of_an_uncommitted_batch_stay_pending(users, channel):
+    for user_id in ("u1", "u2"):
+        add_user(users, user_id)
+    channel.tx_commit.side_effect = AMQPChannelError("channel closed")
+    with pytest.raises(AMQPChannelError):
+        OutboxRelay(users, QUEUE).relay_batch()
+    assert [user["userId"] for user in users.find({OUTBOX_FIELD: {"$exists": True}})] == \
+        ["u1", "u2"]
+
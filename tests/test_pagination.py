@@ -0,0 +1,60 @@
+import pytest
+from bson.objectid import ObjectId
+
+from order_service.app.pagination import decode_cursor, encode_cursor, parse_limit
+
+# Test: Cursor Round Trip
+
+
+def test_cursor_round_trip():
+    for object_id in (ObjectId(), ObjectId("000000000000000000000000"),
+                      ObjectId("ffffffffffffffffffffffff")):
+        cursor = encode_cursor(object_id)
+        assert decode_cursor(cursor) == object_id
+
+
+def test_cursor_is_url_safe_and_unpadded():
+    cursor = encode_cursor(ObjectId("fbfffffbfffffbfffffbffff"))
+    assert "=" not in cursor
+    assert "+" not in cursor and "/" not in cursor
+    assert len(cursor) == 16
+
+# Test: Tampered Cursors
+
+
+@pytest.mark.parametrize("cursor", [
+    "",
+    "abc",
+    "not a cursor!",
+    "é" * 16,
+])
+def test_invalid_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        decode_cursor(cursor)
+
+
+def test_truncated_or_extended_cursor_is_rejected():
+    cursor = encode_cursor(ObjectId())
+    with pytest.raises(ValueError):
+        decode_cursor(cursor[:-4])
+    with pytest.raises(ValueError):
+        decode_cursor(cursor + "AAAA")
+
+
+def test_object_id_hex_is_not_a_cursor():
+    with pytest.raises(ValueError):
+        decode_cursor(str(ObjectId()))
+
+# Test: Page Size
+
+
+def test_parse_limit():
+    assert parse_limit(None, 100) is None
+    assert parse_limit("1", 100) == 1
+    assert parse_limit("100", 100) == 100
+
+
+@pytest.mark.parametrize("value", ["0", "-1", "101", "ten", "1.5"])
+def test_parse_limit_rejects_out_of_range_values(value):
+    with pytest.raises(ValueError):
+        parse_limit(value, 100)
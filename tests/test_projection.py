@@ -0,0 +1,59 @@
+import mongomock
+import pytest
+
+import user_service_v1.app as user_app
+from order_service.app.models import order_model
+from shared.projection import build_projection, parse_fields, trimmed_model
+
+# Test: Parsing Fields
+
+
+def test_no_fields_means_every_field():
+    assert parse_fields(None, order_model) is None
+    assert parse_fields("", order_model) is None
+    assert build_projection(None) is None
+    assert trimmed_model(order_model, None) is order_model
+
+
+def test_fields_are_returned_in_model_order_without_duplicates():
+    assert parse_fields(" orderStatus, orderId ,orderId,", order_model) == \
+        ["orderId", "orderStatus"]
+
+
+def test_unknown_fields_are_rejected():
+    with pytest.raises(ValueError, match="Unknown fields: nope, password"):
+        parse_fields("orderId,password,nope", order_model)
+
+# Test: Projection and Model
+
+
+def test_projection_selects_only_the_requested_fields():
+    assert build_projection(["orderId", "orderStatus"]) == {"orderId": 1, "orderStatus": 1}
+
+
+def test_trimmed_model_is_cached_per_field_set():
+    trimmed = trimmed_model(order_model, ["orderId"])
+    assert list(trimmed) == ["orderId"]
+    assert trimmed["orderId"] is order_model["orderId"]
+    assert trimmed_model(order_model, ["orderId"]) is trimmed
+    assert trimmed_model(order_model, ["orderId", "orderStatus"]) is not trimmed
+
+# Test: User Reads
+
+
+@pytest.fixture
+def user_client(monkeypatch):
+    monkeypatch.setattr(user_app, "MongoClient", lambda uri: mongomock.MongoClient())
+    app = user_app.create_app()
+    app.users_collection.insert_one({"userId": "u1", "firstName": "Ada", "lastName": "L",
+                                     "emails": ["ada@x.com"],
+                                     "deliveryAddress": {"city": "Montreal"}})
+    return app.test_client()
+
+
+def test_user_read_returns_only_the_requested_fields(user_client):
+    response = user_client.get("/users/u1?fields=emails,userId")
+    assert response.json == {"userId": "u1", "emails": ["ada@x.com"]}
+    assert user_client.get("/users/u1").json["firstName"] == "Ada"
+    assert user_client.get("/users/u1?fields=password").status_code == 400
+    assert user_client.get("/users/missing").status_code == 404
@@ -0,0 +1,192 @@
+import os
+import threading
+import time
+from unittest import mock
+
+import pika
+import pytest
+
+from shared.config import rabbitmq_async_publisher
+from shared.config.rabbitmq_async_publisher import AsyncRabbitMQPublisher
+
+QUEUE = "user_order_queue"
+
+
+@pytest.fixture
+def channel(monkeypatch):
+    channel = mock.Mock(is_open=True)
+    connection = mock.Mock(is_open=True)
+    connection.channel.return_value = channel
+    monkeypatch.setattr(rabbitmq_async_publisher, "get_connection", lambda: connection)
+    return channel
+
+
+@pytest.fixture
+def make_publisher(tmp_path, channel):
+    def make(**kwargs):
+        publisher = AsyncRabbitMQPublisher(QUEUE, spill_dir=str(tmp_path), **kwargs)
+        # Batches are taken and sent by the test instead of the sender thread
+        publisher._thread = threading.current_thread()
+        return publisher
+    return make
+
+
+def drain(publisher):
+    publisher._stopping = True
+    for _ in range(100):
+        batch = publisher._next_batch()
+        if batch:
+            publisher._send(batch)
+        elif not publisher.stats()["depth"] and not spill_files(publisher):
+            return
+
+
+def spill_files(publisher):
+    return [name for name in os.listdir(publisher.spill_dir) if not name.endswith(".corrupt")]
+
+
+def bodies(channel):
+    return [call.kwargs["body"] for call in channel.basic_publish.call_args_list]
+
+# Test: Sending
+
+
+def test_buffered_messages_are_published_in_order(make_publisher, channel):
+    publisher = make_publisher(batch_size=2)
+    for body in ("a", "b", "c"):
+        publisher.publish(body)
+    assert channel.basic_publish.call_count == 0
+    drain(publisher)
+    assert bodies(channel) == [b"a", b"b", b"c"]
+    call = channel.basic_publish.call_args
+    assert call.kwargs["routing_key"] == QUEUE
+    assert call.kwargs["properties"].delivery_mode == pika.DeliveryMode.Persistent.value
+    stats = publisher.stats()
+    assert (stats["enqueued"], stats["published"], stats["batches"]) == (3, 3, 2)
+
+
+def test_sender_thread_publishes_and_close_drains(tmp_path, channel):
+    publisher = AsyncRabbitMQPublisher(QUEUE, spill_dir=str(tmp_path))
+    for body in ("a", "b"):
+        publisher.publish(body)
+    publisher.close(timeout=5)
+    assert bodies(channel) == [b"a", b"b"]
+    assert publisher.stats()["depth"] == 0
+
+# Test: Overflow Policies
+
+
+def test_drop_oldest_discards_the_oldest_message(make_publisher, channel):
+    publisher = make_publisher(max_size=2, overflow="drop_oldest")
+    for body in ("a", "b", "c"):
+        publisher.publish(body)
+    assert publisher.stats()["dropped"] == 1
+    drain(publisher)
+    assert bodies(channel) == [b"b", b"c"]
+
+
+def test_block_waits_for_space(make_publisher, channel):
+    publisher = make_publisher(max_size=1, overflow="block", block_timeout=5)
+    publisher.publish("a")
+    sender = threading.Timer(0.05, lambda: publisher._send(publisher._next_batch()))
+    sender.start()
+    started = time.monotonic()
+    publisher.publish("b")
+    sender.join()
+    assert time.monotonic() - started >= 0.04
+    drain(publisher)
+    assert bodies(channel) == [b"a", b"b"]
+
+
+def test_block_spills_after_the_timeout(make_publisher, channel):
+    publisher = make_publisher(max_size=1, overflow="block", block_timeout=0.05)
+    publisher.publish("a")
+    publisher.publish("b")
+    stats = publisher.stats()
+    assert (stats["block_timeouts"], stats["spilled"], stats["depth"]) == (1, 1, 1)
+    drain(publisher)
+    assert bodies(channel) == [b"a", b"b"]
+
+
+def test_spill_writes_overflowing_messages_to_disk(make_publisher, tmp_path):
+    publisher = make_publisher(max_size=1, overflow="spill")
+    publisher.publish("a")
+    publisher.publish("b")
+    publisher.publish("c")
+    assert publisher.stats()["spilled"] == 2
+    assert publisher.stats()["depth"] == 1
+    with open(publisher.spill_path, encoding="utf-8") as spill_file:
+        assert len(spill_file.readlines()) == 2
+
+
+def test_spilled_messages_are_replayed_after_the_buffer(make_publisher, channel):
+    publisher = make_publisher(max_size=1, overflow="spill")
+    for body in ("a", "b", "c"):
+        publisher.publish(body)
+    drain(publisher)
+    assert bodies(channel) == [b"a", b"b", b"c"]
+    assert not os.path.exists(publisher.spill_path)
+
+
+def test_corrupt_spill_lines_are_set_aside(make_publisher, channel):
+    publisher = make_publisher(max_size=1, overflow="spill")
+    for body in ("a", "b"):
+        publisher.publish(body)
+    corrupt = [b"not json\n", b'{"routingKey": "q"}\n', b"\xff\xfe\n", b"[1, 2]\n",
+               b'{"routingKey": "q", "body64": "YQ==", "properties": {"colour": 1}}\n']
+    with open(publisher.spill_path, "ab") as spill_file:
+        spill_file.writelines(corrupt)
+    publisher.publish("c")
+    # Cut short by a crash in the middle of a write
+    with open(publisher.spill_path, "ab") as spill_file:
+        spill_file.write(b'{"exchange": "user_order", "routingK')
+    drain(publisher)
+    assert bodies(channel) == [b"a", b"b", b"c"]
+    assert publisher.stats()["spill_corrupt"] == 6
+    with open(publisher.corrupt_path, "rb") as corrupt_file:
+        assert corrupt_file.read() == b"".join(corrupt) + b'{"exchange": "user_order", "routingK\n'
+    assert spill_files(publisher) == []
+
+# Test: Sender Thread
+
+
+def wait_for_published(publisher, count):
+    deadline = time.monotonic() + 5
+    while publisher.stats()["published"] < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_sender_survives_unexpected_errors(tmp_path, channel, monkeypatch):
+    monkeypatch.setattr(rabbitmq_async_publisher, "RECONNECT_DELAY", 0)
+    publisher = AsyncRabbitMQPublisher(QUEUE, spill_dir=str(tmp_path))
+    send = publisher._send
+    failures = [RuntimeError("bug")]
+
+    def send_once_broken(batch):
+        if failures:
+            raise failures.pop()
+        send(batch)
+
+    monkeypatch.setattr(publisher, "_send", send_once_broken)
+    publisher.publish("a")
+    wait_for_published(publisher, 1)
+    publisher.close(timeout=5)
+    assert bodies(channel) == [b"a"]
+    assert publisher.stats()["sender_errors"] == 1
+
+
+def test_sender_keeps_the_batch_through_broker_failures(tmp_path, channel, monkeypatch):
+    monkeypatch.setattr(rabbitmq_async_publisher, "RECONNECT_DELAY", 0)
+    channel.tx_commit.side_effect = [pika.exceptions.AMQPConnectionError(), None]
+    publisher = AsyncRabbitMQPublisher(QUEUE, spill_dir=str(tmp_path))
+    publisher.publish("a")
+    wait_for_published(publisher, 1)
+    publisher.close(timeout=5)
+    assert bodies(channel) == [b"a", b"a"]
+    stats = publisher.stats()
+    assert (stats["publish_failures"], stats["published"]) == (1, 1)
+
+
+def test_invalid_overflow_policy():
+    with pytest.raises(ValueError):
+        AsyncRabbitMQPublisher(QUEUE, overflow="ignore")
@@ -0,0 +1,134 @@
+import threading
+from unittest import mock
+
+import pytest
+from pika.exceptions import AMQPConnectionError, StreamLostError
+
+from shared import metrics
+from shared.config import rabbitmq_publisher
+from shared.config.rabbitmq_publisher import RabbitMQPublisher, get_publisher
+
+QUEUE = "user_order_queue"
+
+
+class FakeConnection:
+    """A connection whose channels record what is published on them."""
+
+    def __init__(self):
+        self.is_open = True
+        self.channels = []
+
+    def channel(self):
+        channel = mock.Mock(is_open=True)
+        self.channels.append(channel)
+        return channel
+
+    def process_data_events(self, time_limit=None):
+        pass
+
+    def close(self):
+        self.is_open = False
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    opened = []
+
+    def get_connection():
+        opened.append(FakeConnection())
+        return opened[-1]
+
+    monkeypatch.setattr(rabbitmq_publisher, "get_connection", get_connection)
+    return opened
+
+
+def published(connections):
+    return [call.kwargs["body"] for connection in connections
+            for channel in connection.channels
+            for call in channel.basic_publish.call_args_list]
+
+# Test: Long-Lived Connections
+
+
+def test_publishes_reuse_the_connection_of_the_thread(connections):
+    publisher = RabbitMQPublisher(QUEUE)
+    publisher.publish("first")
+    publisher.publish("second")
+    assert len(connections) == 1
+    assert published(connections) == ["first", "second"]
+    call = connections[0].channels[0].basic_publish.call_args
+    assert call.kwargs["routing_key"] == QUEUE
+    assert publisher.stats()["published"] == 2
+    assert publisher.stats()["open_connections"] == 1
+
+
+def test_every_thread_gets_its_own_connection(connections):
+    publisher = RabbitMQPublisher(QUEUE)
+    publisher.publish("main")
+    thread = threading.Thread(target=publisher.publish, args=("worker",))
+    thread.start()
+    thread.join()
+    assert len(connections) == 2
+    assert publisher.stats()["connections_opened"] == 2
+
+
+def test_topology_is_declared_once_per_process(connections):
+    publisher = RabbitMQPublisher(QUEUE)
+    publisher.publish("main")
+    thread = threading.Thread(target=publisher.publish, args=("worker",))
+    thread.start()
+    thread.join()
+    declared = [channel for connection in connections for channel in connection.channels
+                if channel.queue_declare.called]
+    assert len(declared) == 1
+
+# Test: Reconnection
+
+
+def test_broken_connection_is_replaced_and_the_publish_retried(connections):
+    publisher = RabbitMQPublisher(QUEUE)
+    publisher.publish("first")
+    connections[0].channels[0].basic_publish.side_effect = StreamLostError()
+    publisher.publish("second")
+    assert len(connections) == 2
+    assert not connections[0].is_open
+    assert published(connections)[-1] == "second"
+    stats = publisher.stats()
+    assert (stats["reconnects"], stats["published"], stats["publish_failures"]) == (1, 2, 0)
+
+
+def test_closed_connection_is_reopened_before_publishing(connections):
+    publisher = RabbitMQPublisher(QUEUE)
+    publisher.publish("first")
+    connections[0].is_open = False
+    publisher.publish("second")
+    assert len(connections) == 2
+    assert published(connections) == ["first", "second"]
+
+
+def test_publish_fails_after_max_retries(monkeypatch):
+    monkeypatch.setattr(rabbitmq_publisher, "get_connection",
+                        mock.Mock(side_effect=AMQPConnectionError()))
+    publisher = RabbitMQPublisher(QUEUE, max_retries=2)
+    with pytest.raises(AMQPConnectionError):
+        publisher.publish("lost")
+    stats = publisher.stats()
+    assert (stats["reconnects"], stats["publish_failures"]) == (2, 1)
+
+
+def test_close_closes_every_connection(connections):
+    publisher = RabbitMQPublisher(QUEUE)
+    publisher.publish("first")
+    publisher.close()
+    assert not connections[0].is_open
+    assert publisher.stats()["open_connections"] == 0
+
+# Test: Shared Publishers
+
+
+def test_get_publisher_returns_one_publisher_per_queue():
+    publisher = get_publisher("test_get_publisher_queue")
+    assert get_publisher("test_get_publisher_queue") is publisher
+    assert get_publisher("another_test_queue") is not publisher
+    assert metrics.snapshot()["rabbitmq_publisher.test_get_publisher_queue"]["queue"] == \
+        "test_get_publisher_queue"
@@ -0,0 +1,139 @@
+from unittest import mock
+
+import pika
+import pytest
+
+from shared.config import rabbitmq_retry
+from shared.config.rabbitmq_retry import (ATTEMPT_HEADER, ERROR_HEADER, attempt_of,
+                                          declare_retry_topology, parking_queue_name,
+                                          retry_delays, retry_or_park, retry_queue_name,
+                                          settle_failed)
+
+QUEUE = "user_order_queue"
+
+
+@pytest.fixture
+def two_retries(monkeypatch):
+    # Three attempts: the first delivery, then retries after 100 and 200 ms
+    monkeypatch.setattr(rabbitmq_retry, "retry_delays", lambda: [100, 200])
+
+
+def published(channel):
+    kwargs = channel.basic_publish.call_args.kwargs
+    return kwargs["routing_key"], kwargs["body"], kwargs["properties"]
+
+# Test: Retry Delays
+
+
+def test_retry_delays_double_every_retry():
+    assert retry_delays(5, 1000) == [1000, 2000, 4000, 8000]
+
+
+def test_retry_delays_without_retries():
+    assert retry_delays(1, 1000) == []
+    assert retry_delays(0, 1000) == []
+
+# Test: Queue Names
+
+
+def test_retry_queue_names_include_the_delay():
+    assert retry_queue_name(QUEUE, 1, 1000) == f"{QUEUE}.retry.1.1000"
+    assert retry_queue_name(QUEUE, 1, 1000) != retry_queue_name(QUEUE, 1, 500)
+    assert parking_queue_name(QUEUE) == f"{QUEUE}.parking"
+
+
+def test_retry_topology_dead_letters_to_the_main_queue(two_retries):
+    channel = mock.Mock()
+    declare_retry_topology(channel, QUEUE)
+    declared = {call.kwargs["queue"]: call.kwargs.get("arguments")
+                for call in channel.queue_declare.call_args_list}
+    assert declared[f"{QUEUE}.retry.2.200"] == {
+        "x-message-ttl": 200,
+        "x-dead-letter-exchange": rabbitmq_retry.EXCHANGE_NAME,
+        "x-dead-letter-routing-key": QUEUE}
+    assert set(declared) == {f"{QUEUE}.retry.1.100", f"{QUEUE}.retry.2.200",
+                             f"{QUEUE}.parking"}
+
+# Test: Retry or Park
+
+
+def test_first_failure_goes_to_the_first_retry_queue(two_retries):
+    channel = mock.Mock()
+    properties = pika.BasicProperties(content_type="application/json",
+                                      headers={"x-schema-version": 2})
+    assert retry_or_park(channel, QUEUE, b"{}", properties, KeyError("userId")) == "retried"
+    routing_key, body, retry_properties = published(channel)
+    assert routing_key == f"{QUEUE}.retry.1.100"
+    assert body == b"{}"
+    assert retry_properties.content_type == "application/json"
+    assert retry_properties.headers[ATTEMPT_HEADER] == 1
+    assert retry_properties.headers[ERROR_HEADER] == "KeyError: 'userId'"
+    # Headers of the original message are kept
+    assert retry_properties.headers["x-schema-version"] == 2
+
+
+def test_later_failures_go_to_later_retry_queues(two_retries):
+    channel = mock.Mock()
+    properties = pika.BasicProperties(headers={ATTEMPT_HEADER: 1})
+    assert attempt_of(properties) == 2
+    assert retry_or_park(channel, QUEUE, b"{}", properties, ValueError()) == "retried"
+    assert published(channel)[0] == f"{QUEUE}.retry.2.200"
+
+
+def test_message_is_parked_after_its_last_attempt(two_retries):
+    channel = mock.Mock()
+    properties = pika.BasicProperties(headers={ATTEMPT_HEADER: 2})
+    assert retry_or_park(channel, QUEUE, b"{}", properties, ValueError()) == "parked"
+    routing_key, _, retry_properties = published(channel)
+    assert routing_key == f"{QUEUE}.parking"
+    assert retry_properties.headers[ATTEMPT_HEADER] == 3
+
+
+def test_message_that_cannot_succeed_is_parked_at_once(two_retries):
+    channel = mock.Mock()
+    outcome = retry_or_park(channel, QUEUE, b"not json", None, ValueError("undecodable"),
+                            retryable=False)
+    assert outcome == "parked"
+    assert published(channel)[0] == f"{QUEUE}.parking"
+
+
+def test_refused_republish_propagates(two_retries):
+    channel = mock.Mock()
+    channel.basic_publish.side_effect = pika.exceptions.NackError([])
+    with pytest.raises(pika.exceptions.NackError):
+        retry_or_park(channel, QUEUE, b"{}", None, ValueError())
+
+# Test: Settling Failed Deliveries
+
+
+def test_settled_delivery_is_acked_after_the_republish(two_retries):
+    channel = mock.Mock()
+    assert settle_failed(channel, QUEUE, 7, b"{}", None, ValueError()) == "retried"
+    channel.basic_ack.assert_called_once_with(delivery_tag=7)
+    channel.basic_nack.assert_not_called()
+
+
+def test_settled_delivery_is_left_to_the_caller_without_ack(two_retries):
+    channel = mock.Mock()
+    assert settle_failed(channel, QUEUE, 7, b"{}", None, ValueError(), ack=False) == "retried"
+    channel.basic_ack.assert_not_called()
+
+
+@pytest.mark.parametrize("error", [pika.exceptions.NackError([]),
+                                   pika.exceptions.UnroutableError([]),
+                                   pika.exceptions.AMQPChannelError("closing")])
+def test_delivery_is_requeued_when_the_republish_fails(two_retries, error):
+    channel = mock.Mock(is_open=True)
+    channel.basic_publish.side_effect = error
+    requeued = rabbitmq_retry._stats["requeued"]
+    assert settle_failed(channel, QUEUE, 7, b"{}", None, ValueError()) == "requeued"
+    channel.basic_nack.assert_called_once_with(delivery_tag=7, requeue=True)
+    channel.basic_ack.assert_not_called()
+    assert rabbitmq_retry._stats["requeued"] == requeued + 1
+
+
+def test_closed_channel_is_not_nacked(two_retries):
+    channel = mock.Mock(is_open=False)
+    channel.basic_publish.side_effect = pika.exceptions.ChannelWrongStateError()
+    assert settle_failed(channel, QUEUE, 7, b"{}", None, ValueError()) == "requeued"
+    channel.basic_nack.assert_not_called()
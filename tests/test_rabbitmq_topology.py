@@ -0,0 +1,91 @@
+import json
+from unittest import mock
+
+import pytest
+
+from shared.config import rabbitmq_topology
+from shared.config.rabbitmq_topology import (DEFAULT_TOPOLOGY, USER_ADDRESS_UPDATED,
+                                             USER_EMAIL_UPDATED, USER_EVENTS_EXCHANGE,
+                                             USER_PROFILE_UPDATED, declare_spec,
+                                             declare_user_events_topology, load_topology,
+                                             publish_target, user_event_routing_key)
+
+QUEUE = "user_order_queue"
+
+
+@pytest.fixture
+def topic_mode(monkeypatch):
+    monkeypatch.setattr(rabbitmq_topology, "TOPOLOGY_MODE", "topic")
+    monkeypatch.setattr(rabbitmq_topology, "_topology", None)
+
+
+def bindings(channel):
+    return {(call.kwargs["exchange"], call.kwargs["queue"], call.kwargs["routing_key"])
+            for call in channel.queue_bind.call_args_list}
+
+# Test: Routing Keys
+
+
+def test_routing_key_of_single_field_updates():
+    assert user_event_routing_key(["userEmails"]) == USER_EMAIL_UPDATED
+    assert user_event_routing_key(["deliveryAddress"]) == USER_ADDRESS_UPDATED
+
+
+def test_routing_key_of_other_updates():
+    assert user_event_routing_key(["userEmails", "deliveryAddress"]) == USER_PROFILE_UPDATED
+    assert user_event_routing_key(None) == USER_PROFILE_UPDATED
+    assert user_event_routing_key([]) == USER_PROFILE_UPDATED
+    assert user_event_routing_key(["firstName"]) == USER_PROFILE_UPDATED
+
+
+def test_publish_target_in_direct_mode(monkeypatch):
+    monkeypatch.setattr(rabbitmq_topology, "TOPOLOGY_MODE", "direct")
+    assert publish_target(USER_EMAIL_UPDATED, QUEUE) == (rabbitmq_topology.EXCHANGE_NAME,
+                                                         QUEUE)
+
+
+def test_publish_target_in_topic_mode(topic_mode):
+    assert publish_target(USER_EMAIL_UPDATED, QUEUE) == (USER_EVENTS_EXCHANGE,
+                                                         USER_EMAIL_UPDATED)
+
+# Test: Topology Specs
+
+
+def test_default_topology_binds_the_order_queue_to_every_user_event():
+    channel = mock.Mock()
+    declare_spec(channel, DEFAULT_TOPOLOGY)
+    channel.exchange_declare.assert_called_once_with(
+        exchange=USER_EVENTS_EXCHANGE, exchange_type="topic", durable=True)
+    assert {routing_key for _, _, routing_key in bindings(channel)} == {
+        "user.created", USER_EMAIL_UPDATED, USER_ADDRESS_UPDATED, USER_PROFILE_UPDATED}
+
+
+def test_load_topology_from_a_file(tmp_path):
+    spec = {"exchanges": [{"name": USER_EVENTS_EXCHANGE, "type": "topic"}],
+            "queues": [{"name": "audit", "bindings": [{"exchange": USER_EVENTS_EXCHANGE,
+                                                        "routing_keys": ["user.#"]}]}]}
+    path = tmp_path / "topology.json"
+    path.write_text(json.dumps(spec))
+    assert load_topology(str(path)) == spec
+    assert load_topology(None) is DEFAULT_TOPOLOGY
+
+    channel = mock.Mock()
+    declare_spec(channel, load_topology(str(path)))
+    channel.queue_declare.assert_called_once_with(queue="audit", durable=True)
+    assert bindings(channel) == {(USER_EVENTS_EXCHANGE, "audit", "user.#")}
+
+
+def test_direct_mode_declares_only_the_user_order_exchange(monkeypatch):
+    monkeypatch.setattr(rabbitmq_topology, "TOPOLOGY_MODE", "direct")
+    channel = mock.Mock()
+    declare_user_events_topology(channel, QUEUE)
+    assert bindings(channel) == {(rabbitmq_topology.EXCHANGE_NAME, QUEUE, QUEUE)}
+
+
+def test_topic_mode_also_declares_the_spec(topic_mode):
+    channel = mock.Mock()
+    declare_user_events_topology(channel, QUEUE)
+    # Retried messages are dead-lettered through the user_order exchange in both modes
+    assert (rabbitmq_topology.EXCHANGE_NAME, QUEUE, QUEUE) in bindings(channel)
+    order_queue = DEFAULT_TOPOLOGY["queues"][0]["name"]
+    assert (USER_EVENTS_EXCHANGE, order_queue, USER_EMAIL_UPDATED) in bindings(channel)
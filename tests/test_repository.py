@@ -0,0 +1,69 @@
+from unittest import mock
+
+import pytest
+
+from shared.repository import apply_update, insert_document, update_document
+
+# Test: Applying Updates Locally
+
+
+def test_set_unset_and_inc():
+    document = {"_id": 1, "orderStatus": "under process", "version": 1, "note": "x"}
+    after = apply_update(document, {"$set": {"orderStatus": "shipping"},
+                                     "$unset": {"note": ""},
+                                     "$inc": {"version": 1}})
+    assert after == {"_id": 1, "orderStatus": "shipping", "version": 2}
+
+
+def test_dotted_paths_create_embedded_documents():
+    after = apply_update({"_id": 1, "deliveryAddress": {"city": "A", "street": "S"}},
+                         {"$set": {"deliveryAddress.city": "B", "meta.source": "api"},
+                          "$inc": {"stats.updates": 1}})
+    assert after == {"_id": 1, "deliveryAddress": {"city": "B", "street": "S"},
+                     "meta": {"source": "api"}, "stats": {"updates": 1}}
+
+
+def test_unset_missing_field_is_a_no_op():
+    assert apply_update({"_id": 1}, {"$unset": {"note": "", "a.b": ""}}) == \
+        {"_id": 1, "a": {}}
+
+
+def test_document_and_update_are_not_modified():
+    document = {"_id": 1, "items": [{"itemId": "i1"}], "address": {"city": "A"}}
+    value = [{"itemId": "i2"}]
+    after = apply_update(document, {"$set": {"items": value, "address.city": "B"}})
+    after["items"].append({"itemId": "i3"})
+    assert document == {"_id": 1, "items": [{"itemId": "i1"}], "address": {"city": "A"}}
+    assert value == [{"itemId": "i2"}]
+
+# Test: Single Round Trip Writes
+
+
+def test_update_document_returns_before_and_after_images():
+    collection = mock.Mock()
+    collection.find_one_and_update.return_value = {"_id": 1, "version": 3}
+    before, after = update_document(collection, {"_id": 1}, {"$inc": {"version": 1}})
+    assert before == {"_id": 1, "version": 3}
+    assert after == {"_id": 1, "version": 4}
+    assert collection.find_one_and_update.call_count == 1
+
+
+def test_update_document_without_match():
+    collection = mock.Mock()
+    collection.find_one_and_update.return_value = None
+    assert update_document(collection, {"_id": 1}, {"$set": {"a": 1}}) is None
+
+
+def test_update_document_rejects_unsupported_operators():
+    collection = mock.Mock()
+    with pytest.raises(ValueError, match=r"\$push"):
+        update_document(collection, {"_id": 1}, {"$set": {"a": 1}, "$push": {"b": 2}})
+    collection.find_one_and_update.assert_not_called()
+
+
+def test_insert_document_returns_the_document_without_reading_it_back():
+    collection = mock.Mock()
+    document = {"userId": "u1"}
+    assert insert_document(collection, document) is document
+    collection.insert_one.assert_called_once_with(document, session=None)
+    collection.find_one.assert_not_called()
@@ -0,0 +1,176 @@
+import os
+import time
+from unittest import mock
+
+import mongomock
+import pytest
+
+import order_service.app as order_app_package
+from order_service.app.config import Config
+from shared import result_cache
+from shared.result_cache import ResultCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(result_cache.time, "time", lambda: now[0])
+    return now
+
+# Test: TTL
+
+
+def test_entry_expires_after_the_ttl(clock):
+    cache = ResultCache(10, 1000, ttl=5)
+    cache.put("k", b"value")
+    clock[0] += 4.9
+    assert cache.get("k") == b"value"
+    clock[0] += 0.1
+    assert cache.get("k") is None
+    assert cache.stats()["entries"] == 0
+
+# Test: LRU Bounds
+
+
+def test_least_recently_used_entry_is_evicted_past_max_entries():
+    cache = ResultCache(2, 1000, ttl=60)
+    cache.put("a", b"1")
+    cache.put("b", b"2")
+    assert cache.get("a") == b"1"
+    cache.put("c", b"3")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"1"
+    assert cache.get("c") == b"3"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entries_are_evicted_past_max_bytes():
+    cache = ResultCache(10, 10, ttl=60)
+    cache.put("a", b"12345")
+    cache.put("b", b"12345")
+    cache.put("c", b"1")
+    assert cache.get("a") is None
+    assert cache.stats()["bytes"] == 6
+
+
+def test_value_larger_than_the_cache_is_not_cached():
+    cache = ResultCache(10, 4, ttl=60)
+    cache.put("a", b"12345")
+    assert cache.get("a") is None
+    assert cache.stats()["bytes"] == 0
+
+
+def test_replacing_an_entry_updates_the_size():
+    cache = ResultCache(10, 100, ttl=60)
+    cache.put("a", b"12345")
+    cache.put("a", b"12")
+    assert cache.get("a") == b"12"
+    assert cache.stats()["bytes"] == 2
+
+# Test: Invalidation
+
+
+def test_invalidate_drops_the_entries_of_a_tag():
+    cache = ResultCache(10, 1000, ttl=60)
+    cache.put("shipping:1", b"1", tag="shipping")
+    cache.put("shipping:2", b"2", tag="shipping")
+    cache.put("delivered:1", b"3", tag="delivered")
+    cache.invalidate("shipping")
+    assert cache.get("shipping:1") is None
+    assert cache.get("shipping:2") is None
+    assert cache.get("delivered:1") == b"3"
+
+
+def test_invalidate_without_tag_drops_everything():
+    cache = ResultCache(10, 1000, ttl=60)
+    cache.put("a", b"1", tag="x")
+    cache.put("b", b"2", tag="y")
+    cache.invalidate()
+    assert cache.stats()["entries"] == 0
+    assert cache.stats()["bytes"] == 0
+
+
+def test_discard_drops_one_entry():
+    cache = ResultCache(10, 1000, ttl=60)
+    cache.put("a", b"1")
+    cache.put("b", b"2")
+    cache.discard("a")
+    assert cache.get("a") is None
+    assert cache.get("b") == b"2"
+
+
+def test_stats_count_hits_and_misses():
+    cache = ResultCache(10, 1000, ttl=60)
+    cache.put("a", b"1")
+    cache.get("a")
+    cache.get("b")
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_ratio"]) == (1, 1, 0.5)
+
+# Test: File-Backed Tier
+
+
+def test_entries_are_shared_through_the_directory(tmp_path):
+    writer = ResultCache(10, 1000, ttl=60, directory=str(tmp_path))
+    reader = ResultCache(10, 1000, ttl=60, directory=str(tmp_path))
+    writer.put("k", b"rendered", tag="shipping")
+    assert reader.get("k") == b"rendered"
+    assert reader.stats()["file_hits"] == 1
+
+
+def test_invalidate_keeps_the_files(tmp_path):
+    cache = ResultCache(10, 1000, ttl=60, directory=str(tmp_path))
+    cache.put("k", b"rendered")
+    cache.invalidate()
+    assert len(os.listdir(tmp_path)) == 1
+    assert cache.get("k") == b"rendered"
+
+
+def test_sweep_deletes_unused_files_then_the_least_recently_used(tmp_path):
+    cache = ResultCache(2, 1000, ttl=60, directory=str(tmp_path))
+    for key in ("old", "a", "b", "c"):
+        cache.put(key, b"value")
+    now = time.time()
+    for age, key in ((120, "old"), (30, "a"), (20, "b"), (10, "c")):
+        os.utime(cache._path(key), (now - age, now - age))
+
+    cache.sweep()
+    remaining = set(os.listdir(tmp_path))
+    assert remaining == {os.path.basename(cache._path(key)) for key in ("b", "c")}
+    assert cache.stats()["file_evictions"] == 1
+
+# Test: Cached Order Listings
+
+
+@pytest.fixture
+def order_app(monkeypatch):
+    monkeypatch.setattr(Config, "EMBEDDED_EVENT_CONSUMER", False)
+    monkeypatch.setattr(order_app_package, "MongoClient", lambda uri: mongomock.MongoClient())
+    app = order_app_package.create_app()
+    app.orders_collection.insert_many([
+        {"orderId": f"o{i}", "userId": "u1", "orderStatus": "shipping",
+         "items": [{"itemId": "i1", "quantity": 1, "price": 9.99}],
+         "userEmails": ["a@x.com"], "deliveryAddress": {"city": "Montreal"}}
+        for i in range(3)])
+    return app
+
+
+def test_repeated_listing_is_served_from_the_cache(order_app):
+    client = order_app.test_client()
+    first = client.get("/orders/?status=shipping&limit=2")
+    with mock.patch.object(order_app.orders_collection, "find") as find:
+        second = client.get("/orders/?status=shipping&limit=2")
+    find.assert_not_called()
+    assert second.json == first.json
+    assert second.headers["X-Next-Cursor"] == first.headers["X-Next-Cursor"]
+    assert second.headers["ETag"] == first.headers["ETag"]
+    assert order_app.orders_cache.stats()["hits"] == 1
+
+
+def test_write_to_the_status_drops_its_cached_listings(order_app):
+    client = order_app.test_client()
+    client.get("/orders/?status=shipping")
+    client.put("/orders/o0/status", json={"orderStatus": "delivered"})
+    response = client.get("/orders/?status=shipping")
+    assert [order["orderId"] for order in response.json] == ["o1", "o2"]
+    assert order_app.orders_cache.stats()["hits"] == 0
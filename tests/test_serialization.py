@@ -0,0 +1,98 @@
+import json
+from datetime import datetime, timezone
+
+import mongomock
+import pytest
+from bson.objectid import ObjectId
+from flask_restx import Model, fields, marshal
+
+import order_service.app as order_package
+from order_service.app.config import Config
+from order_service.app.models import order_model
+from shared.projection import trimmed_model
+from shared.serialization import compile_plan, dumps
+
+ADDRESS = {"street": "1 Main", "city": "Montreal", "state": "QC", "postalCode": "H1H1H1",
+           "country": "CA"}
+
+ORDERS = [
+    # A complete order, with the types MongoDB returns
+    {"_id": ObjectId(), "orderId": "o1", "userId": "u1",
+     "items": [{"itemId": "i1", "quantity": 2, "price": 9.99},
+               {"itemId": "i2", "quantity": 1, "price": 0}],
+     "userEmails": ["a@x.com", "b@x.com"], "deliveryAddress": ADDRESS,
+     "orderStatus": "shipping", "createdAt": datetime(2024, 5, 1, 12, 30),
+     "updatedAt": datetime(2024, 5, 2, 8, 0, 0, 123000, tzinfo=timezone.utc)},
+    # Missing optional fields, a missing nested document and a stray field
+    {"orderId": "o2", "items": [], "userEmails": [], "orderStatus": "under process",
+     "unexpected": True},
+    # Values of other types than the model's
+    {"orderId": ObjectId("65f000000000000000000001"), "userId": 7,
+     "items": [{"itemId": 3, "quantity": "4", "price": "1.5"}],
+     "userEmails": ("c@x.com",), "deliveryAddress": {"city": "Quebec"},
+     "orderStatus": None, "createdAt": "2024-05-01T12:30:00"},
+]
+
+# Test: Parity With marshal
+
+
+@pytest.mark.parametrize("order", ORDERS)
+def test_plan_matches_marshal_on_the_order_model(order):
+    assert compile_plan(order_model)(order) == marshal(order, order_model)
+
+
+@pytest.mark.parametrize("field_names", [["orderId"], ["orderStatus", "userEmails"],
+                                         ["deliveryAddress", "createdAt"]])
+def test_plan_matches_marshal_on_trimmed_models(field_names):
+    model = trimmed_model(order_model, field_names)
+    for order in ORDERS:
+        assert compile_plan(model)(order) == marshal(order, model)
+
+
+def test_dumps_matches_marshal_for_lists_and_documents():
+    assert json.loads(dumps(ORDERS, order_model)) == \
+        json.loads(json.dumps(marshal(ORDERS, order_model)))
+    assert json.loads(dumps(ORDERS[0], order_model)) == \
+        json.loads(json.dumps(marshal(ORDERS[0], order_model)))
+
+# Test: Compilation
+
+
+def test_plans_are_compiled_once_per_model():
+    assert compile_plan(order_model) is compile_plan(order_model)
+
+
+def test_unsupported_fields_fall_back_to_marshal():
+    model = Model("Renamed", {"name": fields.String(attribute="fullName"),
+                              "tags": fields.List(fields.Raw)})
+    document = {"fullName": "Ada", "tags": ["x"]}
+    assert compile_plan(model)(document) == marshal(document, model) == \
+        {"name": "Ada", "tags": ["x"]}
+
+# Test: Fast Serialization Endpoint
+
+
+@pytest.fixture
+def order_app(monkeypatch):
+    monkeypatch.setattr(Config, "EMBEDDED_EVENT_CONSUMER", False)
+    monkeypatch.setattr(order_package, "MongoClient", lambda uri: mongomock.MongoClient())
+    app = order_package.create_app()
+    app.orders_collection.insert_many([dict(order, orderStatus="shipping", orderId=f"o{i}")
+                                       for i, order in enumerate(ORDERS)])
+    return app
+
+
+@pytest.mark.parametrize("query", ["", "&fields=orderId,createdAt", "&limit=2",
+                                   "&stream=true"])
+def test_fast_serialization_returns_the_same_orders(order_app, query):
+    client = order_app.test_client()
+    url = f"/orders/?status=shipping{query}"
+    order_app.config["ORDERS_FAST_SERIALIZATION"] = False
+    slow = client.get(url)
+    order_app.config["ORDERS_FAST_SERIALIZATION"] = True
+    fast = client.get(url)
+    assert fast.status_code == slow.status_code == 200
+    assert fast.mimetype == slow.mimetype
+    assert [json.loads(line) for line in fast.get_data(as_text=True).splitlines()] == \
+        [json.loads(line) for line in slow.get_data(as_text=True).splitlines()]
+    assert fast.headers.get("X-Next-Cursor") == slow.headers.get("X-Next-Cursor")
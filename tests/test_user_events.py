@@ -0,0 +1,207 @@
+from datetime import datetime
+
+import mongomock
+import pytest
+
+from shared.user_events import (build_user_update_event, build_versioned_filter,
+                                build_versioned_merge, changed_event_fields,
+                                collapse_user_events, event_changes)
+
+VERSION = "userVersion"
+FIELD_VERSIONS = "userFieldVersions"
+
+
+@pytest.fixture
+def orders():
+    return mongomock.MongoClient().db.orders
+
+
+def matches(orders, document, query):
+    orders.delete_many({})
+    orders.insert_one(document)
+    return orders.count_documents(query) == 1
+
+
+def run_pipeline(orders, document, pipeline):
+    orders.delete_many({})
+    orders.insert_one(document)
+    orders.update_one({"orderId": document["orderId"]}, pipeline)
+    return orders.find_one({"orderId": document["orderId"]}, {"_id": 0})
+
+
+def order(emails, address, version=None, field_versions=None):
+    document = {"orderId": "o1", "userId": "u1", "userEmails": emails,
+                "deliveryAddress": address}
+    if version is not None:
+        document[VERSION] = version
+    if field_versions is not None:
+        document[FIELD_VERSIONS] = field_versions
+    return document
+
+# Test: Collapsing Events
+
+
+def test_collapse_keeps_the_newest_version_of_every_field():
+    collapsed = collapse_user_events([
+        {"userId": "u1", "userEmails": ["a@x.com"], "deliveryAddress": {"city": "A"},
+         "version": 2},
+        {"userId": "u1", "userEmails": ["b@x.com"], "version": 3,
+         "changedFields": ["userEmails"]},
+        # Redelivered older event: skipped
+        {"userId": "u1", "userEmails": ["old@x.com"], "deliveryAddress": {"city": "Old"},
+         "version": 1},
+    ])
+    assert collapsed == {"u1": ({"userEmails": ["b@x.com"], "deliveryAddress": {"city": "A"}},
+                                {"userEmails": 3, "deliveryAddress": 2})}
+
+
+def test_collapse_groups_events_per_user():
+    collapsed = collapse_user_events([
+        {"userId": "u1", "userEmails": ["a@x.com"], "version": 1},
+        {"userId": "u2", "userEmails": ["b@x.com"], "version": 5},
+    ])
+    assert set(collapsed) == {"u1", "u2"}
+    assert collapsed["u2"] == ({"userEmails": ["b@x.com"]}, {"userEmails": 5})
+
+
+def test_collapse_unversioned_events_always_win():
+    collapsed = collapse_user_events([
+        {"userId": "u1", "userEmails": ["a@x.com"], "version": 4},
+        {"userId": "u1", "userEmails": ["b@x.com"]},
+    ])
+    assert collapsed == {"u1": ({"userEmails": ["b@x.com"]}, None)}
+
+
+def test_collapse_skips_events_without_changes():
+    assert collapse_user_events([{"userId": "u1", "version": 1},
+                                 {"userId": "u2", "userEmails": [], "version": 1}]) == {}
+
+# Test: Versioned Filter
+
+
+def test_filter_matches_documents_older_than_the_event(orders):
+    query = build_versioned_filter({"userEmails": 3}, VERSION, FIELD_VERSIONS)
+    assert matches(orders, order([], {}, 2, {"userEmails": 2}), query)
+    assert not matches(orders, order([], {}, 3, {"userEmails": 3}), query)
+    assert not matches(orders, order([], {}, 4, {"userEmails": 4}), query)
+
+
+def test_filter_falls_back_to_the_overall_version(orders):
+    query = build_versioned_filter({"userEmails": 3}, VERSION, FIELD_VERSIONS)
+    assert matches(orders, order([], {}, 2), query)
+    assert not matches(orders, order([], {}, 3), query)
+    # Orders written before versioning
+    assert matches(orders, order([], {}), query)
+
+
+def test_filter_matches_if_any_field_is_newer(orders):
+    query = build_versioned_filter({"userEmails": 3, "deliveryAddress": 5},
+                                   VERSION, FIELD_VERSIONS)
+    assert matches(orders, order([], {}, 5, {"userEmails": 5, "deliveryAddress": 4}), query)
+    assert not matches(orders, order([], {}, 5, {"userEmails": 5, "deliveryAddress": 5}), query)
+
+# Test: Versioned Merge
+
+
+def test_merge_writes_newer_fields_and_records_their_versions(orders):
+    pipeline = build_versioned_merge({"userEmails": ["b@x.com"]}, {"userEmails": 3},
+                                     VERSION, FIELD_VERSIONS)
+    merged = run_pipeline(orders, order(["a@x.com"], {"city": "A"}, 2), pipeline)
+    assert merged["userEmails"] == ["b@x.com"]
+    assert merged["deliveryAddress"] == {"city": "A"}
+    assert merged[VERSION] == 3
+    # The untouched field is pinned to the version it was written at
+    assert merged[FIELD_VERSIONS] == {"userEmails": 3, "deliveryAddress": 2}
+
+
+def test_merge_does_not_roll_fields_back(orders):
+    pipeline = build_versioned_merge({"userEmails": ["old@x.com"]}, {"userEmails": 2},
+                                     VERSION, FIELD_VERSIONS)
+    document = order(["new@x.com"], {"city": "A"}, 4, {"userEmails": 4, "deliveryAddress": 1})
+    merged = run_pipeline(orders, document, pipeline)
+    assert merged["userEmails"] == ["new@x.com"]
+    assert merged[FIELD_VERSIONS] == {"userEmails": 4, "deliveryAddress": 1}
+    assert merged[VERSION] == 4
+
+
+def test_merge_applies_a_late_delta_to_the_fields_no_newer_event_wrote(orders):
+    # Version 3 changed the address, version 2 (delivered late) the emails
+    document = order(["a@x.com"], {"city": "B"}, 3, {"userEmails": 1, "deliveryAddress": 3})
+    pipeline = build_versioned_merge({"userEmails": ["b@x.com"]}, {"userEmails": 2},
+                                     VERSION, FIELD_VERSIONS)
+    merged = run_pipeline(orders, document, pipeline)
+    assert merged["userEmails"] == ["b@x.com"]
+    assert merged["deliveryAddress"] == {"city": "B"}
+    assert merged[FIELD_VERSIONS] == {"userEmails": 2, "deliveryAddress": 3}
+    assert merged[VERSION] == 3
+
+
+def test_merge_into_an_unversioned_document_records_no_null_versions(orders):
+    pipeline = build_versioned_merge({"userEmails": ["b@x.com"]}, {"userEmails": 3},
+                                     VERSION, FIELD_VERSIONS)
+    merged = run_pipeline(orders, order(["a@x.com"], {"city": "A"}), pipeline)
+    # The orders validator requires ints of at least 0
+    assert merged[FIELD_VERSIONS] == {"userEmails": 3, "deliveryAddress": 0}
+    assert merged[VERSION] == 3
+
+
+def test_merge_upserts_a_document_with_int_versions(orders):
+    pipeline = build_versioned_merge({"deliveryAddress": {"city": "B"}},
+                                     {"deliveryAddress": 2}, VERSION, FIELD_VERSIONS)
+    orders.update_one({"orderId": "o1"}, pipeline, upsert=True)
+    assert orders.find_one({"orderId": "o1"})[FIELD_VERSIONS] == \
+        {"userEmails": 0, "deliveryAddress": 2}
+
+
+def test_late_delta_applies_to_a_field_never_written(orders):
+    first = build_versioned_merge({"deliveryAddress": {"city": "B"}}, {"deliveryAddress": 2},
+                                  VERSION, FIELD_VERSIONS)
+    late = build_versioned_merge({"userEmails": ["a@x.com"]}, {"userEmails": 1},
+                                 VERSION, FIELD_VERSIONS)
+    merged = run_pipeline(orders, order(None, None), first)
+    merged = run_pipeline(orders, merged, late)
+    assert (merged["userEmails"], merged["deliveryAddress"]) == (["a@x.com"], {"city": "B"})
+    assert merged[FIELD_VERSIONS] == {"userEmails": 1, "deliveryAddress": 2}
+    assert merged[VERSION] == 2
+
+
+def test_merge_literal_values_are_not_evaluated(orders):
+    pipeline = build_versioned_merge({"userEmails": ["$userId"]}, {"userEmails": 1},
+                                     VERSION, FIELD_VERSIONS)
+    assert pipeline[0]["$set"]["userEmails"]["$cond"][1] == {"$literal": ["$userId"]}
+    assert run_pipeline(orders, order([], {}), pipeline)["userEmails"] == ["$userId"]
+
+# Test: Delta Events
+
+
+def test_full_event_carries_every_field():
+    updated_at = datetime(2026, 1, 2, 3, 4, 5)
+    event = build_user_update_event("u1", ["a@x.com"], {"city": "A"}, 7, updated_at)
+    assert event == {"userId": "u1", "userEmails": ["a@x.com"],
+                     "deliveryAddress": {"city": "A"}, "version": 7,
+                     "updatedAt": "2026-01-02T03:04:05"}
+
+
+def test_delta_event_carries_only_the_changed_fields():
+    event = build_user_update_event("u1", ["a@x.com"], {"city": "A"}, 7,
+                                    changed_fields=["deliveryAddress"])
+    assert event == {"userId": "u1", "deliveryAddress": {"city": "A"},
+                     "changedFields": ["deliveryAddress"], "version": 7}
+
+
+def test_changed_event_fields():
+    old = {"emails": ["a@x.com"], "deliveryAddress": {"city": "A"}, "firstName": "A"}
+    assert changed_event_fields(old, dict(old, firstName="B")) == []
+    assert changed_event_fields(old, dict(old, emails=["b@x.com"])) == ["userEmails"]
+    assert changed_event_fields(old, {"emails": [], "deliveryAddress": {}}) == \
+        ["userEmails", "deliveryAddress"]
+
+
+def test_event_changes_of_full_and_delta_events():
+    full = {"userId": "u1", "userEmails": ["a@x.com"], "deliveryAddress": {"city": "A"}}
+    assert event_changes(full) == {"userEmails": ["a@x.com"],
+                                   "deliveryAddress": {"city": "A"}}
+    delta = dict(full, changedFields=["userEmails"])
+    assert event_changes(delta) == {"userEmails": ["a@x.com"]}
+    # Empty values of full events are not applied
+    assert event_changes({"userId": "u1", "userEmails": [], "deliveryAddress": None}) == {}
@@ -0,0 +1,72 @@
+from unittest import mock
+
+import mongomock
+import pytest
+
+import user_service_v2.app as user_app
+from shared.outbox import OUTBOX_FIELD, OutboxRelay
+from user_service_v2.app import create_app, routes
+
+ADDRESS = {"street": "1 Main", "city": "Montreal", "state": "QC", "postalCode": "H1H1H1",
+           "country": "CA"}
+
+
+@pytest.fixture
+def app(monkeypatch):
+    monkeypatch.setattr(user_app, "MongoClient", lambda uri: mongomock.MongoClient())
+    app = create_app()
+    app.config["USER_EVENTS_OUTBOX"] = False
+    app.users_collection.insert_one({"userId": "u1", "firstName": "Ada",
+                                     "emails": ["ada@x.com"], "deliveryAddress": ADDRESS})
+    app.users_collection.insert_one({"userId": "u2", "emails": ["bob@x.com"],
+                                     "deliveryAddress": ADDRESS})
+    return app
+
+
+@pytest.fixture
+def publish(monkeypatch):
+    publish = mock.Mock()
+    monkeypatch.setattr(routes, "publish_user_update_event", publish)
+    return publish
+
+# Test: Updating a User
+
+
+def test_put_returns_the_user_before_and_after_the_update(app, publish):
+    response = app.test_client().put("/users/u1", json={"emails": ["new@x.com"]})
+    assert response.status_code == 200
+    before, after = response.json
+    assert (before["emails"], after["emails"]) == (["ada@x.com"], ["new@x.com"])
+    assert after["firstName"] == "Ada"
+    user = app.users_collection.find_one({"userId": "u1"})
+    assert user["version"] == 1
+    assert publish.call_args.args[:4] == ("u1", ["new@x.com"], ADDRESS, 1)
+
+
+def test_put_of_an_unknown_user_is_not_found(app, publish):
+    response = app.test_client().put("/users/nobody", json={"emails": ["new@x.com"]})
+    assert response.status_code == 404
+    publish.assert_not_called()
+
+
+def test_put_with_an_email_of_another_user_is_rejected(app, publish):
+    response = app.test_client().put("/users/u1", json={"emails": ["bob@x.com"]})
+    assert response.status_code == 400
+    assert app.users_collection.find_one({"userId": "u1"})["emails"] == ["ada@x.com"]
+    publish.assert_not_called()
+
+# Test: Updating a User Through the Outbox
+
+
+def test_put_with_the_outbox_marks_the_user_instead_of_publishing(app, publish,
+                                                                 monkeypatch):
+    app.config["USER_EVENTS_OUTBOX"] = True
+    response = app.test_client().put("/users/u1", json={"emails": ["new@x.com"]})
+    assert response.status_code == 200
+    publish.assert_not_called()
+    assert OUTBOX_FIELD in app.users_collection.find_one({"userId": "u1"})
+
+    connection = mock.Mock(is_open=True)
+    monkeypatch.setattr("shared.outbox.get_connection", lambda: connection)
+    assert OutboxRelay(app.users_collection, "user_order_queue").relay_batch() == 1
+    assert OUTBOX_FIELD not in app.users_collection.find_one({"userId": "u1"})
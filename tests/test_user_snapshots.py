@@ -0,0 +1,240 @@
+import json
+
+import mongomock
+import pytest
+
+import order_service.app as order_app
+from order_service.app.config import Config
+from order_service.app import events
+from order_service.app.events import apply_user_update_event
+from order_service.app.user_snapshots import (UserSnapshotStore, freeze_user_fields,
+                                              without_user_fields)
+
+ADDRESS = {"street": "1 Main", "city": "Montreal", "state": "QC", "postalCode": "H1H1H1",
+           "country": "CA"}
+
+
+def event(user_id, email, version=None):
+    event = {"userId": user_id, "userEmails": [email], "deliveryAddress": ADDRESS}
+    if version is not None:
+        event["version"] = version
+    return event
+
+
+@pytest.fixture
+def collection():
+    return mongomock.MongoClient().db.user_snapshots
+
+
+@pytest.fixture
+def store(collection):
+    return UserSnapshotStore(collection, max_entries=10, ttl=60)
+
+# Test: Recording Snapshots
+
+
+def test_recorded_snapshot_is_stored_and_served(store, collection):
+    store.record([event("u1", "a@x.com", 1)])
+    assert collection.find_one({"_id": "u1"})["userEmails"] == ["a@x.com"]
+    assert store.get("u1") == {"userId": "u1", "userEmails": ["a@x.com"],
+                               "deliveryAddress": ADDRESS, "version": 1,
+                               "fieldVersions": {"userEmails": 1, "deliveryAddress": 1}}
+    assert store.stats()["hits"] == 1
+
+
+def test_only_the_newest_event_of_a_user_is_kept(store, collection):
+    store.record([event("u1", "v2@x.com", 2), event("u1", "v1@x.com", 1)])
+    store.record([event("u1", "v1@x.com", 1)])
+    assert collection.find_one({"_id": "u1"})["userEmails"] == ["v2@x.com"]
+    assert store.get("u1")["userEmails"] == ["v2@x.com"]
+
+
+def test_stale_event_does_not_roll_back_a_snapshot_of_another_process(collection):
+    writer = UserSnapshotStore(collection, max_entries=10, ttl=60)
+    stale = UserSnapshotStore(collection, max_entries=10, ttl=60)
+    writer.record([event("u1", "v3@x.com", 3)])
+    stale.record([event("u1", "v2@x.com", 2)])
+    assert collection.find_one({"_id": "u1"})["userEmails"] == ["v3@x.com"]
+
+
+def test_events_without_contact_details_are_not_recorded(store, collection):
+    store.record([{"userId": "u1", "userEmails": [], "version": 1}])
+    assert collection.count_documents({}) == 0
+
+
+def test_delta_events_are_merged_into_the_snapshot(store, collection):
+    store.record([{"userId": "u1", "userEmails": ["a@x.com"], "version": 1,
+                   "changedFields": ["userEmails"]}])
+    assert collection.find_one({"_id": "u1"})["userEmails"] == ["a@x.com"]
+    store.record([{"userId": "u1", "deliveryAddress": ADDRESS, "version": 2,
+                   "changedFields": ["deliveryAddress"]}])
+    assert store.get("u1") == {"userId": "u1", "userEmails": ["a@x.com"],
+                               "deliveryAddress": ADDRESS, "version": 2,
+                               "fieldVersions": {"userEmails": 1, "deliveryAddress": 2}}
+
+
+def test_late_delta_of_a_field_never_recorded_still_applies(store, collection):
+    store.record([{"userId": "u1", "deliveryAddress": ADDRESS, "version": 2,
+                   "changedFields": ["deliveryAddress"]}])
+    assert collection.find_one({"_id": "u1"})["fieldVersions"] == \
+        {"userEmails": 0, "deliveryAddress": 2}
+    store.record([{"userId": "u1", "userEmails": ["a@x.com"], "version": 1,
+                   "changedFields": ["userEmails"]}])
+    assert collection.find_one({"_id": "u1"})["userEmails"] == ["a@x.com"]
+    assert store.get("u1") == {"userId": "u1", "userEmails": ["a@x.com"],
+                               "deliveryAddress": ADDRESS, "version": 2,
+                               "fieldVersions": {"userEmails": 1, "deliveryAddress": 2}}
+
+# Test: Reading Snapshots
+
+
+def test_unknown_user_has_no_snapshot(store):
+    assert store.get("nobody") is None
+    assert store.stats()["misses"] == 1
+
+
+def test_snapshots_are_read_from_mongo_once_expired_or_evicted(collection):
+    UserSnapshotStore(collection, 10, 60).record([event("u1", "a@x.com", 1),
+                                                   event("u2", "b@x.com", 1)])
+    store = UserSnapshotStore(collection, max_entries=1, ttl=60)
+    assert store.get("u1")["userEmails"] == ["a@x.com"]
+    assert store.get("u2")["userEmails"] == ["b@x.com"]
+    assert store.get("u1")["userEmails"] == ["a@x.com"]
+    assert (store.stats()["reads"], store.stats()["entries"]) == (3, 1)
+
+    expired = UserSnapshotStore(collection, max_entries=10, ttl=0)
+    expired.get("u1")
+    expired.get("u1")
+    assert expired.stats()["reads"] == 2
+
+# Test: Filling in New Orders
+
+
+@pytest.fixture
+def app(monkeypatch):
+    monkeypatch.setattr(Config, "EMBEDDED_EVENT_CONSUMER", False)
+    monkeypatch.setattr(order_app, "MongoClient", lambda uri: mongomock.MongoClient())
+    return order_app.create_app()
+
+
+def new_order(**fields):
+    order = {"userId": "u1", "orderStatus": "under process",
+             "items": [{"itemId": "i1", "quantity": 1, "price": 9.99}]}
+    order.update(fields)
+    return order
+
+
+def test_new_order_is_filled_in_from_the_consumed_events(app):
+    apply_user_update_event(app.orders_collection, event("u1", "a@x.com", 4))
+    response = app.test_client().post("/orders/", json=new_order())
+    assert response.status_code == 201
+    order = app.orders_collection.find_one({"orderId": response.json["orderId"]})
+    assert order["userEmails"] == ["a@x.com"]
+    assert order["deliveryAddress"] == ADDRESS
+    assert order["userVersion"] == 4
+
+
+def test_fields_sent_by_the_client_are_kept(app):
+    apply_user_update_event(app.orders_collection, event("u1", "a@x.com", 4))
+    response = app.test_client().post("/orders/", json=new_order(userEmails=["own@x.com"]))
+    order = app.orders_collection.find_one({"orderId": response.json["orderId"]})
+    assert order["userEmails"] == ["own@x.com"]
+    assert order["deliveryAddress"] == ADDRESS
+
+
+def test_new_order_of_an_unknown_user_still_needs_its_fields(app):
+    assert app.test_client().post("/orders/", json=new_order()).status_code == 400
+
+# Test: Reference Mode
+
+
+@pytest.fixture
+def reference_app(monkeypatch):
+    monkeypatch.setattr(Config, "ORDERS_USER_FIELDS_MODE", "reference")
+    monkeypatch.setattr(events, "USER_FIELDS_MODE", "reference")
+    monkeypatch.setattr(Config, "EMBEDDED_EVENT_CONSUMER", False)
+    monkeypatch.setattr(order_app, "MongoClient", lambda uri: mongomock.MongoClient())
+    return order_app.create_app()
+
+
+def test_without_user_fields_strips_only_fields_equal_to_the_snapshot():
+    snapshot = {"userEmails": ["a@x.com"], "deliveryAddress": ADDRESS}
+    order = new_order(userEmails=["a@x.com"], deliveryAddress=ADDRESS)
+    assert without_user_fields(order, snapshot) == new_order()
+    changed = dict(order, userEmails=["other@x.com"])
+    assert without_user_fields(changed, snapshot) is changed
+    assert without_user_fields(order, None) is order
+
+
+def test_reference_orders_are_stored_without_user_fields_and_resolved_on_read(
+        reference_app):
+    client = reference_app.test_client()
+    apply_user_update_event(reference_app.orders_collection, event("u1", "a@x.com", 1))
+    order_id = client.post("/orders/", json=new_order()).json["orderId"]
+    stored = reference_app.orders_collection.find_one({"orderId": order_id})
+    assert "userEmails" not in stored and "deliveryAddress" not in stored
+
+    apply_user_update_event(reference_app.orders_collection, event("u1", "new@x.com", 2))
+    listing = client.get("/orders/?status=under process").json
+    assert listing[0]["userEmails"] == ["new@x.com"]
+    assert client.get(f"/orders/{order_id}").json["userEmails"] == ["new@x.com"]
+    streamed = client.get("/orders/?status=under process&stream=true")
+    assert json.loads(streamed.get_data(as_text=True))["deliveryAddress"] == ADDRESS
+
+
+def test_reference_and_embedded_reads_return_the_same_orders(reference_app):
+    app = reference_app
+    apply_user_update_event(app.orders_collection, event("u1", "a@x.com", 1))
+    client = app.test_client()
+    client.post("/orders/", json=new_order())
+    reference = client.get("/orders/?status=under process").json
+    app.config["ORDERS_USER_FIELDS_MODE"] = "embedded"
+    app.orders_collection.update_many({}, {"$set": {"userEmails": ["a@x.com"],
+                                                    "deliveryAddress": ADDRESS}})
+    app.orders_cache.invalidate()
+    assert client.get("/orders/?status=under process").json == reference
+
+
+def test_user_update_in_reference_mode_writes_only_the_snapshot(reference_app):
+    apply_user_update_event(reference_app.orders_collection, event("u1", "a@x.com", 1))
+    reference_app.test_client().post("/orders/", json=new_order())
+    result = apply_user_update_event(reference_app.orders_collection,
+                                     event("u1", "new@x.com", 2))
+    assert result["matched"] == 0
+    assert reference_app.user_snapshots.get("u1")["userEmails"] == ["new@x.com"]
+
+
+def test_user_update_changes_the_etag_of_reference_listings(reference_app):
+    client = reference_app.test_client()
+    apply_user_update_event(reference_app.orders_collection, event("u1", "a@x.com", 1))
+    client.post("/orders/", json=new_order())
+    etag = client.get("/orders/?status=under process").headers["ETag"]
+    apply_user_update_event(reference_app.orders_collection, event("u1", "new@x.com", 2))
+    response = client.get("/orders/?status=under process", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json[0]["userEmails"] == ["new@x.com"]
+
+
+def test_delivered_orders_keep_the_user_fields_they_were_delivered_with(reference_app):
+    client = reference_app.test_client()
+    apply_user_update_event(reference_app.orders_collection, event("u1", "a@x.com", 1))
+    order_id = client.post("/orders/", json=new_order()).json["orderId"]
+    client.put(f"/orders/{order_id}/status", json={"orderStatus": "delivered"})
+    stored = reference_app.orders_collection.find_one({"orderId": order_id})
+    assert (stored["userEmails"], stored["userVersion"]) == (["a@x.com"], 1)
+
+    apply_user_update_event(reference_app.orders_collection, event("u1", "new@x.com", 2))
+    assert client.get(f"/orders/{order_id}").json["userEmails"] == ["a@x.com"]
+
+
+def test_freeze_user_fields_keeps_fields_the_order_already_has(store):
+    orders = mongomock.MongoClient().db.orders
+    orders.insert_many([{"orderId": "o1", "userId": "u1"},
+                        {"orderId": "o2", "userId": "u1", "userEmails": ["own@x.com"]},
+                        {"orderId": "o3", "userId": "u2"}])
+    store.record([event("u1", "a@x.com", 3)])
+    assert freeze_user_fields(orders, {"orderId": {"$in": ["o1", "o2", "o3"]}}, store) == 2
+    assert orders.find_one({"orderId": "o1"})["userEmails"] == ["a@x.com"]
+    assert orders.find_one({"orderId": "o2"})["userEmails"] == ["own@x.com"]
+    assert orders.find_one({"orderId": "o2"})["deliveryAddress"] == ADDRESS
+    assert "userEmails" not in orders.find_one({"orderId": "o3"})
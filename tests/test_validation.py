@@ -0,0 +1,87 @@
+import pytest
+
+from shared.schemas import load_schema, to_mongo_schema
+from shared.validation import (RequestValidationError, request_schema, validate,
+                               validation_errors)
+
+ADDRESS = {"street": "1 Test Street", "city": "Montreal", "state": "QC",
+           "postalCode": "H3G 1M8", "country": "Canada"}
+
+# Test: Derived Schemas
+
+
+def test_request_schema_keeps_only_the_allowed_fields():
+    document = {"$schema": "http://json-schema.org/draft-07/schema#",
+                "properties": {"a": {"type": "string"}, "b": {"type": "integer"}}}
+    schema = request_schema(document, ["a"], ["a"], min_properties=1)
+    assert schema["properties"] == {"a": {"type": "string"}}
+    assert schema["required"] == ["a"]
+    assert schema["minProperties"] == 1
+    assert schema["additionalProperties"] is False
+
+
+def test_non_empty_arrays_are_only_enforced_on_requests():
+    document = {"$schema": "http://json-schema.org/draft-07/schema#",
+                "properties": {"a": {"type": "array"}}}
+    schema = request_schema(document, ["a"], [], non_empty=["a"])
+    assert schema["properties"] == {"a": {"type": "array", "minItems": 1}}
+    assert document["properties"]["a"] == {"type": "array"}
+
+
+@pytest.mark.parametrize("name, field", [("order", "items"), ("order", "userEmails"),
+                                         ("user", "emails")])
+def test_document_schemas_allow_empty_arrays(name, field):
+    schema = load_schema(name)
+    assert "minItems" not in schema["properties"][field]
+    assert "minItems" not in to_mongo_schema(schema)["properties"][field]
+
+
+@pytest.mark.parametrize("name, data, field", [
+    ("user_create", {"emails": [], "deliveryAddress": ADDRESS}, "emails"),
+    ("user_update", {"emails": []}, "emails"),
+    ("order_details", {"userEmails": []}, "userEmails"),
+])
+def test_requests_reject_empty_arrays(name, data, field):
+    assert validation_errors(name, data) == [f"{field}: [] should be non-empty"]
+
+# Test: User Requests
+
+
+def test_valid_user_create():
+    validate("user_create", {"firstName": "A", "emails": ["a@x.com"],
+                             "deliveryAddress": ADDRESS, "phoneNumber": "5145550123"})
+
+
+def test_user_create_reports_every_error():
+    errors = validation_errors("user_create", {"emails": ["not-an-email"],
+                                               "phoneNumber": "12",
+                                               "password": "secret"})
+    assert len(errors) == 4
+    assert any(error.startswith("body: 'deliveryAddress' is a required property")
+               for error in errors)
+    assert any(error.startswith("body: Additional properties") for error in errors)
+    assert any(error.startswith("emails.0: ") for error in errors)
+    assert any(error.startswith("phoneNumber: ") for error in errors)
+
+
+def test_user_update_requires_at_least_one_field():
+    assert validation_errors("user_update", {"emails": ["a@x.com"]}) == []
+    assert validation_errors("user_update", {}) != []
+    assert validation_errors("user_update", {"firstName": "A"}) != []
+
+
+def test_invalid_payload_raises_with_every_error():
+    with pytest.raises(RequestValidationError) as info:
+        validate("order_details", {"userEmails": [], "deliveryAddress": {}})
+    assert isinstance(info.value, ValueError)
+    # Every missing address field is reported, ordered by field
+    assert {error.split(":")[0] for error in info.value.errors} == {"deliveryAddress",
+                                                                     "userEmails"}
+    assert len(info.value.errors) == 6
+    assert info.value.errors[-1] == "userEmails: [] should be non-empty"
+    assert str(info.value) == "; ".join(info.value.errors)
+
+
+def test_non_object_payload():
+    assert validation_errors("user_update", ["a@x.com"]) == \
+        ["body: ['a@x.com'] is not of type 'object'"]